@@ -0,0 +1 @@
+"""Benchmarks of the data preparation stages and the simulation core."""
@@ -0,0 +1,174 @@
+"""
+Benchmark cases of the data preparation stages and the simulation core.
+
+Every case prepares its inputs in ``setup``, which is not timed, and does the
+measured work in ``run``. The data preparation cases run the stages of
+``pipeline.STAGES`` on the raw files of a data root; they are listed in the order
+of their dependencies, so every case finds the outputs of the cases before it.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from src.scripts.data_preparation import pipeline
+
+# A benchmark case. ``inputs`` are paths relative to the data root that must exist,
+# ``setup(data_root, scale)`` returns the state passed to ``run(state)``, which
+# returns the number of rows (or trains) it processed.
+Case = namedtuple("Case", ["name", "inputs", "setup", "run"])
+
+# Trains and occupations of the simulation cases at scale 1
+SIMULATION_TRAINS = 1000
+SIMULATION_DURATION = 1800.0
+OCCUPATIONS = 20000
+# Lines rendered by the plot case at scale 1, and its border file
+PLOT_LINES = 20
+PLOT_BORDERS = f"raw/gadm41_{pipeline.COUNTRY}_1.json"
+
+
+def _stage_case(name):
+    """Benchmark a pipeline stage on the files of the data root."""
+    stage = next(stage for stage in pipeline.STAGES if stage.name == name)
+
+    def setup(data_root, scale):
+        paths = [
+            [os.path.join(data_root, path) for path in paths]
+            for paths in (stage.inputs, stage.outputs)
+        ]
+        for path in paths[1]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return paths
+
+    def run(state):
+        import pyarrow.parquet as pq
+
+        inputs, outputs = state
+        stage.function(inputs, outputs)
+        return pq.ParquetFile(outputs[0]).metadata.num_rows
+
+    return Case(name, stage.inputs, setup, run)
+
+
+def _setup_geometry_parsing(data_root, scale):
+    from src.scripts.data_preparation import ingest
+    from src.scripts.data_preparation.clean_and_process_csv import COLUMN_NAMES
+
+    return ingest.read_csv(
+        os.path.join(data_root, "raw", "linie.csv"),
+        COLUMN_NAMES,
+        columns=["geo_shape"],
+    )["geo_shape"].to_numpy()
+
+
+def _run_geometry_parsing(geo_shapes):
+    from src.scripts.data_preparation.geometry import decode_geo_shapes
+
+    return len(decode_geo_shapes(geo_shapes))
+
+
+def _setup_plot(data_root, scale):
+    from src.scripts.data_preparation import processed_store, render_atlas
+
+    processed = os.path.join(data_root, "processed")
+    line_segments = processed_store.read_table(
+        os.path.join(processed, "line_segments.parquet"),
+        columns=["line_id", "line_name", "start_station_id", "end_station_id"]
+        + ["geometry"],
+    )
+    stations_info = processed_store.read_table(
+        os.path.join(processed, "stations_info.parquet"),
+        columns=["latitude", "longitude"],
+    )
+    line_ids = np.unique(line_segments["line_id"])[: PLOT_LINES * scale].tolist()
+    borders_path = os.path.join(data_root, PLOT_BORDERS)
+    output_directory = os.path.join(data_root, "benchmark_atlas")
+    # The base layer is rendered once and cached, as for repeated atlas runs
+    render_atlas.load_base_layer(borders_path, os.path.join(output_directory, ".cache"))
+    return line_segments, stations_info, borders_path, output_directory, line_ids
+
+
+def _run_plot(state):
+    """Render the maps of a sample of lines with the atlas renderer."""
+    from src.scripts.data_preparation.render_atlas import render_atlas
+
+    line_segments, stations_info, borders_path, output_directory, line_ids = state
+    paths = render_atlas(
+        line_segments,
+        stations_info,
+        borders_path,
+        output_directory,
+        line_ids=line_ids,
+        max_workers=1,
+    )
+    return len(paths)
+
+
+def _setup_engine(data_root, scale):
+    from src.simulation.engine import TimeSteppedSimulation, TrainFleet
+
+    rng = np.random.default_rng(0)
+    n_trains = SIMULATION_TRAINS * scale
+    fleet = TrainFleet(
+        route_length=rng.uniform(5000.0, 60000.0, n_trains),
+        departure_time=rng.uniform(0.0, SIMULATION_DURATION / 2, n_trains),
+    )
+    return TimeSteppedSimulation(fleet)
+
+
+def _run_engine(simulation):
+    simulation.run(SIMULATION_DURATION)
+    return len(simulation.fleet)
+
+
+def _setup_conflicts(data_root, scale):
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    n = OCCUPATIONS * scale
+    km_start = rng.uniform(0.0, 50.0, n)
+    reserved = rng.uniform(0.0, 86400.0, n)
+    return pd.DataFrame(
+        {
+            "train": rng.integers(0, n // 10, n),
+            "edge": rng.integers(0, 500 * scale, n),
+            "km_start": km_start,
+            "km_end": km_start + rng.uniform(0.5, 5.0, n),
+            "reserved": reserved,
+            "released": reserved + rng.uniform(60.0, 600.0, n),
+        }
+    )
+
+
+def _run_conflicts(occupations):
+    from src.simulation.conflicts import find_conflicts
+
+    find_conflicts(occupations)
+    return len(occupations)
+
+
+CASES = [
+    _stage_case("clean_linie"),
+    _stage_case("stations_info"),
+    _stage_case("line_info"),
+    _stage_case("line_segments"),
+    Case(
+        "geometry_parsing",
+        ["raw/linie.csv"],
+        _setup_geometry_parsing,
+        _run_geometry_parsing,
+    ),
+    Case(
+        "plot",
+        [
+            "processed/line_segments.parquet",
+            "processed/stations_info.parquet",
+            PLOT_BORDERS,
+        ],
+        _setup_plot,
+        _run_plot,
+    ),
+    Case("engine", [], _setup_engine, _run_engine),
+    Case("conflicts", [], _setup_conflicts, _run_conflicts),
+]
@@ -0,0 +1,298 @@
+"""
+Run the benchmarks, record their results and flag regressions.
+
+Every case of ``benchmarks.cases`` runs in a fresh worker process per scale, so
+its peak memory is not inflated by the cases before it. With ``--source raw`` the
+raw files of the data root are benchmarked at scale 1 and as copies with every
+row repeated at the larger scales (see ``benchmarks.scaling``). With ``--source
+synthetic`` they are replaced by synthetic networks of ``SYNTHETIC_LINES`` lines
+per unit of scale (see ``synthetic_network``). Results are appended to a JSON Lines
+history; a result is flagged as a regression when its time or peak memory exceeds
+the median of the last runs of the same case, scale and machine by more than the
+threshold.
+
+Usage:
+    python -m benchmarks.run [--scales 1 10 100] [--cases clean_linie plot]
+                             [--source raw|synthetic] [--repeat 3]
+                             [--fail-on-regression] [--budget 600]
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.cases import CASES
+from benchmarks.scaling import scale_raw_data
+from src import instrumentation
+from src.scripts.data_preparation import synthetic_network
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT, PROJECT_ROOT
+
+# Metrics compared against the history
+REGRESSION_METRICS = ["wall_s", "peak_rss_mb"]
+SOURCES = ["raw", "synthetic"]
+# Lines of the synthetic network per unit of scale, about those of Switzerland
+SYNTHETIC_LINES = 320
+SYNTHETIC_OPTIONS = {"stations_per_line": 20, "topology": "mesh", "seed": 0}
+
+
+def measure(case_name, data_root, scale, repeat):
+    """
+    Time a case in the current process.
+
+    Args:
+        case_name (str): Name of the case in ``CASES``.
+        data_root (str): Data root the case reads and writes.
+        scale (int): Scale of the data root.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: Median and minimum wall time, median CPU time, peak memory of the
+        runs and rows processed per run.
+    """
+    import gc
+
+    case = next(case for case in CASES if case.name == case_name)
+    state = case.setup(data_root, scale)
+    wall, cpu = [], []
+    # The peak memory is that of the timed runs, without the setup
+    with instrumentation.measure(case_name, kind="benchmark") as record:
+        for _ in range(repeat):
+            gc.collect()
+            start, start_cpu = time.perf_counter(), time.process_time()
+            rows = case.run(state)
+            wall.append(time.perf_counter() - start)
+            cpu.append(time.process_time() - start_cpu)
+    return {
+        "wall_s": float(np.median(wall)),
+        "wall_min_s": float(np.min(wall)),
+        "cpu_s": float(np.median(cpu)),
+        "peak_rss_mb": record["peak_rss_bytes"] / (1 << 20),
+        "rows": rows,
+    }
+
+
+def prepare_data_root(data_root, work_directory, scale, source="raw"):
+    """
+    Prepare the raw files of a benchmark scale.
+
+    Args:
+        data_root (str): Data root with the raw files.
+        work_directory (str): Directory of the scaled data roots.
+        scale (int): Scale of the data.
+        source (str): ``"raw"`` to scale the raw files, ``"synthetic"`` to
+            generate a synthetic network.
+
+    Returns:
+        str: The data root of the scale.
+    """
+    if source == "raw":
+        scaled_root = os.path.join(work_directory, f"x{scale}")
+        scale_raw_data(data_root, scaled_root, scale)
+        return scaled_root
+
+    scaled_root = os.path.join(work_directory, f"synthetic-x{scale}")
+    options = {"n_lines": SYNTHETIC_LINES * scale, **SYNTHETIC_OPTIONS}
+    # The network only depends on the options, so it is generated once
+    options_path = os.path.join(scaled_root, "synthetic.json")
+    if os.path.exists(options_path):
+        with open(options_path) as file:
+            if json.load(file) == options:
+                return scaled_root
+    synthetic_network.generate_network(scaled_root, **options)
+    with open(options_path, "w") as file:
+        json.dump(options, file)
+    return scaled_root
+
+
+def git_commit():
+    """Commit of the working tree, None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_path):
+    """
+    Read the recorded benchmark results.
+
+    Args:
+        history_path (str): JSON Lines file of results.
+
+    Returns:
+        list[dict]: The results in the order they were recorded.
+    """
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def append_history(results, history_path):
+    """Append results to the JSON Lines history."""
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    with open(history_path, "a") as file:
+        for result in results:
+            file.write(json.dumps(result) + "\n")
+
+
+def _benchmark_key(record):
+    """Results with the same key are comparable."""
+    # Results recorded before the synthetic source existed are of the raw files
+    source = record.get("source", "raw")
+    return record["case"], record["scale"], record["machine"], source
+
+
+def detect_regressions(results, history, threshold=0.2, window=5):
+    """
+    Compare results with the recent history of the same benchmarks.
+
+    Args:
+        results (list[dict]): New results.
+        history (list[dict]): Recorded results, oldest first.
+        threshold (float): Relative increase over the baseline that is flagged.
+        window (int): Number of recent runs whose median is the baseline.
+
+    Returns:
+        list[tuple]: ``(result, metric, baseline)`` of every flagged metric.
+    """
+    regressions = []
+    for result in results:
+        key = _benchmark_key(result)
+        previous = [record for record in history if _benchmark_key(record) == key]
+        previous = previous[-window:]
+        if not previous:
+            continue
+        for metric in REGRESSION_METRICS:
+            baseline = np.nanmedian([record[metric] for record in previous])
+            if result[metric] > baseline * (1 + threshold):
+                regressions.append((result, metric, float(baseline)))
+    return regressions
+
+
+def run_benchmarks(
+    data_root, work_directory, scales, case_names=None, repeat=3, source="raw"
+):
+    """
+    Run the benchmark cases at every scale.
+
+    Args:
+        data_root (str): Data root with the raw files.
+        work_directory (str): Directory of the scaled data roots.
+        scales (list[int]): Scales to benchmark.
+        case_names (list[str], optional): Cases to run. Defaults to all cases.
+        repeat (int): Number of timed runs per case.
+        source (str): Input data, see ``prepare_data_root``.
+
+    Returns:
+        list[dict]: One result per case and scale.
+    """
+    common = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "source": source,
+    }
+    # A spawned worker starts from a fresh interpreter, unlike a forked one
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for scale in scales:
+        scaled_root = prepare_data_root(data_root, work_directory, scale, source)
+        for case in CASES:
+            if case_names and case.name not in case_names:
+                continue
+            missing = [
+                path
+                for path in case.inputs
+                if not os.path.exists(os.path.join(scaled_root, path))
+            ]
+            if missing:
+                print(f"Skipping {case.name} at x{scale}, missing {missing[0]}")
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(
+                    measure, case.name, scaled_root, scale, repeat
+                ).result()
+            results.append({**common, "case": case.name, "scale": scale, **result})
+            print(
+                f"{case.name:18s} x{scale:<4d} {result['wall_s']:9.3f} s "
+                f"{result['cpu_s']:9.3f} s cpu {result['peak_rss_mb']:8.1f} MB"
+            )
+    return results
+
+
+def main():
+    """Parse the command line, run the benchmarks and report regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument(
+        "--work-dir",
+        help="Directory of the scaled data, defaults to <data root>/benchmarks",
+    )
+    parser.add_argument("--history", help="Defaults to <work dir>/history.jsonl")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--cases", nargs="+", choices=[case.name for case in CASES])
+    parser.add_argument("--source", choices=SOURCES, default="raw")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        help="Flag scales whose cases take longer than this many seconds in total",
+    )
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument(
+        "--no-record", action="store_true", help="Do not append to the history"
+    )
+    args = parser.parse_args()
+
+    work_directory = args.work_dir or os.path.join(args.data_root, "benchmarks")
+    history_path = args.history or os.path.join(work_directory, "history.jsonl")
+    results = run_benchmarks(
+        args.data_root,
+        work_directory,
+        args.scales,
+        args.cases,
+        args.repeat,
+        args.source,
+    )
+
+    failed = False
+    for result, metric, baseline in detect_regressions(
+        results, load_history(history_path), args.threshold, args.window
+    ):
+        failed = True
+        print(
+            f"Regression: {result['case']} x{result['scale']} {metric} "
+            f"{result[metric]:.3f} > {baseline:.3f} (median of recent runs)"
+        )
+    if args.budget is not None:
+        for scale in args.scales:
+            total = sum(r["wall_s"] for r in results if r["scale"] == scale)
+            if total > args.budget:
+                failed = True
+                print(f"Over budget: x{scale} took {total:.1f} s > {args.budget:.1f} s")
+    if not args.no_record:
+        append_history(results, history_path)
+    return 1 if failed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Scaled copies of the raw open-data files for benchmarks.
+
+A copy at scale ``n`` repeats every row of a raw CSV file ``n`` times. The ids of
+every repetition after the first are shifted by ``ID_STRIDE`` or suffixed, so the
+copies stay distinct lines, stations and segments instead of duplicates that the
+stages would drop. The files are streamed batch by batch, so scaling needs no more
+memory than one batch of the source file.
+"""
+
+import csv
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from src.scripts.data_preparation import ingest
+from src.scripts.data_preparation.clean_and_process_csv import (
+    COLUMN_NAMES as LINIE_COLUMNS,
+)
+from src.scripts.data_preparation.extract_stations_info import (
+    COLUMN_NAMES as BETRIEBSPUNKTE_COLUMNS,
+)
+from src.scripts.data_preparation.linie_mit_polygon_processing import (
+    CSV_COLUMN_NAMES as POLYGON_COLUMNS,
+)
+
+# Offset between the integer ids of two repetitions, above any id of the raw data
+ID_STRIDE = 10_000_000
+
+# Raw CSV file -> (column names, integer id columns, string id columns)
+RAW_TABLES = {
+    "linie.csv": (LINIE_COLUMNS, ["line_id"], []),
+    "linie-mit-betriebspunkten.csv": (
+        BETRIEBSPUNKTE_COLUMNS,
+        ["line", "didok", "bpuic"],
+        ["station_abbr", "stop_name", "stop_name_duplicate", "sloid"],
+    ),
+    "linie-mit-polygon.csv": (
+        POLYGON_COLUMNS,
+        ["Linie"],
+        ["START OPK", "START NAME", "END OPK", "END NAME"],
+    ),
+}
+
+
+def _read_header(path):
+    """Read the header record of a raw CSV file."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        return next(csv.reader(file, delimiter=";"))
+
+
+def _repetition(batch, repetition, id_columns, name_columns):
+    """Shift the ids of one repetition of a batch."""
+    if repetition == 0:
+        return batch
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name in id_columns:
+            column = pc.add(column, repetition * ID_STRIDE)
+        elif name in name_columns:
+            column = pc.binary_join_element_wise(column, f"~{repetition}", "")
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def scale_csv(source_path, target_path, factor, column_names, id_columns, name_columns):
+    """
+    Write a raw CSV file with every row repeated ``factor`` times.
+
+    Args:
+        source_path (str): The raw CSV file.
+        target_path (str): The scaled copy.
+        factor (int): Number of repetitions of every row.
+        column_names (list[str]): Names of the columns, in file order.
+        id_columns (list[str]): Integer id columns shifted by ``ID_STRIDE``.
+        name_columns (list[str]): String id columns suffixed with ``~<repetition>``.
+
+    Returns:
+        int: Number of rows written.
+    """
+    column_types = {
+        name: pa.int64() if name in id_columns else pa.string() for name in column_names
+    }
+    with open(target_path, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file, delimiter=";").writerow(_read_header(source_path))
+
+    n_rows = 0
+    with open(target_path, "ab") as file:
+        writer = None
+        for batch in ingest.iter_record_batches(
+            source_path, column_names, column_types=column_types
+        ):
+            if writer is None:
+                writer = pa_csv.CSVWriter(
+                    file,
+                    batch.schema,
+                    write_options=pa_csv.WriteOptions(
+                        include_header=False, delimiter=";"
+                    ),
+                )
+            for repetition in range(factor):
+                writer.write_batch(
+                    _repetition(batch, repetition, id_columns, name_columns)
+                )
+            n_rows += batch.num_rows * factor
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
+def scale_raw_data(source_root, target_root, factor):
+    """
+    Write scaled copies of all raw files of a data root.
+
+    The raw CSV files are scaled with ``scale_csv``, other raw files such as the
+    border GeoJSON files are copied unchanged. Copies that are newer than their
+    source are kept.
+
+    Args:
+        source_root (str): Data root with the raw files in ``raw/``.
+        target_root (str): Data root of the scaled copy.
+        factor (int): Number of repetitions of every row.
+
+    Returns:
+        list[str]: Names of the raw files of the copy.
+    """
+    source_directory = os.path.join(source_root, "raw")
+    target_directory = os.path.join(target_root, "raw")
+    os.makedirs(target_directory, exist_ok=True)
+
+    names = sorted(os.listdir(source_directory))
+    for name in names:
+        source_path = os.path.join(source_directory, name)
+        target_path = os.path.join(target_directory, name)
+        if os.path.exists(target_path) and os.path.getmtime(
+            target_path
+        ) >= os.path.getmtime(source_path):
+            continue
+        # Write to a temporary file, so an interrupted copy is never kept
+        partial_path = target_path + ".partial"
+        if name in RAW_TABLES:
+            scale_csv(source_path, partial_path, factor, *RAW_TABLES[name])
+        else:
+            shutil.copyfile(source_path, partial_path)
+        os.replace(partial_path, target_path)
+    return names
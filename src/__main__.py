@@ -0,0 +1,7 @@
+"""Run the ``railsim`` command line with ``python -m src``."""
+
+import sys
+
+from src.cli import main
+
+sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Command line entry point of the railway simulation.
+
+Every pipeline stage, the plots and the simulation are subcommands of a single
+``railsim`` command. Only the standard library and the pipeline's stage table
+are imported to parse the command line; pandas, GeoPandas, Matplotlib and the
+simulation are imported by the subcommand that needs them, so ``--help``, quick
+lookups and cron jobs start in a fraction of a second. The data root defaults to
+``$RAILSIM_DATA_ROOT`` and else to the ``data`` directory of the project.
+
+Usage:
+    python -m src pipeline [--data-root DIR] [--force] [--export] [--only STAGE ...]
+    python -m src clean_linie [--data-root DIR] [--force] [--export]
+    python -m src station BN 8507000
+    python -m src plot --line-id 150 [--output figures/line_150.jpeg] [--show]
+    python -m src simulate --trains 50 --duration 3600
+"""
+
+import argparse
+import os
+import sys
+
+from src import instrumentation
+from src.scripts.data_preparation.pipeline import (
+    DATA_ROOT_VARIABLE,
+    DEFAULT_DATA_ROOT,
+    EXPORT_STAGES,
+    PROJECT_ROOT,
+    STAGES,
+    run_pipeline,
+)
+
+
+def _run_stages(args, stages, profiled=()):
+    """Run stages with the pipeline runner and return the exit code."""
+    metrics = instrumentation.MetricsWriter(args.metrics) if args.metrics else None
+    status = run_pipeline(
+        stages,
+        args.data_root,
+        args.workers,
+        args.force,
+        metrics=metrics,
+        profile=dict.fromkeys(profiled, args.profiler),
+    )
+    return 1 if "failed" in status.values() else 0
+
+
+def run_pipeline_command(args):
+    """Run every out-of-date stage of the pipeline."""
+    stages = STAGES + EXPORT_STAGES if args.export else STAGES
+    if args.only:
+        stages = [stage for stage in stages if stage.name in args.only]
+    return _run_stages(args, stages, args.profile)
+
+
+def run_stage_command(args):
+    """Run one stage, with the exports of its outputs for ``--export``."""
+    stage = next(stage for stage in STAGES if stage.name == args.command)
+    stages = [stage]
+    if args.export:
+        stages += [
+            export for export in EXPORT_STAGES if export.inputs[0] in stage.outputs
+        ]
+    return _run_stages(args, stages, [stage.name] if args.profile else [])
+
+
+def run_station_command(args):
+    """Print the stations matching abbreviations or DIDOK numbers."""
+    import pyarrow.parquet as pq
+
+    path = os.path.join(args.data_root, "processed", "stations_info.parquet")
+    if not os.path.exists(path):
+        print(f"{path} not found, run the stations_info stage first", file=sys.stderr)
+        return 1
+
+    # Matched in Python: the filters and compute functions of pyarrow import pandas
+    table = pq.ParquetFile(path).read()
+    queries = set(args.queries)
+    matches = [
+        index
+        for index, (didok, abbreviation) in enumerate(
+            zip(table["didok"].to_pylist(), table["station_abbr"].to_pylist())
+        )
+        if str(didok) in queries or abbreviation in queries
+    ]
+    stations = [table.slice(index, 1).to_pylist()[0] for index in matches]
+    for station in stations:
+        print(
+            f"{station['station_id']:6d} {station['station_abbr']:8s} "
+            f"{station['didok']:8d} {station['stop_name']} "
+            f"({station['latitude']:.5f}, {station['longitude']:.5f})"
+        )
+    return 0 if stations else 1
+
+
+def run_plot_command(args):
+    """Plot a line and its stations on the borders of Switzerland."""
+    import matplotlib
+
+    if not args.show:
+        # Render without a display, e.g. from cron
+        matplotlib.use("Agg")
+    from src.scripts.data_preparation.plot_switzerland_borders_and_line_150 import (
+        plot_line,
+    )
+
+    output = args.output or os.path.join(
+        PROJECT_ROOT, "figures", f"switzerland_borders_with_line_{args.line_id}.jpeg"
+    )
+    plot_line(args.line_id, output, args.data_root, show=args.show)
+    print(f"Line {args.line_id} plotted to {output}")
+    return 0
+
+
+def run_simulate_command(args):
+    """Simulate trains between random pairs of stations of the network."""
+    import numpy as np
+
+    from src.network.railway_network import RailwayNetwork
+    from src.simulation.engine import TimeSteppedSimulation, fleet_from_graph
+    from src.simulation.sweep import sample_od_pairs
+
+    # The graph is memoized on disk, so repeated runs skip building it
+    graph = RailwayNetwork(args.data_root).graph
+    od_pairs = np.array(sample_od_pairs(graph, args.od_pairs, args.seed))
+    if len(od_pairs) == 0:
+        print("No connected pair of stations found in the network.", file=sys.stderr)
+        return 1
+
+    # Trains cycle through the pairs and depart one headway apart
+    pairs = od_pairs[np.arange(args.trains) % len(od_pairs)]
+    fleet = fleet_from_graph(
+        graph,
+        pairs[:, 0],
+        pairs[:, 1],
+        np.arange(args.trains) * args.headway,
+        platoon_size=args.platoon_size,
+    )
+    simulation = TimeSteppedSimulation(fleet)
+    simulation.run(args.duration, metrics=instrumentation.MetricsWriter(args.metrics))
+    print(
+        f"{int(fleet.arrived.sum())} of {len(fleet)} trains arrived "
+        f"after {args.duration:.0f} s"
+    )
+    return 0
+
+
+def build_parser():
+    """
+    Build the parser of the command line.
+
+    Returns:
+        argparse.ArgumentParser: The parser, with one subcommand per stage.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--data-root",
+        default=DEFAULT_DATA_ROOT,
+        help=f"Root directory of the data (${DATA_ROOT_VARIABLE}).",
+    )
+
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument("--workers", type=int, default=None)
+    run_options.add_argument(
+        "--force", action="store_true", help="Run even if up to date."
+    )
+    run_options.add_argument(
+        "--export",
+        action="store_true",
+        help="Also export the processed tables to CSV and GeoJSON.",
+    )
+    run_options.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write metrics as JSON lines, or Prometheus text to a .prom file.",
+    )
+    run_options.add_argument(
+        "--profiler", choices=sorted(instrumentation.PROFILERS), default="cprofile"
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="railsim", description=__doc__.strip().splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    pipeline = commands.add_parser(
+        "pipeline",
+        parents=[common, run_options],
+        help="Run every out-of-date stage.",
+    )
+    pipeline.add_argument("--only", nargs="+", metavar="STAGE")
+    pipeline.add_argument(
+        "--profile", nargs="+", default=[], metavar="STAGE", help="Stages to profile."
+    )
+    pipeline.set_defaults(handler=run_pipeline_command)
+
+    for stage in STAGES:
+        command = commands.add_parser(
+            stage.name,
+            parents=[common, run_options],
+            help=f"Run the {stage.name} stage.",
+        )
+        command.add_argument(
+            "--profile", action="store_true", help="Profile the stage."
+        )
+        command.set_defaults(handler=run_stage_command)
+
+    station = commands.add_parser("station", parents=[common], help="Look up stations.")
+    station.add_argument(
+        "queries", nargs="+", metavar="QUERY", help="Abbreviation or DIDOK number."
+    )
+    station.set_defaults(handler=run_station_command)
+
+    plot = commands.add_parser("plot", parents=[common], help="Plot a line on the map.")
+    plot.add_argument("--line-id", type=int, default=150)
+    plot.add_argument("--output", help="JPEG file, defaults to figures/.")
+    plot.add_argument("--show", action="store_true", help="Show the figure.")
+    plot.set_defaults(handler=run_plot_command)
+
+    simulate = commands.add_parser(
+        "simulate", parents=[common], help="Simulate trains on the network."
+    )
+    simulate.add_argument("--trains", type=int, default=50)
+    simulate.add_argument("--od-pairs", type=int, default=20)
+    simulate.add_argument("--headway", type=float, default=120.0)
+    simulate.add_argument("--duration", type=float, default=3600.0)
+    simulate.add_argument("--platoon-size", type=int, default=1)
+    simulate.add_argument("--seed", type=int, default=0)
+    simulate.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default="-",
+        help="Metrics of the run, standard output by default.",
+    )
+    simulate.set_defaults(handler=run_simulate_command)
+    return parser
+
+
+def main(argv=None):
+    """
+    Parse the command line and run the subcommand.
+
+    Args:
+        argv (list[str], optional): Arguments. Defaults to ``sys.argv[1:]``.
+
+    Returns:
+        int: Exit code.
+    """
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
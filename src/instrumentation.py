@@ -0,0 +1,305 @@
+"""
+Structured instrumentation of the pipeline stages and simulation runs.
+
+``measure`` wraps a piece of work and fills a metrics record with its wall and
+CPU time, the peak resident memory, the rows read and written and the bytes of
+the files it read and wrote. Loaders and writers report their rows with
+``count``; the rows go to the innermost active measurement and are dropped when
+there is none, so the hooks cost next to nothing outside a measurement.
+
+Records are written as JSON lines or in the Prometheus text exposition format by
+a ``MetricsWriter``. A profiler (``PROFILERS``) can be switched on for single
+measurements, which saves a profile next to the metrics without editing the code
+that is measured.
+"""
+
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import sys
+import time
+
+# Numeric fields of a record and their Prometheus metric names and help texts
+METRICS = {
+    "wall_s": ("railsim_wall_seconds", "Wall-clock time of the work."),
+    "cpu_s": ("railsim_cpu_seconds", "CPU time of the process during the work."),
+    "peak_rss_bytes": (
+        "railsim_peak_rss_bytes",
+        "Peak resident memory of the process during the work.",
+    ),
+    "rows_in": ("railsim_rows_read", "Rows read."),
+    "rows_out": ("railsim_rows_written", "Rows written."),
+    "bytes_read": ("railsim_bytes_read", "Bytes of the files read."),
+    "bytes_written": ("railsim_bytes_written", "Bytes of the files written."),
+    "steps": ("railsim_steps", "Simulation steps or events processed."),
+    "step_p99_s": (
+        "railsim_step_p99_seconds",
+        "99th percentile of the wall-clock time of a simulation step.",
+    ),
+}
+
+_current = contextvars.ContextVar("railsim_measurement", default=None)
+
+
+def count(rows_in=0, rows_out=0):
+    """
+    Add rows to the active measurement, if there is one.
+
+    Args:
+        rows_in (int): Rows read.
+        rows_out (int): Rows written.
+    """
+    record = _current.get()
+    if record is not None:
+        record["rows_in"] += int(rows_in)
+        record["rows_out"] += int(rows_out)
+
+
+def _file_bytes(paths):
+    """Total size of the existing files among ``paths``."""
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+
+def _reset_peak_rss():
+    """Reset the peak resident memory of the process, where Linux allows it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of the process.
+
+    On Linux this is the peak since the last reset by the outermost measurement,
+    elsewhere the peak since the process started.
+
+    Returns:
+        int: The peak in bytes, 0 if the platform does not report it.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextlib.contextmanager
+def _cprofile(path):
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path + ".prof")
+
+
+@contextlib.contextmanager
+def _pyinstrument(path):
+    from pyinstrument import Profiler
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        with open(path + ".html", "w") as file:
+            file.write(profiler.output_html())
+
+
+# Profiler name -> context manager factory called with the profile path without
+# extension. pyinstrument is a sampling profiler and an optional dependency.
+PROFILERS = {"cprofile": _cprofile, "pyinstrument": _pyinstrument}
+
+
+@contextlib.contextmanager
+def measure(
+    name,
+    kind="stage",
+    inputs=(),
+    outputs=(),
+    profile=None,
+    profile_directory="profiles",
+):
+    """
+    Measure a piece of work.
+
+    The record is complete when the block exits, also when it raises; the
+    exception type is then recorded as ``error``. The rows of a nested
+    measurement are added to the enclosing one as well.
+
+    Args:
+        name (str): Name of the work, e.g. the stage name.
+        kind (str): Kind of work, e.g. ``"stage"`` or ``"simulation"``.
+        inputs (list[str]): Files the work reads, counted in ``bytes_read``.
+        outputs (list[str]): Files the work writes, counted in ``bytes_written``.
+        profile (str, optional): Key of ``PROFILERS`` to profile the work with.
+        profile_directory (str): Directory of the profiles.
+
+    Yields:
+        dict: The record, to which the work may add fields of its own.
+    """
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="milliseconds"),
+        "kind": kind,
+        "name": name,
+        "pid": os.getpid(),
+        "rows_in": 0,
+        "rows_out": 0,
+        "bytes_read": _file_bytes(inputs),
+    }
+    parent = _current.get()
+    if parent is None:
+        _reset_peak_rss()
+    token = _current.set(record)
+
+    if profile is None:
+        profiler = contextlib.nullcontext()
+    else:
+        os.makedirs(profile_directory, exist_ok=True)
+        path = os.path.join(profile_directory, f"{kind}-{name}")
+        profiler = PROFILERS[profile](path)
+        record["profile"] = path
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        with profiler:
+            yield record
+    except BaseException as error:
+        record["error"] = type(error).__name__
+        raise
+    finally:
+        record["wall_s"] = time.perf_counter() - start
+        record["cpu_s"] = time.process_time() - start_cpu
+        record["peak_rss_bytes"] = peak_rss_bytes()
+        record["bytes_written"] = _file_bytes(outputs)
+        _current.reset(token)
+        if parent is not None:
+            parent["rows_in"] += record["rows_in"]
+            parent["rows_out"] += record["rows_out"]
+
+
+def step_statistics(durations):
+    """
+    Summarize the wall-clock times of simulation steps.
+
+    Args:
+        durations (np.ndarray): Time of every step in s.
+
+    Returns:
+        dict: ``steps`` and the mean, median, 99th percentile and maximum step
+        time in s.
+    """
+    # Imported here, so the command line does not load NumPy to start
+    import numpy as np
+
+    if len(durations) == 0:
+        return {"steps": 0}
+    p50, p99 = np.percentile(durations, [50, 99])
+    return {
+        "steps": len(durations),
+        "step_mean_s": float(durations.mean()),
+        "step_p50_s": float(p50),
+        "step_p99_s": float(p99),
+        "step_max_s": float(durations.max()),
+    }
+
+
+def prometheus_text(records):
+    """
+    Render records in the Prometheus text exposition format.
+
+    Only the latest record of every kind and name is exported.
+
+    Args:
+        records (list[dict]): Records of ``measure``.
+
+    Returns:
+        str: One gauge per metric, labelled with the kind and name of the work.
+    """
+    latest = {(record["kind"], record["name"]): record for record in records}
+    lines = []
+    for field, (metric, help_text) in METRICS.items():
+        samples = [
+            (kind, name, record[field])
+            for (kind, name), record in latest.items()
+            if record.get(field) is not None
+        ]
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for kind, name, value in samples:
+            name = str(name).replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{metric}{{kind="{kind}",name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsWriter:
+    """
+    Sink of metrics records.
+
+    Records are appended to a JSON Lines file, or written to standard output for
+    the path ``"-"``. A path ending in ``.prom`` is rewritten with all records so
+    far in the Prometheus text format, e.g. for the textfile collector of the
+    node exporter.
+
+    Attributes:
+        path (str): Output file, ``"-"`` for standard output.
+        records (list[dict]): Records written so far.
+    """
+
+    def __init__(self, path):
+        """
+        Create a writer.
+
+        Args:
+            path (str): Output file, ``"-"`` for standard output.
+        """
+        self.path = path
+        self.records = []
+
+    def write(self, records):
+        """
+        Write records.
+
+        Args:
+            records (list[dict]): Records of ``measure``.
+        """
+        self.records.extend(records)
+        if self.path == "-":
+            for record in records:
+                print(json.dumps(record), flush=True)
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.path.endswith(".prom"):
+            # Replace the file at once, so a collector never reads half of it
+            partial_path = self.path + ".partial"
+            with open(partial_path, "w") as file:
+                file.write(prometheus_text(self.records))
+            os.replace(partial_path, self.path)
+            return
+        with open(self.path, "a") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
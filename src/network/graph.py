@@ -0,0 +1,547 @@
+"""
+Compact railway network graph built from the processed line segments and stations.
+
+Nodes are the operating points (stations and junctions) referenced by the
+``start_station``/``end_station`` columns of the line segments, keyed by their DIDOK
+number when ``stations_info`` knows them. Edges are the segments themselves and carry
+their length, track gauge and line_id. The adjacency is stored in compressed sparse
+row (CSR) form in NumPy arrays, which keeps memory proportional to the number of
+segments, makes neighbour lookups a slice and lets shortest-path searches run in
+compiled code through ``scipy.sparse.csgraph``.
+"""
+
+import heapq
+from itertools import count
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from src.scripts.data_preparation import processed_store
+
+# Attributes saved by ``RailwayGraph.to_arrays``, the derived CSR structure included
+_GRAPH_ARRAYS = (
+    "node_abbr",
+    "node_didok",
+    "node_station",
+    "edge_source",
+    "edge_target",
+    "edge_length",
+    "edge_gauge",
+    "gauges",
+    "edge_line_id",
+    "edge_km_start",
+    "edge_km_end",
+    "indptr",
+    "indices",
+    "arc_edge",
+    "_pair_starts",
+    "_pair_indptr",
+    "_didok_order",
+)
+
+
+class RailwayGraph:
+    """
+    Undirected railway multigraph in compressed sparse row form.
+
+    Every undirected edge is stored as two directed arcs. The arcs leaving node ``n``
+    are ``indptr[n]:indptr[n + 1]``; ``indices`` holds their target nodes and
+    ``arc_edge`` the id of the edge they belong to.
+
+    Attributes:
+        node_abbr (np.ndarray): Station abbreviation of every node.
+        node_didok (np.ndarray): DIDOK number of every node, -1 if unknown.
+        node_station (np.ndarray): Station registry id of every node, -1 if unknown.
+        indptr (np.ndarray): Arc offsets of every node, length ``n_nodes + 1``.
+        indices (np.ndarray): Target node of every arc.
+        arc_edge (np.ndarray): Edge id of every arc.
+        edge_source (np.ndarray): Source node of every edge.
+        edge_target (np.ndarray): Target node of every edge.
+        edge_length (np.ndarray): Length of every edge in km.
+        edge_gauge (np.ndarray): Track gauge code of every edge.
+        gauges (np.ndarray): Track gauge of every gauge code.
+        edge_line_id (np.ndarray): line_id of every edge.
+        edge_km_start (np.ndarray): Kilometre position on its line where every edge
+            starts.
+        edge_km_end (np.ndarray): Kilometre position on its line where every edge
+            ends.
+    """
+
+    def __init__(
+        self,
+        node_abbr,
+        node_didok,
+        edge_source,
+        edge_target,
+        edge_length,
+        edge_gauge,
+        gauges,
+        edge_line_id,
+        edge_km_start=None,
+        edge_km_end=None,
+        node_station=None,
+    ):
+        """
+        Build the CSR adjacency from edge arrays.
+
+        Args:
+            node_abbr (np.ndarray): Station abbreviation of every node.
+            node_didok (np.ndarray): DIDOK number of every node, -1 if unknown.
+            edge_source (np.ndarray): Source node of every edge.
+            edge_target (np.ndarray): Target node of every edge.
+            edge_length (np.ndarray): Length of every edge in km.
+            edge_gauge (np.ndarray): Track gauge code of every edge.
+            gauges (np.ndarray): Track gauge of every gauge code.
+            edge_line_id (np.ndarray): line_id of every edge.
+            edge_km_start (np.ndarray, optional): Line km where every edge starts.
+                Defaults to 0.
+            edge_km_end (np.ndarray, optional): Line km where every edge ends.
+                Defaults to ``edge_km_start + edge_length``.
+            node_station (np.ndarray, optional): Station registry id of every node.
+                Defaults to -1 for all nodes.
+        """
+        self.node_abbr = np.asarray(node_abbr, dtype=object)
+        self.node_didok = np.asarray(node_didok, dtype=np.int64)
+        if node_station is None:
+            node_station = np.full(len(self.node_didok), -1)
+        self.node_station = np.asarray(node_station, dtype=np.int32)
+        self.edge_source = np.asarray(edge_source, dtype=np.int32)
+        self.edge_target = np.asarray(edge_target, dtype=np.int32)
+        self.edge_length = np.asarray(edge_length, dtype=np.float64)
+        self.edge_gauge = np.asarray(edge_gauge, dtype=np.int16)
+        self.gauges = np.asarray(gauges, dtype=object)
+        self.edge_line_id = np.asarray(edge_line_id, dtype=np.int64)
+        if edge_km_start is None:
+            edge_km_start = np.zeros_like(self.edge_length)
+        self.edge_km_start = np.asarray(edge_km_start, dtype=np.float64)
+        if edge_km_end is None:
+            edge_km_end = self.edge_km_start + self.edge_length
+        self.edge_km_end = np.asarray(edge_km_end, dtype=np.float64)
+
+        n_edges = len(self.edge_source)
+        arc_source = np.concatenate([self.edge_source, self.edge_target])
+        arc_target = np.concatenate([self.edge_target, self.edge_source])
+        arc_edge = np.concatenate([np.arange(n_edges), np.arange(n_edges)])
+        # Sort by source, then target, then length so that the arcs between a pair
+        # of nodes are contiguous with the shortest one first
+        order = np.lexsort((self.edge_length[arc_edge], arc_target, arc_source))
+
+        self.indices = arc_target[order].astype(np.int32)
+        self.arc_edge = arc_edge[order].astype(np.int32)
+        self.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(arc_source, minlength=self.n_nodes), out=self.indptr[1:])
+
+        # Parallel arcs collapse into one entry per node pair for the C searches
+        arc_source = arc_source[order]
+        self._pair_starts = np.flatnonzero(
+            np.r_[
+                True,
+                (arc_source[1:] != arc_source[:-1])
+                | (self.indices[1:] != self.indices[:-1]),
+            ]
+        )
+        self._pair_indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(arc_source[self._pair_starts], minlength=self.n_nodes),
+            out=self._pair_indptr[1:],
+        )
+
+        self._didok_order = np.argsort(self.node_didok, kind="stable")
+        self._abbr_index = pd.Index(self.node_abbr)
+        self._matrix = None
+        self._adjacency = None
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuild a graph from the output of ``to_arrays`` without recomputing it.
+
+        The arrays are used as they are, so memory-mapped arrays stay shared between
+        the processes that open them.
+
+        Args:
+            arrays (dict[str, np.ndarray]): Arrays returned by ``to_arrays``.
+
+        Returns:
+            RailwayGraph: The railway network.
+        """
+        graph = cls.__new__(cls)
+        for name in _GRAPH_ARRAYS:
+            setattr(graph, name, arrays[name.lstrip("_")])
+        graph._abbr_index = pd.Index(graph.node_abbr)
+        graph._matrix = None
+        graph._adjacency = None
+        return graph
+
+    def to_arrays(self):
+        """
+        Return the arrays that describe the graph, including its CSR structure.
+
+        Station abbreviations and gauges are converted to fixed-width strings, so
+        that every array can be saved and memory-mapped with ``np.save``/``np.load``.
+
+        Returns:
+            dict[str, np.ndarray]: Arrays by name.
+        """
+        arrays = {name.lstrip("_"): getattr(self, name) for name in _GRAPH_ARRAYS}
+        arrays["node_abbr"] = self.node_abbr.astype(str)
+        arrays["gauges"] = self.gauges.astype(str)
+        return arrays
+
+    @property
+    def n_nodes(self):
+        """int: Number of nodes."""
+        return len(self.node_abbr)
+
+    @property
+    def n_edges(self):
+        """int: Number of undirected edges."""
+        return len(self.edge_source)
+
+    def nodes_of_didok(self, didoks):
+        """
+        Look up the nodes of DIDOK numbers.
+
+        Args:
+            didoks (array-like): DIDOK numbers.
+
+        Returns:
+            np.ndarray: Node index of every DIDOK number, -1 if it is not in the graph.
+        """
+        didoks = np.asarray(didoks, dtype=np.int64)
+        sorted_didoks = self.node_didok[self._didok_order]
+        positions = np.searchsorted(sorted_didoks, didoks)
+        positions = np.minimum(positions, len(sorted_didoks) - 1)
+        nodes = self._didok_order[positions]
+        return np.where(sorted_didoks[positions] == didoks, nodes, -1)
+
+    def nodes_of_abbr(self, abbrs):
+        """
+        Look up the nodes of station abbreviations.
+
+        Args:
+            abbrs (array-like): Station abbreviations.
+
+        Returns:
+            np.ndarray: Node index of every abbreviation, -1 if it is not in the graph.
+        """
+        return self._abbr_index.get_indexer(pd.Index(abbrs, dtype=object))
+
+    def neighbours(self, node):
+        """
+        Return the neighbours of a node and the edges leading to them.
+
+        Args:
+            node (int): Node index.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Neighbour nodes and edge ids.
+        """
+        start, stop = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:stop], self.arc_edge[start:stop]
+
+    def _arc_weights(self, banned_nodes=(), banned_edges=()):
+        """Return the length of every arc, infinite for banned nodes and edges."""
+        weights = self.edge_length[self.arc_edge]
+        if len(banned_edges):
+            weights[np.isin(self.arc_edge, list(banned_edges))] = np.inf
+        if len(banned_nodes):
+            weights[np.isin(self.indices, list(banned_nodes))] = np.inf
+        return weights
+
+    def _search_matrix(self, banned_nodes=(), banned_edges=()):
+        """Return the sparse matrix of the shortest arc between every node pair."""
+        if not len(banned_nodes) and not len(banned_edges) and self._matrix is not None:
+            return self._matrix
+
+        weights = self._arc_weights(banned_nodes, banned_edges)
+        matrix = csr_matrix(
+            (
+                np.minimum.reduceat(weights, self._pair_starts),
+                self.indices[self._pair_starts],
+                self._pair_indptr,
+            ),
+            shape=(self.n_nodes, self.n_nodes),
+        )
+        if not len(banned_nodes) and not len(banned_edges):
+            self._matrix = matrix
+        return matrix
+
+    def distances_to(self, target, banned_nodes=(), banned_edges=()):
+        """
+        Compute the shortest distance from every node to a target node.
+
+        Args:
+            target (int): Target node index.
+            banned_nodes (collection[int]): Nodes paths must not visit.
+            banned_edges (collection[int]): Edges paths must not use.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Distance in km from every node, infinite if
+            unreachable, and the next node on the way to the target, -9999 if none.
+        """
+        return dijkstra(
+            self._search_matrix(banned_nodes, banned_edges),
+            directed=True,
+            indices=target,
+            return_predecessors=True,
+        )
+
+    def _pair_edge(self, source, target, weights):
+        """Return the shortest usable edge from ``source`` to ``target``."""
+        start, stop = self.indptr[source], self.indptr[source + 1]
+        arcs = start + np.flatnonzero(self.indices[start:stop] == target)
+        return int(self.arc_edge[arcs[np.argmin(weights[arcs])]])
+
+    def shortest_path(self, source, target, banned_nodes=(), banned_edges=()):
+        """
+        Find the shortest path between two nodes.
+
+        The search runs Dijkstra's algorithm in compiled code on the CSR arrays.
+
+        Args:
+            source (int): Source node index.
+            target (int): Target node index.
+            banned_nodes (collection[int]): Nodes the path must not visit.
+            banned_edges (collection[int]): Edges the path must not use.
+
+        Returns:
+            tuple[float, list[int], list[int]]: Path length in km, node indices and
+            edge ids, or ``(inf, [], [])`` if the target is unreachable.
+        """
+        distance, next_node = self.distances_to(target, banned_nodes, banned_edges)
+        if not np.isfinite(distance[source]):
+            return np.inf, [], []
+
+        weights = self._arc_weights(banned_nodes, banned_edges)
+        nodes = [int(source)]
+        while nodes[-1] != target:
+            nodes.append(int(next_node[nodes[-1]]))
+        edges = [self._pair_edge(u, v, weights) for u, v in zip(nodes, nodes[1:])]
+        return float(distance[source]), nodes, edges
+
+    def _adjacency_lists(self):
+        """Return the adjacency as Python lists, which heapq traverses fastest."""
+        if self._adjacency is None:
+            indptr = self.indptr.tolist()
+            targets = self.indices.tolist()
+            edges = self.arc_edge.tolist()
+            lengths = self.edge_length[self.arc_edge].tolist()
+            self._adjacency = [
+                list(
+                    zip(
+                        targets[indptr[n] : indptr[n + 1]],
+                        edges[indptr[n] : indptr[n + 1]],
+                        lengths[indptr[n] : indptr[n + 1]],
+                    )
+                )
+                for n in range(self.n_nodes)
+            ]
+        return self._adjacency
+
+    def _guided_path(self, source, target, estimate, banned_nodes, banned_edges):
+        """
+        Find a shortest path with A* guided by exact unrestricted distances.
+
+        ``estimate`` holds the distance of every node to the target without any
+        bans, a lower bound of the distance with bans. The search therefore only
+        expands nodes close to the shortest path.
+        """
+        adjacency = self._adjacency_lists()
+        distance = {source: 0.0}
+        previous = {}
+        settled = set()
+        tie_breaker = count()
+        queue = [(estimate[source], next(tie_breaker), source)]
+
+        while queue:
+            _, _, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            if node == target:
+                break
+            settled.add(node)
+            length = distance[node]
+            for neighbour, edge, edge_length in adjacency[node]:
+                if neighbour in banned_nodes or edge in banned_edges:
+                    continue
+                candidate = length + edge_length
+                if candidate < distance.get(neighbour, np.inf):
+                    distance[neighbour] = candidate
+                    previous[neighbour] = (node, edge)
+                    heapq.heappush(
+                        queue,
+                        (candidate + estimate[neighbour], next(tie_breaker), neighbour),
+                    )
+        else:
+            return np.inf, [], []
+
+        nodes, edges = [target], []
+        while nodes[-1] != source:
+            node, edge = previous[nodes[-1]]
+            nodes.append(node)
+            edges.append(edge)
+        return distance[target], nodes[::-1], edges[::-1]
+
+    def k_shortest_paths(self, source, target, k):
+        """
+        Find the k shortest loopless paths between two nodes with Yen's algorithm.
+
+        Parallel edges count as distinct paths, so two lines running between the
+        same pair of stations yield two routes. The spur searches use the exact
+        distances to the target as A* heuristic, so each costs roughly the length
+        of the detour it finds rather than a search of the whole network.
+
+        Args:
+            source (int): Source node index.
+            target (int): Target node index.
+            k (int): Number of paths to return.
+
+        Returns:
+            list[tuple[float, list[int], list[int]]]: Up to ``k`` paths as
+            ``(length, nodes, edges)``, shortest first.
+        """
+        first = self.shortest_path(source, target)
+        if not first[1]:
+            return []
+        estimate = self.distances_to(target)[0].tolist()
+
+        paths = [first]
+        candidates = []
+        seen = {tuple(first[2])}
+        tie_breaker = count()
+        while len(paths) < k:
+            _, last_nodes, last_edges = paths[-1]
+            for i in range(len(last_nodes) - 1):
+                spur_node = last_nodes[i]
+                root_nodes, root_edges = last_nodes[: i + 1], last_edges[:i]
+                root_length = float(self.edge_length[root_edges].sum())
+
+                banned_edges = {
+                    edges[i]
+                    for _, nodes, edges in paths
+                    if nodes[: i + 1] == root_nodes and edges[:i] == root_edges
+                }
+                spur_length, spur_nodes, spur_edges = self._guided_path(
+                    spur_node,
+                    target,
+                    estimate,
+                    banned_nodes=set(root_nodes[:-1]),
+                    banned_edges=banned_edges,
+                )
+                if not spur_nodes:
+                    continue
+
+                edges = root_edges + spur_edges
+                if tuple(edges) in seen:
+                    continue
+                seen.add(tuple(edges))
+                heapq.heappush(
+                    candidates,
+                    (
+                        root_length + spur_length,
+                        next(tie_breaker),
+                        root_nodes[:-1] + spur_nodes,
+                        edges,
+                    ),
+                )
+
+            if not candidates:
+                break
+            length, _, nodes, edges = heapq.heappop(candidates)
+            paths.append((length, nodes, edges))
+        return paths
+
+
+def build_graph(line_segments, stations_info):
+    """
+    Build the railway graph from line segments and station information.
+
+    Segments without a start or end station and segments that start and end at the
+    same operating point are left out.
+
+    Args:
+        line_segments (pd.DataFrame): Line segments with ``line_id``, ``track_gauge``,
+            ``segment_start``, ``segment_end``, ``start_station`` and ``end_station``.
+        stations_info (pd.DataFrame): Stations with ``station_abbr``, ``didok`` and
+            optionally ``station_id``.
+
+    Returns:
+        RailwayGraph: The railway network.
+    """
+    segments = line_segments.dropna(subset=["start_station", "end_station"])
+    # Compare as strings: the Parquet reader returns categoricals whose categories
+    # differ between the two columns
+    segments = segments[
+        segments["start_station"].astype(str) != segments["end_station"].astype(str)
+    ]
+
+    # Factorize both endpoint columns together so every operating point gets one id
+    endpoints = pd.concat(
+        [segments["start_station"], segments["end_station"]], ignore_index=True
+    ).astype(str)
+    codes, node_abbr = pd.factorize(endpoints)
+    n_segments = len(segments)
+
+    stations = stations_info.drop_duplicates(subset=["station_abbr"])
+    didok_of_abbr = pd.Series(
+        stations["didok"].to_numpy(), index=stations["station_abbr"].astype(str)
+    )
+    node_didok = didok_of_abbr.reindex(node_abbr).fillna(-1).to_numpy(np.int64)
+    node_station = None
+    if "station_id" in stations.columns:
+        station_of_abbr = pd.Series(
+            stations["station_id"].to_numpy(),
+            index=stations["station_abbr"].astype(str),
+        )
+        node_station = station_of_abbr.reindex(node_abbr).fillna(-1).to_numpy()
+
+    gauge_codes, gauges = pd.factorize(segments["track_gauge"].astype(str))
+    edge_km_start = segments["segment_start"].to_numpy(np.float64)
+    edge_km_end = segments["segment_end"].to_numpy(np.float64)
+
+    return RailwayGraph(
+        node_abbr=np.asarray(node_abbr, dtype=object),
+        node_didok=node_didok,
+        edge_source=codes[:n_segments],
+        edge_target=codes[n_segments:],
+        edge_length=np.abs(edge_km_end - edge_km_start),
+        edge_gauge=gauge_codes,
+        gauges=np.asarray(gauges, dtype=object),
+        edge_line_id=segments["line_id"].to_numpy(np.int64),
+        edge_km_start=edge_km_start,
+        edge_km_end=edge_km_end,
+        node_station=node_station,
+    )
+
+
+def load_graph(line_segments_path, stations_info_path):
+    """
+    Build the railway graph from the processed Parquet tables.
+
+    Only the columns the graph needs are read; geometries are not decoded.
+
+    Args:
+        line_segments_path (str): Path to ``line_segments.parquet``.
+        stations_info_path (str): Path to ``stations_info.parquet``.
+
+    Returns:
+        RailwayGraph: The railway network.
+    """
+    line_segments = processed_store.read_table(
+        line_segments_path,
+        columns=[
+            "line_id",
+            "track_gauge",
+            "segment_start",
+            "segment_end",
+            "start_station",
+            "end_station",
+        ],
+    )
+    stations_info = processed_store.read_table(
+        stations_info_path, columns=["station_id", "station_abbr", "didok"]
+    )
+    return build_graph(line_segments, stations_info)
@@ -0,0 +1,275 @@
+"""
+Vectorized linear referencing along the railway lines.
+
+Every line is turned into one polyline whose vertices carry their kilometre
+position, interpolated from the ``km_start``/``km_end`` of the geometry they
+belong to in proportion to arc length. Conversions between kilometre positions
+and coordinates then work on whole NumPy arrays at once: ``km -> coordinate`` is
+one ``searchsorted`` over all vertices of all lines and ``coordinate -> km`` is
+one nearest-neighbour query per line followed by a vectorized projection.
+"""
+
+import numpy as np
+import shapely
+
+from src.scripts.data_preparation import processed_store
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class LinearReference:
+    """
+    Kilometre positions of the vertices of every line.
+
+    Vertices are stored line after line in CSR form: the vertices of the line
+    ``line_ids[i]`` are ``offsets[i]:offsets[i + 1]``, sorted by kilometre.
+
+    Attributes:
+        line_ids (np.ndarray): Sorted line ids.
+        offsets (np.ndarray): Vertex offsets of every line, length ``n_lines + 1``.
+        vertex_km (np.ndarray): Kilometre position of every vertex.
+        vertex_lat (np.ndarray): Latitude of every vertex.
+        vertex_lon (np.ndarray): Longitude of every vertex.
+        vertex_heading (np.ndarray): Heading in degrees clockwise from north from
+            every vertex to the next one of its line, in the direction of growing km.
+    """
+
+    def __init__(self, line_ids, offsets, vertex_km, vertex_lat, vertex_lon):
+        """
+        Precompute the search keys and headings of the vertex arrays.
+
+        Args:
+            line_ids (np.ndarray): Sorted line ids.
+            offsets (np.ndarray): Vertex offsets of every line.
+            vertex_km (np.ndarray): Kilometre position of every vertex.
+            vertex_lat (np.ndarray): Latitude of every vertex.
+            vertex_lon (np.ndarray): Longitude of every vertex.
+        """
+        self.line_ids = np.asarray(line_ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vertex_km = np.asarray(vertex_km, dtype=np.float64)
+        self.vertex_lat = np.asarray(vertex_lat, dtype=np.float64)
+        self.vertex_lon = np.asarray(vertex_lon, dtype=np.float64)
+
+        first, last = self.offsets[:-1], self.offsets[1:] - 1
+        self.km_min = self.vertex_km[first]
+        self.km_max = self.vertex_km[last]
+
+        # Shift every line into its own disjoint km range so that a single sorted
+        # key array covers all lines
+        widths = self.km_max - self.km_min + 1.0
+        self._line_base = np.r_[0.0, np.cumsum(widths)[:-1]] - self.km_min
+        line_of_vertex = np.repeat(np.arange(len(self.line_ids)), np.diff(self.offsets))
+        self._keys = self.vertex_km + self._line_base[line_of_vertex]
+
+        # Local equirectangular projection in km, good enough for nearest searches
+        self._cos_lat0 = np.cos(np.radians(self.vertex_lat.mean()))
+        self._x = np.radians(self.vertex_lon) * EARTH_RADIUS_KM * self._cos_lat0
+        self._y = np.radians(self.vertex_lat) * EARTH_RADIUS_KM
+
+        next_vertex = np.minimum(
+            np.arange(len(self.vertex_km)) + 1, last[line_of_vertex]
+        )
+        previous_vertex = np.maximum(next_vertex - 1, first[line_of_vertex])
+        self.vertex_heading = _bearing(
+            self.vertex_lat[previous_vertex],
+            self.vertex_lon[previous_vertex],
+            self.vertex_lat[next_vertex],
+            self.vertex_lon[next_vertex],
+        )
+        self._trees = {}
+
+    @classmethod
+    def from_table(cls, table, start_column="km_start", end_column="km_end"):
+        """
+        Build the linear reference from line geometries with km ranges.
+
+        Works with ``linie_cleaned`` (``km_start``/``km_end``) as well as with
+        ``line_segments`` (``segment_start``/``segment_end``).
+
+        Args:
+            table (gpd.GeoDataFrame): Geometries with ``line_id`` and km range columns.
+            start_column (str): Column with the km at the first vertex.
+            end_column (str): Column with the km at the last vertex.
+
+        Returns:
+            LinearReference: The linear reference of every line in the table.
+        """
+        table = table[table.geometry.notna() & ~table.geometry.is_empty]
+        coordinates, part = shapely.get_coordinates(
+            table.geometry.to_numpy(), return_index=True
+        )
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+
+        # Arc length of every vertex from the first vertex of its geometry
+        new_part = part[1:] != part[:-1]
+        part_start = np.flatnonzero(np.r_[True, new_part])
+        part_of_vertex = np.cumsum(np.r_[0, new_part])
+        step = _haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        step[new_part] = 0.0
+        arc = np.r_[0.0, np.cumsum(step)]
+        arc -= arc[part_start][part_of_vertex]
+        part_length = arc[np.r_[part_start[1:] - 1, len(arc) - 1]][part_of_vertex]
+        fraction = np.divide(
+            arc, part_length, out=np.zeros_like(arc), where=part_length > 0
+        )
+
+        km_start = table[start_column].to_numpy(np.float64)[part]
+        km_end = table[end_column].to_numpy(np.float64)[part]
+        km = km_start + fraction * (km_end - km_start)
+
+        # Order the vertices of every line by km; lines need at least two vertices
+        line_id = table["line_id"].to_numpy(np.int64)[part]
+        order = np.lexsort((km, line_id))
+        line_ids, counts = np.unique(line_id[order], return_counts=True)
+        keep = counts >= 2
+        order = order[np.repeat(keep, counts)]
+        return cls(
+            line_ids[keep],
+            np.r_[0, np.cumsum(counts[keep])],
+            km[order],
+            lat[order],
+            lon[order],
+        )
+
+    @classmethod
+    def load(cls, path, start_column="km_start", end_column="km_end"):
+        """
+        Build the linear reference from a processed GeoParquet table.
+
+        Args:
+            path (str): Path to e.g. ``linie_cleaned.parquet``.
+            start_column (str): Column with the km at the first vertex.
+            end_column (str): Column with the km at the last vertex.
+
+        Returns:
+            LinearReference: The linear reference.
+        """
+        table = processed_store.read_table(
+            path, columns=["line_id", start_column, end_column, "geometry"]
+        )
+        return cls.from_table(table, start_column, end_column)
+
+    def _line_index(self, line_ids):
+        """Map line ids to line indices, raising for unknown lines."""
+        line_ids = np.asarray(line_ids, dtype=np.int64)
+        index = np.searchsorted(self.line_ids, line_ids)
+        index = np.minimum(index, len(self.line_ids) - 1)
+        unknown = self.line_ids[index] != line_ids
+        if unknown.any():
+            raise KeyError(f"Unknown line ids: {np.unique(line_ids[unknown]).tolist()}")
+        return index
+
+    def locate_km(self, line_ids, km):
+        """
+        Convert kilometre positions on lines to coordinates and headings.
+
+        Positions outside a line's km range are clamped to its ends.
+
+        Args:
+            line_ids (array-like): line_id of every position, or one line_id for all.
+            km (array-like): Kilometre positions.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: Latitude, longitude and
+            heading (degrees clockwise from north) of every position.
+        """
+        km = np.asarray(km, dtype=np.float64)
+        line = np.broadcast_to(self._line_index(line_ids), km.shape)
+        km = np.clip(km, self.km_min[line], self.km_max[line])
+        keys = km + self._line_base[line]
+
+        vertex = np.searchsorted(self._keys, keys, side="right") - 1
+        vertex = np.clip(vertex, self.offsets[line], self.offsets[line + 1] - 2)
+        span = self._keys[vertex + 1] - self._keys[vertex]
+        t = np.divide(
+            keys - self._keys[vertex], span, out=np.zeros_like(keys), where=span > 0
+        )
+
+        lat = self.vertex_lat[vertex] + t * (
+            self.vertex_lat[vertex + 1] - self.vertex_lat[vertex]
+        )
+        lon = self.vertex_lon[vertex] + t * (
+            self.vertex_lon[vertex + 1] - self.vertex_lon[vertex]
+        )
+        return lat, lon, self.vertex_heading[vertex]
+
+    def _tree(self, line):
+        """Return the STRtree over the pieces of one line, building it on first use."""
+        if line not in self._trees:
+            start, stop = self.offsets[line], self.offsets[line + 1]
+            pieces = shapely.linestrings(
+                np.stack(
+                    [
+                        np.c_[self._x[start : stop - 1], self._y[start : stop - 1]],
+                        np.c_[self._x[start + 1 : stop], self._y[start + 1 : stop]],
+                    ],
+                    axis=1,
+                )
+            )
+            self._trees[line] = shapely.STRtree(pieces)
+        return self._trees[line]
+
+    def locate_point(self, line_ids, lat, lon):
+        """
+        Convert coordinates to kilometre positions on the given lines.
+
+        Every point is projected onto the closest piece of its line.
+
+        Args:
+            line_ids (array-like): line_id of every point, or one line_id for all.
+            lat (array-like): Latitudes.
+            lon (array-like): Longitudes.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Kilometre position of every point and its
+            distance to the line in km.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        line = np.broadcast_to(self._line_index(line_ids), lat.shape).ravel()
+        x = (np.radians(lon) * EARTH_RADIUS_KM * self._cos_lat0).ravel()
+        y = (np.radians(lat) * EARTH_RADIUS_KM).ravel()
+
+        # One nearest query per line for all of its points
+        vertex = np.empty(len(x), dtype=np.int64)
+        order = np.argsort(line, kind="stable")
+        lines, starts = np.unique(line[order], return_index=True)
+        for current, group in zip(lines, np.split(order, starts[1:])):
+            points = shapely.points(x[group], y[group])
+            _, piece = self._tree(current).query_nearest(points, all_matches=False)
+            vertex[group] = self.offsets[current] + piece
+
+        ax, ay = self._x[vertex], self._y[vertex]
+        dx, dy = self._x[vertex + 1] - ax, self._y[vertex + 1] - ay
+        length_squared = dx * dx + dy * dy
+        t = np.divide(
+            (x - ax) * dx + (y - ay) * dy,
+            length_squared,
+            out=np.zeros_like(x),
+            where=length_squared > 0,
+        )
+        t = np.clip(t, 0.0, 1.0)
+        km = self.vertex_km[vertex] + t * (
+            self.vertex_km[vertex + 1] - self.vertex_km[vertex]
+        )
+        distance = np.hypot(x - (ax + t * dx), y - (ay + t * dy))
+        return km.reshape(lat.shape), distance.reshape(lat.shape)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between arrays of coordinates."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    """Initial bearing in degrees clockwise from north between arrays of coordinates."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360.0
@@ -0,0 +1,369 @@
+"""
+In-process façade over the processed railway network of a data root.
+
+``RailwayNetwork`` loads the stations, lines, segments and borders on first
+access and keeps them, and builds the graph, the spatial index and the projected
+segment geometries from them once. A notebook or a long-running service opens
+one network (``RailwayNetwork.open`` shares it within the process) and reuses it
+across cells and requests instead of re-parsing the files every time.
+
+Objects that are slow to build are memoized on disk as well, under
+``<data root>/cache/network``: the graph as memory-mapped arrays, the projected segments
+as GeoParquet and raw GeoJSON files as GeoParquet. An entry is keyed by the
+SHA-256 of its source files and of the code that builds it, so it is rebuilt
+whenever one of them changes and a new process loads it instead of rebuilding
+it. File digests are reused while the size and modification time of a file are
+unchanged, as in the pipeline.
+
+Usage:
+    network = RailwayNetwork.open()
+    network.graph.shortest_path(0, 42)
+    network.spatial_index.snap_stations(network.stations)
+"""
+
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import (
+    COUNTRY,
+    DEFAULT_DATA_ROOT,
+    file_digest,
+)
+
+# Next to the tile cache of the data service in <data root>/cache
+CACHE_DIRECTORY_NAME = os.path.join("cache", "network")
+DIGESTS_NAME = "digests.json"
+
+# Networks shared within the process by RailwayNetwork.open
+_NETWORKS = {}
+
+
+def _module_digest(module_names):
+    """Digest of the source files of modules, without importing them."""
+    digest = hashlib.sha256()
+    for module_name in module_names:
+        spec = importlib.util.find_spec(module_name)
+        with open(spec.origin, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _remove(path):
+    """Remove a cache entry, a file or a directory."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _partial_path(path):
+    """Temporary path to write an entry to, unique to the writer."""
+    return f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.partial"
+
+
+def _save_graph(graph, path):
+    from src.simulation.sweep import save_network
+
+    save_network(graph, path)
+
+
+def _load_graph(path):
+    from src.simulation.sweep import load_network
+
+    return load_network(path)
+
+
+def _save_geodataframe(gdf, path):
+    processed_store.write_table(
+        pd.DataFrame(gdf),
+        path,
+        geometry_column=gdf.geometry.name,
+        crs=gdf.crs,
+        key_column=None,
+    )
+
+
+class RailwayNetwork:
+    """
+    Lazily loaded, cached railway network of a data root.
+
+    Every property is computed on first access and kept until ``clear``.
+
+    Attributes:
+        data_root (str): Data root with the ``raw`` and ``processed`` files.
+        country (str): Country of the border file.
+        cache_directory (str): Directory of the on-disk memo cache, None to
+            keep the values in memory only.
+        metric_crs (str): CRS of the projected segments and the spatial index.
+    """
+
+    def __init__(
+        self,
+        data_root=DEFAULT_DATA_ROOT,
+        country=COUNTRY,
+        cache_directory=None,
+        metric_crs=None,
+        use_cache=True,
+    ):
+        """
+        Create a network; nothing is loaded until a property is accessed.
+
+        Args:
+            data_root (str): Data root with the ``raw`` and ``processed`` files.
+            country (str): Country of the border file ``raw/gadm41_<country>_1.json``.
+            cache_directory (str, optional): Directory of the on-disk memo
+                cache. Defaults to ``<data root>/cache/network``.
+            metric_crs (str, optional): CRS with metre units of the projected
+                segments. Defaults to that of the spatial index.
+            use_cache (bool): Memoize on disk; without it values are only kept
+                in memory.
+        """
+        self.data_root = data_root
+        self.country = country
+        if use_cache and cache_directory is None:
+            cache_directory = os.path.join(data_root, CACHE_DIRECTORY_NAME)
+        self.cache_directory = cache_directory if use_cache else None
+        self.metric_crs = metric_crs
+        self._geojson = {}
+        self._digests = None
+
+    @classmethod
+    def open(cls, data_root=DEFAULT_DATA_ROOT, country=COUNTRY):
+        """
+        Return the network of a data root shared within the process.
+
+        Args:
+            data_root (str): Data root with the ``raw`` and ``processed`` files.
+            country (str): Country of the border file.
+
+        Returns:
+            RailwayNetwork: The same network for every call with these arguments.
+        """
+        key = (os.path.abspath(data_root), country)
+        if key not in _NETWORKS:
+            _NETWORKS[key] = cls(data_root, country)
+        return _NETWORKS[key]
+
+    def path(self, *parts):
+        """Path of a file under the data root."""
+        return os.path.join(self.data_root, *parts)
+
+    @functools.cached_property
+    def stations(self):
+        """pd.DataFrame: The stations_info table, ordered by station id."""
+        return processed_store.read_table(
+            self.path("processed", "stations_info.parquet"), key_column="station_id"
+        )
+
+    @functools.cached_property
+    def registry(self):
+        """StationRegistry: Lookups between the station ids and keys."""
+        from src.scripts.data_preparation.station_registry import StationRegistry
+
+        return StationRegistry.from_stations_info(self.stations)
+
+    @functools.cached_property
+    def lines(self):
+        """pd.DataFrame: The lines_info table, one row per line."""
+        return processed_store.read_table(self.path("processed", "lines_info.parquet"))
+
+    @functools.cached_property
+    def segments(self):
+        """gpd.GeoDataFrame: The line_segments table in EPSG:4326."""
+        return processed_store.read_table(
+            self.path("processed", "line_segments.parquet")
+        )
+
+    @functools.cached_property
+    def borders(self):
+        """gpd.GeoDataFrame: Administrative borders of the country."""
+        return self.read_geojson(f"gadm41_{self.country}_1.json")
+
+    @functools.cached_property
+    def graph(self):
+        """RailwayGraph: Graph of the segments, memory-mapped from the cache."""
+        from src.network.graph import build_graph
+
+        return self.memoize(
+            "graph",
+            [
+                self.path("processed", "line_segments.parquet"),
+                self.path("processed", "stations_info.parquet"),
+            ],
+            lambda: build_graph(self.segments, self.stations),
+            _save_graph,
+            _load_graph,
+            modules=["src.network.graph", "src.simulation.sweep"],
+        )
+
+    @functools.cached_property
+    def spatial_index(self):
+        """SegmentIndex: STRtree over the projected segments."""
+        from src.network.spatial_index import DEFAULT_METRIC_CRS, SegmentIndex
+
+        metric_crs = self.metric_crs or DEFAULT_METRIC_CRS
+        return self.memoize(
+            f"segment_index-{metric_crs.replace(':', '_')}",
+            [self.path("processed", "line_segments.parquet")],
+            lambda: SegmentIndex.from_segments(self.segments, metric_crs),
+            lambda index, path: index.save(path),
+            SegmentIndex.load,
+            modules=[
+                "src.network.spatial_index",
+                "src.scripts.data_preparation.processed_store",
+            ],
+        )
+
+    @property
+    def projected_segments(self):
+        """gpd.GeoDataFrame: Segment geometries in the metric CRS."""
+        return self.spatial_index.segments
+
+    def read_geojson(self, file_name):
+        """
+        Read a raw GeoJSON file, memoized as GeoParquet.
+
+        Args:
+            file_name (str): Name of the file in the ``raw`` directory.
+
+        Returns:
+            gpd.GeoDataFrame: The features of the file.
+        """
+        if file_name not in self._geojson:
+            path = self.path("raw", file_name)
+
+            def read():
+                import geopandas as gpd
+
+                return gpd.read_file(path)
+
+            self._geojson[file_name] = self.memoize(
+                os.path.splitext(file_name)[0],
+                [path],
+                read,
+                _save_geodataframe,
+                lambda entry: processed_store.read_table(entry, key_column=None),
+                modules=["src.scripts.data_preparation.processed_store"],
+            )
+        return self._geojson[file_name]
+
+    def memoize(self, name, sources, build, save, load, modules=()):
+        """
+        Load a value from the on-disk cache, or build and cache it.
+
+        The entry is written under a temporary name of its own first, so an
+        interrupted write is never read and processes building the same entry
+        at once do not clobber each other; the first one stored wins. Entries of
+        ``name`` with other keys are removed.
+
+        Args:
+            name (str): Name of the value, unique within the cache.
+            sources (list[str]): Files the value is built from.
+            build (callable): Builds the value, called without arguments.
+            save (callable): Saves the value, called as ``save(value, path)``.
+            load (callable): Loads a saved value, called as ``load(path)``.
+            modules (list[str]): Modules whose source is part of the key.
+
+        Returns:
+            object: The value.
+        """
+        if self.cache_directory is None:
+            return build()
+
+        key = self.cache_key(name, sources, modules)
+        path = os.path.join(self.cache_directory, f"{name}-{key[:16]}")
+        if os.path.exists(path):
+            return load(path)
+
+        value = build()
+        os.makedirs(self.cache_directory, exist_ok=True)
+        partial_path = _partial_path(path)
+        save(value, partial_path)
+        stored = os.path.exists(path)
+        if not stored:
+            try:
+                os.replace(partial_path, path)
+            except OSError:
+                # A directory cannot replace one stored meanwhile
+                stored = True
+        if stored:
+            # Another process stored the entry while this one built it
+            _remove(partial_path)
+            return load(path)
+        for entry in os.listdir(self.cache_directory):
+            if entry.rsplit("-", 1)[0] == name and entry != os.path.basename(path):
+                _remove(os.path.join(self.cache_directory, entry))
+        return value
+
+    def cache_key(self, name, sources, modules=()):
+        """
+        Key of a cache entry from the content of its sources and code.
+
+        Args:
+            name (str): Name of the value.
+            sources (list[str]): Files the value is built from.
+            modules (list[str]): Modules whose source is part of the key.
+
+        Returns:
+            str: Hex SHA-256 digest.
+        """
+        if self._digests is None:
+            self._digests = self._load_digests()
+        changed = False
+        digests = []
+        for source in map(os.path.abspath, sources):
+            known = self._digests.get(source)
+            digest = file_digest(source, known)
+            if digest != known:
+                self._digests[source] = digest
+                changed = True
+            digests.append(digest["sha256"])
+        if changed:
+            self._save_digests()
+
+        key = {
+            "name": name,
+            "sources": digests,
+            "code": _module_digest([__name__, *modules]),
+        }
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def _load_digests(self):
+        """File digests recorded by previous processes."""
+        path = os.path.join(self.cache_directory, DIGESTS_NAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as file:
+            return json.load(file)
+
+    def _save_digests(self):
+        """Record the file digests for the next process."""
+        os.makedirs(self.cache_directory, exist_ok=True)
+        path = os.path.join(self.cache_directory, DIGESTS_NAME)
+        partial_path = _partial_path(path)
+        with open(partial_path, "w") as file:
+            json.dump(self._digests, file, indent=2)
+        os.replace(partial_path, path)
+
+    def clear(self):
+        """Drop the values held in memory, e.g. after the pipeline ran again."""
+        for name in [
+            "stations",
+            "registry",
+            "lines",
+            "segments",
+            "borders",
+            "graph",
+            "spatial_index",
+        ]:
+            self.__dict__.pop(name, None)
+        self._geojson.clear()
+        self._digests = None
@@ -0,0 +1,139 @@
+"""
+STRtree spatial index over the line segment geometries.
+
+The index projects the segments to a metric CRS once and answers batched queries
+with a single call into GEOS. Its main use is snapping every station to the
+segments of every line it lies on and reporting the station's chainage (km
+position) along those lines, which places the stops of the simulation.
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.scripts.data_preparation import processed_store
+
+# ETRS89 / LAEA Europe: metre units with small distortion across the continent,
+# so distances stay meaningful once networks beyond Switzerland are loaded.
+DEFAULT_METRIC_CRS = "EPSG:3035"
+
+
+class SegmentIndex:
+    """
+    Spatial index over line segments in a metric CRS.
+
+    Attributes:
+        segments (gpd.GeoDataFrame): Segments with ``line_id``, ``segment_start``,
+            ``segment_end`` and their projected geometry.
+        tree (shapely.STRtree): Tree over the projected segment geometries.
+    """
+
+    def __init__(self, segments):
+        """
+        Build the tree over already projected segments.
+
+        Args:
+            segments (gpd.GeoDataFrame): Projected segments, see ``from_segments``.
+        """
+        self.segments = segments.reset_index(drop=True)
+        self.tree = shapely.STRtree(self.segments.geometry.to_numpy())
+
+    @classmethod
+    def from_segments(cls, line_segments, metric_crs=DEFAULT_METRIC_CRS):
+        """
+        Build the index from line segments in any CRS.
+
+        Args:
+            line_segments (gpd.GeoDataFrame): Line segments with ``line_id``,
+                ``segment_start``, ``segment_end`` and a geometry column.
+            metric_crs (str): CRS with metre units to index the segments in.
+
+        Returns:
+            SegmentIndex: The spatial index.
+        """
+        segments = line_segments[
+            ["line_id", "segment_start", "segment_end", line_segments.geometry.name]
+        ]
+        return cls(segments.to_crs(metric_crs))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with ``save``.
+
+        Args:
+            path (str): Path of the GeoParquet file.
+
+        Returns:
+            SegmentIndex: The spatial index.
+        """
+        return cls(processed_store.read_table(path))
+
+    def save(self, path):
+        """
+        Save the projected segments so the index can be rebuilt without reprojecting.
+
+        Args:
+            path (str): Path of the GeoParquet file.
+        """
+        processed_store.write_table(
+            pd.DataFrame(self.segments),
+            path,
+            geometry_column=self.segments.geometry.name,
+            crs=self.segments.crs,
+        )
+
+    def snap_stations(self, stations_info, max_distance=100.0):
+        """
+        Snap all stations to the nearest segment of every line within reach.
+
+        A station near several lines yields one row per line, so the chainage of
+        every station along every line is produced by one batched tree query.
+
+        Args:
+            stations_info (pd.DataFrame): Stations with ``latitude`` and ``longitude``
+                in EPSG:4326.
+            max_distance (float): Largest station-to-track distance in metres.
+
+        Returns:
+            pd.DataFrame: One row per station and line with the station columns,
+            ``line_id``, ``segment`` (row of the indexed segments), ``chainage_km``
+            and ``distance_m``, sorted by ``line_id`` and ``chainage_km``.
+        """
+        points = gpd.points_from_xy(
+            stations_info["longitude"], stations_info["latitude"], crs="EPSG:4326"
+        ).to_crs(self.segments.crs)
+        points = np.asarray(points, dtype=object)
+        geometries = self.segments.geometry.to_numpy()
+
+        station, segment = self.tree.query(
+            points, predicate="dwithin", distance=max_distance
+        )
+        distance = shapely.distance(points[station], geometries[segment])
+        line_id = self.segments["line_id"].to_numpy()[segment]
+
+        # Keep the closest segment of every (station, line) pair
+        order = np.lexsort((distance, line_id, station))
+        station, segment = station[order], segment[order]
+        distance, line_id = distance[order], line_id[order]
+        first = np.r_[
+            True, (station[1:] != station[:-1]) | (line_id[1:] != line_id[:-1])
+        ]
+        station, segment = station[first], segment[first]
+        distance, line_id = distance[first], line_id[first]
+
+        fraction = shapely.line_locate_point(
+            geometries[segment], points[station], normalized=True
+        )
+        segment_start = self.segments["segment_start"].to_numpy()[segment]
+        segment_end = self.segments["segment_end"].to_numpy()[segment]
+
+        snapped = stations_info.iloc[station].reset_index(drop=True)
+        snapped["line_id"] = line_id
+        snapped["segment"] = segment
+        snapped["chainage_km"] = segment_start + fraction * (
+            segment_end - segment_start
+        )
+        snapped["distance_m"] = distance
+        return snapped.sort_values(["line_id", "chainage_km"], ignore_index=True)
@@ -1,66 +1,136 @@
 """
 This module cleans and processes raw railway line CSV data.
 
-The script reads raw CSV data, renames columns to match the dataset schema,
-splits the GeoPoint_2d column into separate latitude and longitude columns, and
-saves the cleaned data to a new CSV file.
+The script streams the raw CSV data in record batches, names the columns to match
+the dataset schema, splits the GeoPoint_2d column into separate latitude and
+longitude columns, and appends every batch to a new GeoParquet file, optionally
+exporting a CSV copy. Memory use is bounded by the batch size, whatever the
+number and size of the raw files.
 """
 
-import pandas as pd
+import os
 
+import pyarrow as pa
 
-def clean_and_process_csv(raw_data_path, processed_data_path):
+from src import instrumentation
+from src.scripts.data_preparation import ingest, processed_store
+from src.scripts.data_preparation.geometry import decode_geo_shapes
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+
+# Column names of linie.csv, in file order
+COLUMN_NAMES = [
+    "line_id",
+    "line_name",
+    "start_opk",
+    "end_opk",
+    "km_start",
+    "km_end",
+    "stationierung_anfang",
+    "stationierung_ende",
+    "geo_shape",
+    "geo_point_2d",
+]
+
+COLUMN_TYPES = {
+    "line_id": pa.int64(),
+    "km_start": pa.float64(),
+    "km_end": pa.float64(),
+    "stationierung_anfang": pa.int64(),
+    "stationierung_ende": pa.int64(),
+}
+
+
+def _split_coordinates(df):
+    """Split the geo_point_2d column into latitude and longitude columns."""
+    df["latitude"], df["longitude"] = ingest.parse_coordinate_pairs(
+        df.pop("geo_point_2d")
+    )
+    return df
+
+
+def _decode_geometries(df):
+    """Replace the GeoJSON geo_shape strings with a geometry column."""
+    df["geometry"] = decode_geo_shapes(df.pop("geo_shape"))
+    return df
+
+
+def _empty_batch():
+    """Raw batch without rows, in the layout of ``ingest.iter_csv_batches``."""
+    schema = pa.schema(
+        [(name, COLUMN_TYPES.get(name, pa.string())) for name in COLUMN_NAMES]
+    )
+    return schema.empty_table().to_pandas()
+
+
+def clean_and_process_csv(
+    raw_data_path,
+    processed_data_path,
+    csv_path=None,
+    block_size=ingest.DEFAULT_BLOCK_SIZE,
+):
     """
     Cleans and processes the raw CSV data.
 
-    This function reads the raw CSV data, renames columns to match the dataset schema,
-    splits the GeoPoint_2d column into separate latitude and longitude columns, and
-    saves the cleaned data to a new CSV file.
+    This function streams the raw CSV data in batches, names the columns to match
+    the dataset schema, splits the GeoPoint_2d column into separate latitude and
+    longitude columns, and appends every batch to a new GeoParquet file whose
+    geometry column replaces the GeoJSON ``geo_shape`` strings. Without any input
+    rows, both files are still written with every column.
 
     Args:
-        raw_data_path (str): The file path of the raw CSV data.
-        processed_data_path (str): The file path where the processed CSV data will be saved.
+        raw_data_path (str or list[str]): The file path of the raw CSV data, or the
+            paths of several raw files with the same layout, e.g. one per country.
+        processed_data_path (str): The file path where the processed GeoParquet data will be saved.
+        csv_path (str, optional): The file path of an optional CSV export.
+        block_size (int): Bytes of raw CSV processed per batch.
 
     Returns:
         None
     """
-    # Load the raw CSV data
-    df = pd.read_csv(raw_data_path, delimiter=";")
-
-    # Rename columns to match the dataset schema
-    df.columns = [
-        "line_id",
-        "line_name",
-        "start_opk",
-        "end_opk",
-        "km_start",
-        "km_end",
-        "stationierung_anfang",
-        "stationierung_ende",
-        "geo_shape",
-        "geo_point_2d",
-    ]
-
-    # Split the geo_point_2d column into separate latitude and longitude columns
-    df[["latitude", "longitude"]] = df["geo_point_2d"].str.split(",", expand=True)
-    df["latitude"] = df["latitude"].astype(float)
-    df["longitude"] = df["longitude"].astype(float)
+    batches = ingest.iter_csv_batches(
+        raw_data_path,
+        COLUMN_NAMES,
+        column_types=COLUMN_TYPES,
+        block_size=block_size,
+    )
+    empty_csv = _split_coordinates(_empty_batch())
+    with processed_store.TableWriter(
+        processed_data_path,
+        geometry_column="geometry",
+        empty=_decode_geometries(empty_csv.copy()),
+    ) as writer:
+        for df in batches:
+            df = _split_coordinates(df)
 
-    # Drop the original geo_point_2d column
-    df = df.drop(columns=["geo_point_2d"])
+            # Append the cleaned batch to the CSV export
+            if csv_path is not None:
+                df.to_csv(
+                    csv_path,
+                    mode="w" if writer.n_rows == 0 else "a",
+                    header=writer.n_rows == 0,
+                    index=False,
+                )
 
-    # Save the cleaned data to a new CSV file
-    df.to_csv(processed_data_path, index=False)
+            # Append the batch with decoded geometries to the GeoParquet file
+            writer.write(_decode_geometries(df))
 
-    print(f"Cleaned data saved to {processed_data_path}")
+    if csv_path is not None and writer.n_rows == 0:
+        empty_csv.to_csv(csv_path, index=False)
 
 
 if __name__ == "__main__":
-    # Define the file paths
-    RAW_DATA_PATH = "C:\\PhD\\Codes\\railway_simulation\\data\\raw\\linie.csv"
-    PROCESSED_DATA_PATH = (
-        "C:\\PhD\\Codes\\railway_simulation\\data\\processed\\linie_cleaned.csv"
+    # Define the file paths under the data root
+    RAW_DATA_PATH = os.path.join(DEFAULT_DATA_ROOT, "raw", "linie.csv")
+    PROCESSED_DATA_PATH = os.path.join(
+        DEFAULT_DATA_ROOT, "processed", "linie_cleaned.parquet"
     )
+    CSV_PATH = os.path.join(DEFAULT_DATA_ROOT, "processed", "linie_cleaned.csv")
 
-    # Execute the cleaning and processing function
-    clean_and_process_csv(RAW_DATA_PATH, PROCESSED_DATA_PATH)
+    # Execute the cleaning and processing function and report its metrics
+    with instrumentation.measure(
+        "clean_linie",
+        inputs=[RAW_DATA_PATH],
+        outputs=[PROCESSED_DATA_PATH, CSV_PATH],
+    ) as record:
+        clean_and_process_csv(RAW_DATA_PATH, PROCESSED_DATA_PATH, CSV_PATH)
+    instrumentation.MetricsWriter("-").write([record])
@@ -0,0 +1,476 @@
+"""
+Multi-country railway dataset partitioned by country and line.
+
+The processed tables are published under a dataset root in a Hive-style layout,
+``<table>/country=<ISO3>/part-0.parquet``, and every partition is written with
+``processed_store`` so its row groups are sorted and cut by ``line_id``. A small
+``catalog.json`` records for every partition its row count, key range and
+bounding box.
+
+``RailwayDataset`` only reads the catalog when it is opened. Queries by country,
+bounding box or line ids first prune the partitions with the catalog, then read
+the remaining ones with row-group filters on the key column, so e.g. a
+cross-border corridor loads the lines of the countries it crosses and nothing
+else. Keys such as ``line_id`` and ``station_id`` are unique within a country
+only; tables read from several countries carry a ``country`` column, and graphs
+built from several countries qualify the station and line keys by country.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.scripts.data_preparation import processed_store
+
+CATALOG_NAME = "catalog.json"
+CATALOG_VERSION = 1
+
+# Processed tables published to the dataset with their geometry and key columns
+DATASET_TABLES = {
+    "linie_cleaned": ("geometry", "line_id"),
+    "lines_info": (None, "line_id"),
+    "line_stations": (None, "line_id"),
+    "line_segments": ("geometry", "line_id"),
+    "stations_info": (None, "station_id"),
+}
+
+# Columns of line_segments and stations_info needed to build the graph
+_GRAPH_SEGMENT_COLUMNS = [
+    "line_id",
+    "track_gauge",
+    "segment_start",
+    "segment_end",
+    "start_station",
+    "end_station",
+]
+_GRAPH_STATION_COLUMNS = ["station_id", "station_abbr", "didok"]
+# Line ids of the i-th country of a dataset are offset by i times this in graphs
+# built from several countries
+COUNTRY_LINE_ID_STRIDE = 10**9
+
+
+def partition_path(table, country):
+    """
+    Return the path of a partition relative to the dataset root.
+
+    Args:
+        table (str): Table name, e.g. ``line_segments``.
+        country (str): ISO 3166-1 alpha-3 country code, e.g. ``CHE``.
+
+    Returns:
+        str: Relative path with forward slashes.
+    """
+    return f"{table}/country={country}/part-0.parquet"
+
+
+def _bbox(df, geometry_column):
+    """Bounding box of the geometries, or of the latitude/longitude columns."""
+    if geometry_column is not None and geometry_column in df.columns:
+        geometries = np.asarray(df[geometry_column], dtype=object)
+        geometries = geometries[~shapely.is_missing(geometries)]
+        if len(geometries) == 0:
+            return None
+        return shapely.total_bounds(geometries).tolist()
+    if {"latitude", "longitude"} <= set(df.columns):
+        latitude = df["latitude"].to_numpy(np.float64)
+        longitude = df["longitude"].to_numpy(np.float64)
+        valid = np.isfinite(latitude) & np.isfinite(longitude)
+        if not valid.any():
+            return None
+        return [
+            float(longitude[valid].min()),
+            float(latitude[valid].min()),
+            float(longitude[valid].max()),
+            float(latitude[valid].max()),
+        ]
+    return None
+
+
+def load_catalog(root):
+    """
+    Load the catalog of a dataset.
+
+    Args:
+        root (str): Dataset root directory.
+
+    Returns:
+        dict: The catalog, with an empty partition list if there is none yet.
+    """
+    path = os.path.join(root, CATALOG_NAME)
+    if not os.path.exists(path):
+        return {"version": CATALOG_VERSION, "partitions": []}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _save_catalog(root, catalog):
+    """Replace the catalog atomically."""
+    path = os.path.join(root, CATALOG_NAME)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(catalog, file, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def write_partition(
+    root, table, country, df, geometry_column=None, key_column="line_id"
+):
+    """
+    Write the rows of one country to its partition of a table and catalog it.
+
+    An existing partition of the same table and country is replaced.
+
+    Args:
+        root (str): Dataset root directory.
+        table (str): Table name.
+        country (str): ISO 3166-1 alpha-3 country code.
+        df (pd.DataFrame): Rows of the partition.
+        geometry_column (str, optional): Name of the shapely geometry column.
+        key_column (str, optional): Column to sort and cut row groups on.
+
+    Returns:
+        dict: The catalog entry of the partition.
+    """
+    relative_path = partition_path(table, country)
+    path = os.path.join(root, *relative_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    processed_store.write_table(
+        df, path, geometry_column=geometry_column, key_column=key_column
+    )
+
+    entry = {
+        "table": table,
+        "country": country,
+        "path": relative_path,
+        "n_rows": len(df),
+        "columns": [str(name) for name in df.columns],
+        "geometry_column": geometry_column,
+        "key_column": key_column if key_column in df.columns else None,
+        "key_min": None,
+        "key_max": None,
+        "bbox": _bbox(df, geometry_column),
+    }
+    if entry["key_column"] is not None and len(df):
+        keys = df[key_column].to_numpy()
+        entry["key_min"], entry["key_max"] = keys.min().item(), keys.max().item()
+
+    catalog = load_catalog(root)
+    catalog["partitions"] = [
+        other
+        for other in catalog["partitions"]
+        if (other["table"], other["country"]) != (table, country)
+    ] + [entry]
+    _save_catalog(root, catalog)
+    return entry
+
+
+def publish_processed(processed_directory, root, country, borders_path=None):
+    """
+    Publish the processed tables of one country to the dataset.
+
+    Args:
+        processed_directory (str): Directory with the processed Parquet tables.
+        root (str): Dataset root directory.
+        country (str): ISO 3166-1 alpha-3 country code.
+        borders_path (str, optional): GeoJSON file with the country's
+            administrative borders, published as the ``borders`` table.
+
+    Returns:
+        list[dict]: The catalog entries of the written partitions.
+    """
+    entries = []
+    for table, (geometry_column, key_column) in DATASET_TABLES.items():
+        df = processed_store.read_table(
+            os.path.join(processed_directory, table + ".parquet"),
+            key_column=key_column,
+        )
+        entries.append(
+            write_partition(root, table, country, df, geometry_column, key_column)
+        )
+    if borders_path is not None:
+        import geopandas as gpd
+
+        borders = gpd.read_file(borders_path)
+        entries.append(
+            write_partition(
+                root,
+                "borders",
+                country,
+                borders,
+                geometry_column=borders.geometry.name,
+                key_column=None,
+            )
+        )
+    return entries
+
+
+def _as_list(values):
+    """Accept a single value or a list of values."""
+    if values is None:
+        return None
+    if isinstance(values, str) or np.isscalar(values):
+        return [values]
+    return list(values)
+
+
+def _qualify_keys(line_segments, stations_info, country, country_index):
+    """Make the station and line keys of one country unique across countries."""
+    line_segments = line_segments.assign(
+        line_id=line_segments["line_id"].to_numpy(np.int64)
+        + country_index * COUNTRY_LINE_ID_STRIDE,
+        start_station=country + ":" + line_segments["start_station"].astype(str),
+        end_station=country + ":" + line_segments["end_station"].astype(str),
+    )
+    stations_info = stations_info.assign(
+        station_abbr=country + ":" + stations_info["station_abbr"].astype(str)
+    )
+    return line_segments, stations_info
+
+
+def _merge_border_stations(line_segments, stations_info):
+    """Give the stations of several countries with one DIDOK number one key."""
+    stations = stations_info.drop_duplicates(subset=["station_abbr"])
+    stations = stations[stations["didok"] > 0]
+    first_key = stations.drop_duplicates(subset=["didok"]).set_index("didok")
+    key_of_abbr = pd.Series(
+        stations["didok"].map(first_key["station_abbr"]).to_numpy(),
+        index=stations["station_abbr"].to_numpy(),
+    )
+
+    def merged(endpoints):
+        keys = endpoints.map(key_of_abbr)
+        return keys.where(keys.notna(), endpoints)
+
+    return line_segments.assign(
+        start_station=merged(line_segments["start_station"]),
+        end_station=merged(line_segments["end_station"]),
+    )
+
+
+def _bbox_overlaps(bbox, other):
+    """Check whether two ``(minx, miny, maxx, maxy)`` boxes intersect."""
+    return (
+        bbox[0] <= other[2]
+        and other[0] <= bbox[2]
+        and bbox[1] <= other[3]
+        and other[1] <= bbox[3]
+    )
+
+
+class RailwayDataset:
+    """
+    Lazy view of a partitioned multi-country dataset.
+
+    Opening the dataset reads the catalog only; tables are read partition by
+    partition when queried.
+
+    Attributes:
+        root (str): Dataset root directory.
+        catalog (dict): The dataset catalog.
+    """
+
+    def __init__(self, root):
+        """
+        Open a dataset.
+
+        Args:
+            root (str): Dataset root directory with a ``catalog.json``.
+
+        Raises:
+            FileNotFoundError: If the root has no catalog.
+        """
+        if not os.path.exists(os.path.join(root, CATALOG_NAME)):
+            raise FileNotFoundError(f"No dataset catalog in {root}")
+        self.root = root
+        self.catalog = load_catalog(root)
+
+    @property
+    def countries(self):
+        """list[str]: Countries with at least one partition."""
+        return sorted({entry["country"] for entry in self.catalog["partitions"]})
+
+    @property
+    def tables(self):
+        """list[str]: Tables with at least one partition."""
+        return sorted({entry["table"] for entry in self.catalog["partitions"]})
+
+    def partitions(self, table, countries=None, bbox=None, line_ids=None):
+        """
+        Select the partitions of a table a query touches.
+
+        Args:
+            table (str): Table name.
+            countries (str or list[str], optional): Countries to keep.
+            bbox (tuple, optional): ``(min_lon, min_lat, max_lon, max_lat)``.
+                Partitions without a bounding box are kept.
+            line_ids (list, optional): Keys to keep; partitions whose key range
+                contains none of them are left out.
+
+        Returns:
+            list[dict]: Catalog entries of the selected partitions.
+        """
+        countries = _as_list(countries)
+        keys = None if line_ids is None else np.asarray(_as_list(line_ids))
+        selected = []
+        for entry in self.catalog["partitions"]:
+            if entry["table"] != table:
+                continue
+            if countries is not None and entry["country"] not in countries:
+                continue
+            if (
+                bbox is not None
+                and entry["bbox"] is not None
+                and not _bbox_overlaps(bbox, entry["bbox"])
+            ):
+                continue
+            if keys is not None and entry["key_column"] is not None:
+                if (
+                    entry["n_rows"] == 0
+                    or not (
+                        (keys >= entry["key_min"]) & (keys <= entry["key_max"])
+                    ).any()
+                ):
+                    continue
+            selected.append(entry)
+        return sorted(selected, key=lambda entry: entry["country"])
+
+    def read(self, table, columns=None, countries=None, bbox=None, line_ids=None):
+        """
+        Read the rows of a table that match a query.
+
+        Only the partitions selected by ``partitions`` are opened, and within
+        them only the row groups that can hold the requested line ids. Rows are
+        filtered by ``bbox`` when the table has a geometry column or latitude and
+        longitude columns.
+
+        Args:
+            table (str): Table name.
+            columns (list[str], optional): Columns to read. Defaults to all.
+            countries (str or list[str], optional): Countries to read.
+            bbox (tuple, optional): ``(min_lon, min_lat, max_lon, max_lat)``.
+            line_ids (list, optional): Values of the table's key column to keep.
+
+        Returns:
+            pd.DataFrame or gpd.GeoDataFrame: The matching rows, with a
+            ``country`` column when several countries are read.
+        """
+        entries = self.partitions(table, countries, bbox, line_ids)
+        frames = []
+        for entry in entries:
+            read_columns = columns
+            spatial_columns = []
+            if columns is not None:
+                if bbox is not None:
+                    # Read the coordinates needed to filter the rows as well
+                    spatial_columns = [
+                        name
+                        for name in [entry["geometry_column"], "latitude", "longitude"]
+                        if name in entry["columns"] and name not in columns
+                    ]
+                read_columns = [
+                    name for name in columns if name in entry["columns"]
+                ] + spatial_columns
+            df = processed_store.read_table(
+                os.path.join(self.root, *entry["path"].split("/")),
+                columns=read_columns,
+                line_ids=None if entry["key_column"] is None else line_ids,
+                key_column=entry["key_column"] or "line_id",
+            )
+            if bbox is not None:
+                df = df[_in_bbox(df, entry["geometry_column"], bbox)]
+            df = df.drop(columns=spatial_columns)
+            if len(entries) > 1:
+                df = df.assign(country=entry["country"])
+            frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        if len(frames) == 1:
+            return frames[0].reset_index(drop=True)
+        return pd.concat(frames, ignore_index=True)
+
+    def graph(self, countries=None, bbox=None, line_ids=None):
+        """
+        Build the railway graph of the lines a query touches.
+
+        Abbreviations and line ids are unique within a country only, so when the
+        lines of several countries are read, the station abbreviations become
+        ``<country>:<abbr>`` and the line ids of the i-th country of the dataset
+        are offset by ``i * COUNTRY_LINE_ID_STRIDE``. Stations of several
+        countries with the same DIDOK number are border stations and join the
+        countries; they keep the key of the first country.
+
+        Args:
+            countries (str or list[str], optional): Countries to include.
+            bbox (tuple, optional): Keep the segments in this bounding box.
+            line_ids (list, optional): Keep the segments of these lines.
+
+        Returns:
+            RailwayGraph: The railway network.
+        """
+        from src.network.graph import build_graph
+
+        segment_countries = [
+            entry["country"]
+            for entry in self.partitions("line_segments", countries, bbox, line_ids)
+        ]
+        if len(segment_countries) <= 1:
+            line_segments = self.read(
+                "line_segments",
+                columns=_GRAPH_SEGMENT_COLUMNS,
+                countries=segment_countries,
+                bbox=bbox,
+                line_ids=line_ids,
+            )
+            stations_info = self.read(
+                "stations_info",
+                columns=_GRAPH_STATION_COLUMNS,
+                countries=segment_countries,
+            )
+            return build_graph(line_segments, stations_info)
+
+        segment_frames = []
+        station_frames = []
+        for country in segment_countries:
+            line_segments, stations_info = _qualify_keys(
+                self.read(
+                    "line_segments",
+                    columns=_GRAPH_SEGMENT_COLUMNS,
+                    countries=country,
+                    bbox=bbox,
+                    line_ids=line_ids,
+                ),
+                self.read(
+                    "stations_info", columns=_GRAPH_STATION_COLUMNS, countries=country
+                ),
+                country,
+                self.countries.index(country),
+            )
+            segment_frames.append(line_segments)
+            station_frames.append(stations_info)
+        stations_info = pd.concat(station_frames, ignore_index=True)
+        line_segments = _merge_border_stations(
+            pd.concat(segment_frames, ignore_index=True), stations_info
+        )
+        return build_graph(line_segments, stations_info)
+
+
+def _in_bbox(df, geometry_column, bbox):
+    """Mask of the rows inside a bounding box, all True without coordinates."""
+    if geometry_column is not None and geometry_column in df.columns:
+        return shapely.intersects(
+            np.asarray(df[geometry_column], dtype=object), shapely.box(*bbox)
+        )
+    if {"latitude", "longitude"} <= set(df.columns):
+        latitude = df["latitude"].to_numpy(np.float64)
+        longitude = df["longitude"].to_numpy(np.float64)
+        return (
+            (longitude >= bbox[0])
+            & (longitude <= bbox[2])
+            & (latitude >= bbox[1])
+            & (latitude <= bbox[3])
+        )
+    return np.ones(len(df), dtype=bool)
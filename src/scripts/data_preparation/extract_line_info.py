@@ -1,9 +1,21 @@
 """
 Script to process and extract line information from a raw CSV file containing railway data.
-This script reads the raw data, processes it, and saves the cleaned data into a new CSV file.
+This script reads the raw data, aggregates it per line and saves the line information and
+the line -> station membership into Parquet files, optionally exporting CSV copies. Line
+lengths are measured on the segment geometries of line_segments, which follow the track;
+the geometries of linie_cleaned are straight chords between the line ends.
 """
 
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+
+from src import instrumentation
+from src.scripts.data_preparation import geometry, ingest, processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+from src.scripts.data_preparation.station_registry import StationRegistry
 
 
 def load_and_clean_data(file_path):
@@ -16,80 +28,168 @@ def load_and_clean_data(file_path):
     Returns:
         pd.DataFrame: Cleaned dataframe.
     """
-    # Read the CSV with the correct delimiter
-    df = pd.read_csv(file_path, delimiter=";")
-
-    # Rename columns for easier access
-    df.columns = [
-        "station_abbr",
-        "stop_name",
-        "line_id",
-        "km",
-        "line_name",
-        "geo_position",
-        "didok",
-        "bpuic",
-        "stop_name_duplicate",
-        "lod",
-        "sloid",
-    ]
-
-    # Convert columns to appropriate data types
-    df = df.astype(
-        {
-            "station_abbr": "string",
-            "stop_name": "string",
-            "line_id": "string",
-            "km": "float32",
-            "line_name": "string",
-            "geo_position": "string",
-            "didok": "int64",
-            "bpuic": "int64",
-            "stop_name_duplicate": "string",
-            "lod": "string",
-            "sloid": "string",
-        }
+    # Read the CSV in batches with the columns renamed and typed
+    df = ingest.read_csv(
+        file_path,
+        [
+            "station_abbr",
+            "stop_name",
+            "line_id",
+            "km",
+            "line_name",
+            "geo_position",
+            "didok",
+            "bpuic",
+            "stop_name_duplicate",
+            "lod",
+            "sloid",
+        ],
+        column_types={
+            "line_id": pa.int64(),
+            "km": pa.float32(),
+            "didok": pa.int64(),
+            "bpuic": pa.int64(),
+        },
     )
     return df
 
 
-def group_and_aggregate_data(df):
+def _ordered_memberships(df):
+    """
+    Order the operating points by line and km and drop repeated stations.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataframe.
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: The ordered rows, one per line and station
+        at its lowest km, and the row offsets where every line starts followed by
+        the number of rows.
+    """
+    line_ids = df["line_id"].to_numpy(np.int64)
+    order = np.lexsort((df["km"].to_numpy(), line_ids))
+    station_codes, station_uniques = pd.factorize(df["station_abbr"])
+    key = line_ids[order] * (len(station_uniques) + 1) + station_codes[order]
+    order = order[~pd.Series(key).duplicated().to_numpy()]
+
+    ordered = df.iloc[order].reset_index(drop=True)
+    sorted_ids = line_ids[order]
+    line_starts = np.r_[0, np.flatnonzero(np.diff(sorted_ids)) + 1, len(order)]
+    return ordered, line_starts
+
+
+def line_stations(df, registry=None):
     """
-    Group by line_id and aggregate station abbreviations and Didok numbers.
+    Build the line -> station membership table.
+
+    Every station appears once per line, at its lowest km position, and the
+    stations of every line are ordered by km.
 
     Args:
         df (pd.DataFrame): Cleaned dataframe.
+        registry (StationRegistry, optional): Registry to refer to stations by
+            ``station_id`` instead of ``station_abbr`` and ``didok``.
 
     Returns:
-        pd.DataFrame: Aggregated dataframe with line information.
+        pd.DataFrame: One row per line and station with ``position`` (order along
+        the line), ``km`` and the station columns, indexed by line_id.
     """
-    lines_info = (
-        df.groupby("line_id")
-        .agg(
-            {
-                "line_name": "first",
-                "km": "sum",
-                "station_abbr": lambda x: ",".join(x.unique()),
-                "didok": lambda x: ",".join(x.astype(str).unique()),
-            }
+    ordered, line_starts = _ordered_memberships(df)
+    counts = np.diff(line_starts)
+    positions = np.arange(len(ordered)) - np.repeat(line_starts[:-1], counts)
+    stations = ordered[["line_id", "km", "station_abbr", "didok"]]
+    if registry is not None:
+        stations = stations[["line_id", "km"]].assign(
+            station_id=registry.ids_of_didok(ordered["didok"])
         )
-        .reset_index()
+    stations.insert(1, "position", positions.astype("int32"))
+    return stations.set_index("line_id")
+
+
+def line_lengths(line_geometries):
+    """
+    Compute the length of every line from its track geometry.
+
+    Args:
+        line_geometries (gpd.GeoDataFrame): Track geometries with a ``line_id``
+            column in EPSG:4326, e.g. ``line_segments``.
+
+    Returns:
+        pd.Series: Length in km, indexed by line_id.
+    """
+    lengths = geometry.geodesic_lengths(line_geometries.geometry.to_numpy())
+    return (
+        pd.Series(lengths, index=line_geometries["line_id"].to_numpy())
+        .groupby(level=0)
+        .sum()
+        .rename("line_length")
     )
 
-    # Rename columns
-    lines_info.columns = [
-        "line_id",
-        "line_name",
-        "line_length",
-        "line_station_abbrs",
-        "line_station_didoks",
-    ]
-
-    # Set line_id as index
-    lines_info = lines_info.set_index("line_id")
+
+def group_and_aggregate_data(df, line_geometries=None, registry=None):
+    """
+    Aggregate the operating points of every line into one row per line.
+
+    The operating points are sorted by line and km once; every aggregate is then
+    read at the first or last row of each line, so all lines are aggregated with
+    a few array operations. The stations of a line are not joined into strings;
+    they are in the table returned by ``line_stations``.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataframe.
+        line_geometries (gpd.GeoDataFrame, optional): Track geometries with a
+            ``line_id`` column to measure the line lengths on, e.g.
+            ``line_segments``.
+        registry (StationRegistry, optional): Registry to refer to the first and
+            last station by ``first_station_id`` and ``last_station_id``.
+
+    Returns:
+        pd.DataFrame: Line information indexed by line_id with ``line_name``,
+        ``km_start`` and ``km_end`` of the first and last station, ``n_stations``,
+        ``first_station``, ``last_station`` and ``line_length`` in km from the
+        geometry, or from the km range for lines without geometry.
+    """
+    ordered, line_starts = _ordered_memberships(df)
+    first, last = line_starts[:-1], line_starts[1:] - 1
+
+    # Rows are ordered by km within every line, so every aggregate is a gather
+    # at the first or last row of the line
+    lines_info = pd.DataFrame(
+        {
+            "line_name": ordered["line_name"].to_numpy()[first],
+            "km_start": ordered["km"].to_numpy()[first],
+            "km_end": ordered["km"].to_numpy()[last],
+            "n_stations": np.diff(line_starts),
+            "first_station": ordered["station_abbr"].to_numpy()[first],
+            "last_station": ordered["station_abbr"].to_numpy()[last],
+        },
+        index=pd.Index(ordered["line_id"].to_numpy()[first], name="line_id"),
+    )
+    if registry is not None:
+        didok = ordered["didok"].to_numpy()
+        lines_info = lines_info.drop(columns=["first_station", "last_station"])
+        lines_info["first_station_id"] = registry.ids_of_didok(didok[first])
+        lines_info["last_station_id"] = registry.ids_of_didok(didok[last])
+    km_range = (lines_info["km_end"] - lines_info["km_start"]).to_numpy(np.float64)
+    if line_geometries is None:
+        lines_info["line_length"] = km_range
+    else:
+        lengths = line_lengths(line_geometries).reindex(lines_info.index).to_numpy()
+        lines_info["line_length"] = np.where(np.isnan(lengths), km_range, lengths)
     return lines_info
 
 
+def save_to_parquet(df, output_path):
+    """
+    Save the dataframe to a Parquet file.
+
+    Args:
+        df (pd.DataFrame): Dataframe indexed by line_id to be saved.
+        output_path (str): Path to save the Parquet file.
+    """
+    processed_store.write_table(df.reset_index(), output_path)
+
+
 def save_to_csv(df, output_path):
     """
     Save the dataframe to a CSV file.
@@ -99,34 +199,45 @@ def save_to_csv(df, output_path):
         output_path (str): Path to save the CSV file.
     """
     df.to_csv(output_path, index=True)
-    print(f"Cleaned data saved to {output_path}")
 
 
 def main():
-    # Define file paths
-    raw_data_path = (
-        r"C:\PhD\Codes\railway_simulation\data\raw\linie-mit-betriebspunkten.csv"
-    )
-    processed_data_path = (
-        r"C:\PhD\Codes\railway_simulation\data\processed\lines_info.csv"
+    # Define file paths under the data root
+    raw_data_path = os.path.join(
+        DEFAULT_DATA_ROOT, "raw", "linie-mit-betriebspunkten.csv"
     )
+    processed = os.path.join(DEFAULT_DATA_ROOT, "processed")
+    line_segments_path = os.path.join(processed, "line_segments.parquet")
+    processed_data_path = os.path.join(processed, "lines_info.parquet")
+    line_stations_path = os.path.join(processed, "line_stations.parquet")
+    stations_info_path = os.path.join(processed, "stations_info.parquet")
+    csv_path = os.path.join(processed, "lines_info.csv")
+
+    with instrumentation.measure(
+        "line_info",
+        inputs=[raw_data_path, line_segments_path, stations_info_path],
+        outputs=[processed_data_path, line_stations_path, csv_path],
+    ) as record:
+        # Load and clean data
+        station_data = load_and_clean_data(raw_data_path)
+        line_geometries = processed_store.read_table(
+            line_segments_path, columns=["line_id", "geometry"]
+        )
 
-    # Load and clean data
-    station_data = load_and_clean_data(raw_data_path)
-
-    # Group and aggregate data
-    lines_info = group_and_aggregate_data(station_data)
+        registry = StationRegistry.load(stations_info_path)
 
-    # Display the transformed information
-    print(lines_info.head())
+        # Group and aggregate data
+        lines_info = group_and_aggregate_data(station_data, line_geometries, registry)
+        stations = line_stations(station_data, registry)
 
-    # Save the cleaned data to a new CSV file
-    save_to_csv(lines_info, processed_data_path)
+        # Save the tables to Parquet files and export a CSV copy
+        save_to_parquet(lines_info, processed_data_path)
+        save_to_parquet(stations, line_stations_path)
+        save_to_csv(lines_info, csv_path)
 
-    # Print summary information
-    print(f"Number of unique lines: {len(lines_info)}")
-    print(lines_info.info())
-    print(f"Total number of rows in the dataframe: {len(lines_info)}")
+    # Report the metrics with the number of lines and memberships
+    record.update(lines=len(lines_info), line_stations=len(stations))
+    instrumentation.MetricsWriter("-").write([record])
 
 
 if __name__ == "__main__":
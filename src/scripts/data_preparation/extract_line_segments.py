@@ -1,11 +1,18 @@
 """
 Script to extract and process line segments from the linie-mit-polygon dataset.
-This script reads the raw data, processes it, and saves the cleaned data into CSV and GeoJSON files.
+This script reads the raw data, processes it, and saves the cleaned data into a GeoParquet
+file, optionally exporting CSV and GeoJSON copies.
 """
 
-import geopandas as gpd
-import pandas as pd
-from shapely.geometry import shape
+import os
+
+import pyarrow as pa
+
+from src import instrumentation
+from src.scripts.data_preparation import ingest, processed_store
+from src.scripts.data_preparation.geometry import decode_geo_shapes
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+from src.scripts.data_preparation.station_registry import StationRegistry
 
 
 def load_and_clean_data(file_path):
@@ -18,27 +25,23 @@ def load_and_clean_data(file_path):
     Returns:
         pd.DataFrame: Cleaned dataframe.
     """
-    # Read the CSV with the correct delimiter
-    line_data = pd.read_csv(file_path, delimiter=";")
-
-    # Rename columns for easier access (if needed)
-    line_data.columns = [
-        "geo_point_2d",
-        "geo_shape",
-        "track_gauge",
-        "segment_start",
-        "segment_end",
-        "start_station",
-        "start_station_name",
-        "end_station",
-        "end_station_name",
-        "line_id",
-        "line_name",
-    ]
-
-    # Extract relevant columns
-    line_segments = line_data[
+    # Read the relevant columns of the CSV in batches, renamed for easier access
+    line_segments = ingest.read_csv(
+        file_path,
         [
+            "geo_point_2d",
+            "geo_shape",
+            "track_gauge",
+            "segment_start",
+            "segment_end",
+            "start_station",
+            "start_station_name",
+            "end_station",
+            "end_station_name",
+            "line_id",
+            "line_name",
+        ],
+        columns=[
             "line_id",
             "line_name",
             "track_gauge",
@@ -47,14 +50,17 @@ def load_and_clean_data(file_path):
             "geo_shape",
             "start_station",
             "end_station",
-        ]
-    ].copy()
+        ],
+        column_types={
+            "segment_start": pa.float64(),
+            "segment_end": pa.float64(),
+            "line_id": pa.int64(),
+        },
+    )
 
     # Convert to appropriate data types
     line_segments["track_gauge"] = line_segments["track_gauge"].astype("category")
-    line_segments["geometry"] = line_segments["geo_shape"].apply(
-        lambda x: shape(eval(x))
-    )
+    line_segments["geometry"] = decode_geo_shapes(line_segments["geo_shape"])
 
     # Sort by line_id and segment_start
     line_segments = line_segments.sort_values(by=["line_id", "segment_start"])
@@ -62,31 +68,72 @@ def load_and_clean_data(file_path):
     return line_segments
 
 
-def save_to_files(line_segments, csv_path, geojson_path):
+def add_station_ids(line_segments, registry):
+    """
+    Add the station ids of the segment end points.
+
+    Operating points without a DIDOK number, such as junctions, get -1.
+
+    Args:
+        line_segments (pd.DataFrame): Line segments with ``start_station`` and
+            ``end_station`` abbreviations.
+        registry (StationRegistry): The station registry.
+
+    Returns:
+        pd.DataFrame: The line segments with ``start_station_id`` and
+        ``end_station_id`` columns.
+    """
+    return line_segments.assign(
+        start_station_id=registry.ids_of_abbr(line_segments["start_station"]),
+        end_station_id=registry.ids_of_abbr(line_segments["end_station"]),
+    )
+
+
+def save_to_files(line_segments, parquet_path, csv_path=None, geojson_path=None):
     """
-    Save the line segments to CSV and GeoJSON files.
+    Save the line segments to a GeoParquet file and optional CSV and GeoJSON exports.
+
+    The GeoParquet file stores the geometry as WKB and drops the redundant
+    ``geo_shape`` text column.
 
     Args:
         line_segments (pd.DataFrame): DataFrame containing the line segments.
-        csv_path (str): Path to save the CSV file.
-        geojson_path (str): Path to save the GeoJSON file.
+        parquet_path (str): Path to save the GeoParquet file.
+        csv_path (str, optional): Path to export a CSV file.
+        geojson_path (str, optional): Path to export a GeoJSON file.
     """
-    # Save to CSV
-    line_segments.to_csv(csv_path, index=False)
+    # Save to GeoParquet
+    processed_store.write_table(
+        line_segments.drop(columns=["geo_shape"]),
+        parquet_path,
+        geometry_column="geometry",
+    )
 
-    # Save to GeoJSON
-    gdf = gpd.GeoDataFrame(line_segments, geometry="geometry", crs="EPSG:4326")
-    gdf.to_file(geojson_path, driver="GeoJSON")
+    # Export to CSV
+    if csv_path is not None:
+        line_segments.to_csv(csv_path, index=False)
 
+    # Export to GeoJSON
+    if geojson_path is not None:
+        # GeoPandas is only needed for this export and slow to import
+        import geopandas as gpd
 
-def print_line_info(line_segments):
+        gdf = gpd.GeoDataFrame(line_segments, geometry="geometry", crs="EPSG:4326")
+        gdf.to_file(geojson_path, driver="GeoJSON")
+
+
+def line_summary(line_segments):
     """
-    Print detailed information about the line segments.
+    Summarize the segments of every line.
 
     Args:
         line_segments (pd.DataFrame): DataFrame containing the line segments.
+
+    Returns:
+        pd.DataFrame: One row per ``line_id`` with its ``segments_count`` and its
+        ``start_km`` and ``end_km``.
     """
-    line_info = (
+    return (
         line_segments.groupby("line_id")
         .agg(
             segments_count=("line_id", "count"),
@@ -96,39 +143,38 @@ def print_line_info(line_segments):
         .reset_index()
     )
 
-    print("\nLine Segment Information:")
-    print(line_info)
 
-    # Print detailed information
-    for _, row in line_info.iterrows():
-        print(
-            f"Line ID: {row['line_id']}, Segments: {row['segments_count']}, Start KM: {row['start_km']}, End KM: {row['end_km']}"
+if __name__ == "__main__":
+    # File paths under the data root
+    raw_data_path = os.path.join(DEFAULT_DATA_ROOT, "raw", "linie-mit-polygon.csv")
+    processed = os.path.join(DEFAULT_DATA_ROOT, "processed")
+    processed_parquet_path = os.path.join(processed, "line_segments.parquet")
+    processed_csv_path = os.path.join(processed, "line_segments.csv")
+    processed_geojson_path = os.path.join(processed, "line_segments.geojson")
+    stations_info_path = os.path.join(processed, "stations_info.parquet")
+
+    with instrumentation.measure(
+        "line_segments",
+        inputs=[raw_data_path, stations_info_path],
+        outputs=[processed_parquet_path, processed_csv_path, processed_geojson_path],
+    ) as record:
+        # Load and clean data, referring to the stations by their registry id
+        line_segments = load_and_clean_data(raw_data_path)
+        line_segments = add_station_ids(
+            line_segments, StationRegistry.load(stations_info_path)
         )
 
+        # Save cleaned data to files
+        save_to_files(
+            line_segments,
+            processed_parquet_path,
+            processed_csv_path,
+            processed_geojson_path,
+        )
 
-if __name__ == "__main__":
-    # File paths
-    raw_data_path = r"C:\PhD\Codes\railway_simulation\data\raw\linie-mit-polygon.csv"
-    processed_csv_path = (
-        r"C:\PhD\Codes\railway_simulation\data\processed\line_segments.csv"
-    )
-    processed_geojson_path = (
-        r"C:\PhD\Codes\railway_simulation\data\processed\line_segments.geojson"
+    # Report the metrics with the number of lines and their longest one
+    summary = line_summary(line_segments)
+    record.update(
+        lines=len(summary), max_segments_per_line=int(summary["segments_count"].max())
     )
-
-    # Load and clean data
-    line_segments = load_and_clean_data(raw_data_path)
-
-    # Save cleaned data to files
-    save_to_files(line_segments, processed_csv_path, processed_geojson_path)
-
-    print(f"Line segments saved to {processed_csv_path} and {processed_geojson_path}")
-
-    # Print additional line segment details
-    print_line_info(line_segments)
-
-    # Count the number of unique line IDs
-    unique_line_ids_count = line_segments["line_id"].nunique()
-
-    # Print the number of unique line IDs
-    print(f"\nNumber of unique line IDs: {unique_line_ids_count}")
+    instrumentation.MetricsWriter("-").write([record])
@@ -1,9 +1,33 @@
 """
 Script to clean and process station information from the linie-mit-betriebspunkten dataset.
-This script reads the raw data, processes it, and saves the cleaned data into a CSV file.
+This script reads the raw data, processes it, and saves the cleaned data into a Parquet file,
+optionally exporting a CSV copy.
 """
 
+import os
+
 import pandas as pd
+import pyarrow as pa
+
+from src import instrumentation
+from src.scripts.data_preparation import ingest, processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+from src.scripts.data_preparation.station_registry import StationRegistry
+
+# Column names of linie-mit-betriebspunkten.csv, in file order
+COLUMN_NAMES = [
+    "station_abbr",
+    "stop_name",
+    "line",
+    "km",
+    "line_name",
+    "geo_position",
+    "didok",
+    "bpuic",
+    "stop_name_duplicate",
+    "lod",
+    "sloid",
+]
 
 
 def load_and_clean_data(file_path):
@@ -14,65 +38,52 @@ def load_and_clean_data(file_path):
         file_path (str): Path to the raw CSV file.
 
     Returns:
-        pd.DataFrame: Cleaned dataframe.
+        pd.DataFrame: Cleaned dataframe, one row per DIDOK number with its dense
+        ``station_id`` (see ``StationRegistry``).
     """
-    # Read the CSV with the correct delimiter
-    station_data = pd.read_csv(file_path, delimiter=";")
-
-    # Rename columns for easier access
-    station_data.columns = [
-        "station_abbr",
-        "stop_name",
-        "line",
-        "km",
-        "line_name",
-        "geo_position",
-        "didok",
-        "bpuic",
-        "stop_name_duplicate",
-        "lod",
-        "sloid",
-    ]
-
-    # Convert columns to appropriate data types
-    station_data = station_data.astype(
-        {
-            "station_abbr": "string",
-            "stop_name": "string",
-            "line": "int32",
-            "km": "float32",
-            "line_name": "string",
-            "geo_position": "string",
-            "didok": "int64",
-            "bpuic": "int64",
-            "stop_name_duplicate": "string",
-            "lod": "string",
-            "sloid": "string",
-        }
-    )
-
-    # Extract relevant information
-    stations_info_df = station_data[
-        ["station_abbr", "stop_name", "geo_position", "didok", "bpuic", "sloid"]
-    ].copy()
+    # Stream the station columns only and keep the first row of every Didok
+    # number per batch, so memory grows with the number of stations, not rows
+    batches = []
+    for batch in ingest.iter_csv_batches(
+        file_path,
+        COLUMN_NAMES,
+        columns=[
+            "station_abbr",
+            "stop_name",
+            "geo_position",
+            "didok",
+            "bpuic",
+            "sloid",
+        ],
+        column_types={"didok": pa.int64(), "bpuic": pa.int64()},
+    ):
+        batch = batch.drop_duplicates("didok")
+
+        # Split geo_position into latitude and longitude
+        batch["latitude"], batch["longitude"] = ingest.parse_coordinate_pairs(
+            batch.pop("geo_position")
+        )
+        batches.append(batch)
+    stations_info_df = pd.concat(batches, ignore_index=True)
+
+    # Keep one row per Didok number and assign the dense station ids
+    registry = StationRegistry.from_stations_info(stations_info_df)
+
+    return registry.to_frame()
+
+
+def save_to_parquet(stations_info_df, processed_data_path):
+    """
+    Save the cleaned data to a new Parquet file.
 
-    # Split geo_position into latitude and longitude
-    stations_info_df[["latitude", "longitude"]] = (
-        stations_info_df["geo_position"].str.strip("[]").str.split(",", expand=True)
+    Args:
+        stations_info_df (pd.DataFrame): DataFrame containing the station information.
+        processed_data_path (str): Path to save the Parquet file.
+    """
+    processed_store.write_table(
+        stations_info_df, processed_data_path, key_column="station_id"
     )
 
-    # Convert latitude and longitude to float
-    stations_info_df["latitude"] = stations_info_df["latitude"].astype(float)
-    stations_info_df["longitude"] = stations_info_df["longitude"].astype(float)
-
-    # Drop the original geo_position column
-    stations_info_df = stations_info_df.drop(columns=["geo_position"])
-
-    # Filter out rows with non-unique Didok numbers
-    stations_info_df = stations_info_df.drop_duplicates(subset=["didok"])
-
-    return stations_info_df
-
 
 def save_to_csv(stations_info_df, processed_data_path):
     """
@@ -83,41 +94,49 @@ def save_to_csv(stations_info_df, processed_data_path):
         processed_data_path (str): Path to save the CSV file.
     """
     stations_info_df.to_csv(processed_data_path, index=False)
-    print(f"Cleaned data saved to {processed_data_path}")
 
 
-def print_summary(stations_info_df):
+def summarize(stations_info_df):
     """
-    Print summary information about the cleaned data.
+    Count the stations and their distinct identifiers.
 
     Args:
         stations_info_df (pd.DataFrame): DataFrame containing the station information.
-    """
-    print(f"Number of unique Didok numbers: {stations_info_df['didok'].nunique()}")
-    print(
-        f"Number of unique station abbreviations: {stations_info_df['station_abbr'].nunique()}"
-    )
-    print(f"Number of unique station names: {stations_info_df['stop_name'].nunique()}")
-    print(stations_info_df.info())
 
-    # Print total number of rows
-    print(f"Total number of rows in the dataframe: {len(stations_info_df)}")
+    Returns:
+        dict: Number of ``stations`` and of distinct ``didok_numbers``,
+        ``station_abbreviations`` and ``station_names``.
+    """
+    return {
+        "stations": len(stations_info_df),
+        "didok_numbers": int(stations_info_df["didok"].nunique()),
+        "station_abbreviations": int(stations_info_df["station_abbr"].nunique()),
+        "station_names": int(stations_info_df["stop_name"].nunique()),
+    }
 
 
 if __name__ == "__main__":
-    # File paths
-    RAW_DATA_PATH = (
-        r"C:\PhD\Codes\railway_simulation\data\raw\linie-mit-betriebspunkten.csv"
+    # File paths under the data root
+    RAW_DATA_PATH = os.path.join(
+        DEFAULT_DATA_ROOT, "raw", "linie-mit-betriebspunkten.csv"
     )
-    PROCESSED_DATA_PATH = (
-        r"C:\PhD\Codes\railway_simulation\data\processed\stations_info.csv"
+    PROCESSED_DATA_PATH = os.path.join(
+        DEFAULT_DATA_ROOT, "processed", "stations_info.parquet"
     )
-
-    # Load and clean data
-    stations_info_df = load_and_clean_data(RAW_DATA_PATH)
-
-    # Save cleaned data to CSV
-    save_to_csv(stations_info_df, PROCESSED_DATA_PATH)
-
-    # Print summary information
-    print_summary(stations_info_df)
+    CSV_PATH = os.path.join(DEFAULT_DATA_ROOT, "processed", "stations_info.csv")
+
+    with instrumentation.measure(
+        "stations_info",
+        inputs=[RAW_DATA_PATH],
+        outputs=[PROCESSED_DATA_PATH, CSV_PATH],
+    ) as record:
+        # Load and clean data
+        stations_info_df = load_and_clean_data(RAW_DATA_PATH)
+
+        # Save cleaned data to Parquet and export a CSV copy
+        save_to_parquet(stations_info_df, PROCESSED_DATA_PATH)
+        save_to_csv(stations_info_df, CSV_PATH)
+
+    # Report the metrics with the summary of the stations
+    record.update(summarize(stations_info_df))
+    instrumentation.MetricsWriter("-").write([record])
@@ -0,0 +1,79 @@
+"""
+Bulk decoding and measuring of the geometry columns of the open-data files.
+
+Both ``linie-mit-polygon.csv`` and ``linie_cleaned.csv`` carry their geometries as
+GeoJSON strings in a ``geo_shape`` column. This module parses a whole column in
+one vectorized pass through GEOS instead of evaluating every string with Python,
+and measures the lengths of whole geometry arrays at once.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def decode_geo_shapes(values, chunk_size=None):
+    """
+    Decode a column of GeoJSON geometry strings into a shapely geometry array.
+
+    Missing values decode to None. Strings that are not valid GeoJSON raise an
+    error instead of being executed, unlike the former ``shape(eval(x))``.
+
+    Args:
+        values (array-like): GeoJSON geometry strings, e.g. a ``geo_shape`` column.
+        chunk_size (int, optional): Number of strings decoded per GEOS call. Bounds
+            the temporary memory used while parsing very large columns.
+
+    Returns:
+        np.ndarray: Object array of shapely geometries, aligned with ``values``.
+
+    Raises:
+        shapely.errors.GEOSException: If a string is not a valid GeoJSON geometry.
+    """
+    values = np.asarray(values, dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values = values.copy()
+        values[missing] = None
+
+    if chunk_size is None or chunk_size >= len(values):
+        return shapely.from_geojson(values, on_invalid="raise")
+
+    geometries = np.empty(len(values), dtype=object)
+    for start in range(0, len(values), chunk_size):
+        stop = start + chunk_size
+        geometries[start:stop] = shapely.from_geojson(
+            values[start:stop], on_invalid="raise"
+        )
+    return geometries
+
+
+def geodesic_lengths(geometries):
+    """
+    Measure the great-circle length of line geometries in EPSG:4326.
+
+    All vertices are extracted in one call and the haversine distances between
+    consecutive vertices are summed per geometry, so no projection is needed.
+
+    Args:
+        geometries (array-like): Shapely (multi)line geometries in lon/lat.
+
+    Returns:
+        np.ndarray: Length of every geometry in km, 0 for missing geometries.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    coordinates, index = shapely.get_coordinates(geometries, return_index=True)
+    # Parts of multi-geometries must not be joined, so split at part boundaries
+    parts = shapely.get_parts(geometries)
+    _, part_index = shapely.get_coordinates(parts, return_index=True)
+
+    lon, lat = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    a = (
+        np.sin((lat[1:] - lat[:-1]) / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin((lon[1:] - lon[:-1]) / 2) ** 2
+    )
+    step = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    step[part_index[1:] != part_index[:-1]] = 0.0
+    return np.bincount(index[1:], weights=step, minlength=len(geometries))
@@ -0,0 +1,142 @@
+"""
+Streaming ingestion of the raw open-data CSV files.
+
+The raw files are read with the multithreaded pyarrow CSV reader in record batches
+of a bounded size, so the memory a loader needs depends on the block size and the
+columns it keeps, not on the size of the files or on how many of them (e.g. one
+per country) are loaded. Columns are named by position, as the raw headers repeat
+names and contain line breaks, and coordinate pairs such as ``"47.3, 8.7"`` are
+parsed with vectorized Arrow kernels instead of splitting Python strings.
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+
+from src import instrumentation
+
+# Bytes of CSV parsed per record batch
+DEFAULT_BLOCK_SIZE = 8 << 20
+
+
+def _paths(paths):
+    """Accept a single path or a list of paths."""
+    return [paths] if isinstance(paths, str) else list(paths)
+
+
+def _open_csv(path, column_names, columns, column_types, block_size, delimiter):
+    """Open a streaming reader over a raw CSV file, skipping its header."""
+    return csv.open_csv(
+        path,
+        read_options=csv.ReadOptions(
+            use_threads=True,
+            block_size=block_size,
+            column_names=column_names,
+            skip_rows_after_names=1,
+        ),
+        parse_options=csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+        convert_options=csv.ConvertOptions(
+            column_types=column_types or {},
+            include_columns=columns or column_names,
+        ),
+    )
+
+
+def iter_record_batches(
+    paths,
+    column_names,
+    columns=None,
+    column_types=None,
+    block_size=DEFAULT_BLOCK_SIZE,
+    delimiter=";",
+):
+    """
+    Stream raw CSV files as Arrow record batches.
+
+    Args:
+        paths (str or list[str]): Raw CSV files with the same layout.
+        column_names (list[str]): Names given to the columns, in file order.
+        columns (list[str], optional): Columns to keep. Defaults to all columns.
+        column_types (dict, optional): Arrow type of columns by name; the types of
+            the other columns are inferred.
+        block_size (int): Bytes of CSV parsed per batch.
+        delimiter (str): Field delimiter.
+
+    Yields:
+        pa.RecordBatch: The next batch of rows.
+    """
+    for path in _paths(paths):
+        reader = _open_csv(
+            path, column_names, columns, column_types, block_size, delimiter
+        )
+        for batch in reader:
+            if batch.num_rows:
+                instrumentation.count(rows_in=batch.num_rows)
+                yield batch
+
+
+def iter_csv_batches(paths, column_names, **options):
+    """
+    Stream raw CSV files as DataFrames of a bounded number of rows.
+
+    Args:
+        paths (str or list[str]): Raw CSV files with the same layout.
+        column_names (list[str]): Names given to the columns, in file order.
+        **options: Options of ``iter_record_batches``.
+
+    Yields:
+        pd.DataFrame: The next batch of rows.
+    """
+    for batch in iter_record_batches(paths, column_names, **options):
+        yield batch.to_pandas()
+
+
+def read_csv(paths, column_names, **options):
+    """
+    Read the selected columns of raw CSV files into one DataFrame.
+
+    The files are parsed batch by batch and only the selected columns are kept,
+    so no copy of the whole file text is ever held in memory.
+
+    Args:
+        paths (str or list[str]): Raw CSV files with the same layout.
+        column_names (list[str]): Names given to the columns, in file order.
+        **options: Options of ``iter_record_batches``.
+
+    Returns:
+        pd.DataFrame: The rows of all files.
+    """
+    batches = list(iter_record_batches(paths, column_names, **options))
+    if not batches:
+        columns = options.get("columns") or column_names
+        return pa.table(
+            {name: pa.array([], pa.string()) for name in columns}
+        ).to_pandas()
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+def parse_coordinate_pairs(values):
+    """
+    Parse ``"latitude, longitude"`` strings, optionally in square brackets.
+
+    Args:
+        values (array-like or pa.Array): The coordinate strings.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Latitudes and longitudes, NaN for missing
+        or incomplete pairs.
+    """
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)):
+        values = pa.array(np.asarray(values, dtype=object), from_pandas=True)
+    values = pc.utf8_trim(values.cast(pa.string()), "[] ")
+    parts = pc.split_pattern(values, ",", max_splits=1)
+    complete = pc.fill_null(pc.equal(pc.list_value_length(parts), 2), False)
+    parts = pc.if_else(complete, parts, pa.scalar(None, parts.type))
+
+    def element(index):
+        numbers = pc.utf8_trim_whitespace(pc.list_element(parts, index))
+        numbers = pc.cast(numbers, pa.float64())
+        return pc.fill_null(numbers, np.nan).to_numpy()
+
+    return element(0), element(1)
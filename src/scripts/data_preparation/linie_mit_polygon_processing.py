@@ -1,10 +1,30 @@
 """
 Script to process railway line data from CSV and GeoJSON formats.
-This script extracts specific columns and saves the processed data into new CSV and GeoJSON files.
+This script extracts specific columns and saves the processed data into new GeoParquet files,
+optionally exporting CSV and GeoJSON copies.
 """
 
-import geopandas as gpd
-import pandas as pd
+import os
+
+from src import instrumentation
+from src.scripts.data_preparation import ingest, processed_store
+from src.scripts.data_preparation.geometry import decode_geo_shapes
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+
+# Column names of linie-mit-polygon.csv, in file order
+CSV_COLUMN_NAMES = [
+    "Geo point",
+    "Geo shape",
+    "TRACK GAUGE",
+    "KM START",
+    "KM END",
+    "START OPK",
+    "START NAME",
+    "END OPK",
+    "END NAME",
+    "Linie",
+    "Line",
+]
 
 
 def load_and_process_csv(file_path):
@@ -17,15 +37,11 @@ def load_and_process_csv(file_path):
     Returns:
         pd.DataFrame: Processed DataFrame.
     """
-    data_csv = pd.read_csv(file_path, delimiter=";")
-    print("CSV Data:")
-    print(data_csv.head())
-
-    lines_info_csv = data_csv[
-        ["Linie", "Line", "TRACK GAUGE", "Geo point", "Geo shape"]
-    ]
-    print("Extracted CSV Data:")
-    print(lines_info_csv.head())
+    lines_info_csv = ingest.read_csv(
+        file_path,
+        CSV_COLUMN_NAMES,
+        columns=["Linie", "Line", "TRACK GAUGE", "Geo point", "Geo shape"],
+    )
 
     return lines_info_csv
 
@@ -40,15 +56,33 @@ def load_and_process_geojson(file_path):
     Returns:
         gpd.GeoDataFrame: Processed GeoDataFrame.
     """
+    # GeoPandas is only needed for this file and slow to import
+    import geopandas as gpd
+
     data_geojson = gpd.read_file(file_path)
-    print("GeoJSON Data:")
-    print(data_geojson.head())
+    instrumentation.count(rows_in=len(data_geojson))
+
+    return data_geojson[["linienr", "liniename", "spurweite", "geometry"]]
+
+
+def save_to_parquet(data, file_path, key_column):
+    """
+    Save DataFrame or GeoDataFrame to a (Geo)Parquet file.
 
-    lines_info_geojson = data_geojson[["linienr", "liniename", "spurweite", "geometry"]]
-    print("Extracted GeoJSON Data:")
-    print(lines_info_geojson.head())
+    A GeoJSON ``Geo shape`` column is decoded and stored as the geometry column.
 
-    return lines_info_geojson
+    Args:
+        data (pd.DataFrame): Data to save.
+        file_path (str): Path to save the Parquet file.
+        key_column (str): Line number column to sort the rows by.
+    """
+    if "Geo shape" in data.columns:
+        data = data.assign(geometry=decode_geo_shapes(data["Geo shape"]))
+        data = data.drop(columns=["Geo shape"])
+    geometry_column = "geometry" if "geometry" in data.columns else None
+    processed_store.write_table(
+        data, file_path, geometry_column=geometry_column, key_column=key_column
+    )
 
 
 def save_to_csv(data, file_path):
@@ -60,7 +94,6 @@ def save_to_csv(data, file_path):
         file_path (str): Path to save the CSV file.
     """
     data.to_csv(file_path, index=False)
-    print(f"Data saved to {file_path}")
 
 
 def save_to_geojson(data, file_path):
@@ -72,26 +105,37 @@ def save_to_geojson(data, file_path):
         file_path (str): Path to save the GeoJSON file.
     """
     data.to_file(file_path, driver="GeoJSON")
-    print(f"Data saved to {file_path}")
 
 
 if __name__ == "__main__":
-    # File paths to the data
-    FILE_PATH_CSV = "C:/PhD/Codes/railway_simulation/data/raw/linie-mit-polygon.csv"
-    FILE_PATH_GEOJSON = (
-        "C:/PhD/Codes/railway_simulation/data/raw/linie-mit-polygon.geojson"
+    # File paths to the data under the data root
+    FILE_PATH_CSV = os.path.join(DEFAULT_DATA_ROOT, "raw", "linie-mit-polygon.csv")
+    FILE_PATH_GEOJSON = os.path.join(
+        DEFAULT_DATA_ROOT, "raw", "linie-mit-polygon.geojson"
     )
 
-    # Process CSV data
-    lines_info_csv = load_and_process_csv(FILE_PATH_CSV)
-    save_to_csv(
-        lines_info_csv,
-        "C:/PhD/Codes/railway_simulation/data/processed/lines_info_csv.csv",
-    )
+    PROCESSED_DIRECTORY = os.path.join(DEFAULT_DATA_ROOT, "processed")
+    CSV_OUTPUTS = [
+        os.path.join(PROCESSED_DIRECTORY, "lines_info_csv.parquet"),
+        os.path.join(PROCESSED_DIRECTORY, "lines_info_csv.csv"),
+    ]
+    GEOJSON_OUTPUTS = [
+        os.path.join(PROCESSED_DIRECTORY, "lines_info_geojson.parquet"),
+        os.path.join(PROCESSED_DIRECTORY, "lines_info_geojson.geojson"),
+    ]
 
-    # Process GeoJSON data
-    lines_info_geojson = load_and_process_geojson(FILE_PATH_GEOJSON)
-    save_to_geojson(
-        lines_info_geojson,
-        "C:/PhD/Codes/railway_simulation/data/processed/lines_info_geojson.geojson",
-    )
+    with instrumentation.measure(
+        "polygon_lines",
+        inputs=[FILE_PATH_CSV, FILE_PATH_GEOJSON],
+        outputs=CSV_OUTPUTS + GEOJSON_OUTPUTS,
+    ) as record:
+        # Process CSV data
+        lines_info_csv = load_and_process_csv(FILE_PATH_CSV)
+        save_to_parquet(lines_info_csv, CSV_OUTPUTS[0], key_column="Linie")
+        save_to_csv(lines_info_csv, CSV_OUTPUTS[1])
+
+        # Process GeoJSON data
+        lines_info_geojson = load_and_process_geojson(FILE_PATH_GEOJSON)
+        save_to_parquet(lines_info_geojson, GEOJSON_OUTPUTS[0], key_column="linienr")
+        save_to_geojson(lines_info_geojson, GEOJSON_OUTPUTS[1])
+    instrumentation.MetricsWriter("-").write([record])
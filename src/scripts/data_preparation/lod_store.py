@@ -0,0 +1,253 @@
+"""
+Multi-resolution (level of detail) store of simplified geometries.
+
+Borders and track geometries are simplified once at a ladder of tolerances with
+topology-preserving Douglas-Peucker simplification, which never produces
+self-intersections or invalid polygons. All levels are written to one GeoParquet
+file as WKB, sorted and cut into row groups by ``level``, so reading one level
+skips the row groups of all the others.
+
+A map that shows ``resolution`` coordinate units per pixel cannot display errors
+smaller than a pixel, so ``LODStore.level_for`` picks the coarsest level whose
+tolerance stays below one pixel.
+
+Usage:
+    python -m src.scripts.data_preparation.lod_store
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+
+# Tolerances of the levels in degrees; level 0 keeps the full geometry and the
+# others are roughly 10 m, 50 m, 200 m and 1 km at Swiss latitudes
+DEFAULT_TOLERANCES = (0.0, 0.0001, 0.0005, 0.002, 0.01)
+
+
+def simplify_levels(geometries, tolerances=DEFAULT_TOLERANCES):
+    """
+    Simplify geometries at every tolerance.
+
+    Args:
+        geometries (np.ndarray): Shapely geometries.
+        tolerances (list[float]): Tolerance of every level, increasing.
+
+    Returns:
+        list[np.ndarray]: The geometries of every level.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    # Every level is simplified from the full geometry so that its error is
+    # bounded by its own tolerance
+    return [
+        (
+            shapely.simplify(geometries, tolerance, preserve_topology=True)
+            if tolerance > 0
+            else geometries
+        )
+        for tolerance in tolerances
+    ]
+
+
+def write_lod(
+    path, geometries, keys, tolerances=DEFAULT_TOLERANCES, key_column="line_id"
+):
+    """
+    Simplify geometries and write all levels to a GeoParquet file.
+
+    Args:
+        path (str): Path of the Parquet file.
+        geometries (np.ndarray): Shapely geometries in longitude/latitude.
+        keys (array-like): Key of every geometry, e.g. its line id.
+        tolerances (list[float]): Tolerance of every level, increasing.
+        key_column (str): Name of the key column.
+
+    Returns:
+        pd.DataFrame: Number of geometries and vertices of every level.
+    """
+    tolerances = sorted(tolerances)
+    keys = np.asarray(keys)
+    levels = simplify_levels(geometries, tolerances)
+    table = pd.DataFrame(
+        {
+            "level": np.repeat(np.arange(len(levels), dtype=np.int8), len(keys)),
+            "tolerance": np.repeat(np.asarray(tolerances, dtype=np.float64), len(keys)),
+            key_column: np.tile(keys, len(levels)),
+            "n_vertices": np.concatenate(
+                [shapely.get_num_coordinates(level) for level in levels]
+            ).astype(np.int32),
+            "geometry": np.concatenate(levels),
+        }
+    )
+    processed_store.write_table(
+        table, path, geometry_column="geometry", key_column="level"
+    )
+    return (
+        table.groupby("level")
+        .agg(
+            tolerance=("tolerance", "first"),
+            n_geometries=("n_vertices", "size"),
+            n_vertices=("n_vertices", "sum"),
+        )
+        .reset_index()
+    )
+
+
+def resolution_of(extent, pixels):
+    """
+    Coordinate units per pixel of a map.
+
+    Args:
+        extent (tuple): ``(min_x, max_x, min_y, max_y)`` shown by the map.
+        pixels (tuple[int, int]): Width and height of the map in pixels.
+
+    Returns:
+        float: The larger of the horizontal and vertical resolution.
+    """
+    return max(
+        (extent[1] - extent[0]) / max(pixels[0], 1),
+        (extent[3] - extent[2]) / max(pixels[1], 1),
+    )
+
+
+class LODStore:
+    """
+    Reader of a level of detail file written by ``write_lod``.
+
+    Opening the store reads the small level columns only; geometries are decoded
+    for the requested level.
+
+    Attributes:
+        path (str): Path of the Parquet file.
+        key_column (str): Name of the key column.
+        tolerances (np.ndarray): Tolerance of every level.
+        n_vertices (np.ndarray): Number of vertices of every level.
+    """
+
+    def __init__(self, path, key_column="line_id"):
+        """
+        Open a level of detail file.
+
+        Args:
+            path (str): Path of the Parquet file.
+            key_column (str): Name of the key column.
+        """
+        self.path = path
+        self.key_column = key_column
+        levels = processed_store.read_table(
+            path, columns=["level", "tolerance", "n_vertices"]
+        )
+        summary = levels.groupby("level").agg(
+            tolerance=("tolerance", "first"), n_vertices=("n_vertices", "sum")
+        )
+        self.tolerances = summary["tolerance"].to_numpy(np.float64)
+        self.n_vertices = summary["n_vertices"].to_numpy(np.int64)
+
+    @property
+    def n_levels(self):
+        """int: Number of levels."""
+        return len(self.tolerances)
+
+    def level_for(self, resolution):
+        """
+        Pick the coarsest level whose simplification error stays below a pixel.
+
+        Args:
+            resolution (float): Coordinate units per pixel, see ``resolution_of``.
+
+        Returns:
+            int: The level.
+        """
+        return max(int(np.searchsorted(self.tolerances, resolution, "right")) - 1, 0)
+
+    def read(self, level=None, resolution=None, keys=None, bbox=None):
+        """
+        Read the geometries of one level.
+
+        Args:
+            level (int, optional): Level to read.
+            resolution (float, optional): Coordinate units per pixel to pick the
+                level for when ``level`` is not given. Defaults to full detail.
+            keys (list, optional): Keys of the geometries to keep.
+            bbox (tuple, optional): ``(min_x, min_y, max_x, max_y)``; only
+                geometries intersecting it are kept.
+
+        Returns:
+            gpd.GeoDataFrame: Key, vertex count and geometry of every feature.
+        """
+        if level is None:
+            level = 0 if resolution is None else self.level_for(resolution)
+        filters = [("level", "==", int(level))]
+        if keys is not None:
+            filters.append((self.key_column, "in", list(keys)))
+        df = processed_store.read_table(
+            self.path,
+            columns=[self.key_column, "n_vertices", "geometry"],
+            filters=filters,
+        )
+        if bbox is not None:
+            df = df[shapely.intersects(df.geometry.to_numpy(), shapely.box(*bbox))]
+        return df.reset_index(drop=True)
+
+
+def build_lod_files(line_segments_path, borders_path, output_paths):
+    """
+    Build the level of detail files of the track and border geometries.
+
+    Args:
+        line_segments_path (str): Path to ``line_segments.parquet``.
+        borders_path (str): GeoJSON file with the border polygons.
+        output_paths (list[str]): Paths of the track and the border files.
+
+    Returns:
+        dict: Level summary of every written file, see ``write_lod``.
+    """
+    import geopandas as gpd
+
+    line_segments = processed_store.read_table(
+        line_segments_path, columns=["line_id", "geometry"]
+    )
+    borders = gpd.read_file(borders_path)
+    return {
+        output_paths[0]: write_lod(
+            output_paths[0],
+            line_segments.geometry.to_numpy(),
+            line_segments["line_id"].to_numpy(),
+        ),
+        output_paths[1]: write_lod(
+            output_paths[1],
+            borders.geometry.to_numpy(),
+            np.arange(len(borders)),
+            key_column="feature",
+        ),
+    }
+
+
+def main():
+    """Parse the command line and build the level of detail files."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--borders", default="gadm41_CHE_3.json")
+    args = parser.parse_args()
+
+    processed = os.path.join(args.data_root, "processed")
+    summaries = build_lod_files(
+        os.path.join(processed, "line_segments.parquet"),
+        os.path.join(args.data_root, "raw", args.borders),
+        [
+            os.path.join(processed, "line_segments_lod.parquet"),
+            os.path.join(processed, "borders_lod.parquet"),
+        ],
+    )
+    for path, summary in summaries.items():
+        print(f"{path}:")
+        print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
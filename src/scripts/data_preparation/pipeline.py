@@ -0,0 +1,645 @@
+"""
+Incremental pipeline runner for the data preparation scripts.
+
+The stages are modelled as a dependency graph that is derived from the files each
+stage reads and writes. Every stage is fingerprinted from the content of its input
+files and the source code that implements it. A stage is skipped when its
+fingerprint matches the one recorded after its last successful run and its outputs
+are still untouched. Stages that do not depend on each other run in parallel
+worker processes.
+
+Every stage that runs is measured with ``src.instrumentation``; with
+``--metrics`` the records are written as JSON lines (or Prometheus text for a
+``.prom`` file) and ``--profile`` profiles selected stages.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src import instrumentation
+
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir)
+)
+# Environment variable overriding the default data root
+DATA_ROOT_VARIABLE = "RAILSIM_DATA_ROOT"
+DEFAULT_DATA_ROOT = os.environ.get(DATA_ROOT_VARIABLE) or os.path.join(
+    PROJECT_ROOT, "data"
+)
+MANIFEST_NAME = ".pipeline_manifest.json"
+# Country whose raw files the stages process, published to the dataset under it
+COUNTRY = "CHE"
+
+# A pipeline stage. ``inputs`` and ``outputs`` are paths relative to the data root,
+# ``function`` is called as ``function(input_paths, output_paths)`` with absolute
+# paths and ``modules`` names the modules whose source is part of the fingerprint.
+Stage = namedtuple("Stage", ["name", "function", "inputs", "outputs", "modules"])
+
+_PACKAGE = "src.scripts.data_preparation"
+
+# Processed tables published to the dataset, see dataset.DATASET_TABLES
+_DATASET_TABLES = [
+    "linie_cleaned",
+    "lines_info",
+    "line_stations",
+    "line_segments",
+    "stations_info",
+]
+
+
+def run_clean_linie(inputs, outputs):
+    """Run the linie.csv cleaning stage."""
+    from src.scripts.data_preparation import clean_and_process_csv
+
+    clean_and_process_csv.clean_and_process_csv(inputs[0], outputs[0])
+
+
+def run_line_info(inputs, outputs):
+    """Run the per-line aggregation stage."""
+    from src.scripts.data_preparation import extract_line_info, processed_store
+    from src.scripts.data_preparation.station_registry import StationRegistry
+
+    station_data = extract_line_info.load_and_clean_data(inputs[0])
+    line_geometries = processed_store.read_table(
+        inputs[1], columns=["line_id", "geometry"]
+    )
+    registry = StationRegistry.load(inputs[2])
+    lines_info = extract_line_info.group_and_aggregate_data(
+        station_data, line_geometries, registry
+    )
+    extract_line_info.save_to_parquet(lines_info, outputs[0])
+    extract_line_info.save_to_parquet(
+        extract_line_info.line_stations(station_data, registry), outputs[1]
+    )
+
+
+def run_line_segments(inputs, outputs):
+    """Run the line segment extraction stage."""
+    from src.scripts.data_preparation import extract_line_segments
+    from src.scripts.data_preparation.station_registry import StationRegistry
+
+    line_segments = extract_line_segments.load_and_clean_data(inputs[0])
+    line_segments = extract_line_segments.add_station_ids(
+        line_segments, StationRegistry.load(inputs[1])
+    )
+    extract_line_segments.save_to_files(line_segments, outputs[0])
+
+
+def run_polygon_lines(inputs, outputs):
+    """Run the linie-mit-polygon column extraction stage."""
+    from src.scripts.data_preparation import linie_mit_polygon_processing
+
+    lines_info_csv = linie_mit_polygon_processing.load_and_process_csv(inputs[0])
+    linie_mit_polygon_processing.save_to_parquet(
+        lines_info_csv, outputs[0], key_column="Linie"
+    )
+    lines_info_geojson = linie_mit_polygon_processing.load_and_process_geojson(
+        inputs[1]
+    )
+    linie_mit_polygon_processing.save_to_parquet(
+        lines_info_geojson, outputs[1], key_column="linienr"
+    )
+
+
+def run_stations_info(inputs, outputs):
+    """Run the station extraction stage."""
+    from src.scripts.data_preparation import extract_stations_info
+
+    stations_info_df = extract_stations_info.load_and_clean_data(inputs[0])
+    extract_stations_info.save_to_parquet(stations_info_df, outputs[0])
+
+
+def run_station_chainage(inputs, outputs):
+    """Snap the stations to the segments and compute their chainage per line."""
+    from src.network.spatial_index import SegmentIndex
+    from src.scripts.data_preparation import processed_store
+
+    segment_index = SegmentIndex.from_segments(processed_store.read_table(inputs[0]))
+    segment_index.save(outputs[0])
+    station_chainage = segment_index.snap_stations(
+        processed_store.read_table(inputs[1])
+    )
+    processed_store.write_table(station_chainage, outputs[1])
+
+
+def run_lod(inputs, outputs):
+    """Build the level of detail files of the track and border geometries."""
+    from src.scripts.data_preparation import lod_store
+
+    lod_store.build_lod_files(inputs[0], inputs[1], outputs)
+
+
+def run_dataset(inputs, outputs):
+    """Publish the processed tables to the partitioned multi-country dataset."""
+    from src.scripts.data_preparation import dataset
+
+    dataset.publish_processed(
+        os.path.dirname(inputs[0]),
+        os.path.dirname(outputs[-1]),
+        COUNTRY,
+        borders_path=inputs[-1],
+    )
+
+
+def run_export(inputs, outputs):
+    """Export a processed Parquet table to CSV and/or GeoJSON."""
+    from src.scripts.data_preparation import processed_store
+
+    for output in outputs:
+        if output.endswith(".geojson"):
+            processed_store.export_geojson(inputs[0], output)
+        else:
+            processed_store.export_csv(inputs[0], output)
+
+
+STAGES = [
+    Stage(
+        "clean_linie",
+        run_clean_linie,
+        ["raw/linie.csv"],
+        ["processed/linie_cleaned.parquet"],
+        [
+            f"{_PACKAGE}.clean_and_process_csv",
+            f"{_PACKAGE}.ingest",
+            f"{_PACKAGE}.geometry",
+            f"{_PACKAGE}.processed_store",
+        ],
+    ),
+    Stage(
+        "line_info",
+        run_line_info,
+        [
+            "raw/linie-mit-betriebspunkten.csv",
+            "processed/line_segments.parquet",
+            "processed/stations_info.parquet",
+        ],
+        ["processed/lines_info.parquet", "processed/line_stations.parquet"],
+        [
+            f"{_PACKAGE}.extract_line_info",
+            f"{_PACKAGE}.ingest",
+            f"{_PACKAGE}.geometry",
+            f"{_PACKAGE}.processed_store",
+            f"{_PACKAGE}.station_registry",
+        ],
+    ),
+    Stage(
+        "line_segments",
+        run_line_segments,
+        ["raw/linie-mit-polygon.csv", "processed/stations_info.parquet"],
+        ["processed/line_segments.parquet"],
+        [
+            f"{_PACKAGE}.extract_line_segments",
+            f"{_PACKAGE}.ingest",
+            f"{_PACKAGE}.geometry",
+            f"{_PACKAGE}.processed_store",
+            f"{_PACKAGE}.station_registry",
+        ],
+    ),
+    Stage(
+        "polygon_lines",
+        run_polygon_lines,
+        ["raw/linie-mit-polygon.csv", "raw/linie-mit-polygon.geojson"],
+        ["processed/lines_info_csv.parquet", "processed/lines_info_geojson.parquet"],
+        [
+            f"{_PACKAGE}.linie_mit_polygon_processing",
+            f"{_PACKAGE}.ingest",
+            f"{_PACKAGE}.geometry",
+            f"{_PACKAGE}.processed_store",
+        ],
+    ),
+    Stage(
+        "stations_info",
+        run_stations_info,
+        ["raw/linie-mit-betriebspunkten.csv"],
+        ["processed/stations_info.parquet"],
+        [
+            f"{_PACKAGE}.extract_stations_info",
+            f"{_PACKAGE}.ingest",
+            f"{_PACKAGE}.processed_store",
+            f"{_PACKAGE}.station_registry",
+        ],
+    ),
+    Stage(
+        "station_chainage",
+        run_station_chainage,
+        ["processed/line_segments.parquet", "processed/stations_info.parquet"],
+        ["processed/segment_index.parquet", "processed/station_chainage.parquet"],
+        ["src.network.spatial_index", f"{_PACKAGE}.processed_store"],
+    ),
+    Stage(
+        "lod",
+        run_lod,
+        ["processed/line_segments.parquet", f"raw/gadm41_{COUNTRY}_3.json"],
+        ["processed/line_segments_lod.parquet", "processed/borders_lod.parquet"],
+        [f"{_PACKAGE}.lod_store", f"{_PACKAGE}.processed_store"],
+    ),
+    Stage(
+        "dataset",
+        run_dataset,
+        [f"processed/{table}.parquet" for table in _DATASET_TABLES]
+        + [f"raw/gadm41_{COUNTRY}_1.json"],
+        [
+            f"dataset/{table}/country={COUNTRY}/part-0.parquet"
+            for table in _DATASET_TABLES + ["borders"]
+        ]
+        + ["dataset/catalog.json"],
+        [f"{_PACKAGE}.dataset", f"{_PACKAGE}.processed_store"],
+    ),
+]
+
+# Optional CSV/GeoJSON exports of the Parquet tables, enabled with --export
+EXPORT_STAGES = [
+    Stage(
+        f"export_{name}",
+        run_export,
+        [f"processed/{name}.parquet"],
+        [f"processed/{name}.{extension}" for extension in extensions],
+        [f"{_PACKAGE}.processed_store"],
+    )
+    for name, extensions in [
+        ("linie_cleaned", ["csv"]),
+        ("lines_info", ["csv"]),
+        ("line_stations", ["csv"]),
+        ("line_segments", ["csv", "geojson"]),
+        ("stations_info", ["csv"]),
+    ]
+]
+
+
+def build_dependency_graph(stages):
+    """
+    Derive the stage dependency graph from the stage inputs and outputs.
+
+    A stage depends on every stage that writes one of its inputs.
+
+    Args:
+        stages (list[Stage]): Pipeline stages.
+
+    Returns:
+        dict: Mapping of stage name to the set of stage names it depends on.
+
+    Raises:
+        ValueError: If two stages write the same output or the graph has a cycle.
+    """
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(
+                    f"Output {output} is written by both {producers[output]} "
+                    f"and {stage.name}"
+                )
+            producers[output] = stage.name
+
+    dependencies = {
+        stage.name: {producers[i] for i in stage.inputs if i in producers}
+        for stage in stages
+    }
+
+    # Kahn's algorithm, only to reject cycles early
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return dependencies
+
+
+def file_digest(path, known=None):
+    """
+    Compute the SHA-256 digest of a file's content.
+
+    When ``known`` holds an entry for the file whose size and modification time
+    still match, its digest is reused instead of re-reading the file.
+
+    Args:
+        path (str): Path to the file.
+        known (dict, optional): Previously recorded ``{"size", "mtime_ns", "sha256"}``.
+
+    Returns:
+        dict: ``{"size", "mtime_ns", "sha256"}`` for the file.
+    """
+    stat = os.stat(path)
+    if (
+        known
+        and known.get("size") == stat.st_size
+        and known.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return dict(known)
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest.hexdigest(),
+    }
+
+
+def code_digest(stage):
+    """
+    Compute the digest of the code implementing a stage.
+
+    The stage modules are hashed from their source files without importing them,
+    so fingerprinting does not pay the import cost of geopandas and friends.
+
+    Args:
+        stage (Stage): Pipeline stage.
+
+    Returns:
+        str: Hex digest of the stage function and module sources.
+    """
+    digest = hashlib.sha256(inspect.getsource(stage.function).encode("utf-8"))
+    for module_name in stage.modules:
+        spec = importlib.util.find_spec(module_name)
+        with open(spec.origin, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, input_digests):
+    """
+    Combine the input and code digests of a stage into its fingerprint.
+
+    Args:
+        stage (Stage): Pipeline stage.
+        input_digests (dict): Mapping of relative input path to its file digest.
+
+    Returns:
+        str: Hex digest identifying this exact stage run.
+    """
+    digest = hashlib.sha256(stage.name.encode("utf-8"))
+    digest.update(code_digest(stage).encode("utf-8"))
+    for path in stage.inputs:
+        digest.update(path.encode("utf-8"))
+        digest.update(input_digests[path]["sha256"].encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_manifest(data_root):
+    """
+    Load the manifest of the last pipeline run.
+
+    Args:
+        data_root (str): Root directory of the data.
+
+    Returns:
+        dict: Manifest with ``"files"`` and ``"stages"`` entries.
+    """
+    path = os.path.join(data_root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"files": {}, "stages": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_manifest(manifest, data_root):
+    """
+    Atomically write the pipeline manifest.
+
+    Args:
+        manifest (dict): Manifest to save.
+        data_root (str): Root directory of the data.
+    """
+    os.makedirs(data_root, exist_ok=True)
+    path = os.path.join(data_root, MANIFEST_NAME)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def outputs_unchanged(stage, data_root, recorded):
+    """
+    Check that the outputs of a stage still look exactly as they were written.
+
+    Args:
+        stage (Stage): Pipeline stage.
+        data_root (str): Root directory of the data.
+        recorded (dict): Recorded output stats of the last run of the stage.
+
+    Returns:
+        bool: True if every output exists with the recorded size and mtime.
+    """
+    for output in stage.outputs:
+        path = os.path.join(data_root, output)
+        known = recorded.get(output)
+        if known is None or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != known["size"] or stat.st_mtime_ns != known["mtime_ns"]:
+            return False
+    return True
+
+
+def _execute_stage(stage, data_root, profile=None):
+    """Run one stage in a worker process and return its metrics record."""
+    inputs = [os.path.join(data_root, path) for path in stage.inputs]
+    outputs = [os.path.join(data_root, path) for path in stage.outputs]
+    for output in outputs:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    with instrumentation.measure(
+        stage.name,
+        inputs=inputs,
+        outputs=outputs,
+        profile=profile,
+        profile_directory=os.path.join(data_root, "profiles"),
+    ) as record:
+        stage.function(inputs, outputs)
+    return record
+
+
+def run_pipeline(
+    stages=None,
+    data_root=DEFAULT_DATA_ROOT,
+    max_workers=None,
+    force=False,
+    metrics=None,
+    profile=None,
+):
+    """
+    Run every out-of-date stage of the pipeline.
+
+    Stages are scheduled as soon as all of their dependencies have finished. A
+    stage whose inputs are missing or whose dependency failed is reported as
+    failed and does not stop independent stages from running.
+
+    Args:
+        stages (list[Stage], optional): Stages to run. Defaults to ``STAGES``.
+        data_root (str): Root directory of the data.
+        max_workers (int, optional): Number of worker processes.
+        force (bool): Re-run every stage even if it is up to date.
+        metrics (instrumentation.MetricsWriter, optional): Sink of the metrics
+            record of every stage that runs.
+        profile (dict, optional): Profiler (see ``instrumentation.PROFILERS``) by
+            stage name; the profiles are saved under ``<data root>/profiles``.
+
+    Returns:
+        dict: Mapping of stage name to ``"skipped"``, ``"ran"`` or ``"failed"``.
+    """
+    stages = STAGES if stages is None else stages
+    by_name = {stage.name: stage for stage in stages}
+    dependencies = build_dependency_graph(stages)
+    manifest = load_manifest(data_root)
+    file_digests = manifest["files"]
+
+    status = {}
+    fingerprints = {}
+    running = {}
+
+    def ready_stages():
+        return [
+            name
+            for name, deps in dependencies.items()
+            if name not in status
+            and name not in fingerprints
+            and all(status.get(dep) in ("skipped", "ran") for dep in deps)
+        ]
+
+    def fail_dependents():
+        for name, deps in dependencies.items():
+            if name not in status and any(status.get(dep) == "failed" for dep in deps):
+                status[name] = "failed"
+                print(f"{name}: failed (upstream stage failed)")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            ready = ready_stages()
+            while ready:
+                for name in ready:
+                    stage = by_name[name]
+                    missing = [
+                        path
+                        for path in stage.inputs
+                        if not os.path.exists(os.path.join(data_root, path))
+                    ]
+                    if missing:
+                        status[name] = "failed"
+                        print(f"{name}: failed (missing inputs {', '.join(missing)})")
+                        continue
+
+                    for path in stage.inputs:
+                        file_digests[path] = file_digest(
+                            os.path.join(data_root, path), file_digests.get(path)
+                        )
+                    fingerprint = stage_fingerprint(stage, file_digests)
+                    recorded = manifest["stages"].get(name, {})
+                    if (
+                        not force
+                        and recorded.get("fingerprint") == fingerprint
+                        and outputs_unchanged(stage, data_root, recorded["outputs"])
+                    ):
+                        status[name] = "skipped"
+                        print(f"{name}: skipped (up to date)")
+                        continue
+
+                    fingerprints[name] = fingerprint
+                    future = executor.submit(
+                        _execute_stage, stage, data_root, (profile or {}).get(name)
+                    )
+                    running[future] = name
+                fail_dependents()
+                ready = ready_stages()
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                stage = by_name[name]
+                try:
+                    record = future.result()
+                    # A stage that did not write one of its outputs failed too
+                    digests = {
+                        output: file_digest(os.path.join(data_root, output))
+                        for output in stage.outputs
+                    }
+                except Exception as error:  # noqa: BLE001 - report and go on
+                    status[name] = "failed"
+                    print(f"{name}: failed ({error!r})")
+                    fail_dependents()
+                    continue
+
+                file_digests.update(digests)
+                outputs = {
+                    output: {"size": digest["size"], "mtime_ns": digest["mtime_ns"]}
+                    for output, digest in digests.items()
+                }
+                manifest["stages"][name] = {
+                    "fingerprint": fingerprints[name],
+                    "outputs": outputs,
+                }
+                save_manifest(manifest, data_root)
+                status[name] = "ran"
+                if metrics is not None:
+                    metrics.write([record])
+                print(f"{name}: ran in {record['wall_s']:.2f} s")
+
+    save_manifest(manifest, data_root)
+    return status
+
+
+def main():
+    """Parse the command line and run the pipeline."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Re-run every stage.")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Also export the processed tables to CSV and GeoJSON.",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        metavar="STAGE",
+        help="Run only the named stages.",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write stage metrics as JSON lines, or Prometheus text to a .prom file.",
+    )
+    parser.add_argument(
+        "--profile", nargs="+", default=[], metavar="STAGE", help="Stages to profile."
+    )
+    parser.add_argument(
+        "--profiler", choices=sorted(instrumentation.PROFILERS), default="cprofile"
+    )
+    args = parser.parse_args()
+
+    stages = STAGES + EXPORT_STAGES if args.export else STAGES
+    if args.only:
+        stages = [stage for stage in stages if stage.name in args.only]
+
+    metrics = instrumentation.MetricsWriter(args.metrics) if args.metrics else None
+    status = run_pipeline(
+        stages,
+        args.data_root,
+        args.workers,
+        args.force,
+        metrics=metrics,
+        profile=dict.fromkeys(args.profile, args.profiler),
+    )
+    if "failed" in status.values():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import pandas as pd
 
+from src.network.railway_network import RailwayNetwork
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT, PROJECT_ROOT
+
 
 def load_geojson_data(file_path):
     """Load GeoJSON data.
@@ -14,6 +16,8 @@ def load_geojson_data(file_path):
     Returns:
         GeoDataFrame: Loaded GeoDataFrame.
     """
+    import geopandas as gpd
+
     return gpd.read_file(file_path)
 
 
@@ -65,6 +69,19 @@ def get_total_length(line_data):
     return line_data["km"].sum()
 
 
+def load_parquet_data(file_path, columns=None):
+    """Load a processed Parquet table.
+
+    Args:
+        file_path (str): Path to the Parquet file.
+        columns (list[str], optional): Columns to load.
+
+    Returns:
+        DataFrame: Loaded DataFrame.
+    """
+    return processed_store.read_table(file_path, columns=columns)
+
+
 def get_line_length_from_info(lines_info, line_id):
     """Get the line length from lines_info.csv for a specific line ID.
 
@@ -75,7 +92,7 @@ def get_line_length_from_info(lines_info, line_id):
     Returns:
         float or str: Line length if found, else "Not found".
     """
-    line_info = lines_info[lines_info["line_id"] == line_id]
+    line_info = lines_info[lines_info["line_id"].astype(str) == str(line_id)]
     return line_info["line_length"].values[0] if not line_info.empty else "Not found"
 
 
@@ -87,6 +104,8 @@ def plot_line_and_borders(switzerland_borders, line_segments, figure_path):
         line_segments (GeoDataFrame): GeoDataFrame containing the line segments to plot.
         figure_path (str): Path to save the plot figure.
     """
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(12, 12))
     switzerland_borders.plot(ax=ax, color="white", edgecolor="red")
     line_segments.plot(ax=ax, color="black")
@@ -98,17 +117,27 @@ def plot_line_and_borders(switzerland_borders, line_segments, figure_path):
     plt.show()
 
 
-def main():
-    """Main function to execute the script."""
-    figures_dir = r"C:\PhD\Codes\railway_simulation\figures"
+def main(data_root=DEFAULT_DATA_ROOT, figures_dir=None, network=None):
+    """Main function to execute the script.
+
+    The GeoJSON files and tables are taken from a ``RailwayNetwork``, so they are
+    parsed once and memoized on disk instead of being read on every run.
+
+    Args:
+        data_root (str): Data root of the raw and processed files.
+        figures_dir (str, optional): Directory of the figure. Defaults to the
+            ``figures`` directory of the project.
+        network (RailwayNetwork, optional): Loaded network. Defaults to the
+            shared network of ``data_root``.
+    """
+    import geopandas as gpd
+
+    figures_dir = figures_dir or os.path.join(PROJECT_ROOT, "figures")
     os.makedirs(figures_dir, exist_ok=True)
+    network = network or RailwayNetwork.open(data_root)
 
-    switzerland_borders = load_geojson_data(
-        r"C:\PhD\Codes\railway_simulation\data\raw\gadm41_CHE_1.json"
-    )
-    line_data = load_geojson_data(
-        r"C:\PhD\Codes\railway_simulation\data\raw\linienkilometrierung.geojson"
-    )
+    switzerland_borders = network.borders
+    line_data = network.read_geojson("linienkilometrierung.geojson")
     line_150_data = filter_line_data(line_data, 150)
 
     print("Individual segment lengths for line 150:")
@@ -116,8 +145,7 @@ def main():
 
     total_length = get_total_length(line_150_data)
 
-    lines_info_path = r"C:\PhD\Codes\railway_simulation\data\processed\lines_info.csv"
-    lines_info = load_csv_data(lines_info_path)
+    lines_info = network.lines[["line_id", "line_length"]]
     line_150_length_from_info = get_line_length_from_info(lines_info, 150)
 
     print("Rows related to line 150:")
@@ -5,9 +5,13 @@ This script processes the data and generates a plot for line_id 150, showing the
 
 import os
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
+
+from src.network.railway_network import RailwayNetwork
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT, PROJECT_ROOT
+
+FIGURES_DIR = os.path.join(PROJECT_ROOT, "figures")
 
 
 def create_figures_directory(directory_path):
@@ -20,23 +24,63 @@ def create_figures_directory(directory_path):
     os.makedirs(directory_path, exist_ok=True)
 
 
-def load_data():
+def load_data(
+    line_ids=None,
+    dataset=None,
+    country="CHE",
+    data_root=DEFAULT_DATA_ROOT,
+    network=None,
+):
     """
     Load necessary data for plotting.
 
+    Without a ``network`` the segments and stations are read from the processed
+    files, only the row groups of ``line_ids``, and the borders come from the
+    shared network of the data root, whose GeoJSON is memoized on disk.
+
+    Args:
+        line_ids (list[int], optional): Only load the segments of these lines.
+        dataset (RailwayDataset, optional): Partitioned dataset to load the
+            partitions of ``country`` from instead of the processed files.
+        country (str): Country to load from the dataset.
+        data_root (str): Data root of the raw and processed files.
+        network (RailwayNetwork, optional): Loaded network to take the tables
+            from, e.g. the one of a notebook or service.
+
     Returns:
         gpd.GeoDataFrame: Switzerland borders data.
         gpd.GeoDataFrame: Railway line segments data.
         pd.DataFrame: Stations information data.
     """
-    switzerland_borders = gpd.read_file(
-        r"C:\PhD\Codes\railway_simulation\data\raw\gadm41_CHE_1.json"
-    )
-    line_segments = gpd.read_file(
-        r"C:\PhD\Codes\railway_simulation\data\processed\line_segments.geojson"
+    station_columns = [
+        "station_id",
+        "station_abbr",
+        "stop_name",
+        "didok",
+        "latitude",
+        "longitude",
+    ]
+    if dataset is not None:
+        return (
+            dataset.read("borders", countries=country),
+            dataset.read("line_segments", countries=country, line_ids=line_ids),
+            dataset.read("stations_info", columns=station_columns, countries=country),
+        )
+
+    if network is not None:
+        line_segments = network.segments
+        if line_ids is not None:
+            line_segments = line_segments[line_segments["line_id"].isin(line_ids)]
+        return network.borders, line_segments, network.stations[station_columns]
+
+    switzerland_borders = RailwayNetwork.open(data_root, country).borders
+    line_segments = processed_store.read_table(
+        os.path.join(data_root, "processed", "line_segments.parquet"),
+        line_ids=line_ids,
     )
-    stations_info = pd.read_csv(
-        r"C:\PhD\Codes\railway_simulation\data\processed\stations_info.csv"
+    stations_info = processed_store.read_table(
+        os.path.join(data_root, "processed", "stations_info.parquet"),
+        columns=station_columns,
     )
 
     return switzerland_borders, line_segments, stations_info
@@ -60,6 +104,10 @@ def extract_stations_on_line(stations_info, line_segments):
     """
     Extract stations on a specific line based on line segments data.
 
+    The segments refer to their end points by station id, and the rows of
+    stations_info are ordered by station id, so the stations are gathered by
+    position instead of being joined on their abbreviations.
+
     Args:
         stations_info (pd.DataFrame): DataFrame containing stations information.
         line_segments (gpd.GeoDataFrame): DataFrame containing line segments.
@@ -67,13 +115,16 @@ def extract_stations_on_line(stations_info, line_segments):
     Returns:
         pd.DataFrame: DataFrame containing stations on the specified line.
     """
-    line_stations = (
-        line_segments[["start_station", "end_station"]]
-        .melt(value_name="station_abbr")
-        .drop(columns=["variable"])
-        .drop_duplicates()
+    station_ids = np.unique(
+        np.concatenate(
+            [
+                line_segments["start_station_id"].to_numpy(),
+                line_segments["end_station_id"].to_numpy(),
+            ]
+        )
     )
-    return pd.merge(line_stations, stations_info, on="station_abbr")
+    station_ids = station_ids[station_ids >= 0]
+    return stations_info.iloc[station_ids].reset_index(drop=True)
 
 
 def create_geodataframes(switzerland_borders, stations_on_line):
@@ -88,6 +139,8 @@ def create_geodataframes(switzerland_borders, stations_on_line):
         gpd.GeoDataFrame: GeoDataFrame of Switzerland borders.
         gpd.GeoDataFrame: GeoDataFrame of stations on the specified line.
     """
+    import geopandas as gpd
+
     gdf_borders = gpd.GeoDataFrame(switzerland_borders)
     gdf_stations = gpd.GeoDataFrame(
         stations_on_line,
@@ -98,7 +151,9 @@ def create_geodataframes(switzerland_borders, stations_on_line):
     return gdf_borders, gdf_stations
 
 
-def plot_data(gdf_borders, line_segments, gdf_stations, output_path):
+def plot_data(
+    gdf_borders, line_segments, gdf_stations, output_path, line_id=150, show=True
+):
     """
     Plot the data and save as JPEG.
 
@@ -107,43 +162,60 @@ def plot_data(gdf_borders, line_segments, gdf_stations, output_path):
         line_segments (gpd.GeoDataFrame): GeoDataFrame of line segments.
         gdf_stations (gpd.GeoDataFrame): GeoDataFrame of stations.
         output_path (str): Path to save the output JPEG file.
+        line_id (int): Line ID shown in the title.
+        show (bool): Show the figure in a window after saving it.
     """
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(12, 12))
     gdf_borders.plot(ax=ax, color="white", edgecolor="red")
     line_segments.plot(ax=ax, color="black")
     gdf_stations.plot(ax=ax, color="blue", marker="o", markersize=5, label="Stations")
 
-    plt.title("Switzerland Borders with Railway Line (Line ID: 150) and Stations")
+    plt.title(
+        f"Switzerland Borders with Railway Line (Line ID: {line_id}) and Stations"
+    )
     plt.legend()
     ax.set_axis_off()
 
     plt.savefig(output_path, bbox_inches="tight", format="jpeg")
-    plt.show()
-
+    if show:
+        plt.show()
+    plt.close(fig)
 
-if __name__ == "__main__":
-    # Define paths
-    FIGURES_DIR = r"C:\PhD\Codes\railway_simulation\figures"
-    OUTPUT_JPEG_PATH = os.path.join(
-        FIGURES_DIR, "switzerland_borders_with_line_150.jpeg"
-    )
-
-    # Create figures directory
-    create_figures_directory(FIGURES_DIR)
 
-    # Load data
-    switzerland_borders, line_segments, stations_info = load_data()
+def plot_line(
+    line_id, output_path, data_root=DEFAULT_DATA_ROOT, show=False, network=None
+):
+    """
+    Plot a line and its stations on the borders of Switzerland.
 
-    # Extract line segments for line_id 150
-    line_150_segments = extract_line_segments(line_segments, line_id=150)
+    Args:
+        line_id (int): Line ID to plot.
+        output_path (str): Path to save the output JPEG file.
+        data_root (str): Data root of the raw and processed files.
+        show (bool): Show the figure in a window after saving it.
+        network (RailwayNetwork, optional): Loaded network to take the data from.
+    """
+    create_figures_directory(os.path.dirname(output_path) or ".")
 
-    # Extract stations on line_id 150
-    stations_on_line_150 = extract_stations_on_line(stations_info, line_150_segments)
+    # Load data, reading only the row groups of the line
+    switzerland_borders, line_segments, stations_info = load_data(
+        line_ids=[line_id], data_root=data_root, network=network
+    )
+    segments = extract_line_segments(line_segments, line_id=line_id)
+    stations_on_line = extract_stations_on_line(stations_info, segments)
 
-    # Create GeoDataFrames
     gdf_borders, gdf_stations = create_geodataframes(
-        switzerland_borders, stations_on_line_150
+        switzerland_borders, stations_on_line
     )
+    plot_data(gdf_borders, segments, gdf_stations, output_path, line_id, show)
+
 
-    # Plot data and save as JPEG
-    plot_data(gdf_borders, line_150_segments, gdf_stations, OUTPUT_JPEG_PATH)
+if __name__ == "__main__":
+    # Plot line_id 150 and save it as JPEG
+    plot_line(
+        150,
+        os.path.join(FIGURES_DIR, "switzerland_borders_with_line_150.jpeg"),
+        show=True,
+    )
@@ -0,0 +1,368 @@
+"""
+Columnar storage for the tables under data/processed.
+
+Tables are written as (Geo)Parquet files: string columns are dictionary encoded,
+geometries are stored as WKB with GeoParquet metadata and rows are sorted by
+``line_id`` so that every row group covers a narrow range of lines. Readers can
+then load selected columns only and skip every row group that does not contain
+the requested lines, without parsing the rest of the file.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from src import instrumentation
+
+GEOPARQUET_VERSION = "1.0.0"
+DEFAULT_CRS = "EPSG:4326"
+
+_GEOMETRY_TYPES = {
+    0: "Point",
+    1: "LineString",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+
+
+def _row_group_bounds(keys, row_group_size):
+    """
+    Split sorted keys into row groups that never split a key across two groups.
+
+    Args:
+        keys (np.ndarray): Sorted key values.
+        row_group_size (int): Target number of rows per row group.
+
+    Returns:
+        list[int]: Row offsets where the row groups start, followed by the length.
+    """
+    if len(keys) == 0:
+        return [0, 0]
+    key_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    bounds = [0]
+    for start in key_starts[1:]:
+        if start - bounds[-1] >= row_group_size:
+            bounds.append(int(start))
+    bounds.append(len(keys))
+    return bounds
+
+
+def _geo_metadata(geometries, geometry_column, crs):
+    """
+    Build the GeoParquet ``geo`` metadata for a geometry column.
+
+    Without ``geometries`` the geometry types are declared unknown and the
+    optional bounding box is left out.
+    """
+    column = {"encoding": "WKB", "geometry_types": []}
+    if geometries is not None:
+        valid = geometries[~shapely.is_missing(geometries)]
+        column["geometry_types"] = [
+            _GEOMETRY_TYPES[type_id]
+            for type_id in np.unique(shapely.get_type_id(valid)).tolist()
+        ]
+        if len(valid):
+            column["bbox"] = shapely.total_bounds(valid).tolist()
+    if crs is not None and crs != DEFAULT_CRS:
+        # GeoParquet defaults to OGC:CRS84 (lon/lat), which is how EPSG:4326
+        # coordinates are stored here; any other CRS is written as PROJJSON.
+        from pyproj import CRS
+
+        column["crs"] = CRS.from_user_input(crs).to_json_dict()
+    return {
+        "version": GEOPARQUET_VERSION,
+        "primary_column": geometry_column,
+        "columns": {geometry_column: column},
+    }
+
+
+def to_arrow(df, geometry_column=None, crs=DEFAULT_CRS, key_column="line_id"):
+    """
+    Convert a DataFrame to an Arrow table in the processed-data layout.
+
+    String and categorical columns are dictionary encoded, except the key column
+    which stays plain so it can be filtered on. The geometry column is encoded as
+    WKB and described in the GeoParquet ``geo`` schema metadata.
+
+    Args:
+        df (pd.DataFrame): Table to convert.
+        geometry_column (str, optional): Name of the shapely geometry column.
+        crs (str): CRS of the geometry column.
+        key_column (str): Column the table is sorted and filtered on.
+
+    Returns:
+        pa.Table: Arrow table.
+    """
+    arrays = []
+    names = []
+    for name in df.columns:
+        values = df[name]
+        if name == geometry_column:
+            array = pa.array(shapely.to_wkb(np.asarray(values, dtype=object)))
+        elif name != key_column and (
+            isinstance(values.dtype, pd.CategoricalDtype)
+            or pd.api.types.is_string_dtype(values.dtype)
+            or values.dtype == object
+        ):
+            array = pa.array(values.astype("string"), type=pa.string())
+            array = array.dictionary_encode()
+        else:
+            array = pa.array(values, from_pandas=True)
+        arrays.append(array)
+        names.append(str(name))
+
+    table = pa.Table.from_arrays(arrays, names=names)
+    if geometry_column is not None:
+        geo = _geo_metadata(
+            np.asarray(df[geometry_column], dtype=object), geometry_column, crs
+        )
+        table = table.replace_schema_metadata({b"geo": json.dumps(geo).encode()})
+    return table
+
+
+def write_table(
+    df,
+    path,
+    geometry_column=None,
+    crs=DEFAULT_CRS,
+    key_column="line_id",
+    row_group_size=1024,
+):
+    """
+    Write a processed table to a (Geo)Parquet file.
+
+    Rows are sorted by ``key_column`` when the table has one, and row groups are
+    cut at key boundaries so that a single line never spans two row groups unless
+    it alone exceeds ``row_group_size`` rows.
+
+    Args:
+        df (pd.DataFrame): Table to write.
+        path (str): Path of the Parquet file.
+        geometry_column (str, optional): Name of the shapely geometry column.
+        crs (str): CRS of the geometry column.
+        key_column (str): Column to sort and cut row groups on.
+        row_group_size (int): Target number of rows per row group.
+    """
+    df, bounds = _sorted_row_groups(df, key_column, row_group_size)
+    table = to_arrow(df, geometry_column, crs, key_column)
+    with pq.ParquetWriter(path, table.schema, compression="zstd") as writer:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(start, stop - start))
+        if len(df) == 0:
+            writer.write_table(table)
+    instrumentation.count(rows_out=len(df))
+
+
+def _sorted_row_groups(df, key_column, row_group_size):
+    """Sort a table by its key column and return it with its row group bounds."""
+    if key_column in df.columns:
+        df = df.sort_values(key_column, kind="stable")
+        return df, _row_group_bounds(df[key_column].to_numpy(), row_group_size)
+    return df, list(range(0, len(df), row_group_size)) + [len(df)]
+
+
+class TableWriter:
+    """
+    Incremental writer of a processed table, one chunk of rows at a time.
+
+    Every chunk is sorted by ``key_column`` and cut into row groups like
+    ``write_table`` does, so readers still skip row groups by line, but a line is
+    only contiguous within its chunk. Only the current chunk is held in memory.
+    The schema is fixed by the first chunk; as the geometries of later chunks are
+    not known yet, the GeoParquet metadata declares the geometry types unknown
+    and leaves out the bounding box. If no chunk is written, ``close`` still
+    writes a file without rows, with the columns of ``empty``.
+
+    Attributes:
+        n_rows (int): Number of rows written so far.
+    """
+
+    def __init__(
+        self,
+        path,
+        geometry_column=None,
+        crs=DEFAULT_CRS,
+        key_column="line_id",
+        row_group_size=1024,
+        empty=None,
+    ):
+        """
+        Prepare the writer; the file is created with the first chunk.
+
+        Args:
+            path (str): Path of the Parquet file.
+            geometry_column (str, optional): Name of the shapely geometry column.
+            crs (str): CRS of the geometry column.
+            key_column (str): Column to sort and cut row groups on.
+            row_group_size (int): Target number of rows per row group.
+            empty (pd.DataFrame, optional): Table without rows, with the columns
+                and types of the chunks, written if no chunk is. Defaults to a
+                table of the key and geometry columns only.
+        """
+        self.path = path
+        self.geometry_column = geometry_column
+        self.crs = crs
+        self.key_column = key_column
+        self.row_group_size = row_group_size
+        self.empty = empty
+        self.n_rows = 0
+        self._writer = None
+        self._closed = False
+
+    def write(self, df):
+        """
+        Append a chunk of rows.
+
+        Args:
+            df (pd.DataFrame): Rows with the same columns as the first chunk.
+        """
+        df, bounds = _sorted_row_groups(df, self.key_column, self.row_group_size)
+        table = to_arrow(df, self.geometry_column, self.crs, self.key_column)
+        if self._writer is None:
+            schema = table.schema
+            if self.geometry_column is not None:
+                geo = _geo_metadata(None, self.geometry_column, self.crs)
+                schema = schema.with_metadata({b"geo": json.dumps(geo).encode()})
+            self._writer = pq.ParquetWriter(self.path, schema, compression="zstd")
+        table = table.cast(self._writer.schema)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            self._writer.write_table(table.slice(start, stop - start))
+        self.n_rows += len(df)
+        instrumentation.count(rows_out=len(df))
+
+    def close(self):
+        """Finish the file."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is None:
+            # Readers and the pipeline expect the file even for empty input
+            self.write(self._empty_table())
+        self._writer.close()
+        self._writer = None
+
+    def _empty_table(self):
+        """Table without rows written when no chunk was."""
+        if self.empty is not None:
+            return self.empty
+        columns = {}
+        if self.key_column is not None:
+            columns[self.key_column] = np.empty(0, dtype=np.int64)
+        if self.geometry_column is not None:
+            columns[self.geometry_column] = np.empty(0, dtype=object)
+        return pd.DataFrame(columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_table(
+    path,
+    columns=None,
+    line_ids=None,
+    filters=None,
+    key_column="line_id",
+    memory_map=True,
+):
+    """
+    Read a processed table, loading only the requested columns and lines.
+
+    Row groups whose ``key_column`` statistics exclude every requested line are
+    skipped without being decoded. When the file has a GeoParquet geometry column
+    among the selected columns, a GeoDataFrame is returned.
+
+    Args:
+        path (str): Path of the Parquet file.
+        columns (list[str], optional): Columns to read. Defaults to all columns.
+        line_ids (list, optional): Values of ``key_column`` to keep.
+        filters (list, optional): Additional pyarrow filter expressions.
+        key_column (str): Column ``line_ids`` refers to.
+        memory_map (bool): Memory-map the file instead of reading it into memory.
+
+    Returns:
+        pd.DataFrame or gpd.GeoDataFrame: The selected part of the table.
+    """
+    schema = pq.read_schema(path, memory_map=memory_map)
+    filters = list(filters or [])
+    if line_ids is not None:
+        key_type = schema.field(key_column).type
+        values = pa.array(list(line_ids)).cast(key_type).to_pylist()
+        filters.append((key_column, "in", values))
+
+    table = pq.read_table(
+        path,
+        columns=columns,
+        filters=filters or None,
+        memory_map=memory_map,
+    )
+    df = table.to_pandas()
+    instrumentation.count(rows_in=len(df))
+
+    geo = schema.metadata and schema.metadata.get(b"geo")
+    if not geo:
+        return df
+    geo = json.loads(geo)
+    geometry_column = geo["primary_column"]
+    if geometry_column not in df.columns:
+        return df
+
+    import geopandas as gpd
+
+    df[geometry_column] = shapely.from_wkb(df[geometry_column].to_numpy())
+    crs = geo["columns"][geometry_column].get("crs", DEFAULT_CRS)
+    return gpd.GeoDataFrame(df, geometry=geometry_column, crs=crs)
+
+
+def read_line_ids(path, key_column="line_id"):
+    """
+    Read the distinct line ids stored in a processed table.
+
+    Args:
+        path (str): Path of the Parquet file.
+        key_column (str): Name of the line id column.
+
+    Returns:
+        np.ndarray: Sorted distinct line ids.
+    """
+    keys = pq.read_table(path, columns=[key_column], memory_map=True)
+    return np.unique(keys.column(key_column).to_numpy())
+
+
+def export_csv(path, csv_path):
+    """
+    Export a processed table to CSV.
+
+    Geometries are written as GeoJSON strings in a ``geo_shape`` column, the same
+    representation the raw open-data files use.
+
+    Args:
+        path (str): Path of the Parquet file.
+        csv_path (str): Path of the CSV file to write.
+    """
+    df = read_table(path)
+    if hasattr(df, "geometry"):
+        geometry_column = df.geometry.name
+        df = pd.DataFrame(df)
+        df["geo_shape"] = shapely.to_geojson(df.pop(geometry_column).to_numpy())
+    df.to_csv(csv_path, index=False)
+
+
+def export_geojson(path, geojson_path):
+    """
+    Export a processed table with a geometry column to GeoJSON.
+
+    Args:
+        path (str): Path of the GeoParquet file.
+        geojson_path (str): Path of the GeoJSON file to write.
+    """
+    read_table(path).to_file(geojson_path, driver="GeoJSON")
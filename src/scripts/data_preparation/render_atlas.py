@@ -0,0 +1,415 @@
+"""
+Headless batch rendering of a map of every railway line.
+
+The border base layer is drawn once, rasterized and cached on disk next to the
+figures, keyed by the content of the border file and the image size. Every line
+map then only pastes that raster and draws its own segments and stations on top.
+Figures are rendered with the Agg canvas directly, without pyplot or a window,
+in a pool of worker processes that each receive the base raster and the line
+coordinates once and reuse a single figure for all of their lines.
+
+Usage:
+    python -m src.scripts.data_preparation.render_atlas --lines 150 151
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT, PROJECT_ROOT
+
+DEFAULT_OUTPUT_DIRECTORY = os.path.join(PROJECT_ROOT, "figures", "atlas")
+
+# Width of the figures in inches; the height follows the map's aspect ratio
+DEFAULT_WIDTH = 8.0
+DEFAULT_DPI = 100
+
+# Map renderer and line drawings of the worker process, set by the initializer
+_RENDERER = None
+_DRAWINGS = None
+
+
+def map_extent(bounds, margin=0.02):
+    """
+    Pad the bounds of a map.
+
+    Args:
+        bounds (tuple): ``(min_lon, min_lat, max_lon, max_lat)``.
+        margin (float): Padding as a fraction of the larger side.
+
+    Returns:
+        tuple: ``(min_lon, max_lon, min_lat, max_lat)`` in the order of
+        ``imshow`` extents.
+    """
+    min_lon, min_lat, max_lon, max_lat = bounds
+    pad = margin * max(max_lon - min_lon, max_lat - min_lat)
+    return (min_lon - pad, max_lon + pad, min_lat - pad, max_lat + pad)
+
+
+def figure_size(extent, width=DEFAULT_WIDTH):
+    """
+    Size of a figure showing a longitude/latitude extent without distortion.
+
+    Args:
+        extent (tuple): ``(min_lon, max_lon, min_lat, max_lat)``.
+        width (float): Figure width in inches.
+
+    Returns:
+        tuple[float, float]: Width and height in inches.
+    """
+    min_lon, max_lon, min_lat, max_lat = extent
+    # A degree of longitude shrinks with the cosine of the latitude
+    scale = np.cos(np.radians((min_lat + max_lat) / 2.0))
+    return width, width * (max_lat - min_lat) / ((max_lon - min_lon) * scale)
+
+
+def _map_figure(extent, width, dpi):
+    """Create an Agg figure whose single axes fill it and show the extent."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figure_size(extent, width), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_axes([0.0, 0.0, 1.0, 1.0])
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    ax.set_axis_off()
+    return figure, ax
+
+
+def render_base_layer(borders, extent, width=DEFAULT_WIDTH, dpi=DEFAULT_DPI):
+    """
+    Rasterize the border base layer.
+
+    Args:
+        borders (gpd.GeoDataFrame): Border polygons.
+        extent (tuple): ``(min_lon, max_lon, min_lat, max_lat)``.
+        width (float): Figure width in inches.
+        dpi (int): Resolution in dots per inch.
+
+    Returns:
+        np.ndarray: RGBA image of shape ``(height, width, 4)``.
+    """
+    figure, ax = _map_figure(extent, width, dpi)
+    borders.plot(ax=ax, color="white", edgecolor="red", linewidth=0.5)
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    figure.canvas.draw()
+    return np.asarray(figure.canvas.buffer_rgba()).copy()
+
+
+def read_borders(borders_path, width=DEFAULT_WIDTH, dpi=DEFAULT_DPI, margin=0.02):
+    """
+    Read the border polygons and the extent of the map showing them.
+
+    From a level of detail file (see ``lod_store``) only the level that the map
+    resolves at its size is read.
+
+    Args:
+        borders_path (str): GeoJSON file or level of detail Parquet file.
+        width (float): Figure width in inches.
+        dpi (int): Resolution in dots per inch.
+        margin (float): Padding of the map extent, see ``map_extent``.
+
+    Returns:
+        tuple[gpd.GeoDataFrame, tuple]: The borders and the map extent.
+    """
+    if not borders_path.endswith(".parquet"):
+        import geopandas as gpd
+
+        borders = gpd.read_file(borders_path)
+        return borders, map_extent(borders.total_bounds, margin)
+
+    from src.scripts.data_preparation.lod_store import LODStore, resolution_of
+
+    store = LODStore(borders_path, key_column="feature")
+    # The coarsest level is within its tolerance of the full bounds
+    extent = map_extent(store.read(level=store.n_levels - 1).total_bounds, margin)
+    size = np.asarray(figure_size(extent, width)) * dpi
+    return store.read(resolution=resolution_of(extent, size)), extent
+
+
+def load_base_layer(
+    borders_path, cache_directory, width=DEFAULT_WIDTH, dpi=DEFAULT_DPI, margin=0.02
+):
+    """
+    Load the cached base layer of a border file, rendering it on a cache miss.
+
+    Args:
+        borders_path (str): GeoJSON file with the border polygons, or their
+            level of detail file.
+        cache_directory (str): Directory of the cached rasters.
+        width (float): Figure width in inches.
+        dpi (int): Resolution in dots per inch.
+        margin (float): Padding of the map extent, see ``map_extent``.
+
+    Returns:
+        tuple[str, tuple]: Path of the ``.npy`` raster and the map extent.
+    """
+    digest = hashlib.sha256(f"{width}:{dpi}:{margin}:".encode("utf-8"))
+    with open(borders_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    cache_path = os.path.join(cache_directory, f"base_{digest.hexdigest()[:16]}")
+    if os.path.exists(cache_path + ".npy") and os.path.exists(cache_path + ".json"):
+        with open(cache_path + ".json", encoding="utf-8") as file:
+            return cache_path + ".npy", tuple(json.load(file)["extent"])
+
+    borders, extent = read_borders(borders_path, width, dpi, margin)
+    os.makedirs(cache_directory, exist_ok=True)
+    np.save(cache_path + ".npy", render_base_layer(borders, extent, width, dpi))
+    with open(cache_path + ".json", "w", encoding="utf-8") as file:
+        json.dump({"extent": [float(value) for value in extent]}, file)
+    return cache_path + ".npy", extent
+
+
+def line_drawings(line_segments, stations_info, line_ids=None):
+    """
+    Collect the coordinates to draw for every line.
+
+    Args:
+        line_segments (gpd.GeoDataFrame): Segments with ``line_id``,
+            ``start_station_id``, ``end_station_id``, a geometry and optionally
+            ``line_name``.
+        stations_info (pd.DataFrame): Stations ordered by station id with
+            ``latitude`` and ``longitude``.
+        line_ids (list[int], optional): Lines to keep. Defaults to all lines.
+
+    Returns:
+        dict: ``(title, paths, station_coordinates)`` by line id, where ``paths``
+        is a list of ``(n, 2)`` longitude/latitude arrays.
+    """
+    if line_ids is not None:
+        line_segments = line_segments[line_segments["line_id"].isin(line_ids)]
+    line_of_segment = line_segments["line_id"].to_numpy(np.int64)
+    names = (
+        line_segments["line_name"].astype(str).to_numpy()
+        if "line_name" in line_segments.columns
+        else None
+    )
+
+    # Split multi-part geometries so that their parts are not joined up
+    parts, part_segment = shapely.get_parts(
+        line_segments.geometry.to_numpy(), return_index=True
+    )
+    coordinates, part_of_point = shapely.get_coordinates(parts, return_index=True)
+    part_starts = np.searchsorted(part_of_point, np.arange(len(parts) + 1))
+    paths = np.split(coordinates, part_starts[1:-1])
+
+    station_ids = np.stack(
+        [
+            line_segments["start_station_id"].to_numpy(np.int64),
+            line_segments["end_station_id"].to_numpy(np.int64),
+        ],
+        axis=1,
+    )
+    longitude = stations_info["longitude"].to_numpy(np.float64)
+    latitude = stations_info["latitude"].to_numpy(np.float64)
+
+    # Group the segments and parts by line once instead of scanning per line
+    segment_order = np.argsort(line_of_segment, kind="stable")
+    sorted_lines = line_of_segment[segment_order]
+    line_ids, line_starts = np.unique(sorted_lines, return_index=True)
+    segments_of_line = np.split(segment_order, line_starts[1:])
+    line_of_part = line_of_segment[part_segment]
+    part_order = np.argsort(line_of_part, kind="stable")
+    parts_of_line = np.split(
+        part_order, np.searchsorted(line_of_part[part_order], line_ids[1:])
+    )
+    line_ids = line_ids.tolist()
+
+    drawings = {}
+    for line_id, segments, line_parts in zip(line_ids, segments_of_line, parts_of_line):
+        ids = np.unique(station_ids[segments])
+        ids = ids[ids >= 0]
+        title = f"Line {line_id}"
+        if names is not None:
+            title += f": {names[segments[0]]}"
+        drawings[line_id] = (
+            title,
+            [paths[part] for part in line_parts],
+            np.column_stack([longitude[ids], latitude[ids]]),
+        )
+    return drawings
+
+
+class LineMapRenderer:
+    """
+    Reusable map figure that holds the base layer and draws one line at a time.
+
+    Creating a figure costs about as much as drawing a line, so a worker keeps one
+    and only swaps the artists of the line between images.
+    """
+
+    def __init__(self, base, extent, dpi=DEFAULT_DPI):
+        """
+        Create the figure and paste the base layer.
+
+        Args:
+            base (np.ndarray): RGBA base raster, see ``render_base_layer``.
+            extent (tuple): ``(min_lon, max_lon, min_lat, max_lat)`` of the raster.
+            dpi (int): Resolution the base raster was rendered at.
+        """
+        self.dpi = dpi
+        self.extent = extent
+        self.figure, self.ax = _map_figure(extent, base.shape[1] / dpi, dpi)
+        self.ax.imshow(
+            base, extent=extent, interpolation="none", aspect="auto", zorder=0
+        )
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(extent[2], extent[3])
+
+    def render(self, drawing, path):
+        """
+        Render the map of one line.
+
+        Args:
+            drawing (tuple): ``(title, paths, station_coordinates)`` of the line,
+                see ``line_drawings``.
+            path (str): Image file to write; the format follows the extension.
+        """
+        from matplotlib.collections import LineCollection
+
+        title, paths, stations = drawing
+        artists = [
+            self.ax.add_collection(
+                LineCollection(paths, colors="black", linewidths=1.5),
+                autolim=False,
+            ),
+            self.ax.scatter(stations[:, 0], stations[:, 1], s=5, color="blue"),
+            self.ax.text(
+                0.02, 0.98, title, transform=self.ax.transAxes, va="top", fontsize=10
+            ),
+        ]
+        options = {}
+        if path.lower().endswith(".png"):
+            # Fast zlib level: the maps are mostly flat colour and compress well
+            options["pil_kwargs"] = {"compress_level": 1}
+        try:
+            self.ax.set_xlim(self.extent[0], self.extent[1])
+            self.ax.set_ylim(self.extent[2], self.extent[3])
+            self.figure.savefig(path, dpi=self.dpi, **options)
+        finally:
+            for artist in artists:
+                artist.remove()
+
+
+def _init_worker(base_path, extent, drawings, dpi):
+    """Load the shared base raster and line drawings once per worker."""
+    global _RENDERER, _DRAWINGS
+    _RENDERER = LineMapRenderer(np.load(base_path, mmap_mode="r"), extent, dpi)
+    _DRAWINGS = drawings
+
+
+def _render(job):
+    """Render one line in a worker."""
+    line_id, path = job
+    _RENDERER.render(_DRAWINGS[line_id], path)
+    return path
+
+
+def render_atlas(
+    line_segments,
+    stations_info,
+    borders_path,
+    output_directory,
+    line_ids=None,
+    image_format="png",
+    width=DEFAULT_WIDTH,
+    dpi=DEFAULT_DPI,
+    max_workers=None,
+):
+    """
+    Render the map of every line, or of the selected lines, in parallel.
+
+    Args:
+        line_segments (gpd.GeoDataFrame): Segments, see ``line_drawings``.
+        stations_info (pd.DataFrame): Stations, see ``line_drawings``.
+        borders_path (str): GeoJSON file with the border polygons, or their
+            level of detail file.
+        output_directory (str): Directory of the images; the base layer is
+            cached in its ``.cache`` subdirectory.
+        line_ids (list[int], optional): Lines to render. Defaults to all lines.
+        image_format (str): Image file extension, e.g. ``png`` or ``jpeg``.
+        width (float): Figure width in inches.
+        dpi (int): Resolution in dots per inch.
+        max_workers (int, optional): Number of worker processes.
+
+    Returns:
+        list[str]: Paths of the written images.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    base_path, extent = load_base_layer(
+        borders_path, os.path.join(output_directory, ".cache"), width, dpi
+    )
+    drawings = line_drawings(line_segments, stations_info, line_ids)
+    jobs = [
+        (line_id, os.path.join(output_directory, f"line_{line_id}.{image_format}"))
+        for line_id in drawings
+    ]
+    if not jobs:
+        return []
+
+    n_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=(base_path, extent, drawings, dpi),
+    ) as executor:
+        chunksize = max(1, len(jobs) // (4 * n_workers))
+        return list(executor.map(_render, jobs, chunksize=chunksize))
+
+
+def main():
+    """Parse the command line and render the line atlas."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIRECTORY)
+    parser.add_argument("--lines", type=int, nargs="*", default=None)
+    parser.add_argument(
+        "--borders",
+        default=os.path.join("raw", "gadm41_CHE_1.json"),
+        help="Border GeoJSON or level of detail file, relative to the data root.",
+    )
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    processed = os.path.join(args.data_root, "processed")
+    line_segments = processed_store.read_table(
+        os.path.join(processed, "line_segments.parquet"),
+        columns=[
+            "line_id",
+            "line_name",
+            "start_station_id",
+            "end_station_id",
+            "geometry",
+        ],
+        line_ids=args.lines,
+    )
+    stations_info = processed_store.read_table(
+        os.path.join(processed, "stations_info.parquet"),
+        columns=["latitude", "longitude"],
+    )
+    paths = render_atlas(
+        line_segments,
+        stations_info,
+        os.path.join(args.data_root, args.borders),
+        args.output,
+        line_ids=args.lines,
+        image_format=args.format,
+        dpi=args.dpi,
+        max_workers=args.workers,
+    )
+    print(f"Rendered {len(paths)} line maps to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
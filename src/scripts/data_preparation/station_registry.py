@@ -0,0 +1,263 @@
+"""
+Central registry of the stations (operating points with a DIDOK number).
+
+Every DIDOK number gets a dense int32 ``station_id`` in ascending DIDOK order.
+Abbreviations, names and sloids are kept once per station in dictionary-encoded
+(categorical) arrays, and the processed tables as well as the simulation refer
+to stations by their id. Hash indexes give O(1) lookups from every key to the id
+and array indexing gives O(1) lookups from the id back to every attribute.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.scripts.data_preparation import processed_store
+
+STATION_COLUMNS = [
+    "station_id",
+    "station_abbr",
+    "stop_name",
+    "didok",
+    "bpuic",
+    "sloid",
+    "latitude",
+    "longitude",
+]
+
+
+class StationRegistry:
+    """
+    Stations indexed by a dense id.
+
+    Attributes:
+        didok (np.ndarray): Ascending DIDOK number of every station id.
+        station_abbr (pd.Categorical): Abbreviation of every station id.
+        stop_name (pd.Categorical): Name of every station id.
+        sloid (pd.Categorical): Swiss location id of every station id.
+        bpuic (np.ndarray): UIC number of every station id.
+        latitude (np.ndarray): Latitude of every station id.
+        longitude (np.ndarray): Longitude of every station id.
+    """
+
+    def __init__(
+        self,
+        didok,
+        station_abbr,
+        stop_name,
+        sloid,
+        bpuic=None,
+        latitude=None,
+        longitude=None,
+    ):
+        """
+        Build the registry from per-station arrays, one entry per DIDOK number.
+
+        The stations are sorted by DIDOK number; repeated DIDOK numbers keep their
+        first entry.
+
+        Args:
+            didok (array-like): DIDOK number of every station.
+            station_abbr (array-like): Abbreviation of every station.
+            stop_name (array-like): Name of every station.
+            sloid (array-like): Swiss location id of every station.
+            bpuic (array-like, optional): UIC number of every station.
+            latitude (array-like, optional): Latitude of every station.
+            longitude (array-like, optional): Longitude of every station.
+        """
+        didok = np.asarray(didok, dtype=np.int64)
+        n = len(didok)
+        order = np.argsort(didok, kind="stable")
+        order = order[np.r_[True, np.diff(didok[order]) != 0]] if n else order
+
+        def column(values, dtype=None, default=np.nan):
+            if values is None:
+                values = np.full(n, default)
+            return np.asarray(values, dtype=dtype)[order]
+
+        def categorical(values):
+            return pd.Categorical(np.asarray(values, dtype=object)[order])
+
+        self.didok = didok[order]
+        self.station_abbr = categorical(station_abbr)
+        self.stop_name = categorical(stop_name)
+        self.sloid = categorical(sloid)
+        self.bpuic = column(bpuic, np.int64, default=-1)
+        self.latitude = column(latitude, np.float64)
+        self.longitude = column(longitude, np.float64)
+
+        self._didok_index = pd.Index(self.didok)
+        self._abbr_ids = self._first_id_of_codes(self.station_abbr)
+        self._sloid_ids = self._first_id_of_codes(self.sloid)
+
+    @staticmethod
+    def _first_id_of_codes(values):
+        """Map every category of a categorical to the first id that has it."""
+        first = np.full(len(values.categories), -1, dtype=np.int32)
+        codes = values.codes
+        ids = np.arange(len(codes), dtype=np.int32)
+        valid = codes >= 0
+        # Assign in reverse so that the first id wins
+        first[codes[valid][::-1]] = ids[valid][::-1]
+        return first
+
+    @classmethod
+    def from_stations_info(cls, stations_info):
+        """
+        Build the registry from a stations_info table.
+
+        Args:
+            stations_info (pd.DataFrame): Stations with ``didok``, ``station_abbr``,
+                ``stop_name``, ``sloid`` and optionally ``bpuic``, ``latitude`` and
+                ``longitude``.
+
+        Returns:
+            StationRegistry: The registry.
+        """
+        optional = {
+            name: stations_info[name].to_numpy()
+            for name in ["bpuic", "latitude", "longitude"]
+            if name in stations_info.columns
+        }
+        return cls(
+            stations_info["didok"].to_numpy(),
+            stations_info["station_abbr"].to_numpy(dtype=object),
+            stations_info["stop_name"].to_numpy(dtype=object),
+            stations_info["sloid"].to_numpy(dtype=object),
+            **optional,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the registry from ``stations_info.parquet``.
+
+        Args:
+            path (str): Path of the Parquet file.
+
+        Returns:
+            StationRegistry: The registry.
+        """
+        return cls.from_stations_info(processed_store.read_table(path))
+
+    def to_frame(self):
+        """
+        Return the registry as a table, one row per station id.
+
+        Returns:
+            pd.DataFrame: Table with the columns of ``STATION_COLUMNS``.
+        """
+        return pd.DataFrame(
+            {
+                "station_id": np.arange(len(self), dtype=np.int32),
+                "station_abbr": self.station_abbr,
+                "stop_name": self.stop_name,
+                "didok": self.didok,
+                "bpuic": self.bpuic,
+                "sloid": self.sloid,
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+            }
+        )
+
+    def save(self, path):
+        """
+        Save the registry, e.g. as ``stations_info.parquet``.
+
+        Args:
+            path (str): Path of the Parquet file.
+        """
+        processed_store.write_table(self.to_frame(), path, key_column="station_id")
+
+    def __len__(self):
+        return len(self.didok)
+
+    def ids_of_didok(self, didoks):
+        """
+        Look up the station ids of DIDOK numbers.
+
+        Args:
+            didoks (array-like): DIDOK numbers.
+
+        Returns:
+            np.ndarray: Station id of every DIDOK number, -1 if unknown.
+        """
+        ids = self._didok_index.get_indexer(np.asarray(didoks, dtype=np.int64))
+        return ids.astype(np.int32)
+
+    def ids_of_abbr(self, abbrs):
+        """
+        Look up the station ids of abbreviations.
+
+        Args:
+            abbrs (array-like): Station abbreviations.
+
+        Returns:
+            np.ndarray: Station id of every abbreviation, -1 if unknown.
+        """
+        codes = self.station_abbr.categories.get_indexer(
+            pd.Index(np.asarray(abbrs, dtype=object))
+        )
+        return np.where(codes >= 0, self._abbr_ids[codes], -1).astype(np.int32)
+
+    def ids_of_sloid(self, sloids):
+        """
+        Look up the station ids of Swiss location ids.
+
+        Args:
+            sloids (array-like): Swiss location ids.
+
+        Returns:
+            np.ndarray: Station id of every sloid, -1 if unknown.
+        """
+        codes = self.sloid.categories.get_indexer(
+            pd.Index(np.asarray(sloids, dtype=object))
+        )
+        return np.where(codes >= 0, self._sloid_ids[codes], -1).astype(np.int32)
+
+    def didok_of(self, ids):
+        """
+        Look up the DIDOK numbers of station ids.
+
+        Args:
+            ids (array-like): Station ids.
+
+        Returns:
+            np.ndarray: DIDOK number of every station id.
+        """
+        return self.didok[np.asarray(ids)]
+
+    def abbr_of(self, ids):
+        """
+        Look up the abbreviations of station ids.
+
+        Args:
+            ids (array-like): Station ids.
+
+        Returns:
+            np.ndarray: Abbreviation of every station id.
+        """
+        return np.asarray(self.station_abbr.take(np.asarray(ids)), dtype=object)
+
+    def name_of(self, ids):
+        """
+        Look up the names of station ids.
+
+        Args:
+            ids (array-like): Station ids.
+
+        Returns:
+            np.ndarray: Name of every station id.
+        """
+        return np.asarray(self.stop_name.take(np.asarray(ids)), dtype=object)
+
+    def sloid_of(self, ids):
+        """
+        Look up the Swiss location ids of station ids.
+
+        Args:
+            ids (array-like): Station ids.
+
+        Returns:
+            np.ndarray: Sloid of every station id.
+        """
+        return np.asarray(self.sloid.take(np.asarray(ids)), dtype=object)
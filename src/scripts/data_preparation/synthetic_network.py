@@ -0,0 +1,463 @@
+"""
+Synthetic railway networks in the layout of the raw open-data files.
+
+The generator writes ``linie.csv``, ``linie-mit-betriebspunkten.csv`` and
+``linie-mit-polygon.csv`` with the headers, column order, semicolon delimiter,
+GeoJSON ``geo_shape`` strings and ``"latitude, longitude"`` pairs of the Swiss
+files, so every loader and stage can be run on networks of any size.
+
+Stations sit on a jittered grid and every line is a walk over neighbouring grid
+nodes, so lines cross and share stations like a real network. The topology sets
+where the walks start and how often they turn:
+
+- ``lattice``: straight lines from random stations, crossing at right angles.
+- ``mesh``: lines from random stations that turn now and then.
+- ``radial``: lines that all start at the central station.
+
+All lines are walked at once with NumPy and the CSV text is built with Arrow
+string kernels, in chunks of lines of a bounded size, so networks with millions
+of segments are written in seconds to minutes with bounded memory. The output
+only depends on the arguments and the seed.
+
+Usage:
+    python -m src.scripts.data_preparation.synthetic_network --lines 50000
+        --stations-per-line 40 --topology mesh --seed 0 --data-root data/synthetic
+"""
+
+import argparse
+import csv
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from src.scripts.data_preparation.linie_mit_polygon_processing import (
+    CSV_COLUMN_NAMES as POLYGON_HEADER,
+)
+
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir)
+)
+DEFAULT_DATA_ROOT = os.path.join(PROJECT_ROOT, "data", "synthetic")
+
+_CONTENT_TYPE = "Content-Type: text/plain; charset=utf-8\n"
+# Header records of the raw files, in file order
+LINIE_HEADER = (
+    ["Line", "Line", "START OPK", "END OPK", "KM START", "KM END"]
+    + [_CONTENT_TYPE] * 3
+    + ["geo_point_2d"]
+)
+BETRIEBSPUNKTE_HEADER = [
+    "Station abbreviation",
+    "Stop name",
+    "Line",
+    "KM",
+    "Line",
+    "Geopos",
+    "Didok number",
+    "OPUIC",
+    "Stop name",
+    "lod",
+    "sloid",
+]
+
+# Topology -> (probability that a line turns at a station, start at the centre)
+TOPOLOGIES = {
+    "lattice": (0.0, False),
+    "mesh": (0.25, False),
+    "radial": (0.15, True),
+}
+# South-west corner of the grid (longitude, latitude) and its spacing in degrees
+ORIGIN = (5.9, 45.8)
+GRID_SPACING = 0.05
+# Largest extent of the grid in degrees of latitude, 1.5 times that in longitude;
+# larger grids are packed closer so every station stays below 90°N
+MAX_GRID_EXTENT = 40.0
+# Average number of lines through a station, sets the size of the grid
+LINES_PER_STATION = 3
+# Stations generated and written at a time, in whole lines
+CHUNK_STATIONS = 100000
+# Share of the lines on metre gauge track
+METRE_GAUGE_SHARE = 0.1
+_LOD = "http://lod.opentransportdata.swiss/didok/didok85"
+# Grid steps east, north, west and south
+_STEPS = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]])
+
+
+def _hash_uniform(values, salt):
+    """Deterministic uniform numbers in [0, 1) derived from integers."""
+    x = values.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(salt)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def grid_size(n_lines, stations_per_line):
+    """Number of grid nodes per side for a network of this size."""
+    nodes = n_lines * stations_per_line / LINES_PER_STATION
+    return max(2, int(np.ceil(np.sqrt(nodes))))
+
+
+def grid_spacing(side):
+    """Spacing in degrees of latitude between the nodes of a grid of this size."""
+    return min(GRID_SPACING, MAX_GRID_EXTENT / side)
+
+
+def walk_lines(rng, n_lines, stations_per_line, side, topology="mesh"):
+    """
+    Walk lines over the station grid.
+
+    Lines never turn back onto the station they came from; at the edge of the
+    grid they turn along it.
+
+    Args:
+        rng (np.random.Generator): Random numbers of the walks.
+        n_lines (int): Number of lines.
+        stations_per_line (int): Stations visited by every line.
+        side (int): Grid nodes per side.
+        topology (str): Key of ``TOPOLOGIES``.
+
+    Returns:
+        np.ndarray: Grid node of every station of every line, shape
+        ``(n_lines, stations_per_line)``.
+    """
+    turn_probability, from_centre = TOPOLOGIES[topology]
+    if from_centre:
+        position = np.full((n_lines, 2), side // 2)
+    else:
+        position = rng.integers(0, side, (n_lines, 2))
+    direction = rng.integers(0, 4, n_lines)
+    nodes = np.empty((n_lines, stations_per_line), dtype=np.int64)
+    nodes[:, 0] = position[:, 1] * side + position[:, 0]
+    for step in range(1, stations_per_line):
+        turns = rng.random(n_lines) < turn_probability
+        direction = np.where(
+            turns, (direction + rng.choice([1, 3], n_lines)) % 4, direction
+        )
+        # Turn left, else right, where the line would leave the grid
+        for rotation in (0, 1, 2):
+            candidate = position + _STEPS[direction]
+            outside = ((candidate < 0) | (candidate >= side)).any(axis=1)
+            if not outside.any():
+                break
+            direction = np.where(outside, (direction + 1 + rotation) % 4, direction)
+        position = position + _STEPS[direction]
+        nodes[:, step] = position[:, 1] * side + position[:, 0]
+    return nodes
+
+
+def station_coordinates(nodes, side, spacing=None):
+    """Longitude and latitude of grid nodes, jittered by up to a third step."""
+    if spacing is None:
+        spacing = grid_spacing(side)
+    column, row = nodes % side, nodes // side
+    jitter_x = (_hash_uniform(nodes, 1) - 0.5) * 0.6
+    jitter_y = (_hash_uniform(nodes, 2) - 0.5) * 0.6
+    longitude = ORIGIN[0] + (column + jitter_x) * spacing * 1.5
+    latitude = ORIGIN[1] + (row + jitter_y) * spacing
+    return longitude, latitude
+
+
+def station_abbreviations(nodes, n_letters):
+    """Upper-case station abbreviations, the base 26 digits of the grid node."""
+    digits = (nodes[:, None] // 26 ** np.arange(n_letters - 1, -1, -1)) % 26
+    letters = (digits + ord("A")).astype(np.uint8)
+    return pa.array(letters.view(f"S{n_letters}").ravel()).cast(pa.string())
+
+
+def _text(values, decimals=None):
+    """Format numbers as strings with Arrow."""
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return pc.cast(pa.array(values), pa.string())
+
+
+def _join(*parts):
+    """Concatenate string arrays and literals element-wise."""
+    return pc.binary_join_element_wise(*parts, "")
+
+
+def _linestrings(longitude, latitude):
+    """GeoJSON LineString strings of rows of vertices, shape ``(rows, vertices)``."""
+    n_rows, n_vertices = longitude.shape
+    vertices = _join(
+        "[", _text(longitude.ravel(), 8), ", ", _text(latitude.ravel(), 8), "]"
+    )
+    offsets = pa.array(
+        np.arange(0, n_rows * n_vertices + 1, n_vertices, dtype=np.int32)
+    )
+    coordinates = pc.binary_join(pa.ListArray.from_arrays(offsets, vertices), ", ")
+    return _join('{"coordinates": [', coordinates, '], "type": "LineString"}')
+
+
+def _pairs(latitude, longitude):
+    """``"latitude, longitude"`` strings."""
+    return _join(_text(latitude, 10), ", ", _text(longitude, 10))
+
+
+def segment_vertices(start, end, n_vertices, wiggle):
+    """
+    Vertices of the track between consecutive stations.
+
+    The track bends away from the straight line between the stations by up to
+    ``wiggle`` degrees, in the middle and to a side given per segment.
+
+    Args:
+        start (tuple[np.ndarray, np.ndarray]): Longitude and latitude of the
+            first station of every segment.
+        end (tuple[np.ndarray, np.ndarray]): The same of the last station.
+        n_vertices (int): Vertices per segment, including both stations.
+        wiggle (np.ndarray): Signed bend of every segment in degrees.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Longitudes and latitudes, shape
+        ``(segments, n_vertices)``.
+    """
+    t = np.linspace(0.0, 1.0, n_vertices)
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    norm = np.maximum(np.hypot(dx, dy), 1e-12)
+    bend = np.sin(np.pi * t) * wiggle[:, None]
+    longitude = start[0][:, None] + t * dx[:, None] - bend * (dy / norm)[:, None]
+    latitude = start[1][:, None] + t * dy[:, None] + bend * (dx / norm)[:, None]
+    return longitude, latitude
+
+
+def _line_vertices(track, stations, vertices_per_segment):
+    """Join the segment vertices of every line, dropping the repeated stations."""
+    n_lines = len(stations)
+    inner = track.reshape(n_lines, -1, vertices_per_segment)[:, :, :-1]
+    return np.concatenate([inner.reshape(n_lines, -1), stations[:, -1:]], axis=1)
+
+
+def _track_km(longitude, latitude):
+    """Length of polylines in km on an equirectangular approximation."""
+    dx = np.diff(longitude, axis=-1) * np.cos(np.radians(latitude[..., 1:]))
+    dy = np.diff(latitude, axis=-1)
+    return (np.hypot(dx, dy) * 111.2).sum(axis=-1)
+
+
+def generate_chunk(
+    rng, first_line, n_lines, stations_per_line, side, topology, vertices_per_segment
+):
+    """
+    Generate the rows of the raw files for a chunk of lines.
+
+    Args:
+        rng (np.random.Generator): Random numbers of the chunk.
+        first_line (int): Index of the first line of the chunk.
+        n_lines (int): Lines in the chunk.
+        stations_per_line (int): Stations visited by every line.
+        side (int): Grid nodes per side.
+        topology (str): Key of ``TOPOLOGIES``.
+        vertices_per_segment (int): Vertices of the track between two stations.
+
+    Returns:
+        dict: ``pa.Table`` of the rows of every raw file by file name.
+    """
+    nodes = walk_lines(rng, n_lines, stations_per_line, side, topology)
+    n_segments = stations_per_line - 1
+    line_id = np.arange(first_line, first_line + n_lines) + 1
+    spacing = grid_spacing(side)
+    longitude, latitude = station_coordinates(nodes, side, spacing)
+
+    wiggle = (rng.random((n_lines, n_segments)) - 0.5) * 0.2 * spacing
+    track_x, track_y = segment_vertices(
+        (longitude[:, :-1].ravel(), latitude[:, :-1].ravel()),
+        (longitude[:, 1:].ravel(), latitude[:, 1:].ravel()),
+        vertices_per_segment,
+        wiggle.ravel(),
+    )
+    segment_km = _track_km(track_x, track_y).reshape(n_lines, n_segments)
+    km = np.round(
+        np.concatenate([np.zeros((n_lines, 1)), segment_km.cumsum(axis=1)], axis=1), 3
+    )
+
+    n_letters = max(3, int(np.ceil(np.log(side * side) / np.log(26))))
+    abbr = station_abbreviations(nodes.ravel(), n_letters)
+    name = _join("Synthetic ", abbr)
+    start_name = pc.take(name, pa.array(np.arange(n_lines) * stations_per_line))
+    end_name = pc.take(
+        name, pa.array(np.arange(n_lines) * stations_per_line + n_segments)
+    )
+    line_name = _join(start_name, " - ", end_name)
+    gauge = np.where(rng.random(n_lines) < METRE_GAUGE_SHARE, "1000", "1435")
+
+    # linie.csv: one row per line with the track of the whole line
+    line_x = _line_vertices(track_x, longitude, vertices_per_segment)
+    line_y = _line_vertices(track_y, latitude, vertices_per_segment)
+    middle = line_x.shape[1] // 2
+    linie = pa.table(
+        {
+            "line_id": line_id,
+            "line_name": line_name,
+            "start_opk": start_name,
+            "end_opk": end_name,
+            "km_start": km[:, 0],
+            "km_end": km[:, -1],
+            "stationierung_anfang": np.zeros(n_lines, dtype=np.int64),
+            "stationierung_ende": np.full(n_lines, 1000000),
+            "geo_shape": _linestrings(line_x, line_y),
+            "geo_point_2d": _pairs(line_y[:, middle], line_x[:, middle]),
+        }
+    )
+
+    # linie-mit-betriebspunkten.csv: one row per station of every line
+    didok = nodes.ravel() + 1
+    line_of_station = np.repeat(np.arange(n_lines), stations_per_line)
+    betriebspunkte = pa.table(
+        {
+            "station_abbr": abbr,
+            "stop_name": name,
+            "line": line_id[line_of_station],
+            "km": km.ravel(),
+            "line_name": pc.take(line_name, pa.array(line_of_station)),
+            "geo_position": _pairs(latitude.ravel(), longitude.ravel()),
+            "didok": didok,
+            "bpuic": didok + 8500000,
+            "stop_name_duplicate": name,
+            "lod": pa.repeat(_LOD, len(didok)),
+            "sloid": _join("ch:1:sloid:", _text(didok)),
+        }
+    )
+
+    # linie-mit-polygon.csv: one row per segment between consecutive stations
+    first = (
+        np.arange(n_lines)[:, None] * stations_per_line + np.arange(n_segments)
+    ).ravel()
+    line_of_segment = np.repeat(np.arange(n_lines), n_segments)
+    middle_x = track_x[:, vertices_per_segment // 2]
+    middle_y = track_y[:, vertices_per_segment // 2]
+    polygon = pa.table(
+        {
+            "geo_point_2d": _pairs(middle_y, middle_x),
+            "geo_shape": _linestrings(track_x, track_y),
+            "track_gauge": gauge[line_of_segment],
+            "segment_start": km[:, :-1].ravel(),
+            "segment_end": km[:, 1:].ravel(),
+            "start_station": pc.take(abbr, pa.array(first)),
+            "start_station_name": pc.take(name, pa.array(first)),
+            "end_station": pc.take(abbr, pa.array(first + 1)),
+            "end_station_name": pc.take(name, pa.array(first + 1)),
+            "line_id": line_id[line_of_segment],
+            "line_name": pc.take(line_name, pa.array(line_of_segment)),
+        }
+    )
+    return {
+        "linie.csv": linie,
+        "linie-mit-betriebspunkten.csv": betriebspunkte,
+        "linie-mit-polygon.csv": polygon,
+    }
+
+
+def generate_network(
+    data_root,
+    n_lines,
+    stations_per_line=20,
+    topology="mesh",
+    vertices_per_segment=4,
+    seed=0,
+):
+    """
+    Write the raw files of a synthetic network.
+
+    Args:
+        data_root (str): Data root; the files are written to its ``raw/``.
+        n_lines (int): Number of lines.
+        stations_per_line (int): Stations on every line, at least 2.
+        topology (str): ``"lattice"``, ``"mesh"`` or ``"radial"``.
+        vertices_per_segment (int): Vertices of the track between two stations,
+            at least 2.
+        seed (int): Seed of the random numbers.
+
+    Returns:
+        dict: Number of rows written to every raw file by file name.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(
+            f"Unknown topology {topology!r}, expected one of {list(TOPOLOGIES)}"
+        )
+    if stations_per_line < 2 or vertices_per_segment < 2:
+        raise ValueError("Lines need at least 2 stations and segments 2 vertices")
+
+    directory = os.path.join(data_root, "raw")
+    os.makedirs(directory, exist_ok=True)
+    headers = {
+        "linie.csv": LINIE_HEADER,
+        "linie-mit-betriebspunkten.csv": BETRIEBSPUNKTE_HEADER,
+        "linie-mit-polygon.csv": POLYGON_HEADER,
+    }
+    files, writers = {}, {}
+    for file_name, header in headers.items():
+        path = os.path.join(directory, file_name)
+        # The raw files start with a byte order mark
+        with open(path, "w", newline="", encoding="utf-8-sig") as file:
+            csv.writer(file, delimiter=";").writerow(header)
+        files[file_name] = open(path, "ab")
+
+    side = grid_size(n_lines, stations_per_line)
+    chunk_lines = max(1, CHUNK_STATIONS // stations_per_line)
+    rows = dict.fromkeys(headers, 0)
+    try:
+        for chunk, first_line in enumerate(range(0, n_lines, chunk_lines)):
+            # Every chunk draws from its own stream of the seed
+            rng = np.random.default_rng([seed, chunk])
+            tables = generate_chunk(
+                rng,
+                first_line,
+                min(chunk_lines, n_lines - first_line),
+                stations_per_line,
+                side,
+                topology,
+                vertices_per_segment,
+            )
+            for file_name, table in tables.items():
+                if file_name not in writers:
+                    writers[file_name] = pa_csv.CSVWriter(
+                        files[file_name],
+                        table.schema,
+                        write_options=pa_csv.WriteOptions(
+                            include_header=False, delimiter=";"
+                        ),
+                    )
+                writers[file_name].write_table(table)
+                rows[file_name] += table.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+        for file in files.values():
+            file.close()
+    return rows
+
+
+def main():
+    """Parse the command line and write a synthetic network."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--stations-per-line", type=int, default=20)
+    parser.add_argument("--topology", choices=list(TOPOLOGIES), default="mesh")
+    parser.add_argument("--vertices-per-segment", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = generate_network(
+        args.data_root,
+        args.lines,
+        args.stations_per_line,
+        args.topology,
+        args.vertices_per_segment,
+        args.seed,
+    )
+    for file_name, n_rows in rows.items():
+        print(
+            f"Wrote {n_rows} rows to {os.path.join(args.data_root, 'raw', file_name)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
-import pandas as pd
+from src.network.railway_network import RailwayNetwork
 
-# Load the dataset
-file_path = r"C:\PhD\Codes\railway_simulation\data\processed\stations_info.csv"
-stations_info = pd.read_csv(file_path)
+# Load the dataset from the shared network, parsed once per process
+stations_info = RailwayNetwork.open().stations[["didok", "station_abbr", "stop_name"]]
 
 # Count unique values for Didok numbers, station abbreviations, and station names
 unique_didok = stations_info["didok"].nunique()
@@ -0,0 +1,295 @@
+"""
+Conflict detection between the track occupations of different trains.
+
+A track occupation (blocking time) is a time interval during which a train holds
+a km range of a track, e.g. a block section of a graph edge. Two occupations
+conflict when they belong to different trains, lie on the same track and
+overlap in both time and km range.
+
+``find_conflicts`` reports every conflict of a whole timetable with one sorted
+sweep per track in vectorized form, in O(n log n) plus the number of occupations
+overlapping in time. ``ConflictDetector`` keeps the occupations of every track in
+a sorted list so that train paths can be inserted and removed one at a time.
+Occupation tables use the columns of ``EventDrivenSimulation.occupations``; an
+occupation whose end is NaN (a block still held at the end of a run) is open and
+runs to +inf.
+"""
+
+from bisect import bisect_left, insort
+
+import numpy as np
+import pandas as pd
+
+CONFLICT_COLUMNS = [
+    "first",
+    "second",
+    "train_first",
+    "train_second",
+    "track",
+    "start",
+    "end",
+]
+
+
+def _intervals(occupations, track_column, start_column, end_column):
+    """Extract the interval arrays of an occupation table."""
+    km_start = occupations["km_start"].to_numpy(np.float64)
+    km_end = occupations["km_end"].to_numpy(np.float64)
+    end = occupations[end_column].to_numpy(np.float64)
+    return (
+        occupations[track_column].to_numpy(np.int64),
+        occupations[start_column].to_numpy(np.float64),
+        # Open occupations have no end yet
+        np.where(np.isnan(end), np.inf, end),
+        np.minimum(km_start, km_end),
+        np.maximum(km_start, km_end),
+        occupations["train"].to_numpy(np.int64),
+    )
+
+
+def find_conflicts(
+    occupations, track_column="edge", start_column="reserved", end_column="released"
+):
+    """
+    Find all pairs of conflicting occupations in a timetable.
+
+    Occupations are sorted by track and start time. Every occupation can then only
+    conflict with the ones after it on its track that start before it ends, which
+    one ``searchsorted`` finds for all occupations at once. Only these candidate
+    pairs are checked for km overlap.
+
+    Args:
+        occupations (pd.DataFrame): Occupations with ``train``, ``km_start``,
+            ``km_end`` and the track, start and end time columns.
+        track_column (str): Column identifying the track.
+        start_column (str): Column with the start of the blocking time.
+        end_column (str): Column with the end of the blocking time, NaN for
+            open occupations.
+
+    Returns:
+        pd.DataFrame: One row per conflict with the index labels of both
+        occupations (``first`` starts first), their trains, the track and the
+        ``start`` and ``end`` of the time overlap (inf if both are open).
+    """
+    track, start, end, km_low, km_high, train = _intervals(
+        occupations, track_column, start_column, end_column
+    )
+    if len(track) == 0:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+
+    order = np.lexsort((start, track))
+    track, start, end = track[order], start[order], end[order]
+    km_low, km_high, train = km_low[order], km_high[order], train[order]
+
+    # Shift every track into its own disjoint time range so that one sorted key
+    # array covers all tracks. The range is sized from the finite times; open
+    # occupations are searched up to its end, past every start of their track.
+    finite_end = end[np.isfinite(end)]
+    horizon = max(finite_end.max(initial=start.max()), start.max())
+    span = horizon - start.min() + 1.0
+    _, track_rank = np.unique(track, return_inverse=True)
+    base = track_rank * span - start.min()
+    keys = start + base
+    last = np.searchsorted(keys, np.minimum(end, horizon + 0.5) + base, side="left")
+
+    first = np.arange(len(keys))
+    counts = np.maximum(last - first - 1, 0)
+    a = np.repeat(first, counts)
+    # Offsets 1..count within every run of candidates
+    b = a + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    conflicting = (
+        (train[a] != train[b])
+        & (end[b] > start[a])
+        & (km_low[a] < km_high[b])
+        & (km_low[b] < km_high[a])
+    )
+    a, b = a[conflicting], b[conflicting]
+    labels = occupations.index.to_numpy()[order]
+    return pd.DataFrame(
+        {
+            "first": labels[a],
+            "second": labels[b],
+            "train_first": train[a],
+            "train_second": train[b],
+            "track": track[a],
+            "start": start[b],
+            "end": np.minimum(end[a], end[b]),
+        }
+    )
+
+
+class ConflictDetector:
+    """
+    Incrementally maintained conflicts of a changing timetable.
+
+    Every track keeps its occupations in a list sorted by start time, together
+    with the longest finite occupation ever stored on it. The occupations that
+    can overlap a new one therefore start within one longest duration before it,
+    and two bisections find them; open occupations are kept aside per track and
+    checked against every new one.
+
+    Attributes:
+        conflicts (dict): Time overlap ``(start, end)`` of every conflicting pair of
+            occupation ids, keyed by ``(first_id, second_id)``.
+    """
+
+    def __init__(
+        self, track_column="edge", start_column="reserved", end_column="released"
+    ):
+        """
+        Create an empty detector.
+
+        Args:
+            track_column (str): Column identifying the track.
+            start_column (str): Column with the start of the blocking time.
+            end_column (str): Column with the end of the blocking time.
+        """
+        self.track_column = track_column
+        self.start_column = start_column
+        self.end_column = end_column
+        self.conflicts = {}
+
+        self._occupations = {}
+        self._tracks = {}
+        self._longest = {}
+        self._open = {}
+        self._train_occupations = {}
+        self._pairs_of = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._occupations)
+
+    def add(self, occupations):
+        """
+        Insert the occupations of one or more train paths.
+
+        Args:
+            occupations (pd.DataFrame): Occupations to insert, see ``find_conflicts``.
+
+        Returns:
+            list[tuple[int, int]]: Occupation id pairs of the conflicts the new
+            occupations cause, see ``conflict_table`` for details.
+        """
+        new = []
+        for track, start, end, km_low, km_high, train in zip(
+            *(
+                values.tolist()
+                for values in _intervals(
+                    occupations, self.track_column, self.start_column, self.end_column
+                )
+            )
+        ):
+            occupation_id = self._next_id
+            self._next_id += 1
+            new.extend(
+                self._insert(occupation_id, track, start, end, km_low, km_high, train)
+            )
+        return new
+
+    def conflict_table(self, pairs=None):
+        """
+        Describe conflicts in the layout of ``find_conflicts``.
+
+        Args:
+            pairs (list[tuple[int, int]], optional): Occupation id pairs, e.g. as
+                returned by ``add``. Defaults to all current conflicts.
+
+        Returns:
+            pd.DataFrame: The conflicts, with occupation ids in ``first`` and
+            ``second``.
+        """
+        occupations = self._occupations
+        pairs = sorted(self.conflicts) if pairs is None else pairs
+        return pd.DataFrame(
+            [
+                (first, second, occupations[first][5], occupations[second][5])
+                + (occupations[first][0],)
+                + self.conflicts[first, second]
+                for first, second in pairs
+                if (first, second) in self.conflicts
+            ],
+            columns=CONFLICT_COLUMNS,
+        )
+
+    def _insert(self, occupation_id, track, start, end, km_low, km_high, train):
+        """Store one occupation and register its conflicts."""
+        entries = self._tracks.setdefault(track, [])
+        open_ids = self._open.setdefault(track, set())
+        longest = self._longest.get(track, 0.0)
+        if end != np.inf:
+            longest = max(longest, end - start)
+            self._longest[track] = longest
+
+        found = []
+        low = bisect_left(entries, (start - longest,))
+        high = bisect_left(entries, (end,))
+        # Open occupations that started before the window can still overlap
+        candidates = entries[low:high] + [
+            (self._occupations[other_id][1], other_id)
+            for other_id in open_ids
+            if self._occupations[other_id][1] < start - longest
+        ]
+        for other_start, other_id in candidates:
+            _, _, other_end, other_low, other_high, other_train = self._occupations[
+                other_id
+            ]
+            if (
+                other_train != train
+                and other_end > start
+                and other_low < km_high
+                and km_low < other_high
+            ):
+                pair = (other_id, occupation_id)
+                if (other_start, other_id) > (start, occupation_id):
+                    pair = (occupation_id, other_id)
+                self.conflicts[pair] = (max(start, other_start), min(end, other_end))
+                self._pairs_of.setdefault(other_id, set()).add(pair)
+                self._pairs_of.setdefault(occupation_id, set()).add(pair)
+                found.append(pair)
+
+        self._occupations[occupation_id] = (track, start, end, km_low, km_high, train)
+        self._train_occupations.setdefault(train, []).append(occupation_id)
+        insort(entries, (start, occupation_id))
+        if end == np.inf:
+            open_ids.add(occupation_id)
+        return found
+
+    def remove_train(self, train):
+        """
+        Delete all occupations of a train, e.g. before inserting its changed path.
+
+        Args:
+            train (int): The train to remove.
+
+        Returns:
+            int: Number of conflicts resolved by the removal.
+        """
+        resolved = 0
+        for occupation_id in self._train_occupations.pop(train, []):
+            track, start = self._occupations.pop(occupation_id)[:2]
+            entries = self._tracks[track]
+            del entries[bisect_left(entries, (start, occupation_id))]
+            self._open[track].discard(occupation_id)
+
+            for pair in self._pairs_of.pop(occupation_id, ()):
+                if self.conflicts.pop(pair, None) is not None:
+                    resolved += 1
+                other_id = pair[0] if pair[1] == occupation_id else pair[1]
+                self._pairs_of.get(other_id, set()).discard(pair)
+        return resolved
+
+    def conflicting_trains(self):
+        """
+        List the trains involved in at least one conflict.
+
+        Returns:
+            np.ndarray: Sorted train ids.
+        """
+        trains = {
+            self._occupations[occupation_id][5]
+            for pair in self.conflicts
+            for occupation_id in pair
+        }
+        return np.array(sorted(trains), dtype=np.int64)
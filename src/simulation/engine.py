@@ -0,0 +1,463 @@
+"""
+Time-stepped train movement engine with virtual-coupling platoons.
+
+The state of all trains is kept in contiguous NumPy arrays (structure of arrays)
+and every simulation step updates all of them with a handful of vectorized
+kernels. Trains run along routes through the ``RailwayGraph``; their position is
+the distance travelled along the route in metres.
+
+Trains of a platoon follow the train in front of them (their leader). With
+virtual coupling a follower keeps its relative braking distance to the leader,
+without it the absolute braking distance of a conventionally signalled train.
+The gap controller runs as one batched operation over all followers.
+"""
+
+import contextlib
+import time
+
+import numpy as np
+
+from src import instrumentation
+
+COUPLING_NONE = 0
+COUPLING_VIRTUAL = 1
+
+
+class TrainFleet:
+    """
+    Structure-of-arrays state of all trains.
+
+    Attributes:
+        route_length (np.ndarray): Length of every train's route in m.
+        departure_time (np.ndarray): Departure time of every train in s.
+        max_speed (np.ndarray): Maximum speed of every train in m/s.
+        max_acceleration (np.ndarray): Maximum acceleration in m/s².
+        max_deceleration (np.ndarray): Service braking deceleration in m/s².
+        length (np.ndarray): Train length in m.
+        leader (np.ndarray): Index of the train each train follows, -1 if none.
+        platoon (np.ndarray): Platoon id of every train, -1 if it runs alone.
+        coupling (np.ndarray): ``COUPLING_VIRTUAL`` or ``COUPLING_NONE`` per train.
+        route (np.ndarray): Index into ``routes`` of every train, -1 if unknown.
+        routes (list[list[int]]): Graph edge ids of every distinct route.
+        route_origins (np.ndarray): Graph node every route starts at.
+        position (np.ndarray): Distance travelled along the route in m.
+        speed (np.ndarray): Speed in m/s.
+        acceleration (np.ndarray): Acceleration of the last step in m/s².
+        running (np.ndarray): Whether the train has departed and not yet arrived.
+        arrived (np.ndarray): Whether the train has reached the end of its route.
+        arrival_time (np.ndarray): Time the train arrived in s, NaN before.
+    """
+
+    def __init__(
+        self,
+        route_length,
+        departure_time,
+        max_speed=44.4,
+        max_acceleration=0.8,
+        max_deceleration=0.9,
+        length=200.0,
+        leader=None,
+        platoon=None,
+        coupling=COUPLING_VIRTUAL,
+        route=None,
+        routes=None,
+        route_origins=None,
+    ):
+        """
+        Allocate the state arrays of a fleet.
+
+        Scalar train parameters are broadcast to every train.
+
+        Args:
+            route_length (array-like): Length of every train's route in m.
+            departure_time (array-like): Departure time of every train in s.
+            max_speed (float or array-like): Maximum speed in m/s.
+            max_acceleration (float or array-like): Maximum acceleration in m/s².
+            max_deceleration (float or array-like): Braking deceleration in m/s².
+            length (float or array-like): Train length in m.
+            leader (array-like, optional): Leader of every train, -1 if none.
+            platoon (array-like, optional): Platoon id of every train, -1 if none.
+            coupling (int or array-like): Coupling mode of every follower.
+            route (array-like, optional): Index into ``routes`` of every train.
+            routes (list[list[int]], optional): Graph edge ids of every route.
+            route_origins (array-like, optional): Graph node every route starts at.
+        """
+        self.route_length = np.asarray(route_length, dtype=np.float64)
+        n = len(self.route_length)
+
+        def per_train(value, dtype):
+            return np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype), n))
+
+        self.departure_time = per_train(departure_time, np.float64)
+        self.max_speed = per_train(max_speed, np.float64)
+        self.max_acceleration = per_train(max_acceleration, np.float64)
+        self.max_deceleration = per_train(max_deceleration, np.float64)
+        self.length = per_train(length, np.float64)
+        self.leader = per_train(-1 if leader is None else leader, np.int32)
+        self.platoon = per_train(-1 if platoon is None else platoon, np.int32)
+        self.coupling = per_train(coupling, np.int8)
+        self.route = per_train(-1 if route is None else route, np.int32)
+        self.routes = [] if routes is None else routes
+        if route_origins is None:
+            route_origins = np.full(len(self.routes), -1)
+        self.route_origins = np.asarray(route_origins, dtype=np.int32)
+
+        self.position = np.zeros(n)
+        self.speed = np.zeros(n)
+        self.acceleration = np.zeros(n)
+        self.running = np.zeros(n, dtype=bool)
+        self.arrived = np.zeros(n, dtype=bool)
+        self.arrival_time = np.full(n, np.nan)
+
+    def __len__(self):
+        return len(self.route_length)
+
+    @property
+    def followers(self):
+        """np.ndarray: Indices of the trains that follow a leader."""
+        return np.flatnonzero(self.leader >= 0)
+
+
+def form_platoons(departure_time, platoon_size, route=None, follow_platoons=True):
+    """
+    Group trains on the same route into platoons of consecutive departures.
+
+    Within a platoon every train follows the train that departed just before it,
+    which gives the chain topology used by the gap controller. With
+    ``follow_platoons`` the head of a platoon also follows the tail of the previous
+    platoon on its route, so that successive platoons keep their distance too.
+
+    Args:
+        departure_time (array-like): Departure time of every train in s.
+        platoon_size (int): Number of trains per platoon.
+        route (array-like, optional): Route of every train. Only trains on the same
+            route follow each other. Defaults to one common route.
+        follow_platoons (bool): Let platoon heads follow the previous platoon.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Leader and platoon id of every train.
+    """
+    departure_time = np.asarray(departure_time, dtype=np.float64)
+    n = len(departure_time)
+    route = np.zeros(n, dtype=np.int64) if route is None else np.asarray(route)
+    order = np.lexsort((departure_time, route))
+
+    sorted_route = route[order]
+    first_on_route = np.r_[True, sorted_route[1:] != sorted_route[:-1]]
+    route_start = np.flatnonzero(first_on_route)
+    rank = np.arange(n) - np.repeat(route_start, np.diff(np.r_[route_start, n]))
+    is_head = rank % platoon_size == 0
+
+    platoon = np.empty(n, dtype=np.int32)
+    platoon[order] = np.cumsum(is_head) - 1
+    has_leader = ~first_on_route if follow_platoons else ~is_head
+    leader = np.full(n, -1, dtype=np.int32)
+    leader[order[has_leader]] = order[np.flatnonzero(has_leader) - 1]
+    return leader, platoon
+
+
+def coupling_modes(leader, platoon, coupling=COUPLING_VIRTUAL):
+    """
+    Derive the coupling mode of every train from its leader.
+
+    Trains following a member of their own platoon use ``coupling``, trains
+    following another platoon keep conventional absolute braking distance.
+
+    Args:
+        leader (np.ndarray): Leader of every train, -1 if none.
+        platoon (np.ndarray): Platoon id of every train.
+        coupling (int): Coupling mode inside platoons.
+
+    Returns:
+        np.ndarray: Coupling mode of every train.
+    """
+    in_platoon = np.zeros(len(leader), dtype=bool)
+    follows = leader >= 0
+    in_platoon[follows] = platoon[leader[follows]] == platoon[follows]
+    return np.where(in_platoon, coupling, COUPLING_NONE).astype(np.int8)
+
+
+def fleet_from_graph(
+    graph,
+    origins,
+    destinations,
+    departure_time,
+    platoon_size=1,
+    coupling=COUPLING_VIRTUAL,
+    **train_parameters,
+):
+    """
+    Build a fleet running on shortest routes through the railway graph.
+
+    Every distinct origin-destination pair is routed once. Trains sharing a route
+    are grouped into platoons of ``platoon_size`` consecutive departures; platoons
+    on the same route follow each other with conventional braking distance.
+
+    Args:
+        graph (RailwayGraph): The railway network.
+        origins (array-like): Origin node of every train.
+        destinations (array-like): Destination node of every train.
+        departure_time (array-like): Departure time of every train in s.
+        platoon_size (int): Number of trains per platoon, 1 for no platoons.
+        coupling (int): Coupling mode of the platoon followers.
+        **train_parameters: Further ``TrainFleet`` arguments such as ``max_speed``.
+
+    Returns:
+        TrainFleet: The fleet, with ``route``, ``routes`` and ``route_origins`` set.
+
+    Raises:
+        ValueError: If a destination cannot be reached from its origin.
+    """
+    pairs = np.stack([np.asarray(origins), np.asarray(destinations)], axis=1)
+    unique_pairs, route = np.unique(pairs, axis=0, return_inverse=True)
+    route = route.ravel()
+
+    routes = []
+    for origin, destination in unique_pairs:
+        _, nodes, edges = graph.shortest_path(origin, destination)
+        if not nodes:
+            raise ValueError(f"Node {destination} is unreachable from node {origin}")
+        routes.append(edges)
+
+    leader, platoon = form_platoons(departure_time, platoon_size, route)
+    return TrainFleet(
+        route_lengths(graph, routes)[route],
+        departure_time,
+        leader=leader,
+        platoon=platoon,
+        coupling=coupling_modes(leader, platoon, coupling),
+        route=route,
+        routes=routes,
+        route_origins=unique_pairs[:, 0],
+        **train_parameters,
+    )
+
+
+def route_lengths(graph, edge_paths):
+    """
+    Compute the length of routes through the railway graph.
+
+    Args:
+        graph (RailwayGraph): The railway network.
+        edge_paths (list[list[int]]): Edge ids of every route.
+
+    Returns:
+        np.ndarray: Length of every route in m.
+    """
+    return np.array(
+        [graph.edge_length[path].sum() * 1000.0 for path in edge_paths],
+        dtype=np.float64,
+    )
+
+
+class TimeSteppedSimulation:
+    """
+    Advance a fleet in fixed time steps.
+
+    The kernels only touch the trains that are currently running. That subset is
+    rebuilt when trains depart or arrive, which happens in few of the steps of an
+    operating day, so a step costs time in proportion to the trains on the move.
+
+    Attributes:
+        fleet (TrainFleet): The trains.
+        dt (float): Time step in s.
+        time (float): Current simulation time in s.
+    """
+
+    def __init__(
+        self,
+        fleet,
+        dt=1.0,
+        min_gap=50.0,
+        time_gap=1.0,
+        gap_gain=0.05,
+        speed_gain=0.6,
+    ):
+        """
+        Prepare a simulation of a fleet.
+
+        Args:
+            fleet (TrainFleet): The trains.
+            dt (float): Time step in s.
+            min_gap (float): Standstill distance followers keep in m.
+            time_gap (float): Additional gap per m/s of follower speed in s.
+            gap_gain (float): Controller gain on the gap error in 1/s².
+            speed_gain (float): Controller gain on the speed difference in 1/s.
+        """
+        self.fleet = fleet
+        self.dt = dt
+        self.time = 0.0
+        self.min_gap = min_gap
+        self.time_gap = time_gap
+        self.gap_gain = gap_gain
+        self.speed_gain = speed_gain
+
+        self._departure_order = np.argsort(fleet.departure_time, kind="stable")
+        self._departed = 0
+        self._refresh_running()
+
+    def _refresh_running(self):
+        """Gather the parameters of the running trains into contiguous arrays."""
+        fleet = self.fleet
+        running = np.flatnonzero(fleet.running)
+        self._running = running
+        self._route_length = fleet.route_length[running]
+        self._max_speed = fleet.max_speed[running]
+        self._max_acceleration = fleet.max_acceleration[running]
+        self._max_deceleration = fleet.max_deceleration[running]
+        self._half_inverse_deceleration = 0.5 / self._max_deceleration
+
+        is_follower = fleet.leader[running] >= 0
+        self._followers = np.flatnonzero(is_follower)
+        self._leaders = fleet.leader[running[is_follower]]
+        self._virtual = fleet.coupling[running[is_follower]] == COUPLING_VIRTUAL
+
+    def _free_running_acceleration(self, position, speed):
+        """Accelerate to line speed and brake to stop at the end of the route."""
+        remaining = self._route_length - position
+        braking_distance = speed * speed * self._half_inverse_deceleration
+        # Start braking when the next step would overrun the braking curve
+        must_brake = remaining <= braking_distance + speed * self.dt
+        acceleration = np.minimum(
+            self._max_acceleration, (self._max_speed - speed) / self.dt
+        )
+        stopping = -(speed * speed) / (2.0 * np.maximum(remaining, 1e-3))
+        return np.where(
+            must_brake,
+            np.maximum(stopping, -self._max_deceleration),
+            acceleration,
+        )
+
+    def _gap_control_acceleration(self, position, speed):
+        """Batched gap controller over all running platoon followers."""
+        fleet = self.fleet
+        followers, leaders = self._followers, self._leaders
+        follower_speed = speed[followers]
+        leader_speed = fleet.speed[leaders]
+        half_inverse_deceleration = self._half_inverse_deceleration[followers]
+
+        gap = fleet.position[leaders] - position[followers] - fleet.length[leaders]
+        absolute = follower_speed * follower_speed * half_inverse_deceleration
+        relative = np.maximum(
+            absolute - leader_speed * leader_speed * half_inverse_deceleration, 0.0
+        )
+        braking = np.where(self._virtual, relative, absolute)
+        desired_gap = self.min_gap + self.time_gap * follower_speed + braking
+
+        acceleration = self.gap_gain * (gap - desired_gap) + self.speed_gain * (
+            leader_speed - follower_speed
+        )
+        # A follower inside the standstill distance, e.g. at a departure behind a
+        # train still clearing the platform, or whose leader has not departed yet
+        # brakes fully; one whose leader has arrived runs freely into the terminus
+        waiting = (gap < self.min_gap) | (
+            ~fleet.running[leaders] & ~fleet.arrived[leaders]
+        )
+        acceleration[waiting] = -self._max_deceleration[followers][waiting]
+        acceleration[fleet.arrived[leaders]] = np.inf
+        return acceleration
+
+    def _depart(self):
+        """Start the trains whose departure time has come."""
+        order, fleet = self._departure_order, self.fleet
+        start = self._departed
+        while (
+            self._departed < len(order)
+            and fleet.departure_time[order[self._departed]] <= self.time
+        ):
+            self._departed += 1
+        if self._departed > start:
+            fleet.running[order[start : self._departed]] = True
+            self._refresh_running()
+
+    def step(self):
+        """Advance every running train by one time step."""
+        self._depart()
+        if not len(self._running):
+            self.time += self.dt
+            return
+
+        fleet, running = self.fleet, self._running
+        position = fleet.position[running]
+        speed = fleet.speed[running]
+
+        acceleration = self._free_running_acceleration(position, speed)
+        if len(self._followers):
+            acceleration[self._followers] = np.minimum(
+                acceleration[self._followers],
+                self._gap_control_acceleration(position, speed),
+            )
+        np.clip(
+            acceleration,
+            -self._max_deceleration,
+            self._max_acceleration,
+            out=acceleration,
+        )
+
+        new_speed = np.clip(speed + acceleration * self.dt, 0.0, self._max_speed)
+        position += 0.5 * (speed + new_speed) * self.dt
+
+        fleet.position[running] = position
+        fleet.speed[running] = new_speed
+        fleet.acceleration[running] = acceleration
+
+        arriving = position >= self._route_length - 0.5
+        if arriving.any():
+            arrived = running[arriving]
+            fleet.position[arrived] = fleet.route_length[arrived]
+            fleet.speed[arrived] = 0.0
+            fleet.acceleration[arrived] = 0.0
+            fleet.running[arrived] = False
+            fleet.arrived[arrived] = True
+            fleet.arrival_time[arrived] = self.time + self.dt
+            self._refresh_running()
+
+        self.time += self.dt
+
+    def run(self, duration, record_every=None, metrics=None):
+        """
+        Run the simulation for a duration.
+
+        Args:
+            duration (float): Simulated time to advance in s.
+            record_every (int, optional): Record positions and speeds every this many
+                steps.
+            metrics (instrumentation.MetricsWriter, optional): Sink of the metrics
+                record of the run, with the distribution of the step times. The
+                run is only measured when given.
+
+        Returns:
+            dict: ``"time"``, ``"position"`` and ``"speed"`` arrays of the recorded
+            steps (one row per record), empty if nothing was recorded.
+        """
+        n_steps = int(round(duration / self.dt))
+        times, positions, speeds = [], [], []
+        # Measured only on request: an outermost measurement resets the peak
+        # memory of the process, which callers may be accounting themselves
+        measured = metrics is not None
+        if measured:
+            durations = np.empty(n_steps)
+            context = instrumentation.measure("engine", kind="simulation")
+        else:
+            context = contextlib.nullcontext()
+        clock = time.perf_counter
+        with context as record:
+            for step in range(n_steps):
+                if measured:
+                    start = clock()
+                self.step()
+                if measured:
+                    durations[step] = clock() - start
+                if record_every and (step + 1) % record_every == 0:
+                    times.append(self.time)
+                    positions.append(self.fleet.position.copy())
+                    speeds.append(self.fleet.speed.copy())
+        if measured:
+            record.update(instrumentation.step_statistics(durations))
+            record["trains"] = len(self.fleet)
+            metrics.write([record])
+        return {
+            "time": np.array(times),
+            "position": np.array(positions).reshape(len(times), len(self.fleet)),
+            "speed": np.array(speeds).reshape(len(times), len(self.fleet)),
+        }
@@ -0,0 +1,448 @@
+"""
+Discrete-event simulation of fixed-block signalling.
+
+Every edge of the ``RailwayGraph`` is divided into block sections, each protected
+by a signal at its entry. A block is reserved for one train at a time from the
+moment its route is set until the tail of the train has left it. Trains stop at
+the operating points known to ``stations_info`` (nodes with a DIDOK number).
+
+Instead of advancing the clock in fixed steps, the simulation keeps a heap of
+pending events (route requests, block entries and exits, signal aspect changes
+and dwell ends) and jumps from one event to the next. The idle time between
+events costs nothing, so a run takes time in proportion to the number of events.
+Block occupations are recorded with their reservation and release times, which
+are the blocking times used for conflict detection.
+"""
+
+import contextlib
+import heapq
+import math
+from collections import deque
+from itertools import count
+
+import numpy as np
+import pandas as pd
+
+from src import instrumentation
+
+# Events happening at the same time are processed in this order, so that a block
+# released at time t can be reserved again at time t
+EVENT_BLOCK_EXIT = 0
+EVENT_SIGNAL = 1
+EVENT_DWELL_END = 2
+EVENT_ROUTE_REQUEST = 3
+EVENT_BLOCK_ENTRY = 4
+
+ASPECT_STOP = 0
+ASPECT_CLEAR = 1
+
+
+class BlockLayout:
+    """
+    Block sections along the edges of the railway graph.
+
+    The blocks of edge ``e`` are ``edge_first_block[e]:edge_first_block[e + 1]``,
+    ordered from the edge's source to its target.
+
+    Attributes:
+        block_edge (np.ndarray): Graph edge of every block.
+        block_km_start (np.ndarray): Line km at the source end of every block.
+        block_km_end (np.ndarray): Line km at the target end of every block.
+        block_length (np.ndarray): Length of every block in m.
+        edge_first_block (np.ndarray): Block offsets of every edge.
+        stop_nodes (np.ndarray): Whether trains stop at every graph node.
+    """
+
+    def __init__(self, graph, max_block_length=2.0):
+        """
+        Divide every edge into equally long blocks.
+
+        Args:
+            graph (RailwayGraph): The railway network.
+            max_block_length (float): Longest block section in km.
+        """
+        n_blocks = np.maximum(np.ceil(graph.edge_length / max_block_length), 1).astype(
+            np.int64
+        )
+        self.edge_first_block = np.r_[0, np.cumsum(n_blocks)]
+        self.block_edge = np.repeat(np.arange(graph.n_edges), n_blocks)
+
+        # Position of every block within its edge as a fraction of the edge
+        index = np.arange(len(self.block_edge)) - self.edge_first_block[self.block_edge]
+        fraction_start = index / n_blocks[self.block_edge]
+        fraction_end = (index + 1) / n_blocks[self.block_edge]
+        km_start = graph.edge_km_start[self.block_edge]
+        km_span = graph.edge_km_end[self.block_edge] - km_start
+        self.block_km_start = km_start + fraction_start * km_span
+        self.block_km_end = km_start + fraction_end * km_span
+        self.block_length = (
+            graph.edge_length[self.block_edge] / n_blocks[self.block_edge] * 1000.0
+        )
+        self.stop_nodes = graph.node_didok >= 0
+
+    @property
+    def n_blocks(self):
+        """int: Number of block sections."""
+        return len(self.block_edge)
+
+    def route_blocks(self, graph, origin, edges):
+        """
+        List the blocks a route passes in travel order.
+
+        Args:
+            graph (RailwayGraph): The railway network the layout was built on.
+            origin (int): Node the route starts at.
+            edges (list[int]): Edge ids of the route.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Blocks of the route and whether the train
+            reaches a stop at the end of each of them.
+        """
+        blocks, stops = [], []
+        node = origin
+        for edge in edges:
+            edge_blocks = np.arange(
+                self.edge_first_block[edge], self.edge_first_block[edge + 1]
+            )
+            if graph.edge_source[edge] == node:
+                node = graph.edge_target[edge]
+            else:
+                edge_blocks = edge_blocks[::-1]
+                node = graph.edge_source[edge]
+            blocks.append(edge_blocks)
+            stop = np.zeros(len(edge_blocks), dtype=bool)
+            stop[-1] = self.stop_nodes[node]
+            stops.append(stop)
+        if not blocks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+        return np.concatenate(blocks), np.concatenate(stops)
+
+
+def running_time(distance, initial_speed, max_speed, acceleration, deceleration, stop):
+    """
+    Time to run a distance, accelerating to line speed and optionally stopping.
+
+    Args:
+        distance (float): Distance to run in m.
+        initial_speed (float): Speed at the start in m/s.
+        max_speed (float): Line speed of the train in m/s.
+        acceleration (float): Acceleration in m/s².
+        deceleration (float): Service braking deceleration in m/s².
+        stop (bool): Whether the train has to stand at the end of the distance.
+
+    Returns:
+        tuple[float, float]: Running time in s and speed at the end in m/s.
+    """
+    final_speed = 0.0 if stop else max_speed
+    accelerating = (max_speed**2 - initial_speed**2) / (2.0 * acceleration)
+    braking = (max_speed**2 - final_speed**2) / (2.0 * deceleration)
+    if accelerating + braking <= distance:
+        cruising = (distance - accelerating - braking) / max_speed
+        time = (
+            (max_speed - initial_speed) / acceleration
+            + (max_speed - final_speed) / deceleration
+            + cruising
+        )
+        return time, final_speed
+    if not stop:
+        # Too short to reach line speed: accelerate all the way
+        speed = math.sqrt(initial_speed**2 + 2.0 * acceleration * distance)
+        return (speed - initial_speed) / acceleration, speed
+
+    peak = math.sqrt(
+        (2.0 * acceleration * deceleration * distance + deceleration * initial_speed**2)
+        / (acceleration + deceleration)
+    )
+    if peak <= initial_speed:
+        # Too fast to stop with service braking: brake harder over the distance
+        return 2.0 * distance / max(initial_speed, 1e-9), 0.0
+    return (peak - initial_speed) / acceleration + peak / deceleration, 0.0
+
+
+class EventDrivenSimulation:
+    """
+    Fixed-block signalling simulation driven by a heap of events.
+
+    Trains are taken from a ``TrainFleet`` built with ``fleet_from_graph``; their
+    speeds, accelerations and lengths apply, platoon settings do not since the
+    block signals keep the trains apart.
+
+    Attributes:
+        graph (RailwayGraph): The railway network.
+        fleet (TrainFleet): The trains.
+        layout (BlockLayout): The block sections.
+        time (float): Time of the last processed event in s.
+        n_events (int): Number of processed events.
+        aspect (np.ndarray): Current aspect of the entry signal of every block.
+        reserved_by (np.ndarray): Train every block is reserved for, -1 if free.
+        arrival_time (np.ndarray): Arrival time of every train, NaN if not arrived.
+        signal_delay (np.ndarray): Time every train waited at stop signals in s.
+    """
+
+    def __init__(self, graph, fleet, layout=None, dwell_time=60.0):
+        """
+        Prepare the routes and schedule the departures.
+
+        Args:
+            graph (RailwayGraph): The railway network.
+            fleet (TrainFleet): Trains with ``route``, ``routes`` and
+                ``route_origins`` set.
+            layout (BlockLayout, optional): Block sections. Defaults to blocks of at
+                most 2 km.
+            dwell_time (float or array-like): Dwell time of every train at stops in
+                s. Trains with a dwell time of 0 run through intermediate stops.
+        """
+        self.graph = graph
+        self.fleet = fleet
+        self.layout = BlockLayout(graph) if layout is None else layout
+        n_trains, n_blocks = len(fleet), self.layout.n_blocks
+        self.dwell_time = np.broadcast_to(
+            np.asarray(dwell_time, dtype=np.float64), n_trains
+        )
+
+        self._route_blocks, self._route_stops = [], []
+        for origin, edges in zip(fleet.route_origins, fleet.routes):
+            blocks, stops = self.layout.route_blocks(graph, origin, edges)
+            self._route_blocks.append(blocks.tolist())
+            self._route_stops.append(stops.tolist())
+
+        # Python lists are much faster than NumPy arrays for the scalar lookups of
+        # the event handlers
+        self._train_route = fleet.route.tolist()
+        self._train_length = fleet.length.tolist()
+        self._dynamics = list(
+            zip(
+                fleet.max_speed.tolist(),
+                fleet.max_acceleration.tolist(),
+                fleet.max_deceleration.tolist(),
+            )
+        )
+        self._block_length = self.layout.block_length.tolist()
+
+        self.time = 0.0
+        self.n_events = 0
+        self.aspect = np.full(n_blocks, ASPECT_STOP, dtype=np.int8)
+        self.reserved_by = np.full(n_blocks, -1, dtype=np.int64)
+        self.arrival_time = np.full(n_trains, np.nan)
+        self.signal_delay = np.zeros(n_trains)
+
+        # Per train: index of the next block to request, speed at the entry of the
+        # current block and time it stands (or will stand) at the next signal
+        self._next = np.zeros(n_trains, dtype=np.int64)
+        self._entry_speed = np.zeros(n_trains)
+        self._standing_since = np.array(fleet.departure_time, dtype=np.float64)
+        self._reserved_at = np.zeros(n_trains)
+        self._record = np.full(n_trains, -1, dtype=np.int64)
+        self._waiting = {}
+
+        self._occupations = []
+        self._aspect_changes = []
+        self._queue = []
+        self._sequence = count()
+        for train in range(n_trains):
+            if self._route_blocks[fleet.route[train]]:
+                self._schedule(
+                    fleet.departure_time[train], EVENT_ROUTE_REQUEST, train, 0
+                )
+
+    def _schedule(self, time, kind, train, value):
+        """Push an event on the queue."""
+        heapq.heappush(self._queue, (time, kind, next(self._sequence), train, value))
+
+    def _blocks(self, train):
+        """Blocks and stop flags of a train's route."""
+        route = self._train_route[train]
+        return self._route_blocks[route], self._route_stops[route]
+
+    def _running_time(self, train, distance, initial_speed, stop):
+        """Running time of a train over a distance, see ``running_time``."""
+        return running_time(distance, initial_speed, *self._dynamics[train], stop)
+
+    def _on_route_request(self, train, index):
+        """Reserve the next block of a train or make it wait at the signal."""
+        blocks, stops = self._blocks(train)
+        block = blocks[index]
+        standing = self._standing_since[train] <= self.time
+        if self.reserved_by[block] != -1:
+            if not standing:
+                # Brake to stand at the signal at the end of the current block
+                previous = blocks[index - 1]
+                stop_time, _ = self._running_time(
+                    train,
+                    self._block_length[previous],
+                    self._entry_speed[train],
+                    True,
+                )
+                self._standing_since[train] = self.time + stop_time
+            self._waiting.setdefault(block, deque()).append(train)
+            return
+
+        self.reserved_by[block] = train
+        self._reserved_at[train] = self.time
+        self._schedule(self.time, EVENT_SIGNAL, block, ASPECT_CLEAR)
+        if standing:
+            self.signal_delay[train] += self.time - self._standing_since[train]
+            self._schedule(self.time, EVENT_BLOCK_ENTRY, train, 0.0)
+        else:
+            # The signal cleared in time: run through the current block
+            previous = blocks[index - 1]
+            time, speed = self._running_time(
+                train,
+                self._block_length[previous],
+                self._entry_speed[train],
+                False,
+            )
+            self._schedule(self.time + time, EVENT_BLOCK_ENTRY, train, speed)
+
+    def _on_block_entry(self, train, speed):
+        """Occupy the next block and plan the train's way through it."""
+        blocks, stops = self._blocks(train)
+        index = self._next[train]
+        block = blocks[index]
+        self._schedule(self.time, EVENT_SIGNAL, block, ASPECT_STOP)
+
+        # The previous block is released once the tail has left it
+        previous_record = self._record[train]
+        self._record[train] = len(self._occupations)
+        self._occupations.append(
+            [train, block, self._reserved_at[train], self.time, np.nan]
+        )
+        if previous_record >= 0:
+            clearing, _ = self._running_time(
+                train, self._train_length[train], speed, False
+            )
+            self._schedule(
+                self.time + clearing, EVENT_BLOCK_EXIT, train, previous_record
+            )
+
+        self._next[train] = index + 1
+        self._entry_speed[train] = speed
+        self._standing_since[train] = np.inf
+        length = self._block_length[block]
+        if index + 1 == len(blocks):
+            # Terminus: the train stops and leaves the line
+            time, _ = self._running_time(train, length, speed, True)
+            self.arrival_time[train] = self.time + time
+            self._schedule(
+                self.time + time, EVENT_BLOCK_EXIT, train, self._record[train]
+            )
+        elif stops[index] and self.dwell_time[train] > 0:
+            time, _ = self._running_time(train, length, speed, True)
+            self._standing_since[train] = self.time + time
+            self._schedule(
+                self.time + time + self.dwell_time[train],
+                EVENT_DWELL_END,
+                train,
+                index + 1,
+            )
+        else:
+            self._schedule(self.time, EVENT_ROUTE_REQUEST, train, index + 1)
+
+    def _on_block_exit(self, train, record):
+        """Release a block and let the first train waiting for it request it."""
+        occupation = self._occupations[record]
+        occupation[4] = self.time
+        block = occupation[1]
+        self.reserved_by[block] = -1
+        waiting = self._waiting.get(block)
+        if waiting:
+            follower = waiting.popleft()
+            self._schedule(
+                max(self.time, self._standing_since[follower]),
+                EVENT_ROUTE_REQUEST,
+                follower,
+                self._next[follower],
+            )
+
+    def _on_signal(self, block, aspect):
+        """Change the aspect of the signal protecting a block."""
+        if self.aspect[block] != aspect:
+            self.aspect[block] = aspect
+            self._aspect_changes.append((self.time, block, aspect))
+
+    def _on_dwell_end(self, train, index):
+        """Request the next block after the stop."""
+        self._standing_since[train] = self.time
+        self._schedule(self.time, EVENT_ROUTE_REQUEST, train, index)
+
+    def step(self):
+        """
+        Process the next event.
+
+        Returns:
+            bool: False if no event was pending.
+        """
+        if not self._queue:
+            return False
+        time, kind, _, subject, value = heapq.heappop(self._queue)
+        self.time = time
+        self.n_events += 1
+        if kind == EVENT_ROUTE_REQUEST:
+            self._on_route_request(subject, value)
+        elif kind == EVENT_BLOCK_ENTRY:
+            self._on_block_entry(subject, value)
+        elif kind == EVENT_BLOCK_EXIT:
+            self._on_block_exit(subject, value)
+        elif kind == EVENT_SIGNAL:
+            self._on_signal(subject, value)
+        else:
+            self._on_dwell_end(subject, value)
+        return True
+
+    def run(self, until=np.inf, metrics=None):
+        """
+        Process events until the queue is empty or the time limit is reached.
+
+        Trains still holding blocks when the queue runs empty are stuck, e.g.
+        opposing trains on a single-track section.
+
+        Args:
+            until (float): Time up to which events are processed in s.
+            metrics (instrumentation.MetricsWriter, optional): Sink of the metrics
+                record of the run; its ``steps`` are the events processed. The
+                run is only measured when given.
+
+        Returns:
+            int: Number of events processed in this call.
+        """
+        start = self.n_events
+        # Measured only on request, see TimeSteppedSimulation.run
+        if metrics is None:
+            context = contextlib.nullcontext()
+        else:
+            context = instrumentation.measure("events", kind="simulation")
+        with context as record:
+            while self._queue and self._queue[0][0] <= until:
+                self.step()
+        if metrics is not None:
+            record["steps"] = self.n_events - start
+            metrics.write([record])
+        return self.n_events - start
+
+    def occupations(self):
+        """
+        Block occupations recorded so far.
+
+        Returns:
+            pd.DataFrame: One row per train and block with ``train``, ``block``,
+            ``edge``, ``line_id``, ``km_start``, ``km_end`` and the ``reserved``,
+            ``entered`` and ``released`` times in s (NaN while still occupied).
+        """
+        columns = ["train", "block", "reserved", "entered", "released"]
+        table = pd.DataFrame(self._occupations, columns=columns)
+        block = table["block"].to_numpy(np.int64)
+        edge = self.layout.block_edge[block]
+        table.insert(2, "edge", edge)
+        table.insert(3, "line_id", self.graph.edge_line_id[edge])
+        table.insert(4, "km_start", self.layout.block_km_start[block])
+        table.insert(5, "km_end", self.layout.block_km_end[block])
+        return table
+
+    def aspect_changes(self):
+        """
+        Signal aspect changes recorded so far.
+
+        Returns:
+            pd.DataFrame: ``time``, ``block`` and ``aspect`` of every change.
+        """
+        return pd.DataFrame(self._aspect_changes, columns=["time", "block", "aspect"])
@@ -0,0 +1,324 @@
+"""
+Parallel Monte-Carlo sweep over perturbed simulation scenarios.
+
+The railway network is loaded once from ``data/processed`` and its arrays are
+saved as ``.npy`` files that every worker process memory-maps read-only. The
+operating system shares the pages between the processes, so neither load time
+nor memory grow with the number of workers. Scenarios are fanned out to a
+process pool and every result is appended to a JSON Lines file as soon as it
+finishes; scenarios already in the file are skipped when a sweep is resumed.
+
+Usage:
+    python -m src.simulation.sweep --scenarios 200 --output data/sweeps/sweep.jsonl
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.network.graph import RailwayGraph, load_graph
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+from src.simulation.engine import (
+    COUPLING_NONE,
+    COUPLING_VIRTUAL,
+    TimeSteppedSimulation,
+    fleet_from_graph,
+)
+
+Scenario = namedtuple(
+    "Scenario",
+    [
+        "name",
+        "seed",
+        "origin",
+        "destination",
+        "n_trains",
+        "headway",
+        "delay",
+        "platoon_size",
+        "coupling",
+    ],
+)
+
+# Network of the worker process, memory-mapped once by the pool initializer
+_GRAPH = None
+
+
+def save_network(graph, directory):
+    """
+    Save the graph arrays as ``.npy`` files for memory-mapping.
+
+    Args:
+        graph (RailwayGraph): The railway network.
+        directory (str): Directory to write the arrays to.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, array in graph.to_arrays().items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+
+
+def load_network(directory):
+    """
+    Memory-map a graph saved with ``save_network``.
+
+    Args:
+        directory (str): Directory with the arrays.
+
+    Returns:
+        RailwayGraph: The railway network backed by read-only memory maps.
+    """
+    arrays = {
+        file_name[: -len(".npy")]: np.load(
+            os.path.join(directory, file_name), mmap_mode="r"
+        )
+        for file_name in os.listdir(directory)
+        if file_name.endswith(".npy")
+    }
+    return RailwayGraph.from_arrays(arrays)
+
+
+def monte_carlo_scenarios(
+    od_pairs,
+    n_scenarios,
+    n_trains=50,
+    headways=(60.0, 120.0, 180.0, 300.0),
+    delays=(0.0, 30.0, 120.0),
+    platoon_sizes=(1, 2, 3, 4),
+    couplings=(COUPLING_VIRTUAL, COUPLING_NONE),
+    seed=0,
+):
+    """
+    Draw random scenarios from the given parameter ranges.
+
+    Args:
+        od_pairs (list[tuple[int, int]]): Origin and destination nodes to draw from.
+        n_scenarios (int): Number of scenarios.
+        n_trains (int): Trains per scenario.
+        headways (list[float]): Scheduled headways between departures in s.
+        delays (list[float]): Mean departure delays in s.
+        platoon_sizes (list[int]): Trains per platoon.
+        couplings (list[int]): Coupling modes.
+        seed (int): Seed of the random draws.
+
+    Returns:
+        list[Scenario]: The scenarios.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(len(od_pairs), size=n_scenarios)
+    return [
+        Scenario(
+            name=f"scenario-{index:05d}",
+            seed=int(rng.integers(2**31)),
+            origin=int(od_pairs[pair][0]),
+            destination=int(od_pairs[pair][1]),
+            n_trains=int(n_trains),
+            headway=float(rng.choice(headways)),
+            delay=float(rng.choice(delays)),
+            platoon_size=int(rng.choice(platoon_sizes)),
+            coupling=int(rng.choice(couplings)),
+        )
+        for index, pair in enumerate(pairs)
+    ]
+
+
+def sample_od_pairs(graph, n_pairs, seed=0, max_attempts=10000):
+    """
+    Draw random pairs of connected stations, or of any nodes if the network has
+    fewer than two stations with a DIDOK number.
+
+    Args:
+        graph (RailwayGraph): The railway network.
+        n_pairs (int): Number of pairs to draw.
+        seed (int): Seed of the random draws.
+        max_attempts (int): Number of candidate pairs to try at most.
+
+    Returns:
+        list[tuple[int, int]]: Origin and destination nodes.
+    """
+    rng = np.random.default_rng(seed)
+    stations = np.flatnonzero(np.asarray(graph.node_didok) >= 0)
+    if len(stations) < 2:
+        stations = np.arange(graph.n_nodes)
+    pairs = []
+    for _ in range(max_attempts):
+        if len(pairs) == n_pairs or len(stations) < 2:
+            break
+        origin, destination = rng.choice(stations, size=2, replace=False)
+        if np.isfinite(graph.shortest_path(origin, destination)[0]):
+            pairs.append((int(origin), int(destination)))
+    return pairs
+
+
+def simulate_scenario(graph, scenario, max_duration=2 * 86400.0):
+    """
+    Run one scenario with the time-stepped engine.
+
+    Trains depart every ``headway`` seconds, each delayed by an exponentially
+    distributed time with mean ``delay``.
+
+    Args:
+        graph (RailwayGraph): The railway network.
+        scenario (Scenario): The scenario.
+        max_duration (float): Simulated time after which the run is stopped in s.
+
+    Returns:
+        dict: Number of trains that arrived and their travel times in s.
+    """
+    rng = np.random.default_rng(scenario.seed)
+    n = scenario.n_trains
+    departure_time = np.arange(n) * scenario.headway
+    if scenario.delay > 0:
+        departure_time += rng.exponential(scenario.delay, n)
+
+    fleet = fleet_from_graph(
+        graph,
+        np.full(n, scenario.origin),
+        np.full(n, scenario.destination),
+        departure_time,
+        platoon_size=scenario.platoon_size,
+        coupling=scenario.coupling,
+    )
+    simulation = TimeSteppedSimulation(fleet)
+    while not fleet.arrived.all() and simulation.time < max_duration:
+        simulation.run(600.0)
+
+    travel_time = (fleet.arrival_time - fleet.departure_time)[fleet.arrived]
+    return {
+        "route_length_m": float(fleet.route_length[0]),
+        "arrived": int(fleet.arrived.sum()),
+        "mean_travel_time": float(travel_time.mean()) if len(travel_time) else None,
+        "max_travel_time": float(travel_time.max()) if len(travel_time) else None,
+        "last_arrival": (
+            float(np.nanmax(fleet.arrival_time)) if len(travel_time) else None
+        ),
+    }
+
+
+def _init_worker(network_directory):
+    """Memory-map the network once per worker process."""
+    global _GRAPH
+    _GRAPH = load_network(network_directory)
+
+
+def _run_scenario(function, scenario):
+    """Run a scenario in a worker and time it."""
+    start = time.perf_counter()
+    result = function(_GRAPH, scenario)
+    return result, time.perf_counter() - start
+
+
+def _completed_scenarios(output_path):
+    """Return the names of the scenarios with a result in a results file."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return {record["scenario"]["name"] for record in records if "result" in record}
+
+
+def run_sweep(
+    network,
+    scenarios,
+    output_path,
+    function=simulate_scenario,
+    max_workers=None,
+    resume=True,
+):
+    """
+    Run scenarios in parallel and stream their results to a JSON Lines file.
+
+    Every line holds the ``scenario`` parameters and either its ``result`` and
+    ``runtime_s`` or the ``error`` it raised.
+
+    Args:
+        network (RailwayGraph or str): The network, or a directory written by
+            ``save_network``.
+        scenarios (list[Scenario]): Scenarios to run.
+        output_path (str): JSON Lines file the results are appended to.
+        function (callable): Module-level function ``function(graph, scenario)``
+            returning a JSON-serializable result.
+        max_workers (int, optional): Number of worker processes.
+        resume (bool): Skip scenarios whose results are already in the file;
+            failed scenarios are run again.
+
+    Returns:
+        dict: Status of every scenario, ``"skipped"``, ``"ran"`` or ``"failed"``.
+    """
+    done = _completed_scenarios(output_path) if resume else set()
+    status = {
+        scenario.name: "skipped" for scenario in scenarios if scenario.name in done
+    }
+    pending = [scenario for scenario in scenarios if scenario.name not in done]
+    if not pending:
+        return status
+
+    output_directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_directory, exist_ok=True)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        if isinstance(network, RailwayGraph):
+            save_network(network, temporary_directory)
+            network = temporary_directory
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(network,)
+        ) as executor, open(output_path, "a", encoding="utf-8") as output:
+            futures = {
+                executor.submit(_run_scenario, function, scenario): scenario
+                for scenario in pending
+            }
+            for future in as_completed(futures):
+                scenario = futures[future]
+                record = {"scenario": scenario._asdict()}
+                try:
+                    record["result"], record["runtime_s"] = future.result()
+                    status[scenario.name] = "ran"
+                except Exception as error:
+                    record["error"] = repr(error)
+                    status[scenario.name] = "failed"
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    return status
+
+
+def main():
+    """Parse the command line and run a Monte-Carlo sweep."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--output", default=None, help="JSON Lines results file.")
+    parser.add_argument("--scenarios", type=int, default=100)
+    parser.add_argument("--trains", type=int, default=50)
+    parser.add_argument("--od-pairs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    processed = os.path.join(args.data_root, "processed")
+    graph = load_graph(
+        os.path.join(processed, "line_segments.parquet"),
+        os.path.join(processed, "stations_info.parquet"),
+    )
+    od_pairs = sample_od_pairs(graph, args.od_pairs, args.seed)
+    if not od_pairs:
+        raise SystemExit("No connected pair of stations found in the network.")
+    scenarios = monte_carlo_scenarios(
+        od_pairs, args.scenarios, n_trains=args.trains, seed=args.seed
+    )
+    output = args.output or os.path.join(args.data_root, "sweeps", "sweep.jsonl")
+
+    status = run_sweep(graph, scenarios, output, max_workers=args.workers)
+    counts = {
+        value: list(status.values()).count(value) for value in set(status.values())
+    }
+    print(f"Sweep finished: {counts}, results in {output}")
+    if "failed" in status.values():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
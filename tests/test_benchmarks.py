@@ -0,0 +1,56 @@
+# tests/test_benchmarks.py
+
+import os
+
+from benchmarks.run import detect_regressions
+from benchmarks.scaling import ID_STRIDE, scale_raw_data
+from src.scripts.data_preparation import extract_stations_info
+
+
+def test_scale_raw_data_repeats_rows_with_new_ids(tmp_path):
+    raw = tmp_path / "source" / "raw"
+    raw.mkdir(parents=True)
+    header = ";".join(extract_stations_info.COLUMN_NAMES)
+    rows = [
+        'AA;Alpha;100;1.5;Line 100;"47.1, 8.1";8500001;8500001;Alpha;x;ch:1:sloid:1',
+        'BB;Beta;100;4.0;Line 100;"47.2, 8.2";8500002;8500002;Beta;x;ch:1:sloid:2',
+    ]
+    (raw / "linie-mit-betriebspunkten.csv").write_text(
+        "\n".join([header] + rows) + "\n"
+    )
+    (raw / "borders.json").write_text("{}")
+
+    target = tmp_path / "x3"
+    scale_raw_data(str(tmp_path / "source"), str(target), 3)
+
+    stations = extract_stations_info.load_and_clean_data(
+        os.path.join(target, "raw", "linie-mit-betriebspunkten.csv")
+    )
+    assert len(stations) == 6
+    assert sorted(stations["didok"]) == sorted(
+        8500001 + k * ID_STRIDE + i for k in range(3) for i in range(2)
+    )
+    assert set(stations["station_abbr"]) >= {"AA", "AA~1", "BB~2"}
+    assert (target / "raw" / "borders.json").read_text() == "{}"
+
+
+def test_detect_regressions_against_recent_median():
+    def record(wall_s, peak_rss_mb=100.0, case="clean_linie"):
+        return {
+            "case": case,
+            "scale": 10,
+            "machine": "ci",
+            "wall_s": wall_s,
+            "peak_rss_mb": peak_rss_mb,
+        }
+
+    history = [record(9.0), record(1.0), record(1.1), record(0.9)]
+    results = [record(1.05), record(1.5, case="plot"), record(1.5, 130.0)]
+
+    regressions = detect_regressions(results, history, threshold=0.2, window=3)
+
+    assert [(result["wall_s"], metric) for result, metric, _ in regressions] == [
+        (1.5, "wall_s"),
+        (1.5, "peak_rss_mb"),
+    ]
+    assert regressions[0][2] == 1.0
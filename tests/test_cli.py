@@ -0,0 +1,58 @@
+# tests/test_cli.py
+
+import os
+import subprocess
+import sys
+
+from src.cli import main
+from src.scripts.data_preparation.pipeline import PROJECT_ROOT
+from src.scripts.data_preparation.synthetic_network import generate_network
+
+HEAVY_MODULES = ["geopandas", "matplotlib", "numpy", "pandas", "shapely"]
+
+
+def run_python(code, **environment):
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, **environment},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def test_parsing_imports_no_heavy_dependencies():
+    loaded = run_python(
+        "import sys\n"
+        "from src.cli import build_parser\n"
+        "for command in ['pipeline', 'clean_linie', 'plot', 'simulate']:\n"
+        "    build_parser().parse_args([command])\n"
+        f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])"
+    )
+    assert loaded == "[]"
+
+
+def test_data_root_defaults_to_the_environment_variable(tmp_path):
+    data_root = run_python(
+        "from src.cli import build_parser\n"
+        "print(build_parser().parse_args(['station', 'BN']).data_root)",
+        RAILSIM_DATA_ROOT=str(tmp_path),
+    )
+    assert data_root == str(tmp_path)
+
+
+def test_stage_and_station_lookup_on_a_data_root(tmp_path, capsys):
+    generate_network(str(tmp_path), n_lines=4, stations_per_line=5, seed=1)
+    data_root = ["--data-root", str(tmp_path)]
+
+    assert main(["stations_info", "--export"] + data_root) == 0
+    assert (tmp_path / "processed" / "stations_info.csv").exists()
+    # The stage is up to date on the second run
+    assert main(["stations_info"] + data_root) == 0
+    assert "skipped" in capsys.readouterr().out
+
+    assert main(["station", "AAB", "1"] + data_root) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[1] for line in lines] == ["AAA", "AAB"]
+    assert main(["station", "unknown"] + data_root) == 1
@@ -0,0 +1,133 @@
+# tests/test_conflicts.py
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from src.network.graph import build_graph
+from src.simulation.conflicts import ConflictDetector, find_conflicts
+from src.simulation.engine import fleet_from_graph
+from src.simulation.events import EventDrivenSimulation
+
+
+def make_occupations():
+    return pd.DataFrame(
+        {
+            "train": [0, 0, 1, 1, 2, 3],
+            "edge": [5, 6, 5, 6, 5, 6],
+            "km_start": [0.0, 2.0, 1.0, 2.0, 3.0, 2.5],
+            "km_end": [2.0, 4.0, 3.0, 4.0, 4.0, 3.0],
+            "reserved": [0.0, 50.0, 60.0, 100.0, 10.0, 160.0],
+            "released": [90.0, 150.0, 120.0, 170.0, 200.0, 180.0],
+        }
+    )
+
+
+def brute_force(occupations):
+    pairs = set()
+    rows = occupations.fillna({"released": np.inf}).to_dict("records")
+    for (i, a), (j, b) in itertools.combinations(enumerate(rows), 2):
+        if (
+            a["train"] != b["train"]
+            and a["edge"] == b["edge"]
+            and a["reserved"] < b["released"]
+            and b["reserved"] < a["released"]
+            and a["km_start"] < b["km_end"]
+            and b["km_start"] < a["km_end"]
+        ):
+            pairs.add(frozenset((i, j)))
+    return pairs
+
+
+def test_find_conflicts_on_small_timetable():
+    conflicts = find_conflicts(make_occupations())
+
+    # Train 2 is on edge 5 at the same time as train 1 but on another km range
+    assert sorted(zip(conflicts["first"], conflicts["second"])) == [
+        (0, 2),
+        (1, 3),
+        (3, 5),
+    ]
+    assert conflicts.set_index("first").loc[0, "start"] == 60.0
+    assert conflicts.set_index("first").loc[0, "end"] == 90.0
+
+
+def test_find_conflicts_matches_brute_force():
+    rng = np.random.default_rng(0)
+    start = rng.uniform(0, 3600, 400)
+    km = rng.uniform(0, 10, 400)
+    occupations = pd.DataFrame(
+        {
+            "train": rng.integers(0, 40, 400),
+            "edge": rng.integers(0, 8, 400),
+            "km_start": km,
+            "km_end": km + rng.uniform(0.2, 2.0, 400),
+            "reserved": start,
+            "released": start + rng.uniform(30, 300, 400),
+        }
+    )
+
+    conflicts = find_conflicts(occupations)
+
+    found = {frozenset(pair) for pair in zip(conflicts["first"], conflicts["second"])}
+    assert len(found) == len(conflicts)
+    assert found == brute_force(occupations)
+
+
+def test_detector_insert_and_delete():
+    occupations = make_occupations()
+    detector = ConflictDetector()
+    for _, path in occupations.groupby("train"):
+        detector.add(path)
+
+    assert len(detector.conflicts) == 3
+    assert detector.conflicting_trains().tolist() == [0, 1, 3]
+
+    # Reroute train 1 later so that it no longer conflicts
+    assert detector.remove_train(1) == 3
+    later = occupations[occupations["train"] == 1].assign(
+        reserved=[400.0, 450.0], released=[450.0, 500.0]
+    )
+    assert detector.add(later) == []
+    assert len(detector) == 6
+    assert detector.conflict_table().empty
+
+
+def test_open_occupations_run_to_infinity():
+    line_segments = pd.DataFrame(
+        {
+            "line_id": [1, 1, 1],
+            "track_gauge": ["1435"] * 3,
+            "segment_start": [0.0, 5.0, 8.0],
+            "segment_end": [5.0, 8.0, 12.0],
+            "start_station": ["A", "B", "C"],
+            "end_station": ["B", "C", "D"],
+        }
+    )
+    stations_info = pd.DataFrame({"station_abbr": ["A", "C", "D"], "didok": [1, 3, 4]})
+    graph = build_graph(line_segments, stations_info)
+    a, d = graph.nodes_of_didok([1, 4])
+    fleet = fleet_from_graph(graph, [a, a, a], [d, d, d], [0.0, 30.0, 60.0])
+    simulation = EventDrivenSimulation(graph, fleet, dwell_time=30.0)
+    # The trains are still on their way, so some blocks are never released
+    simulation.run(until=200.0)
+    occupations = simulation.occupations()
+    assert occupations["released"].isna().any()
+
+    # A train entering every block long after the others still conflicts with
+    # the blocks that are held open
+    late = occupations.assign(train=9, reserved=5000.0, released=5010.0)
+    occupations = pd.concat([occupations, late], ignore_index=True)
+    conflicts = find_conflicts(occupations)
+
+    found = {frozenset(pair) for pair in zip(conflicts["first"], conflicts["second"])}
+    open_rows = np.flatnonzero(occupations["released"].isna())
+    assert len(open_rows) > 0
+    assert found == brute_force(occupations)
+    assert {frozenset((row, row + len(late))) for row in open_rows} <= found
+
+    detector = ConflictDetector()
+    for _, path in occupations.groupby("train"):
+        detector.add(path)
+    assert len(detector.conflicts) == len(found)
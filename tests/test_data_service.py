@@ -0,0 +1,102 @@
+# tests/test_data_service.py
+
+import gzip
+import json
+
+import pandas as pd
+import pytest
+import shapely
+
+from src.scripts.data_preparation import processed_store
+from ui import data_service
+
+
+def write_processed(directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    processed_store.write_table(
+        pd.DataFrame(
+            {
+                "station_id": [0, 1, 2],
+                "station_abbr": ["A", "B", "C"],
+                "latitude": [47.0, 47.0, 46.0],
+                "longitude": [7.0, 8.0, 9.0],
+            }
+        ),
+        str(directory / "stations_info.parquet"),
+        key_column="station_id",
+    )
+    processed_store.write_table(
+        pd.DataFrame({"line_id": [100, 200], "line_name": ["A - B", "B - C"]}),
+        str(directory / "lines_info.parquet"),
+    )
+    processed_store.write_table(
+        pd.DataFrame({"line_id": [100, 100, 200, 200], "station_id": [0, 1, 1, 2]}),
+        str(directory / "line_stations.parquet"),
+    )
+    processed_store.write_table(
+        pd.DataFrame(
+            {
+                "line_id": [100, 200],
+                "start_station": ["A", "B"],
+                "end_station": ["B", "C"],
+                "geometry": [
+                    shapely.LineString([(7.0, 47.0), (8.0, 47.0)]),
+                    shapely.LineString([(8.0, 47.0), (9.0, 46.0)]),
+                ],
+            }
+        ),
+        str(directory / "line_segments.parquet"),
+        geometry_column="geometry",
+    )
+
+
+@pytest.fixture
+def client(tmp_path):
+    write_processed(tmp_path / "processed")
+    return data_service.create_app(str(tmp_path)).test_client()
+
+
+def test_collections_are_filtered_and_paginated(client):
+    page = client.get("/api/stations?limit=2").get_json()
+    assert page["total"] == 3 and page["next"] == 2
+    assert [item["station_abbr"] for item in page["items"]] == ["A", "B"]
+
+    page = client.get("/api/stations?line_id=200").get_json()
+    assert [item["station_id"] for item in page["items"]] == [1, 2]
+
+    page = client.get("/api/lines?bbox=6.5,46.5,7.5,47.5").get_json()
+    assert [item["line_id"] for item in page["items"]] == [100]
+
+    segments = client.get("/api/segments?line_id=200").get_json()["items"]
+    assert segments[0]["geometry"]["type"] == "LineString"
+    assert client.get("/api/lines/200").get_json()["line_name"] == "B - C"
+    assert client.get("/api/lines/300").status_code == 404
+    assert client.get("/api/stations?bbox=1,2,3").status_code == 400
+
+
+def test_responses_are_cached_with_etag_and_gzip(client, monkeypatch):
+    first = client.get("/api/segments")
+    second = client.get("/api/segments", headers={"If-None-Match": first.get_etag()[0]})
+    assert second.status_code == 304
+    assert client.get("/api/health").get_json()["cache"]["hits"] == 1
+
+    small = client.get("/api/segments?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert small.headers.get("Content-Encoding") is None
+
+    monkeypatch.setattr(data_service, "MIN_GZIP_SIZE", 0)
+    compressed = client.get("/api/stations", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.get_etag()[0].endswith("-gzip")
+    assert json.loads(gzip.decompress(compressed.data))["total"] == 3
+
+
+def test_index_is_reloaded_when_the_data_changes(tmp_path):
+    write_processed(tmp_path / "processed")
+    app = data_service.create_app(str(tmp_path), reload_interval=0.0)
+    client = app.test_client()
+    assert client.get("/api/lines").get_json()["total"] == 2
+    processed_store.write_table(
+        pd.DataFrame({"line_id": [100], "line_name": ["A - B"]}),
+        str(tmp_path / "processed" / "lines_info.parquet"),
+    )
+    assert client.get("/api/lines").get_json()["total"] == 1
@@ -0,0 +1,139 @@
+# tests/test_dataset.py
+
+import pandas as pd
+import pytest
+import shapely
+
+from src.scripts.data_preparation import dataset
+
+
+def make_segments(lon, line_ids, stations):
+    return pd.DataFrame(
+        {
+            "line_id": line_ids,
+            "track_gauge": ["1435"] * len(line_ids),
+            "segment_start": [0.0] * len(line_ids),
+            "segment_end": [2.0] * len(line_ids),
+            "start_station": stations[:-1],
+            "end_station": stations[1:],
+            "geometry": [
+                shapely.LineString([(lon + i, 47.0), (lon + i + 0.5, 47.0)])
+                for i in range(len(line_ids))
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = str(tmp_path / "dataset")
+    for country, lon, stations in [
+        ("CHE", 7.0, ["A", "B", "C"]),
+        ("DEU", 10.0, ["C", "D", "E"]),
+    ]:
+        dataset.write_partition(
+            root,
+            "line_segments",
+            country,
+            make_segments(lon, [100, 200], stations),
+            geometry_column="geometry",
+        )
+        dataset.write_partition(
+            root,
+            "stations_info",
+            country,
+            pd.DataFrame(
+                {
+                    "station_id": [0, 1, 2],
+                    "station_abbr": stations,
+                    "didok": [ord(s) for s in stations],
+                    "latitude": [47.0] * 3,
+                    "longitude": [lon, lon + 1, lon + 2],
+                }
+            ),
+            key_column="station_id",
+        )
+    return root
+
+
+def test_partitions_are_pruned_by_country_bbox_and_line(root):
+    railway_dataset = dataset.RailwayDataset(root)
+
+    assert railway_dataset.countries == ["CHE", "DEU"]
+    assert railway_dataset.tables == ["line_segments", "stations_info"]
+    assert [
+        entry["country"]
+        for entry in railway_dataset.partitions("line_segments", bbox=(9.5, 46, 11, 48))
+    ] == ["DEU"]
+    assert railway_dataset.partitions("line_segments", line_ids=[300]) == []
+    assert len(railway_dataset.partitions("line_segments", countries="CHE")) == 1
+
+
+def test_read_filters_rows_and_tags_countries(root):
+    railway_dataset = dataset.RailwayDataset(root)
+
+    segments = railway_dataset.read(
+        "line_segments", columns=["line_id"], bbox=(7.9, 46.5, 10.2, 47.5)
+    )
+    assert sorted(zip(segments["country"], segments["line_id"])) == [
+        ("CHE", 200),
+        ("DEU", 100),
+    ]
+    assert list(segments.columns) == ["line_id", "country"]
+
+    one_line = railway_dataset.read("line_segments", countries="DEU", line_ids=[200])
+    assert one_line["line_id"].tolist() == [200]
+    assert "country" not in one_line.columns
+
+
+def test_cross_border_graph_joins_countries(root):
+    graph = dataset.RailwayDataset(root).graph()
+
+    assert graph.n_edges == 4
+    assert graph.n_nodes == 5
+    # The border station C has one DIDOK number and keeps the key of CHE
+    assert sorted(graph.node_abbr) == ["CHE:A", "CHE:B", "CHE:C", "DEU:D", "DEU:E"]
+
+
+def test_graph_keeps_equal_keys_of_countries_apart(root):
+    # AUT reuses the abbreviations and line ids of CHE for other stations
+    stations = ["A", "B", "C"]
+    dataset.write_partition(
+        root,
+        "line_segments",
+        "AUT",
+        make_segments(14.0, [100, 200], stations),
+        geometry_column="geometry",
+    )
+    dataset.write_partition(
+        root,
+        "stations_info",
+        "AUT",
+        pd.DataFrame(
+            {
+                "station_id": [0, 1, 2],
+                "station_abbr": stations,
+                "didok": [8100001, 8100002, 8100003],
+            }
+        ),
+        key_column="station_id",
+    )
+    railway_dataset = dataset.RailwayDataset(root)
+
+    graph = railway_dataset.graph(countries=["AUT", "CHE"])
+    assert graph.n_nodes == 6
+    assert sorted(graph.node_didok) == sorted(
+        [ord(s) for s in stations] + [8100001, 8100002, 8100003]
+    )
+    assert len(set(graph.edge_line_id)) == 4
+    assert set(graph.edge_line_id % dataset.COUNTRY_LINE_ID_STRIDE) == {100, 200}
+
+    # A single country keeps its own keys
+    graph = railway_dataset.graph(countries="AUT")
+    assert sorted(graph.node_abbr) == stations
+    assert sorted(graph.edge_line_id) == [100, 200]
+
+
+def test_missing_catalog_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        dataset.RailwayDataset(str(tmp_path))
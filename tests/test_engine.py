@@ -0,0 +1,74 @@
+# tests/test_engine.py
+
+import numpy as np
+import pandas as pd
+
+from src.network.graph import build_graph
+from src.simulation.engine import (
+    COUPLING_NONE,
+    COUPLING_VIRTUAL,
+    TimeSteppedSimulation,
+    fleet_from_graph,
+    form_platoons,
+)
+
+
+def make_graph():
+    line_segments = pd.DataFrame(
+        {
+            "line_id": [1, 1],
+            "track_gauge": ["1435", "1435"],
+            "segment_start": [0.0, 20.0],
+            "segment_end": [20.0, 50.0],
+            "start_station": ["A", "B"],
+            "end_station": ["B", "C"],
+        }
+    )
+    stations_info = pd.DataFrame({"station_abbr": ["A", "C"], "didok": [1, 3]})
+    return build_graph(line_segments, stations_info)
+
+
+def test_form_platoons_chains_trains_per_route():
+    leader, platoon = form_platoons(
+        [0.0, 10.0, 20.0, 30.0, 5.0], platoon_size=2, route=[0, 0, 0, 0, 1]
+    )
+
+    assert leader.tolist() == [-1, 0, 1, 2, -1]
+    assert platoon.tolist() == [0, 0, 1, 1, 2]
+
+
+def run_platoon(coupling):
+    graph = make_graph()
+    origin, destination = graph.nodes_of_didok([1, 3])
+    departures = np.array([0.0, 30.0, 60.0, 600.0])
+    fleet = fleet_from_graph(
+        graph,
+        np.full(4, origin),
+        np.full(4, destination),
+        departures,
+        platoon_size=3,
+        coupling=coupling,
+        max_speed=[30.0, 44.4, 44.4, 44.4],
+    )
+    simulation = TimeSteppedSimulation(fleet)
+    record = simulation.run(4 * 3600, record_every=10)
+    return fleet, record
+
+
+def test_virtual_coupling_shortens_gaps_without_collisions():
+    gaps = {}
+    for coupling in (COUPLING_VIRTUAL, COUPLING_NONE):
+        fleet, record = run_platoon(coupling)
+        assert fleet.arrived.all()
+        assert np.allclose(fleet.position, 50000.0)
+        assert fleet.coupling.tolist() == [COUPLING_NONE, coupling, coupling, 0]
+
+        cruising = record["speed"][:, 1] > 29.0
+        leader_position = record["position"][:, fleet.leader[1]]
+        gap = leader_position - record["position"][:, 1] - fleet.length[0]
+        # Arrived trains leave the line, so only check while both are on it
+        on_line = (record["position"][:, 1] > 0) & (leader_position < 50000.0)
+        assert (gap[on_line] > 0).all()
+        gaps[coupling] = gap[cruising].mean()
+
+    assert gaps[COUPLING_VIRTUAL] < 0.5 * gaps[COUPLING_NONE]
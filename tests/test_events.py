@@ -0,0 +1,64 @@
+# tests/test_events.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.network.graph import build_graph
+from src.simulation.engine import fleet_from_graph
+from src.simulation.events import BlockLayout, EventDrivenSimulation, running_time
+
+
+def make_graph():
+    line_segments = pd.DataFrame(
+        {
+            "line_id": [1, 1, 1],
+            "track_gauge": ["1435"] * 3,
+            "segment_start": [0.0, 5.0, 8.0],
+            "segment_end": [5.0, 8.0, 12.0],
+            "start_station": ["A", "B", "C"],
+            "end_station": ["B", "C", "D"],
+        }
+    )
+    stations_info = pd.DataFrame({"station_abbr": ["A", "C", "D"], "didok": [1, 3, 4]})
+    return build_graph(line_segments, stations_info)
+
+
+def test_running_time_with_cruising_and_stop():
+    time, speed = running_time(1000.0, 0.0, 20.0, 1.0, 1.0, stop=True)
+
+    # 200 m accelerating, 600 m at 20 m/s, 200 m braking
+    assert time == pytest.approx(20.0 + 30.0 + 20.0)
+    assert speed == 0.0
+
+
+def test_block_layout_follows_travel_direction():
+    graph = make_graph()
+    layout = BlockLayout(graph, max_block_length=2.0)
+    a, d = graph.nodes_of_didok([1, 4])
+    _, _, edges = graph.shortest_path(d, a)
+
+    blocks, stops = layout.route_blocks(graph, d, edges)
+
+    assert layout.n_blocks == 3 + 2 + 2
+    assert layout.block_km_end[blocks[0]] == pytest.approx(12.0)
+    assert layout.block_km_start[blocks[-1]] == pytest.approx(0.0)
+    assert np.flatnonzero(stops).tolist() == [1, 6]
+
+
+def test_block_occupations_never_overlap():
+    graph = make_graph()
+    a, d = graph.nodes_of_didok([1, 4])
+    fleet = fleet_from_graph(graph, [a, a, a], [d, d, d], [0.0, 30.0, 60.0])
+    simulation = EventDrivenSimulation(graph, fleet, dwell_time=30.0)
+
+    simulation.run()
+
+    assert not np.isnan(simulation.arrival_time).any()
+    assert (np.diff(simulation.arrival_time) > 0).all()
+    assert simulation.signal_delay[1:].min() > 0
+    occupations = simulation.occupations().sort_values(["block", "entered"])
+    assert len(occupations) == 3 * 7
+    for _, block in occupations.groupby("block"):
+        released = block["released"].to_numpy()[:-1]
+        assert (block["reserved"].to_numpy()[1:] >= released).all()
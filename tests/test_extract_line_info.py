@@ -0,0 +1,75 @@
+# tests/test_extract_line_info.py
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import LineString
+
+from src.scripts.data_preparation import geometry
+from src.scripts.data_preparation.extract_line_info import (
+    group_and_aggregate_data,
+    line_lengths,
+    line_stations,
+)
+
+
+def make_station_data():
+    return pd.DataFrame(
+        {
+            "station_abbr": ["B", "A", "C", "A", "D", "B"],
+            "line_id": [1, 1, 1, 1, 2, 2],
+            "km": [5.0, 0.0, 9.0, 0.0, 3.0, 1.0],
+            "line_name": ["A - C"] * 4 + ["B - D"] * 2,
+            "didok": [2, 1, 3, 1, 4, 2],
+        }
+    )
+
+
+def test_line_stations_are_exploded_in_km_order():
+    stations = line_stations(make_station_data())
+
+    assert stations.loc[1, "station_abbr"].tolist() == ["A", "B", "C"]
+    assert stations.loc[1, "position"].tolist() == [0, 1, 2]
+    assert stations.loc[2, "didok"].tolist() == [2, 4]
+
+
+def test_line_lengths_come_from_geometry():
+    line_geometries = gpd.GeoDataFrame(
+        {"line_id": [1, 1]},
+        geometry=[
+            LineString([(8, 46), (8, 46.05)]),
+            LineString([(8, 46.05), (8, 46.1)]),
+        ],
+        crs="EPSG:4326",
+    )
+
+    lines_info = group_and_aggregate_data(make_station_data(), line_geometries)
+
+    assert lines_info.loc[1, "n_stations"] == 3
+    assert lines_info.loc[1, "first_station"] == "A"
+    assert lines_info.loc[1, "last_station"] == "C"
+    assert lines_info.loc[2, "km_start"] == 1.0
+    # 0.1 degrees of latitude
+    assert lines_info.loc[1, "line_length"] == pytest.approx(11.1195, rel=1e-4)
+    # Line 2 has no geometry and falls back to its km range
+    assert lines_info.loc[2, "line_length"] == 2.0
+
+
+def test_line_lengths_follow_the_track_not_the_chord():
+    # linie_cleaned has a straight chord between the line ends, line_segments
+    # the track, which bends east between them
+    chord = LineString([(8, 46), (8, 46.1)])
+    track = [
+        LineString([(8, 46), (8.05, 46.05)]),
+        LineString([(8.05, 46.05), (8.06, 46.07), (8, 46.1)]),
+    ]
+    line_cleaned = gpd.GeoDataFrame({"line_id": [1]}, geometry=[chord], crs=4326)
+    line_segments = gpd.GeoDataFrame({"line_id": [1, 1]}, geometry=track, crs=4326)
+
+    lines_info = group_and_aggregate_data(make_station_data(), line_segments)
+
+    track_length = geometry.geodesic_lengths(np.asarray(track)).sum()
+    chord_length = line_lengths(line_cleaned).loc[1]
+    assert lines_info.loc[1, "line_length"] == pytest.approx(track_length)
+    assert lines_info.loc[1, "line_length"] > 1.2 * chord_length
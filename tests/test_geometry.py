@@ -0,0 +1,44 @@
+# tests/test_geometry.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from src.scripts.data_preparation.geometry import decode_geo_shapes
+
+LINIE_CLEANED = os.path.join(
+    os.path.dirname(__file__), os.pardir, "data", "processed", "linie_cleaned.csv"
+)
+
+
+def test_decode_geo_shapes_matches_geojson_content():
+    values = pd.Series(
+        [
+            '{"coordinates": [[8.0, 47.0], [8.5, 47.5]], "type": "LineString"}',
+            None,
+            '{"coordinates": [[[7.0, 46.0], [7.1, 46.1]]], "type": "MultiLineString"}',
+        ]
+    )
+
+    geometries = decode_geo_shapes(values, chunk_size=2)
+
+    assert geometries[0].equals(shapely.LineString([(8.0, 47.0), (8.5, 47.5)]))
+    assert geometries[1] is None
+    assert geometries[2].geom_type == "MultiLineString"
+
+
+def test_decode_geo_shapes_rejects_code():
+    with pytest.raises(shapely.errors.GEOSException):
+        decode_geo_shapes(["__import__('os').getcwd()"])
+
+
+def test_decode_geo_shapes_reads_linie_cleaned():
+    linie_cleaned = pd.read_csv(LINIE_CLEANED)
+
+    geometries = decode_geo_shapes(linie_cleaned["geo_shape"])
+
+    assert len(geometries) == len(linie_cleaned)
+    assert np.all(shapely.get_type_id(geometries) == 1)
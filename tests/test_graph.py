@@ -0,0 +1,57 @@
+# tests/test_graph.py
+
+import numpy as np
+import pandas as pd
+
+from src.network.graph import build_graph
+
+
+def make_graph():
+    # A - B - D on line 1, A - C - D on line 2 and a second, longer A - B track
+    line_segments = pd.DataFrame(
+        {
+            "line_id": [1, 1, 2, 2, 3],
+            "track_gauge": ["1435", "1435", "1000", "1000", "1435"],
+            "segment_start": [0.0, 2.0, 0.0, 1.5, 10.0],
+            "segment_end": [2.0, 5.0, 1.5, 5.0, 14.0],
+            "start_station": ["A", "B", "A", "C", "A"],
+            "end_station": ["B", "D", "C", "D", "B"],
+        }
+    )
+    stations_info = pd.DataFrame(
+        {"station_abbr": ["A", "B", "D"], "didok": [100, 200, 400]}
+    )
+    return build_graph(line_segments, stations_info)
+
+
+def test_build_graph_keys_nodes_by_didok():
+    graph = make_graph()
+
+    assert graph.n_nodes == 4
+    assert graph.n_edges == 5
+    assert graph.nodes_of_didok([400, 999]).tolist() == [
+        graph.nodes_of_abbr(["D"])[0],
+        -1,
+    ]
+    junction = graph.nodes_of_abbr(["C"])[0]
+    assert graph.node_didok[junction] == -1
+
+    node_a = graph.nodes_of_abbr(["A"])[0]
+    neighbours, edges = graph.neighbours(node_a)
+    assert sorted(graph.node_abbr[neighbours]) == ["B", "B", "C"]
+    assert sorted(graph.edge_line_id[edges]) == [1, 2, 3]
+
+
+def test_shortest_and_k_shortest_paths():
+    graph = make_graph()
+    node_a, node_d = graph.nodes_of_abbr(["A", "D"])
+
+    length, nodes, edges = graph.shortest_path(node_a, node_d)
+    assert length == 5.0
+    assert graph.node_abbr[nodes].tolist() in (["A", "B", "D"], ["A", "C", "D"])
+    assert graph.edge_length[edges].sum() == length
+
+    paths = graph.k_shortest_paths(node_a, node_d, k=5)
+    assert [path[0] for path in paths] == [5.0, 5.0, 7.0]
+    assert np.all(np.diff([path[0] for path in paths]) >= 0)
+    assert len({tuple(path[2]) for path in paths}) == 3
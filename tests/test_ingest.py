@@ -0,0 +1,81 @@
+# tests/test_ingest.py
+
+import numpy as np
+import pyarrow as pa
+
+from src.scripts.data_preparation import ingest, processed_store
+from src.scripts.data_preparation.clean_and_process_csv import clean_and_process_csv
+
+LINIE_HEADER = (
+    'Line;Line;START OPK;END OPK;KM START;KM END;"Content-Type: text/plain\n";'
+    '"Content-Type: text/plain\n";"Content-Type: text/plain\n";geo_point_2d\n'
+)
+
+
+def write_linie(path, line_ids):
+    rows = [
+        f"{line_id};Line {line_id};A;B;0.0;1.5;0;1000000;"
+        f'"{{""coordinates"": [[8.0, 47.0], [8.1, 47.{line_id % 10}]], '
+        f'""type"": ""LineString""}}";47.05, 8.05\n'
+        for line_id in line_ids
+    ]
+    path.write_text(LINIE_HEADER + "".join(rows), encoding="utf-8")
+
+
+def test_parse_coordinate_pairs():
+    latitude, longitude = ingest.parse_coordinate_pairs(
+        ["47.5, 8.25", "[46.0,7.0]", None, "47.1"]
+    )
+
+    np.testing.assert_array_equal(latitude[:2], [47.5, 46.0])
+    np.testing.assert_array_equal(longitude[:2], [8.25, 7.0])
+    assert np.isnan(latitude[2:]).all() and np.isnan(longitude[2:]).all()
+
+
+def test_batches_are_bounded_and_typed(tmp_path):
+    path = tmp_path / "linie.csv"
+    write_linie(path, range(200))
+
+    batches = list(
+        ingest.iter_record_batches(
+            str(path),
+            [f"column_{i}" for i in range(10)],
+            columns=["column_0", "column_9"],
+            column_types={"column_0": pa.int64()},
+            block_size=4096,
+        )
+    )
+
+    assert len(batches) > 1
+    assert sum(batch.num_rows for batch in batches) == 200
+    assert batches[0].schema.names == ["column_0", "column_9"]
+    assert batches[0].schema.field("column_0").type == pa.int64()
+
+
+def test_clean_and_process_csv_streams_several_files(tmp_path):
+    paths = [tmp_path / "linie_a.csv", tmp_path / "linie_b.csv"]
+    write_linie(paths[0], range(100))
+    write_linie(paths[1], range(100, 150))
+    output = str(tmp_path / "linie_cleaned.parquet")
+
+    clean_and_process_csv([str(path) for path in paths], output, block_size=4096)
+
+    df = processed_store.read_table(output)
+    assert sorted(df["line_id"].tolist()) == list(range(150))
+    assert (df["latitude"] == 47.05).all() and (df["longitude"] == 8.05).all()
+    assert df.geometry.iloc[0].geom_type == "LineString"
+    assert "geo_shape" not in df.columns
+
+
+def test_clean_and_process_csv_writes_empty_outputs(tmp_path):
+    path = tmp_path / "linie.csv"
+    write_linie(path, [])
+    output = str(tmp_path / "linie_cleaned.parquet")
+    csv_path = tmp_path / "linie_cleaned.csv"
+
+    clean_and_process_csv(str(path), output, str(csv_path))
+
+    table = processed_store.read_table(output)
+    assert len(table) == 0
+    assert {"line_id", "latitude", "longitude", "geometry"} <= set(table.columns)
+    assert csv_path.read_text().startswith("line_id,line_name,")
@@ -0,0 +1,72 @@
+# tests/test_instrumentation.py
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from src import instrumentation
+from src.scripts.data_preparation import processed_store
+from src.simulation.engine import TimeSteppedSimulation, TrainFleet
+
+
+def test_measure_counts_rows_bytes_and_errors(tmp_path):
+    path = str(tmp_path / "table.parquet")
+    table = pd.DataFrame({"line_id": [1, 2, 3], "km": [0.0, 1.0, 2.0]})
+
+    with instrumentation.measure("outer", outputs=[path]) as outer:
+        with instrumentation.measure("write", outputs=[path]) as inner:
+            processed_store.write_table(table, path)
+        processed_store.read_table(path)
+
+    assert (inner["rows_in"], inner["rows_out"]) == (0, 3)
+    assert (outer["rows_in"], outer["rows_out"]) == (3, 3)
+    assert outer["bytes_written"] == os.path.getsize(path) > 0
+    assert outer["wall_s"] >= inner["wall_s"] >= 0
+    assert outer["peak_rss_bytes"] > 0 and "error" not in outer
+
+    with pytest.raises(ZeroDivisionError):
+        with instrumentation.measure("failing") as failed:
+            1 / 0
+    assert failed["error"] == "ZeroDivisionError"
+    # Rows outside a measurement are dropped
+    instrumentation.count(rows_in=5)
+
+
+def test_simulation_metrics_as_json_lines_and_prometheus(tmp_path):
+    fleet = TrainFleet(route_length=[2000.0, 3000.0], departure_time=[0.0, 10.0])
+    jsonl = instrumentation.MetricsWriter(str(tmp_path / "metrics.jsonl"))
+    prom = instrumentation.MetricsWriter(str(tmp_path / "metrics.prom"))
+
+    TimeSteppedSimulation(fleet).run(60.0, metrics=jsonl)
+    prom.write(jsonl.records)
+
+    (record,) = [json.loads(line) for line in open(tmp_path / "metrics.jsonl")]
+    assert record["kind"] == "simulation" and record["name"] == "engine"
+    assert record["steps"] == 60 and record["trains"] == 2
+    assert 0 < record["step_p50_s"] <= record["step_p99_s"] <= record["step_max_s"]
+
+    text = (tmp_path / "metrics.prom").read_text()
+    assert "# TYPE railsim_wall_seconds gauge" in text
+    assert 'railsim_steps{kind="simulation",name="engine"} 60' in text
+
+
+def test_simulation_without_metrics_leaves_peak_memory_alone(tmp_path, monkeypatch):
+    resets = []
+    monkeypatch.setattr(instrumentation, "_reset_peak_rss", lambda: resets.append(1))
+    fleet = TrainFleet(route_length=[2000.0, 3000.0], departure_time=[0.0, 10.0])
+
+    TimeSteppedSimulation(fleet).run(60.0)
+    assert resets == []
+    metrics = instrumentation.MetricsWriter(str(tmp_path / "metrics.jsonl"))
+    TimeSteppedSimulation(fleet).run(60.0, metrics=metrics)
+    assert resets == [1]
+
+
+def test_profiler_hook_saves_a_profile(tmp_path):
+    with instrumentation.measure(
+        "profiled", profile="cprofile", profile_directory=str(tmp_path)
+    ) as record:
+        sum(range(1000))
+    assert os.path.exists(record["profile"] + ".prof")
@@ -0,0 +1,48 @@
+# tests/test_linear_referencing.py
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from src.network.linear_referencing import LinearReference
+
+
+def make_reference():
+    # Line 7 runs north then east, line 9 is described against its drawing direction
+    table = gpd.GeoDataFrame(
+        {
+            "line_id": [7, 7, 9],
+            "km_start": [0.0, 10.0, 30.0],
+            "km_end": [10.0, 20.0, 20.0],
+        },
+        geometry=[
+            shapely.LineString([(8.0, 47.0), (8.0, 47.09)]),
+            shapely.LineString([(8.0, 47.09), (8.132, 47.09)]),
+            shapely.LineString([(6.0, 46.0), (6.1, 46.0)]),
+        ],
+        crs="EPSG:4326",
+    )
+    return LinearReference.from_table(table)
+
+
+def test_locate_km_interpolates_positions_and_headings():
+    reference = make_reference()
+
+    lat, lon, heading = reference.locate_km([7, 7, 7, 9], [5.0, 15.0, 99.0, 25.0])
+
+    np.testing.assert_allclose(lat, [47.045, 47.09, 47.09, 46.0], atol=1e-9)
+    np.testing.assert_allclose(lon, [8.0, 8.066, 8.132, 6.05], atol=1e-9)
+    np.testing.assert_allclose(heading[:2], [0.0, 90.0], atol=0.1)
+    # km grows towards the west on line 9
+    np.testing.assert_allclose(heading[3], 270.0, atol=0.1)
+
+
+def test_locate_point_inverts_locate_km():
+    reference = make_reference()
+    km = np.linspace(0.0, 20.0, 101)
+
+    lat, lon, _ = reference.locate_km(7, km)
+    located, distance = reference.locate_point(7, lat, lon)
+
+    np.testing.assert_allclose(located, km, atol=1e-6)
+    assert distance.max() < 1e-6
@@ -0,0 +1,114 @@
+# tests/test_live_stream.py
+
+import base64
+import io
+
+import numpy as np
+
+from src.simulation.engine import TimeSteppedSimulation, TrainFleet, fleet_from_graph
+from ui import data_service, live_stream
+
+
+def test_slow_clients_skip_to_exact_deltas():
+    stream = live_stream.LiveStream()
+    fast, slow = stream.subscribe(), stream.subscribe()
+    position = np.array([0.0, 100.0, 200.0])
+    stream.publish(0.0, position, np.zeros(3), np.ones(3))
+
+    state = live_stream.decode_frame(fast.next_frame(timeout=0).data)
+    assert state["keyframe"] and state["position"].tolist() == [0.0, 100.0, 200.0]
+    slow_state = live_stream.decode_frame(slow.next_frame(timeout=0).data)
+
+    position[0] = 10.0
+    stream.publish(1.0, position, [10.0, 0.0, 0.0], np.ones(3))
+    frame = fast.next_frame(timeout=0)
+    state = live_stream.decode_frame(frame.data, state)
+    assert not frame.keyframe and state["changed"].tolist() == [0]
+
+    position[2] = 230.0
+    stream.publish(2.0, position, [10.0, 0.0, 30.0], np.ones(3))
+    # The slow client skips sequence 2 and still ends up with the latest state
+    frame = slow.next_frame(timeout=0)
+    assert frame.sequence == 3
+    slow_state = live_stream.decode_frame(frame.data, slow_state)
+    assert slow_state["changed"].tolist() == [0, 2]
+    assert slow_state["position"].tolist() == [10.0, 100.0, 230.0]
+    assert np.allclose(slow_state["speed"], [10.0, 0.0, 30.0])
+    assert slow.next_frame(timeout=0) is None
+
+
+def test_simulation_is_streamed_over_sse_and_binary(tmp_path):
+    from tests.test_data_service import write_processed
+
+    write_processed(tmp_path / "processed")
+    stream = live_stream.LiveStream(max_subscribers=2)
+    client = data_service.create_app(str(tmp_path), stream=stream).test_client()
+    simulation = TimeSteppedSimulation(
+        TrainFleet([5000.0, 5000.0], departure_time=[0.0, 30.0], max_speed=20.0)
+    )
+    events = client.get("/stream/trains", buffered=False)
+    stream.publish_simulation(simulation)
+    binary = client.get("/stream/trains.bin", buffered=False)
+    assert client.get("/stream/trains").status_code == 503
+
+    assert live_stream.run_simulation(simulation, stream, 60.0, publish_every=10) == 6
+    stream.close()
+
+    lines = b"".join(events.response).decode().splitlines()
+    data = [line[len("data: ") :] for line in lines if line.startswith("data: ")]
+    state = live_stream.decode_frame(base64.b64decode(data[0]))
+    assert state["keyframe"]
+
+    frames = list(live_stream.iter_binary_frames(io.BytesIO(b"".join(binary.response))))
+    state = None
+    for frame in frames:
+        state = live_stream.decode_frame(frame, state)
+    assert state["time"] == simulation.time
+    assert np.allclose(state["position"], simulation.fleet.position, atol=0.5)
+    assert state["status"].tolist() == [live_stream.STATUS_RUNNING] * 2
+
+
+def test_requests_without_a_body_free_their_slot(tmp_path):
+    from tests.test_data_service import write_processed
+
+    write_processed(tmp_path / "processed")
+    stream = live_stream.LiveStream(max_subscribers=2)
+    client = data_service.create_app(str(tmp_path), stream=stream).test_client()
+
+    for path in ["/stream/trains", "/stream/trains.bin", "/stream/trains"]:
+        response = client.head(path)
+        assert response.status_code == 200
+        response.close()
+
+    stream.publish(0.0, np.zeros(2), np.zeros(2), np.ones(2))
+    events = client.get("/stream/trains", buffered=False)
+    binary = client.get("/stream/trains.bin", buffered=False)
+    assert (events.status_code, binary.status_code) == (200, 200)
+    assert client.get("/stream/trains").status_code == 503
+    stream.close()
+
+
+def test_frames_place_the_trains_on_the_map():
+    from tests.test_viewer_model import make_network
+    from ui.viewer_model import RoutePlacer
+
+    _, graph, reference = make_network()
+    a, c = graph.nodes_of_abbr(["A", "C"])
+    fleet = fleet_from_graph(graph, [a, c], [c, a], [0.0, 0.0])
+    simulation = TimeSteppedSimulation(fleet)
+    placer = RoutePlacer(graph, reference, fleet.routes, fleet.route_origins)
+    stream = live_stream.LiveStream()
+    client = stream.subscribe()
+
+    live_stream.run_simulation(simulation, stream, 300.0, placer=placer)
+    state = live_stream.decode_frame(client.next_frame(timeout=0).data)
+
+    longitude, latitude = placer.place(fleet.route, fleet.position)
+    assert np.allclose(state["longitude"], longitude, atol=1e-6)
+    assert np.allclose(state["latitude"], latitude, atol=1e-6)
+    assert (np.abs(state["longitude"] - [7.0, 7.2]) > 0.01).all()
+
+    # Without a placer the trains have no place on the map
+    stream.publish_simulation(simulation)
+    state = live_stream.decode_frame(client.next_frame(timeout=0).data, state)
+    assert np.isnan(state["longitude"]).all() and np.isnan(state["latitude"]).all()
@@ -0,0 +1,44 @@
+# tests/test_lod_store.py
+
+import numpy as np
+import shapely
+
+from src.scripts.data_preparation import lod_store
+
+
+def make_lines():
+    # A zigzag whose teeth are 0.0003 degrees high and a straight line
+    x = np.linspace(7.0, 8.0, 201)
+    y = 46.5 + 0.0003 * (np.arange(201) % 2)
+    return [shapely.LineString(np.column_stack([x, y])), shapely.box(9, 46, 9.5, 46.5)]
+
+
+def test_levels_lose_vertices_and_stay_valid(tmp_path):
+    path = str(tmp_path / "lod.parquet")
+
+    summary = lod_store.write_lod(
+        path, make_lines(), [10, 20], tolerances=[0.0, 0.0001, 0.001]
+    )
+
+    assert summary["n_vertices"].tolist() == [206, 206, 7]
+    store = lod_store.LODStore(path)
+    assert store.tolerances.tolist() == [0.0, 0.0001, 0.001]
+    coarse = store.read(level=2)
+    assert coarse["line_id"].tolist() == [10, 20]
+    assert shapely.is_valid(coarse.geometry.to_numpy()).all()
+
+
+def test_level_for_picks_coarsest_level_below_a_pixel(tmp_path):
+    path = str(tmp_path / "lod.parquet")
+    lod_store.write_lod(path, make_lines(), [10, 20], tolerances=[0.0, 0.0001, 0.001])
+    store = lod_store.LODStore(path)
+
+    assert store.level_for(0.00005) == 0
+    assert store.level_for(0.0005) == 1
+    assert store.level_for(1.0) == 2
+    resolution = lod_store.resolution_of((7.0, 8.0, 46.0, 47.0), (1000, 500))
+    assert resolution == 0.002
+
+    only_box = store.read(resolution=resolution, bbox=(8.9, 45.9, 9.1, 46.1))
+    assert only_box["line_id"].tolist() == [20]
+    assert store.read(keys=[10])["n_vertices"].tolist() == [201]
@@ -0,0 +1,65 @@
+# tests/test_pipeline.py
+
+import os
+
+from src.scripts.data_preparation.pipeline import Stage, run_pipeline
+
+
+def copy_upper(inputs, outputs):
+    with open(inputs[0]) as source, open(outputs[0], "w") as target:
+        target.write(source.read().upper())
+
+
+def count_chars(inputs, outputs):
+    with open(inputs[0]) as source, open(outputs[0], "w") as target:
+        target.write(str(len(source.read())))
+
+
+def write_nothing(inputs, outputs):
+    pass
+
+
+STAGES = [
+    Stage("upper_a", copy_upper, ["raw/a.txt"], ["processed/a.txt"], []),
+    Stage("upper_b", copy_upper, ["raw/b.txt"], ["processed/b.txt"], []),
+    Stage("count_a", count_chars, ["processed/a.txt"], ["processed/a_len.txt"], []),
+]
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def test_pipeline_skips_up_to_date_stages(tmp_path):
+    write(str(tmp_path / "raw" / "a.txt"), "abc")
+    write(str(tmp_path / "raw" / "b.txt"), "xyz")
+
+    first = run_pipeline(STAGES, str(tmp_path), max_workers=2)
+    assert first == {"upper_a": "ran", "upper_b": "ran", "count_a": "ran"}
+    assert (tmp_path / "processed" / "a_len.txt").read_text() == "3"
+
+    second = run_pipeline(STAGES, str(tmp_path), max_workers=2)
+    assert set(second.values()) == {"skipped"}
+
+    write(str(tmp_path / "raw" / "a.txt"), "abcd")
+    third = run_pipeline(STAGES, str(tmp_path), max_workers=2)
+    assert third == {"upper_a": "ran", "upper_b": "skipped", "count_a": "ran"}
+    assert (tmp_path / "processed" / "a_len.txt").read_text() == "4"
+
+
+def test_pipeline_fails_dependents_of_missing_inputs(tmp_path):
+    write(str(tmp_path / "raw" / "b.txt"), "xyz")
+
+    status = run_pipeline(STAGES, str(tmp_path), max_workers=1)
+    assert status == {"upper_a": "failed", "upper_b": "ran", "count_a": "failed"}
+
+
+def test_pipeline_fails_stages_that_write_no_output(tmp_path):
+    write(str(tmp_path / "raw" / "a.txt"), "abc")
+    stages = [Stage("upper_a", write_nothing, *STAGES[0][2:])]
+    stages += STAGES[2:]
+
+    status = run_pipeline(stages, str(tmp_path), max_workers=1)
+    assert status == {"upper_a": "failed", "count_a": "failed"}
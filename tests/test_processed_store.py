@@ -0,0 +1,73 @@
+# tests/test_processed_store.py
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import shapely
+
+from src.scripts.data_preparation import processed_store
+
+
+def make_segments():
+    return pd.DataFrame(
+        {
+            "line_id": [300, 100, 200, 100, 300],
+            "track_gauge": ["1435", "1000", "1435", "1000", "1435"],
+            "segment_start": [0.0, 0.0, 0.0, 1.0, 1.0],
+            "geometry": [
+                shapely.LineString([(7.0 + i, 46.0), (7.5 + i, 46.5)]) for i in range(5)
+            ],
+        }
+    )
+
+
+def test_round_trip_sorts_by_line_and_keeps_geometry(tmp_path):
+    path = str(tmp_path / "segments.parquet")
+    processed_store.write_table(make_segments(), path, geometry_column="geometry")
+
+    segments = processed_store.read_table(path)
+
+    assert segments["line_id"].tolist() == [100, 100, 200, 300, 300]
+    assert segments.crs == "EPSG:4326"
+    assert segments.geometry.iloc[0].equals(
+        shapely.LineString([(8.0, 46.0), (8.5, 46.5)])
+    )
+    schema = pq.read_schema(path)
+    assert str(schema.field("track_gauge").type).startswith("dictionary")
+
+
+def test_row_groups_do_not_split_lines(tmp_path):
+    path = str(tmp_path / "segments.parquet")
+    processed_store.write_table(
+        make_segments(), path, geometry_column="geometry", row_group_size=1
+    )
+
+    metadata = pq.ParquetFile(path).metadata
+    assert [metadata.row_group(i).num_rows for i in range(3)] == [2, 1, 2]
+
+    one_line = processed_store.read_table(
+        path, columns=["line_id", "segment_start"], line_ids=[300]
+    )
+    assert one_line["line_id"].tolist() == [300, 300]
+    assert list(one_line.columns) == ["line_id", "segment_start"]
+
+
+def test_table_writer_without_rows_writes_readable_columns(tmp_path):
+    path = str(tmp_path / "empty.parquet")
+    with processed_store.TableWriter(path, geometry_column="geometry"):
+        pass
+    df = processed_store.read_table(path, columns=["line_id"], line_ids=[1])
+    assert len(df) == 0 and list(df.columns) == ["line_id"]
+
+    empty = pd.DataFrame(
+        {
+            "line_id": np.empty(0, dtype=np.int64),
+            "km": np.empty(0),
+            "geometry": np.empty(0, dtype=object),
+        }
+    )
+    with processed_store.TableWriter(path, geometry_column="geometry", empty=empty):
+        pass
+    df = processed_store.read_table(path, columns=["line_id", "km"], line_ids=[1])
+    assert len(df) == 0 and list(df.columns) == ["line_id", "km"]
+    assert df["km"].dtype == np.float64
@@ -0,0 +1,105 @@
+# tests/test_railway_network.py
+
+import os
+
+import numpy as np
+
+from src.network.railway_network import RailwayNetwork
+from src.scripts.data_preparation.pipeline import STAGES, run_pipeline
+from src.scripts.data_preparation.synthetic_network import generate_network
+
+
+def save_text(value, path):
+    with open(path, "w") as file:
+        file.write(value)
+
+
+def load_text(path):
+    with open(path) as file:
+        return file.read()
+
+
+def test_network_is_loaded_once_and_memoized_on_disk(tmp_path):
+    data_root = str(tmp_path)
+    generate_network(data_root, n_lines=6, stations_per_line=5, seed=2)
+    stages = [s for s in STAGES if s.name in ("stations_info", "line_segments")]
+    assert set(run_pipeline(stages, data_root, max_workers=1).values()) == {"ran"}
+
+    network = RailwayNetwork(data_root)
+    graph = network.graph
+    assert network.graph is graph
+    assert len(network.stations) == graph.n_nodes
+    assert network.projected_segments.crs.to_epsg() == 3035
+    entries = {entry.rsplit("-", 1)[0] for entry in os.listdir(network.cache_directory)}
+    assert entries == {"digests.json", "graph", "segment_index-EPSG_3035"}
+
+    # A new process loads the graph and projected segments instead of building them
+    reopened = RailwayNetwork(data_root)
+    cached = reopened.graph
+    assert isinstance(cached.to_arrays()["indptr"], np.memmap)
+    for name, array in graph.to_arrays().items():
+        np.testing.assert_array_equal(cached.to_arrays()[name], array)
+    assert len(reopened.projected_segments) == len(network.projected_segments)
+    assert "segments" not in vars(reopened)
+
+
+def test_memo_entry_is_rebuilt_when_a_source_changes(tmp_path):
+    source = tmp_path / "raw" / "source.txt"
+    source.parent.mkdir()
+    source.write_text("first")
+    builds = []
+
+    def build():
+        builds.append(source.read_text())
+        return source.read_text().upper()
+
+    def memoize():
+        network = RailwayNetwork(str(tmp_path))
+        return network.memoize("upper", [str(source)], build, save_text, load_text)
+
+    assert memoize() == "FIRST"
+    assert memoize() == "FIRST"
+    assert builds == ["first"]
+
+    source.write_text("second")
+    assert memoize() == "SECOND"
+    assert builds == ["first", "second"]
+    entries = os.listdir(tmp_path / "cache" / "network")
+    assert len([entry for entry in entries if entry.startswith("upper-")]) == 1
+
+
+def save_directory(value, path):
+    os.makedirs(path)
+    save_text(value, os.path.join(path, "value.txt"))
+
+
+def load_directory(path):
+    return load_text(os.path.join(path, "value.txt"))
+
+
+def test_concurrent_builds_keep_the_first_stored_entry(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("value")
+
+    def memoize(build):
+        network = RailwayNetwork(str(tmp_path))
+        return network.memoize(
+            "value", [str(source)], build, save_directory, load_directory
+        )
+
+    # Another process stores the entry while this one is building it
+    assert memoize(lambda: memoize(lambda: "first") and "second") == "first"
+    assert memoize(lambda: "third") == "first"
+    entries = sorted(os.listdir(tmp_path / "cache" / "network"))
+    assert [entry.rsplit("-", 1)[0] for entry in entries] == ["digests.json", "value"]
+
+
+def test_open_shares_the_network_until_cleared(tmp_path):
+    network = RailwayNetwork.open(str(tmp_path))
+    assert RailwayNetwork.open(str(tmp_path)) is network
+    assert RailwayNetwork.open(str(tmp_path), country="DEU") is not network
+
+    network.__dict__["stations"] = "loaded"
+    assert network.stations == "loaded"
+    network.clear()
+    assert "stations" not in vars(network)
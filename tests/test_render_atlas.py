@@ -0,0 +1,87 @@
+# tests/test_render_atlas.py
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from PIL import Image
+
+from src.scripts.data_preparation import render_atlas
+
+
+def make_segments():
+    return gpd.GeoDataFrame(
+        {
+            "line_id": [1, 1, 2],
+            "line_name": ["A - C", "A - C", "B - D"],
+            "start_station_id": [0, 1, 1],
+            "end_station_id": [1, 2, -1],
+        },
+        geometry=[
+            shapely.LineString([(7.0, 46.5), (7.5, 46.6)]),
+            shapely.MultiLineString(
+                [[(7.5, 46.6), (8.0, 46.8)], [(8.1, 46.8), (8.3, 47.0)]]
+            ),
+            shapely.LineString([(7.5, 46.6), (8.5, 46.2)]),
+        ],
+        crs="EPSG:4326",
+    )
+
+
+def make_stations():
+    return pd.DataFrame({"latitude": [46.5, 46.6, 47.0], "longitude": [7.0, 7.5, 8.3]})
+
+
+def test_line_drawings_split_parts_and_gather_stations():
+    drawings = render_atlas.line_drawings(make_segments(), make_stations())
+
+    title, paths, stations = drawings[1]
+    assert title == "Line 1: A - C"
+    assert [len(path) for path in paths] == [2, 2, 2]
+    np.testing.assert_array_equal(stations[:, 0], [7.0, 7.5, 8.3])
+    assert len(drawings[2][2]) == 1
+
+
+def test_render_atlas_writes_every_line_over_cached_base(tmp_path):
+    borders_path = str(tmp_path / "borders.json")
+    gpd.GeoDataFrame(
+        {"name": ["X"]}, geometry=[shapely.box(6.5, 46.0, 9.0, 47.5)], crs="EPSG:4326"
+    ).to_file(borders_path, driver="GeoJSON")
+    output = str(tmp_path / "atlas")
+
+    paths = render_atlas.render_atlas(
+        make_segments(),
+        make_stations(),
+        borders_path,
+        output,
+        width=3,
+        dpi=50,
+        max_workers=1,
+    )
+
+    assert sorted(os.path.basename(path) for path in paths) == [
+        "line_1.png",
+        "line_2.png",
+    ]
+    (base_file,) = [
+        name
+        for name in os.listdir(os.path.join(output, ".cache"))
+        if name.endswith(".npy")
+    ]
+    base = np.load(os.path.join(output, ".cache", base_file))
+    assert Image.open(paths[0]).size == (base.shape[1], base.shape[0])
+
+    cached = os.stat(os.path.join(output, ".cache", base_file)).st_mtime_ns
+    render_atlas.render_atlas(
+        make_segments(),
+        make_stations(),
+        borders_path,
+        output,
+        line_ids=[2],
+        width=3,
+        dpi=50,
+        max_workers=1,
+    )
+    assert os.stat(os.path.join(output, ".cache", base_file)).st_mtime_ns == cached
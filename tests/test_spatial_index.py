@@ -0,0 +1,62 @@
+# tests/test_spatial_index.py
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.network.spatial_index import SegmentIndex
+
+
+def make_index():
+    line_segments = gpd.GeoDataFrame(
+        {
+            "line_id": [1, 1, 2],
+            "segment_start": [0.0, 10.0, 50.0],
+            "segment_end": [10.0, 20.0, 40.0],
+        },
+        geometry=[
+            shapely.LineString([(7.0, 46.9), (7.1, 46.9)]),
+            shapely.LineString([(7.1, 46.9), (7.2, 46.9)]),
+            shapely.LineString([(7.1, 46.8), (7.1, 47.0)]),
+        ],
+        crs="EPSG:4326",
+    )
+    return SegmentIndex.from_segments(line_segments)
+
+
+def test_snap_stations_reports_chainage_on_every_line():
+    stations_info = pd.DataFrame(
+        {
+            "station_abbr": ["A", "X", "FAR"],
+            "latitude": [46.9, 46.9, 46.0],
+            "longitude": [7.05, 7.1, 7.0],
+        }
+    )
+
+    snapped = make_index().snap_stations(stations_info)
+
+    assert snapped[["station_abbr", "line_id"]].values.tolist() == [
+        ["A", 1],
+        ["X", 1],
+        ["X", 2],
+    ]
+    np.testing.assert_allclose(snapped["chainage_km"], [5.0, 10.0, 45.0], atol=0.05)
+    assert (snapped["distance_m"] < 5.0).all()
+
+
+def test_saved_index_snaps_the_same(tmp_path):
+    path = str(tmp_path / "segment_index.parquet")
+    index = make_index()
+    index.save(path)
+    stations_info = pd.DataFrame(
+        {"station_abbr": ["A"], "latitude": [46.9001], "longitude": [7.15]}
+    )
+
+    snapped = SegmentIndex.load(path).snap_stations(stations_info)
+
+    assert snapped["line_id"].tolist() == [1]
+    assert (
+        snapped["chainage_km"].iloc[0]
+        == index.snap_stations(stations_info)["chainage_km"].iloc[0]
+    )
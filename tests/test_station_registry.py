@@ -0,0 +1,49 @@
+# tests/test_station_registry.py
+
+import pandas as pd
+
+from src.scripts.data_preparation.station_registry import StationRegistry
+
+
+def make_stations_info():
+    return pd.DataFrame(
+        {
+            "station_abbr": ["ZUE", "BN", "LS", "BN"],
+            "stop_name": ["Zürich HB", "Bern", "Lausanne", "Bern"],
+            "didok": [3000, 7000, 1120, 7000],
+            "bpuic": [8503000, 8507000, 8501120, 8507000],
+            "sloid": ["ch:1:sloid:3000", "ch:1:sloid:7000", "ch:1:sloid:1120", "x"],
+            "latitude": [47.38, 46.95, 46.52, 46.95],
+            "longitude": [8.54, 7.44, 6.63, 7.44],
+        }
+    )
+
+
+def test_ids_are_dense_and_ordered_by_didok():
+    registry = StationRegistry.from_stations_info(make_stations_info())
+
+    assert len(registry) == 3
+    assert registry.didok.tolist() == [1120, 3000, 7000]
+    assert registry.abbr_of([0, 1, 2]).tolist() == ["LS", "ZUE", "BN"]
+
+
+def test_lookups_in_every_direction():
+    registry = StationRegistry.from_stations_info(make_stations_info())
+
+    ids = registry.ids_of_abbr(["BN", "ZUE", "XYZ"])
+    assert ids.tolist() == [2, 1, -1]
+    assert registry.ids_of_didok([7000, 1, 1120]).tolist() == [2, -1, 0]
+    assert registry.ids_of_sloid(["ch:1:sloid:3000"]).tolist() == [1]
+    assert registry.didok_of(ids[:2]).tolist() == [7000, 3000]
+    assert registry.name_of([1]).tolist() == ["Zürich HB"]
+    assert registry.sloid_of([2]).tolist() == ["ch:1:sloid:7000"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    registry = StationRegistry.from_stations_info(make_stations_info())
+    path = str(tmp_path / "stations_info.parquet")
+
+    registry.save(path)
+    loaded = StationRegistry.load(path)
+
+    pd.testing.assert_frame_equal(loaded.to_frame(), registry.to_frame())
@@ -0,0 +1,59 @@
+# tests/test_sweep.py
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.network.graph import build_graph
+from src.simulation.sweep import (
+    load_network,
+    monte_carlo_scenarios,
+    run_sweep,
+    save_network,
+)
+
+
+def make_graph():
+    line_segments = pd.DataFrame(
+        {
+            "line_id": [1, 1, 2],
+            "track_gauge": ["1435", "1435", "1000"],
+            "segment_start": [0.0, 5.0, 0.0],
+            "segment_end": [5.0, 12.0, 4.0],
+            "start_station": ["A", "B", "B"],
+            "end_station": ["B", "C", "D"],
+        }
+    )
+    stations_info = pd.DataFrame({"station_abbr": ["A", "C", "D"], "didok": [1, 3, 4]})
+    return build_graph(line_segments, stations_info)
+
+
+def test_memory_mapped_network_matches_graph(tmp_path):
+    graph = make_graph()
+    save_network(graph, str(tmp_path))
+
+    mapped = load_network(str(tmp_path))
+
+    assert isinstance(mapped.indices, np.memmap)
+    a, c, d = graph.nodes_of_didok([1, 3, 4])
+    assert mapped.shortest_path(a, c) == graph.shortest_path(a, c)
+    assert mapped.nodes_of_abbr(["D"]).tolist() == [d]
+
+
+def test_run_sweep_streams_and_resumes(tmp_path):
+    graph = make_graph()
+    a, c, d = graph.nodes_of_didok([1, 3, 4])
+    scenarios = monte_carlo_scenarios([(a, c), (d, a)], 4, n_trains=3)
+    output = str(tmp_path / "sweep.jsonl")
+
+    status = run_sweep(graph, scenarios, output, max_workers=2)
+
+    assert set(status.values()) == {"ran"}
+    with open(output) as file:
+        records = [json.loads(line) for line in file]
+    assert len(records) == 4
+    assert all(record["result"]["arrived"] == 3 for record in records)
+
+    status = run_sweep(graph, scenarios, output, max_workers=2)
+    assert set(status.values()) == {"skipped"}
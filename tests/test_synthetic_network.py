@@ -0,0 +1,87 @@
+# tests/test_synthetic_network.py
+
+import os
+
+import numpy as np
+import pytest
+import shapely
+
+from src.scripts.data_preparation import (
+    clean_and_process_csv,
+    extract_line_segments,
+    extract_stations_info,
+    ingest,
+)
+from src.scripts.data_preparation.synthetic_network import (
+    generate_network,
+    grid_size,
+    station_coordinates,
+)
+
+
+@pytest.mark.parametrize("topology", ["lattice", "mesh", "radial"])
+def test_generated_files_load_with_the_raw_loaders(tmp_path, topology):
+    rows = generate_network(
+        str(tmp_path), n_lines=12, stations_per_line=6, topology=topology, seed=3
+    )
+    raw = tmp_path / "raw"
+
+    segments = extract_line_segments.load_and_clean_data(
+        str(raw / "linie-mit-polygon.csv")
+    )
+    assert rows["linie-mit-polygon.csv"] == len(segments) == 12 * 5
+    assert segments.groupby("line_id").size().eq(5).all()
+    # Consecutive segments of a line meet at their stations
+    same_line = (
+        segments["line_id"].to_numpy()[1:] == segments["line_id"].to_numpy()[:-1]
+    )
+    ends = shapely.get_point(segments["geometry"].to_numpy(), -1)[:-1][same_line]
+    starts = shapely.get_point(segments["geometry"].to_numpy(), 0)[1:][same_line]
+    assert shapely.equals(ends, starts).all()
+    assert (
+        segments["end_station"].to_numpy()[:-1][same_line]
+        == segments["start_station"].to_numpy()[1:][same_line]
+    ).all()
+
+    stations = extract_stations_info.load_and_clean_data(
+        str(raw / "linie-mit-betriebspunkten.csv")
+    )
+    assert set(stations["station_abbr"]) == set(segments["start_station"]) | set(
+        segments["end_station"]
+    )
+    assert stations[["latitude", "longitude"]].notna().all().all()
+
+    lines = ingest.read_csv(
+        str(raw / "linie.csv"),
+        clean_and_process_csv.COLUMN_NAMES,
+        column_types=clean_and_process_csv.COLUMN_TYPES,
+    )
+    assert len(lines) == 12
+    assert np.allclose(
+        lines.set_index("line_id")["km_end"],
+        segments.groupby("line_id")["segment_end"].max(),
+    )
+
+
+def test_generation_is_deterministic(tmp_path):
+    for name, seed in [("a", 1), ("b", 1), ("c", 2)]:
+        generate_network(str(tmp_path / name), n_lines=5, seed=seed)
+
+    def read(name):
+        with open(os.path.join(tmp_path, name, "raw", "linie.csv"), "rb") as file:
+            return file.read()
+
+    assert read("a") == read("b")
+    assert read("a") != read("c")
+
+
+@pytest.mark.parametrize("n_lines", [100, 150000, 10**8])
+def test_stations_stay_on_the_globe(n_lines):
+    side = grid_size(n_lines, 20)
+    # The bottom and top rows of the grid
+    nodes = np.concatenate([np.arange(side), side * (side - 1) + np.arange(side)])
+
+    longitude, latitude = station_coordinates(nodes, side)
+
+    assert ((latitude >= -90) & (latitude <= 90)).all()
+    assert ((longitude >= -180) & (longitude <= 180)).all()
@@ -0,0 +1,105 @@
+# tests/test_vector_tiles.py
+
+import numpy as np
+import pytest
+
+from tests.test_data_service import write_processed
+from ui import data_service, vector_tiles
+
+
+def read_varint(data, position):
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        value |= (byte & 0x7F) << shift
+        position += 1
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def read_message(data):
+    """Decode a protobuf message to a list of (field, value) pairs."""
+    fields, position = [], 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        if key & 7 == 0:
+            value, position = read_varint(data, position)
+        elif key & 7 == 1:
+            value, position = data[position : position + 8], position + 8
+        else:
+            length, position = read_varint(data, position)
+            value, position = data[position : position + length], position + length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def read_packed(data):
+    values, position = [], 0
+    while position < len(data):
+        value, position = read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def read_tile(data):
+    layers = {}
+    for _, layer in read_message(data):
+        fields = read_message(layer)
+        name = next(value for field, value in fields if field == 1).decode()
+        keys = [value.decode() for field, value in fields if field == 3]
+        values = [read_message(value)[0] for field, value in fields if field == 4]
+        features = []
+        for field, feature in fields:
+            if field != 2:
+                continue
+            feature = dict(read_message(feature))
+            tags = read_packed(feature[2])
+            properties = {keys[k]: values[v][1] for k, v in zip(tags[::2], tags[1::2])}
+            features.append(
+                (feature[1], feature[3], read_packed(feature[4]), properties)
+            )
+        layers[name] = features
+    return layers
+
+
+def test_packed_varints_match_the_scalar_encoding():
+    values = [0, 1, 127, 128, 300, 2**21, 2**35 + 5]
+    assert vector_tiles._packed_varints(values) == b"".join(
+        vector_tiles._varint(value) for value in values
+    )
+    assert read_packed(vector_tiles._packed_varints(values)) == values
+
+
+def test_tiles_hold_the_visible_segments_and_stations(tmp_path):
+    write_processed(tmp_path / "processed")
+    app = data_service.create_app(str(tmp_path))
+    client = app.test_client()
+
+    # The zoom 8 tile of 7.5E to 8.4E around 47N holds both lines and station B
+    x = int((7.5 + 180) / 360 * 2**8)
+    y = int(
+        (1 - np.log(np.tan(np.radians(47.0)) + 1 / np.cos(np.radians(47.0))) / np.pi)
+        / 2
+        * 2**8
+    )
+    response = client.get(f"/tiles/8/{x}/{y}.mvt")
+    assert response.mimetype == vector_tiles.MVT_MIMETYPE
+    layers = read_tile(response.data)
+    assert [feature[3]["line_id"] for feature in layers["segments"]] == [100, 200]
+    segment_id, geometry_type, commands, properties = layers["segments"][0]
+    assert geometry_type == 2 and properties == {"line_id": 100}
+    # MoveTo(1), dx, dy, LineTo(n)
+    assert commands[0] == 9 and commands[3] & 7 == 2
+    assert [feature[3]["station_abbr"] for feature in layers["stations"]] == [b"B"]
+
+    assert client.get("/tiles/0/1/0.mvt").status_code == 404
+    tiles = app.extensions["railway_tiles"]
+    assert tiles.disk.get(tiles.index.version, 8, x, y) == response.data
+
+
+@pytest.mark.parametrize("z", [1, 10, 16])
+def test_tiles_far_from_the_network_are_empty(tmp_path, z):
+    write_processed(tmp_path / "processed")
+    client = data_service.create_app(str(tmp_path)).test_client()
+    assert client.get(f"/tiles/{z}/0/0.mvt").data == b""
@@ -0,0 +1,73 @@
+# tests/test_viewer_model.py
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.network.graph import build_graph
+from src.network.linear_referencing import LinearReference
+from src.simulation.engine import TimeSteppedSimulation, fleet_from_graph
+from ui.viewer_model import NetworkGeometry, Replay, RoutePlacer, in_view
+
+
+def make_network():
+    line_segments = gpd.GeoDataFrame(
+        {
+            "line_id": [1, 1],
+            "track_gauge": ["1435", "1435"],
+            "segment_start": [0.0, 10.0],
+            "segment_end": [10.0, 20.0],
+            "start_station": ["A", "B"],
+            "end_station": ["B", "C"],
+            "geometry": [
+                shapely.LineString([(7.0, 47.0), (7.1, 47.0)]),
+                shapely.LineString([(7.1, 47.0), (7.2, 47.0)]),
+            ],
+        }
+    )
+    stations_info = pd.DataFrame({"station_abbr": ["A", "B", "C"], "didok": [1, 2, 3]})
+    graph = build_graph(line_segments, stations_info)
+    reference = LinearReference.from_table(
+        line_segments, "segment_start", "segment_end"
+    )
+    return line_segments, graph, reference
+
+
+def test_route_positions_are_placed_in_both_directions():
+    _, graph, reference = make_network()
+    a, c = graph.nodes_of_abbr(["A", "C"])
+    fleet = fleet_from_graph(graph, [a, c], [c, a], [0.0, 0.0])
+    placer = RoutePlacer(graph, reference, fleet.routes, fleet.route_origins)
+
+    lon, lat = placer.place(fleet.route, [5000.0, 5000.0])
+    forward, backward = np.argsort(fleet.route_origins[fleet.route] != a)
+    assert np.isclose(lon[forward], 7.05) and np.isclose(lon[backward], 7.15)
+    assert np.allclose(lat, 47.0)
+    lon, _ = placer.place(fleet.route, [15000.0, 0.0])
+    assert np.isclose(lon[forward], 7.15) and np.isclose(lon[backward], 7.2)
+
+    simulation = TimeSteppedSimulation(fleet)
+    replay = Replay.record(simulation, 60.0, placer, record_every=10)
+    trains, lon, lat = replay.state_at(35.0)
+    assert trains.tolist() == [0, 1]
+    expected, _ = placer.place(
+        fleet.route, (replay.position[3] + replay.position[4]) / 2
+    )
+    assert np.allclose(lon, expected)
+
+
+def test_network_paths_are_culled_and_decimated():
+    wiggly = shapely.LineString(
+        [(7.0 + i * 0.001, 47.0 + 0.00005 * (i % 2)) for i in range(101)]
+    )
+    far = shapely.LineString([(9.0, 46.0), (9.1, 46.0)])
+    network = NetworkGeometry.from_geometries(np.array([wiggly, far]))
+
+    level, paths = network.paths((6.95, 7.15, 46.95, 47.05), (3000, 2000))
+    assert level == 0 and len(paths) == 1 and len(paths[0]) == 101
+    level, paths = network.paths((6.0, 10.0, 45.0, 48.0), (400, 300))
+    assert level > 0 and len(paths) == 2 and len(paths[0]) == 2
+
+    mask = in_view(np.array([7.0, 9.0]), np.array([47.0, 46.0]), (6.9, 7.2, 46.9, 47.1))
+    assert mask.tolist() == [True, False]
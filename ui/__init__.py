@@ -0,0 +1 @@
+"""User interface of the railway simulation: main window and data services."""
@@ -0,0 +1,614 @@
+"""
+REST data service for the stations, lines and segments of the railway network.
+
+The processed tables are loaded once into a ``DataIndex``: every record is
+encoded to JSON up front and kept next to the arrays that filtering needs
+(coordinates, bounding boxes and line memberships), so a request only selects
+indices with NumPy and joins pre-encoded bytes. Finished responses are kept in
+an LRU cache together with their gzip encoding and ETag, which answers repeated
+polls from memory and conditional requests with ``304 Not Modified``. The index
+is rebuilt, and the cache cleared, when the processed files change.
+
+Endpoints (all ``GET``):
+    /api/health
+    /api/stations[/<station_id>]   ?bbox=&line_id=&offset=&limit=
+    /api/lines[/<line_id>]         ?bbox=&line_id=&offset=&limit=
+    /api/segments                  ?bbox=&line_id=&offset=&limit=
+    /tiles/<z>/<x>/<y>.mvt         vector tiles, see ``ui.vector_tiles``
+    /stream/trains[.bin]           live simulation, see ``ui.live_stream``
+
+``bbox`` is ``min_lon,min_lat,max_lon,max_lat`` and ``line_id`` a comma-separated
+list of line ids.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+from flask import Flask, Response, jsonify, request
+
+from src.scripts.data_preparation import processed_store
+from src.scripts.data_preparation.pipeline import DEFAULT_DATA_ROOT
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Responses smaller than this are not worth compressing
+MIN_GZIP_SIZE = 1024
+
+# Processed tables the index is built from
+SOURCE_TABLES = ["stations_info", "lines_info", "line_stations", "line_segments"]
+
+
+class BadRequest(ValueError):
+    """Invalid query parameter, answered with ``400 Bad Request``."""
+
+
+def _encode_records(df):
+    """Encode every row of a table as a compact JSON object."""
+    if len(df) == 0:
+        return []
+    text = pd.DataFrame(df).to_json(orient="records", lines=True)
+    return [line.encode("utf-8") for line in text.splitlines()]
+
+
+class RecordTable:
+    """
+    Pre-encoded records of one resource with the arrays used to filter them.
+
+    Attributes:
+        ids (np.ndarray): Id of every record, e.g. its station id.
+        records (list[bytes]): JSON object of every record.
+        bounds (np.ndarray): ``(n, 4)`` bounding box of every record, NaN if
+            the record has no location.
+        member_record (np.ndarray): Record index of every line membership.
+        member_line (np.ndarray): Line id of every line membership.
+    """
+
+    def __init__(self, ids, records, bounds, member_record, member_line):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.records = records
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self.member_record = np.asarray(member_record, dtype=np.int64)
+        self.member_line = np.asarray(member_line, dtype=np.int64)
+        self._position = pd.Index(self.ids)
+
+    def __len__(self):
+        return len(self.records)
+
+    def position_of(self, record_id):
+        """
+        Find the record with an id.
+
+        Args:
+            record_id (int): The id.
+
+        Returns:
+            int: Record index, or -1 if there is no such record.
+        """
+        return int(self._position.get_indexer([record_id])[0])
+
+    def select(self, bbox=None, line_ids=None):
+        """
+        Select the records matching the filters.
+
+        Args:
+            bbox (tuple, optional): ``(min_lon, min_lat, max_lon, max_lat)``.
+            line_ids (list[int], optional): Keep records on these lines.
+
+        Returns:
+            np.ndarray: Ascending record indices.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if bbox is not None:
+            min_x, min_y, max_x, max_y = (self.bounds[:, i] for i in range(4))
+            mask &= (
+                (min_x <= bbox[2])
+                & (max_x >= bbox[0])
+                & (min_y <= bbox[3])
+                & (max_y >= bbox[1])
+            )
+        if line_ids is not None:
+            on_lines = np.zeros(len(self), dtype=bool)
+            on_lines[self.member_record[np.isin(self.member_line, line_ids)]] = True
+            mask &= on_lines
+        return np.flatnonzero(mask)
+
+
+class DataIndex:
+    """
+    In-memory index of the processed network data.
+
+    Attributes:
+        stations (RecordTable): Stations keyed by station id.
+        lines (RecordTable): Lines keyed by line id.
+        segments (RecordTable): Segments keyed by their row number.
+        version (str): Signature of the processed files the index was built from.
+        frames (dict): Source tables by name, for derived views such as tiles.
+    """
+
+    def __init__(self, stations, lines, segments, version="", frames=None):
+        self.stations = stations
+        self.lines = lines
+        self.segments = segments
+        self.version = version
+        self.frames = frames or {}
+
+    @classmethod
+    def from_tables(
+        cls, stations_info, lines_info, line_stations, line_segments, version=""
+    ):
+        """
+        Build the index from the processed tables.
+
+        Args:
+            stations_info (pd.DataFrame): The station registry.
+            lines_info (pd.DataFrame): The per-line information.
+            line_stations (pd.DataFrame): Station ids of every line.
+            line_segments (gpd.GeoDataFrame): The line segments.
+            version (str): Signature of the source data.
+
+        Returns:
+            DataIndex: The index.
+        """
+        station_ids = stations_info["station_id"].to_numpy(np.int64)
+        longitude = stations_info["longitude"].to_numpy(np.float64)
+        latitude = stations_info["latitude"].to_numpy(np.float64)
+        station_position = pd.Index(station_ids)
+        member_station = station_position.get_indexer(
+            line_stations["station_id"].to_numpy(np.int64)
+        )
+        known = member_station >= 0
+        stations = RecordTable(
+            station_ids,
+            _encode_records(stations_info),
+            np.column_stack([longitude, latitude, longitude, latitude]),
+            member_station[known],
+            line_stations["line_id"].to_numpy(np.int64)[known],
+        )
+
+        geometries = line_segments.geometry.to_numpy()
+        segment_bounds = shapely.bounds(geometries)
+        segment_lines = line_segments["line_id"].to_numpy(np.int64)
+        attributes = pd.DataFrame(
+            line_segments.drop(columns=line_segments.geometry.name)
+        )
+        attributes.insert(0, "segment_id", np.arange(len(attributes)))
+        geojson = shapely.to_geojson(geometries)
+        segments = RecordTable(
+            np.arange(len(line_segments)),
+            [
+                record[:-1] + b',"geometry":' + shape.encode("utf-8") + b"}"
+                for record, shape in zip(
+                    _encode_records(attributes),
+                    np.where(pd.isna(geojson), "null", geojson),
+                )
+            ],
+            segment_bounds,
+            np.arange(len(line_segments)),
+            segment_lines,
+        )
+
+        line_ids = lines_info["line_id"].to_numpy(np.int64)
+        line_bounds = (
+            pd.DataFrame(segment_bounds, columns=["min_x", "min_y", "max_x", "max_y"])
+            .groupby(segment_lines)
+            .agg({"min_x": "min", "min_y": "min", "max_x": "max", "max_y": "max"})
+            .reindex(line_ids)
+            .to_numpy()
+        )
+        lines = RecordTable(
+            line_ids,
+            _encode_records(lines_info),
+            line_bounds,
+            np.arange(len(line_ids)),
+            line_ids,
+        )
+        frames = {"stations_info": stations_info, "line_segments": line_segments}
+        return cls(stations, lines, segments, version, frames)
+
+    @classmethod
+    def load(cls, processed_directory):
+        """
+        Build the index from the Parquet tables of ``data/processed``.
+
+        Args:
+            processed_directory (str): Directory with the processed tables.
+
+        Returns:
+            DataIndex: The index.
+        """
+        tables = {
+            name: processed_store.read_table(
+                os.path.join(processed_directory, name + ".parquet"),
+                key_column="station_id" if name == "stations_info" else "line_id",
+            )
+            for name in SOURCE_TABLES
+        }
+        return cls.from_tables(
+            tables["stations_info"],
+            tables["lines_info"],
+            tables["line_stations"],
+            tables["line_segments"],
+            version=source_signature(processed_directory),
+        )
+
+
+def source_signature(processed_directory):
+    """
+    Fingerprint the processed tables from their sizes and modification times.
+
+    Args:
+        processed_directory (str): Directory with the processed tables.
+
+    Returns:
+        str: Short hex digest that changes whenever a table is rewritten.
+    """
+    digest = hashlib.sha1()
+    for name in SOURCE_TABLES:
+        path = os.path.join(processed_directory, name + ".parquet")
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of encoded responses.
+
+    Attributes:
+        max_entries (int): Number of responses kept at most.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that were not.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value of a key, or None, and mark it recently used."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used one when full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class ServiceState:
+    """
+    Data index and response cache shared by the request handlers.
+
+    The processed files are checked for changes at most every
+    ``reload_interval`` seconds; the index is then rebuilt, the cache cleared and
+    every ``on_reload`` callback called with the new index.
+
+    Attributes:
+        index (DataIndex): The current data index.
+        cache (ResponseCache): Cache of encoded responses.
+        on_reload (list[callable]): Callbacks run after the index was rebuilt.
+    """
+
+    def __init__(self, processed_directory, index, cache, reload_interval=5.0):
+        self.processed_directory = processed_directory
+        self.index = index
+        self.cache = cache
+        self.reload_interval = reload_interval
+        self.on_reload = []
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+        Rebuild the index if the processed files changed.
+
+        Args:
+            force (bool): Check now, regardless of the reload interval.
+
+        Returns:
+            bool: Whether the index was rebuilt.
+        """
+        if self.processed_directory is None or self.reload_interval is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            if source_signature(self.processed_directory) == self.index.version:
+                return False
+            self.index = DataIndex.load(self.processed_directory)
+            self.cache.clear()
+        for callback in self.on_reload:
+            callback(self.index)
+        return True
+
+
+def _parse_bbox(value):
+    """Parse a ``min_lon,min_lat,max_lon,max_lat`` query parameter."""
+    if value is None:
+        return None
+    try:
+        bbox = [float(part) for part in value.split(",")]
+    except ValueError:
+        raise BadRequest("bbox must be four numbers") from None
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise BadRequest("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+
+def _parse_line_ids(value):
+    """Parse a comma-separated ``line_id`` query parameter."""
+    if value is None:
+        return None
+    try:
+        return [int(part) for part in value.split(",") if part]
+    except ValueError:
+        raise BadRequest("line_id must be a comma-separated list of integers") from None
+
+
+def _parse_int(value, name, default, minimum, maximum):
+    """Parse a bounded integer query parameter."""
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+    if not minimum <= number <= maximum:
+        raise BadRequest(f"{name} must be between {minimum} and {maximum}")
+    return number
+
+
+def encode_page(table, indices, offset, limit):
+    """
+    Encode one page of records.
+
+    Args:
+        table (RecordTable): The records.
+        indices (np.ndarray): Indices of the matching records.
+        offset (int): Number of matching records to skip.
+        limit (int): Number of records per page.
+
+    Returns:
+        bytes: JSON object with ``total``, ``offset``, ``limit``, ``next`` (the
+        offset of the next page or null) and the ``items``.
+    """
+    total = len(indices)
+    page = indices[offset : offset + limit].tolist()
+    next_offset = offset + limit if offset + limit < total else None
+    head = (
+        f'{{"total":{total},"offset":{offset},"limit":{limit},'
+        f'"next":{"null" if next_offset is None else next_offset},"items":['
+    )
+    return head.encode("utf-8") + b",".join(table.records[i] for i in page) + b"]}"
+
+
+def cached_response(cache, key, build, mimetype="application/json"):
+    """
+    Answer a request from the response cache, building the body on a miss.
+
+    The body is compressed with gzip when the client accepts it, and requests
+    whose ``If-None-Match`` matches the ETag are answered with ``304``.
+
+    Args:
+        cache (ResponseCache): The response cache.
+        key (tuple): Cache key, including the data version.
+        build (callable): Function returning the body as bytes.
+        mimetype (str): Content type of the body.
+
+    Returns:
+        flask.Response: The response.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        body = build()
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        compressed = (
+            gzip.compress(body, compresslevel=6) if len(body) >= MIN_GZIP_SIZE else None
+        )
+        entry = (body, compressed, etag)
+        cache.put(key, entry)
+    body, compressed, etag = entry
+
+    use_gzip = compressed is not None and "gzip" in request.accept_encodings
+    if use_gzip:
+        body, etag = compressed, etag + "-gzip"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def create_app(
+    data_root=DEFAULT_DATA_ROOT,
+    index=None,
+    cache_size=512,
+    reload_interval=5.0,
+    tile_cache_directory=None,
+    stream=None,
+):
+    """
+    Create the data service.
+
+    Args:
+        data_root (str): Root directory of the data; the index is built from its
+            ``processed`` directory.
+        index (DataIndex, optional): Prebuilt index to serve instead; it is never
+            reloaded.
+        cache_size (int): Number of responses kept in the LRU cache.
+        reload_interval (float): Seconds between checks of the processed files
+            for changes; None disables reloading.
+        tile_cache_directory (str, optional): Directory of the disk cache of
+            vector tiles. Defaults to ``cache/tiles`` under the data root when the
+            index is loaded from there, and to no disk cache otherwise.
+        stream (LiveStream, optional): Live simulation stream to serve. Defaults
+            to a new, empty stream a simulation can publish to.
+
+    Returns:
+        Flask: The application. Its ``extensions["railway_data"]`` holds the
+        ``ServiceState``.
+    """
+    from ui.live_stream import LiveStream, register_stream
+    from ui.vector_tiles import register_tiles
+
+    processed_directory = os.path.join(data_root, "processed")
+    if index is None:
+        index = DataIndex.load(processed_directory)
+        if tile_cache_directory is None:
+            tile_cache_directory = os.path.join(data_root, "cache", "tiles")
+    else:
+        processed_directory = None
+    state = ServiceState(
+        processed_directory, index, ResponseCache(cache_size), reload_interval
+    )
+
+    app = Flask(__name__)
+    app.extensions["railway_data"] = state
+
+    @app.before_request
+    def refresh_index():
+        state.refresh()
+
+    register_tiles(app, state, tile_cache_directory)
+    register_stream(app, LiveStream() if stream is None else stream)
+
+    @app.errorhandler(BadRequest)
+    def bad_request(error):
+        return jsonify(error=str(error)), 400
+
+    def collection(name, table):
+        bbox = _parse_bbox(request.args.get("bbox"))
+        line_ids = _parse_line_ids(request.args.get("line_id"))
+        offset = _parse_int(request.args.get("offset"), "offset", 0, 0, 2**31)
+        limit = _parse_int(
+            request.args.get("limit"), "limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE
+        )
+        key = (
+            name,
+            state.index.version,
+            None if bbox is None else tuple(bbox),
+            None if line_ids is None else tuple(sorted(line_ids)),
+            offset,
+            limit,
+        )
+        return cached_response(
+            state.cache,
+            key,
+            lambda: encode_page(table, table.select(bbox, line_ids), offset, limit),
+        )
+
+    def item(name, table, record_id):
+        position = table.position_of(record_id)
+        if position < 0:
+            return jsonify(error=f"No {name} with id {record_id}"), 404
+        return cached_response(
+            state.cache,
+            (name, state.index.version, record_id),
+            lambda: table.records[position],
+        )
+
+    @app.route("/")
+    def endpoints():
+        return jsonify(
+            endpoints=[
+                "/api/health",
+                "/api/stations",
+                "/api/lines",
+                "/api/segments",
+                "/tiles/<z>/<x>/<y>.mvt",
+                "/tiles.json",
+                "/stream/trains",
+                "/stream/trains.bin",
+            ]
+        )
+
+    @app.route("/api/health")
+    def health():
+        index = state.index
+        return jsonify(
+            version=index.version,
+            stations=len(index.stations),
+            lines=len(index.lines),
+            segments=len(index.segments),
+            cache={
+                "entries": len(state.cache),
+                "hits": state.cache.hits,
+                "misses": state.cache.misses,
+            },
+        )
+
+    @app.route("/api/stations")
+    def stations():
+        return collection("stations", state.index.stations)
+
+    @app.route("/api/stations/<int:station_id>")
+    def station(station_id):
+        return item("station", state.index.stations, station_id)
+
+    @app.route("/api/lines")
+    def lines():
+        return collection("lines", state.index.lines)
+
+    @app.route("/api/lines/<int:line_id>")
+    def line(line_id):
+        return item("line", state.index.lines, line_id)
+
+    @app.route("/api/segments")
+    def segments():
+        return collection("segments", state.index.segments)
+
+    return app
+
+
+def serve_in_thread(app, host="127.0.0.1", port=8050):
+    """
+    Serve an app from a daemon thread, e.g. next to the Qt event loop.
+
+    Args:
+        app (Flask): The application.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+
+    Returns:
+        werkzeug.serving.BaseWSGIServer: The server; call ``shutdown()`` to stop.
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
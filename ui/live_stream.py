@@ -0,0 +1,531 @@
+"""
+Live streaming of the simulation state as delta-encoded binary frames.
+
+The simulation loop publishes snapshots of the fleet to a ``LiveStream``. A
+snapshot is quantized once (positions along the routes to ``position_resolution``
+metres, speeds to ``speed_resolution`` m/s, map coordinates to
+``coordinate_resolution`` degrees) and only replaces the latest snapshot of the
+stream, so publishing costs O(trains) no matter how many clients watch and never
+waits for any of them.
+
+Every client keeps the snapshot it was last sent as its baseline. When it is
+ready for more data it takes the latest snapshot and receives only the trains
+whose quantized state differs from its baseline. A slow client thus skips the
+snapshots published meanwhile instead of queueing them, and its deltas stay
+exact. Clients in step share a baseline, so their frames are encoded once.
+
+The longitude and latitude of every train are placed on the map with a
+``RoutePlacer`` when the snapshot is published, so a client can draw the trains
+without knowing their routes; trains that cannot be placed carry
+``UNKNOWN_COORDINATE``.
+
+Frame layout (little-endian)::
+
+    uint8 version, uint8 flags (1 = keyframe), uint32 sequence, float64 time,
+    uint32 n_trains, uint32 n_changed, float32 position_resolution,
+    float32 speed_resolution, float64 coordinate_resolution,
+    uint32[n_changed] train, int32[n_changed] position,
+    int16[n_changed] speed, uint8[n_changed] status,
+    int32[n_changed] longitude, int32[n_changed] latitude
+
+Endpoints:
+    /stream/trains       Server-Sent Events, frames base64 encoded
+    /stream/trains.bin   chunked binary stream of uint32 length-prefixed frames
+"""
+
+import base64
+import struct
+import threading
+import time as clock
+from collections import namedtuple
+
+import numpy as np
+from flask import Response, jsonify
+
+from ui.data_service import ResponseCache
+
+FRAME_VERSION = 2
+KEYFRAME = 1
+# Quantized coordinate of trains without a known place on the map
+UNKNOWN_COORDINATE = np.iinfo(np.int32).min
+
+# Train states in the frames
+STATUS_WAITING = 0
+STATUS_RUNNING = 1
+STATUS_ARRIVED = 2
+
+# Reconnection delay suggested to SSE clients
+RETRY_MILLISECONDS = 1000
+
+_HEADER = struct.Struct("<BBIdIIffd")
+_LENGTH = struct.Struct("<I")
+
+Snapshot = namedtuple(
+    "Snapshot", "sequence time position speed status longitude latitude"
+)
+Frame = namedtuple("Frame", "sequence keyframe data")
+
+# Per-train arrays of the state decoded by clients
+_STATE_ARRAYS = ("position", "speed", "status", "longitude", "latitude")
+
+
+def encode_frame(
+    snapshot, baseline, position_resolution, speed_resolution, coordinate_resolution
+):
+    """
+    Encode the difference between two snapshots.
+
+    Args:
+        snapshot (Snapshot): The snapshot to send.
+        baseline (Snapshot, optional): The snapshot the client holds; without
+            one, or with a different number of trains, a keyframe is encoded.
+        position_resolution (float): Metres per position unit.
+        speed_resolution (float): m/s per speed unit.
+        coordinate_resolution (float): Degrees per coordinate unit.
+
+    Returns:
+        Frame: The encoded frame.
+    """
+    n = len(snapshot.position)
+    keyframe = baseline is None or len(baseline.position) != n
+    if keyframe:
+        changed = np.arange(n)
+    else:
+        changed = np.flatnonzero(
+            (snapshot.position != baseline.position)
+            | (snapshot.speed != baseline.speed)
+            | (snapshot.status != baseline.status)
+            | (snapshot.longitude != baseline.longitude)
+            | (snapshot.latitude != baseline.latitude)
+        )
+    data = b"".join(
+        [
+            _HEADER.pack(
+                FRAME_VERSION,
+                KEYFRAME if keyframe else 0,
+                snapshot.sequence,
+                snapshot.time,
+                n,
+                len(changed),
+                position_resolution,
+                speed_resolution,
+                coordinate_resolution,
+            ),
+            changed.astype("<u4").tobytes(),
+            snapshot.position[changed].astype("<i4").tobytes(),
+            snapshot.speed[changed].astype("<i2").tobytes(),
+            snapshot.status[changed].astype("u1").tobytes(),
+            snapshot.longitude[changed].astype("<i4").tobytes(),
+            snapshot.latitude[changed].astype("<i4").tobytes(),
+        ]
+    )
+    return Frame(snapshot.sequence, keyframe, data)
+
+
+def decode_frame(data, state=None):
+    """
+    Apply a frame to the state a client holds.
+
+    Args:
+        data (bytes): The frame.
+        state (dict, optional): State returned for the previous frame; required
+            unless the frame is a keyframe.
+
+    Returns:
+        dict: ``sequence``, ``time``, ``keyframe``, ``changed`` (the trains in the
+        frame), and the ``position`` (m), ``speed`` (m/s), ``status``,
+        ``longitude`` and ``latitude`` (degrees, NaN if unknown) of all trains.
+
+    Raises:
+        ValueError: If a delta frame does not fit the given state.
+    """
+    (
+        version,
+        flags,
+        sequence,
+        time,
+        n_trains,
+        n_changed,
+        position_resolution,
+        speed_resolution,
+        coordinate_resolution,
+    ) = _HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    keyframe = bool(flags & KEYFRAME)
+    if keyframe:
+        state = {
+            "position": np.zeros(n_trains),
+            "speed": np.zeros(n_trains),
+            "status": np.zeros(n_trains, dtype=np.uint8),
+            "longitude": np.full(n_trains, np.nan),
+            "latitude": np.full(n_trains, np.nan),
+        }
+    elif state is None or len(state["position"]) != n_trains:
+        raise ValueError("Delta frame without a matching keyframe")
+    else:
+        state = {name: state[name].copy() for name in _STATE_ARRAYS}
+
+    offset = _HEADER.size
+    arrays = []
+    for dtype in ("<u4", "<i4", "<i2", "u1", "<i4", "<i4"):
+        array = np.frombuffer(data, dtype=dtype, count=n_changed, offset=offset)
+        offset += array.nbytes
+        arrays.append(array)
+    changed, position, speed, status, longitude, latitude = arrays
+    state["position"][changed] = position * position_resolution
+    state["speed"][changed] = speed * speed_resolution
+    state["status"][changed] = status
+    for name, values in (("longitude", longitude), ("latitude", latitude)):
+        state[name][changed] = np.where(
+            values == UNKNOWN_COORDINATE, np.nan, values * coordinate_resolution
+        )
+    state.update(sequence=sequence, time=time, keyframe=keyframe, changed=changed)
+    return state
+
+
+def fleet_status(fleet):
+    """
+    Status of every train of a fleet.
+
+    Args:
+        fleet (TrainFleet): The trains.
+
+    Returns:
+        np.ndarray: ``STATUS_WAITING``, ``STATUS_RUNNING`` or ``STATUS_ARRIVED``.
+    """
+    status = np.full(len(fleet), STATUS_WAITING, dtype=np.uint8)
+    status[fleet.running] = STATUS_RUNNING
+    status[fleet.arrived] = STATUS_ARRIVED
+    return status
+
+
+class LiveStream:
+    """
+    Latest quantized snapshot of a simulation and the clients watching it.
+
+    Attributes:
+        position_resolution (float): Metres per position unit.
+        speed_resolution (float): m/s per speed unit.
+        coordinate_resolution (float): Degrees per coordinate unit.
+        max_subscribers (int): Number of clients served at most.
+        latest (Snapshot): The latest snapshot, None before the first one.
+    """
+
+    def __init__(
+        self,
+        position_resolution=1.0,
+        speed_resolution=0.1,
+        coordinate_resolution=1e-6,
+        max_subscribers=64,
+        cache_size=64,
+    ):
+        self.position_resolution = position_resolution
+        self.speed_resolution = speed_resolution
+        self.coordinate_resolution = coordinate_resolution
+        self.max_subscribers = max_subscribers
+        self.latest = None
+        self.closed = False
+        self._sequence = 0
+        self._subscribers = 0
+        self._frames = ResponseCache(cache_size)
+        self._condition = threading.Condition()
+
+    @property
+    def n_subscribers(self):
+        """int: Number of connected clients."""
+        return self._subscribers
+
+    def publish(self, time, position, speed, status, longitude=None, latitude=None):
+        """
+        Publish the state of all trains; never blocks on clients.
+
+        Args:
+            time (float): Simulation time in s.
+            position (np.ndarray): Position of every train along its route in m.
+            speed (np.ndarray): Speed of every train in m/s.
+            status (np.ndarray): Status of every train.
+            longitude (np.ndarray, optional): Longitude of every train, NaN where
+                unknown. Defaults to unknown for all trains.
+            latitude (np.ndarray, optional): Latitude of every train.
+
+        Returns:
+            int: Sequence number of the snapshot.
+        """
+        position = np.round(np.asarray(position) / self.position_resolution)
+        speed = np.round(np.asarray(speed) / self.speed_resolution)
+        status = np.asarray(status, dtype=np.uint8).copy()
+        longitude, latitude = (
+            self._quantize_coordinate(values, len(position))
+            for values in (longitude, latitude)
+        )
+        with self._condition:
+            self._sequence += 1
+            snapshot = Snapshot(
+                self._sequence,
+                float(time),
+                position.astype(np.int32),
+                speed.astype(np.int16),
+                status,
+                longitude,
+                latitude,
+            )
+            self.latest = snapshot
+            self._condition.notify_all()
+        return snapshot.sequence
+
+    def publish_simulation(self, simulation, placer=None):
+        """
+        Publish the current state of a ``TimeSteppedSimulation``.
+
+        Args:
+            simulation (TimeSteppedSimulation): The simulation.
+            placer (RoutePlacer, optional): Placer of the fleet's routes on the
+                map, see ``ui.viewer_model``. Without it the coordinates of the
+                trains are unknown.
+
+        Returns:
+            int: Sequence number of the snapshot.
+        """
+        fleet = simulation.fleet
+        longitude = latitude = None
+        if placer is not None:
+            longitude, latitude = placer.place(fleet.route, fleet.position)
+        return self.publish(
+            simulation.time,
+            fleet.position,
+            fleet.speed,
+            fleet_status(fleet),
+            longitude,
+            latitude,
+        )
+
+    def _quantize_coordinate(self, values, n_trains):
+        """Quantize longitudes or latitudes, ``UNKNOWN_COORDINATE`` for NaN."""
+        if values is None:
+            return np.full(n_trains, UNKNOWN_COORDINATE, dtype=np.int32)
+        values = np.round(
+            np.asarray(values, dtype=np.float64) / self.coordinate_resolution
+        )
+        return np.where(np.isnan(values), UNKNOWN_COORDINATE, values).astype(np.int32)
+
+    def close(self):
+        """End the stream; clients receive the latest snapshot, then stop."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def subscribe(self):
+        """
+        Connect a client.
+
+        Returns:
+            Subscriber: The client, or None if ``max_subscribers`` are connected.
+        """
+        with self._condition:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+        return Subscriber(self)
+
+    def _unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def _frame(self, snapshot, baseline):
+        """Encode a frame once for all clients with the same baseline."""
+        key = (snapshot.sequence, None if baseline is None else baseline.sequence)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = encode_frame(
+                snapshot,
+                baseline,
+                self.position_resolution,
+                self.speed_resolution,
+                self.coordinate_resolution,
+            )
+            self._frames.put(key, frame)
+        return frame
+
+
+class Subscriber:
+    """
+    One client of a ``LiveStream``.
+
+    Attributes:
+        baseline (Snapshot): The snapshot the client was last sent.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.baseline = None
+        self._closed = False
+
+    def next_frame(self, timeout=None):
+        """
+        Wait for a snapshot newer than the baseline and encode it as a frame.
+
+        Snapshots published while the client was busy are skipped.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most.
+
+        Returns:
+            Frame: The frame, or None on timeout or when the stream has ended.
+        """
+        stream = self.stream
+        sent = 0 if self.baseline is None else self.baseline.sequence
+        with stream._condition:
+            stream._condition.wait_for(
+                lambda: stream.closed
+                or (stream.latest is not None and stream.latest.sequence > sent),
+                timeout,
+            )
+            snapshot = stream.latest
+        if snapshot is None or snapshot.sequence <= sent:
+            return None
+        frame = stream._frame(snapshot, self.baseline)
+        self.baseline = snapshot
+        return frame
+
+    def close(self):
+        """Disconnect the client."""
+        if not self._closed:
+            self._closed = True
+            self.stream._unsubscribe()
+
+
+def run_simulation(
+    simulation,
+    stream,
+    duration,
+    publish_every=1,
+    realtime_factor=None,
+    placer=None,
+):
+    """
+    Run a simulation and publish its state to a stream.
+
+    Args:
+        simulation (TimeSteppedSimulation): The simulation.
+        stream (LiveStream): The stream to publish to.
+        duration (float): Simulated time to advance in s.
+        publish_every (int): Publish every this many steps.
+        realtime_factor (float, optional): Simulated seconds per wall-clock
+            second to pace the simulation at; None runs it as fast as possible.
+        placer (RoutePlacer, optional): Placer of the trains on the map.
+
+    Returns:
+        int: Number of published snapshots.
+    """
+    n_steps = int(round(duration / simulation.dt))
+    start, published = clock.monotonic(), 0
+    stream.publish_simulation(simulation, placer)
+    for step in range(n_steps):
+        simulation.step()
+        if (step + 1) % publish_every:
+            continue
+        stream.publish_simulation(simulation, placer)
+        published += 1
+        if realtime_factor:
+            delay = (step + 1) * simulation.dt / realtime_factor
+            clock.sleep(max(0.0, start + delay - clock.monotonic()))
+    return published
+
+
+def register_stream(app, stream, keepalive=15.0):
+    """
+    Add the streaming endpoints to the data service.
+
+    Args:
+        app (Flask): The data service.
+        stream (LiveStream): The stream to serve, also kept in
+            ``app.extensions["railway_stream"]``.
+        keepalive (float): Seconds without frames after which an SSE comment is
+            sent to keep the connection open.
+
+    Returns:
+        LiveStream: The stream.
+    """
+    app.extensions["railway_stream"] = stream
+
+    def subscribe():
+        subscriber = stream.subscribe()
+        if subscriber is None:
+            return None, (jsonify(error="Too many stream clients"), 503)
+        return subscriber, None
+
+    def respond(subscriber, body, mimetype):
+        response = Response(
+            body,
+            mimetype=mimetype,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Also frees the slot of HEAD requests and of clients that disconnect
+        # before the body is iterated
+        response.call_on_close(subscriber.close)
+        return response
+
+    def frames(subscriber, idle):
+        try:
+            while True:
+                frame = subscriber.next_frame(timeout=keepalive)
+                if frame is not None:
+                    yield frame
+                elif stream.closed:
+                    return
+                elif idle is not None:
+                    yield idle
+        finally:
+            subscriber.close()
+
+    @app.route("/stream/trains")
+    def stream_events():
+        subscriber, error = subscribe()
+        if error is not None:
+            return error
+
+        def events():
+            # Sent right away so the client sees the open stream before any frame
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            for frame in frames(subscriber, ": keepalive\n\n"):
+                if isinstance(frame, str):
+                    yield frame
+                    continue
+                kind = "keyframe" if frame.keyframe else "delta"
+                data = base64.b64encode(frame.data).decode("ascii")
+                yield f"id: {frame.sequence}\nevent: {kind}\ndata: {data}\n\n"
+
+        return respond(subscriber, events(), "text/event-stream")
+
+    @app.route("/stream/trains.bin")
+    def stream_binary():
+        subscriber, error = subscribe()
+        if error is not None:
+            return error
+
+        def chunks():
+            for frame in frames(subscriber, None):
+                yield _LENGTH.pack(len(frame.data)) + frame.data
+
+        return respond(subscriber, chunks(), "application/octet-stream")
+
+    return stream
+
+
+def iter_binary_frames(file):
+    """
+    Read the frames of a ``/stream/trains.bin`` response.
+
+    Args:
+        file: Binary file-like object, e.g. an HTTP response.
+
+    Yields:
+        bytes: The next frame.
+    """
+    while True:
+        head = file.read(_LENGTH.size)
+        if len(head) < _LENGTH.size:
+            return
+        (length,) = _LENGTH.unpack(head)
+        yield file.read(length)
@@ -1,33 +1,71 @@
+"""
+Main window of the railway simulation together with its data service.
+
+The window shows the network viewer of ``ui.network_viewer`` with a replay of
+``--trains`` simulated trains. The REST data service of ``ui.data_service`` runs
+in a background thread, so it keeps answering requests independently of the Qt
+event loop. With ``--serve`` the service runs on its own, without importing Qt
+at all.
+
+Usage:
+    python -m ui.main_window [--serve] [--host 127.0.0.1] [--port 8050]
+                             [--trains 1000] [--duration 3600]
+"""
+
+import argparse
+import os
 import sys
 
-from flask import Flask
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from PyQt5.QtWidgets import QApplication, QLabel
+from ui.data_service import DEFAULT_DATA_ROOT, create_app, serve_in_thread
+
+
+def run_window(data_root, n_trains=1000, duration=3600.0):
+    """
+    Show the main window until it is closed.
+
+    Args:
+        data_root (str): Root directory of the data.
+        n_trains (int): Number of trains of the replay, 0 for none.
+        duration (float): Simulated time of the replay in s.
 
-print("Starting the application...")
+    Returns:
+        int: Exit code of the Qt event loop.
+    """
+    from PyQt5.QtWidgets import QApplication
 
-app = QApplication(sys.argv)
-print("Application created successfully...")
+    from ui.network_viewer import MainWindow
 
-label = QLabel("Hello, PyQt5!")
-label.show()
-print("Label created and shown successfully...")
+    app = QApplication(sys.argv)
+    window = MainWindow(os.path.join(data_root, "processed"), n_trains, duration)
+    window.resize(1200, 800)
+    window.show()
+    return app.exec_()
 
-fig = Figure()
-canvas = FigureCanvas(fig)
-canvas.show()
-print("FigureCanvas created successfully...")
 
-print("Entering the application event loop...")
-sys.exit(app.exec_())
-app = Flask(__name__)
+def main():
+    """Parse the command line, start the data service and show the window."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-root", default=DEFAULT_DATA_ROOT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument(
+        "--serve", action="store_true", help="Run the data service without a window"
+    )
+    parser.add_argument("--trains", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=3600.0)
+    args = parser.parse_args()
 
+    app = create_app(args.data_root)
+    if args.serve:
+        app.run(host=args.host, port=args.port, threaded=True)
+        return 0
 
-@app.route("/")
-def hello():
-    return "Hello, World!"
+    server = serve_in_thread(app, args.host, args.port)
+    try:
+        return run_window(args.data_root, args.trains, args.duration)
+    finally:
+        server.shutdown()
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80)
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Interactive PyQt5 viewer of the network with an animated simulation replay.
+
+The static network is drawn by a full render only when the view changes, and
+that render is kept as the background. Every animation frame restores the
+background, draws the train markers, which are an animated artist left out of
+full renders, and blits the result, so a frame costs one marker draw no matter
+how large the network is. Full renders draw only the tracks inside the view at
+the level of detail of its resolution (see ``NetworkGeometry``), and the trains
+are culled to the view as well.
+
+Mouse events only record the requested view and the frame timer applies it at
+most once per frame, so a burst of wheel events costs one render. While the
+network is dragged the background is only shifted by the mouse offset, and the
+network is rendered again when the button is released. The network
+and the replay are loaded in a ``QThread`` and handed over when ready, which
+keeps the window responsive while they load.
+"""
+
+import os
+import time
+
+import numpy as np
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PyQt5 import QtCore, QtWidgets
+
+from src.scripts.data_preparation import processed_store
+from ui.viewer_model import NetworkGeometry, build_demo_replay, in_view
+
+# Target frame interval, about 30 fps
+FRAME_INTERVAL_MS = 33
+# Zoom factor of one mouse wheel step
+ZOOM_STEP = 1.25
+# Simulated seconds shown per wall-clock second
+DEFAULT_REPLAY_SPEED = 60.0
+
+
+class DataLoader(QtCore.QThread):
+    """
+    Loads the network geometry and the replay off the main thread.
+
+    Signals:
+        network_loaded (NetworkGeometry): The track geometry is ready.
+        replay_loaded (Replay): The simulation replay is ready.
+        failed (str): Loading failed with this message.
+    """
+
+    network_loaded = QtCore.pyqtSignal(object)
+    replay_loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(
+        self, processed_directory, n_trains=1000, duration=3600.0, parent=None
+    ):
+        super().__init__(parent)
+        self.processed_directory = processed_directory
+        self.n_trains = n_trains
+        self.duration = duration
+
+    def run(self):
+        """Load the data; runs in the worker thread."""
+        try:
+            lod_path = os.path.join(
+                self.processed_directory, "line_segments_lod.parquet"
+            )
+            if os.path.exists(lod_path):
+                network = NetworkGeometry.from_lod(lod_path)
+            else:
+                line_segments = processed_store.read_table(
+                    os.path.join(self.processed_directory, "line_segments.parquet"),
+                    columns=["line_id", "geometry"],
+                )
+                network = NetworkGeometry.from_geometries(
+                    line_segments.geometry.to_numpy()
+                )
+            self.network_loaded.emit(network)
+            if self.n_trains:
+                self.replay_loaded.emit(
+                    build_demo_replay(
+                        self.processed_directory, self.n_trains, self.duration
+                    )
+                )
+        except Exception as error:
+            self.failed.emit(f"Loading failed: {error}")
+
+
+class NetworkCanvas(FigureCanvasQTAgg):
+    """
+    Map canvas with the cached network background and blitted trains.
+
+    Signals:
+        frame_rendered (float, float, int): Frame rate, simulation time and
+            number of visible trains after every frame.
+    """
+
+    frame_rendered = QtCore.pyqtSignal(float, float, int)
+
+    def __init__(self, parent=None):
+        figure = Figure()
+        super().__init__(figure)
+        self.setParent(parent)
+        self.axes = figure.add_axes([0, 0, 1, 1])
+        self.axes.set_axis_off()
+        self.network_lines = LineCollection([], colors="#555555", linewidths=0.6)
+        self.axes.add_collection(self.network_lines)
+        (self.trains,) = self.axes.plot(
+            [], [], "o", markersize=3, color="#d62728", animated=True
+        )
+
+        self.network = None
+        self.replay = None
+        self.replay_speed = DEFAULT_REPLAY_SPEED
+        self.simulation_time = 0.0
+        self.fps = 0.0
+        self._background = None
+        self._pending_view = None
+        self._pan_start = None
+        self._pan_offset = None
+        self._pan_view = None
+        self._last_frame = time.perf_counter()
+
+        self.mpl_connect("draw_event", self._on_draw)
+        self.mpl_connect("scroll_event", self._on_scroll)
+        self.mpl_connect("button_press_event", self._on_press)
+        self.mpl_connect("motion_notify_event", self._on_motion)
+        self.mpl_connect("button_release_event", self._on_release)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(FRAME_INTERVAL_MS)
+
+    @property
+    def extent(self):
+        """tuple: ``(min_x, max_x, min_y, max_y)`` of the current view."""
+        return (*self.axes.get_xlim(), *self.axes.get_ylim())
+
+    def set_network(self, network):
+        """Show a network and zoom to it."""
+        self.network = network
+        min_x, max_x, min_y, max_y = network.bounds
+        # Keep distances true to scale at the latitude of the network
+        self.axes.set_aspect(1 / np.cos(np.radians((min_y + max_y) / 2)), "datalim")
+        self._pending_view = network.bounds
+
+    def set_replay(self, replay):
+        """Animate a simulation replay from its start."""
+        self.replay = replay
+        self.simulation_time = replay.time[0]
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.network is not None:
+            # The level of detail depends on the size of the view in pixels
+            self._pending_view = self.extent
+
+    def _on_draw(self, event):
+        """Keep the freshly rendered network as the background of the frames."""
+        self._background = self.copy_from_bbox(self.figure.bbox)
+        self._draw_trains()
+
+    def _on_scroll(self, event):
+        if event.xdata is None:
+            return
+        factor = ZOOM_STEP**-event.step
+        min_x, max_x, min_y, max_y = self._pending_view or self.extent
+        self._pending_view = (
+            event.xdata + (min_x - event.xdata) * factor,
+            event.xdata + (max_x - event.xdata) * factor,
+            event.ydata + (min_y - event.ydata) * factor,
+            event.ydata + (max_y - event.ydata) * factor,
+        )
+
+    def _on_press(self, event):
+        if (
+            event.button == 1
+            and event.inaxes is self.axes
+            and self._background is not None
+        ):
+            self._pan_start = (event.x, event.y, self.extent, self._background)
+
+    def _on_motion(self, event):
+        if self._pan_start is None:
+            return
+        x, y, (min_x, max_x, min_y, max_y), _ = self._pan_start
+        box = self.axes.bbox
+        self._pan_offset = (event.x - x, event.y - y)
+        dx = self._pan_offset[0] * (max_x - min_x) / box.width
+        dy = self._pan_offset[1] * (max_y - min_y) / box.height
+        self._pan_view = (min_x - dx, max_x - dx, min_y - dy, max_y - dy)
+
+    def _on_release(self, event):
+        if self._pan_view is not None:
+            self._pending_view = self._pan_view
+        self._pan_start = self._pan_offset = self._pan_view = None
+
+    def _draw_panned(self):
+        """Shift the background with the mouse while a pan is in progress."""
+        _, _, _, background = self._pan_start
+        min_x, max_x, min_y, max_y = self._pan_view
+        self.axes.set_xlim(min_x, max_x)
+        self.axes.set_ylim(min_y, max_y)
+        renderer = self.get_renderer()
+        renderer.clear()
+        self.figure.patch.draw(renderer)
+        # Buffer rows grow downwards, display coordinates upwards
+        x, y, _, _ = background.get_extents()
+        self.restore_region(
+            background, xy=(x + self._pan_offset[0], y - self._pan_offset[1])
+        )
+        return self._draw_trains()
+
+    def _apply_view(self):
+        """Move to the pending view and render the network visible in it."""
+        min_x, max_x, min_y, max_y = self._pending_view
+        self._pending_view = None
+        self.axes.set_xlim(min_x, max_x)
+        self.axes.set_ylim(min_y, max_y)
+        # Widen the limits to the aspect now, so the paths cover the whole view
+        self.axes.apply_aspect()
+        ratio = self.devicePixelRatioF()
+        _, paths = self.network.paths(
+            self.extent, (self.width() * ratio, self.height() * ratio)
+        )
+        self.network_lines.set_segments(paths)
+        # The draw event captures the new background
+        self.draw()
+
+    def _draw_trains(self):
+        """Draw the visible trains at the current simulation time."""
+        if self.replay is None:
+            return 0
+        _, lon, lat = self.replay.state_at(self.simulation_time)
+        visible = in_view(lon, lat, self.extent)
+        self.trains.set_data(lon[visible], lat[visible])
+        self.axes.draw_artist(self.trains)
+        return int(visible.sum())
+
+    def tick(self):
+        """Advance the replay and render one frame."""
+        now = time.perf_counter()
+        elapsed, self._last_frame = now - self._last_frame, now
+        self.fps = 0.9 * self.fps + 0.1 / max(elapsed, 1e-6)
+        if self.replay is not None and self.replay.duration > 0:
+            start = self.replay.time[0]
+            self.simulation_time = (
+                start
+                + (self.simulation_time - start + elapsed * self.replay_speed)
+                % self.replay.duration
+            )
+
+        if self.network is None:
+            return
+        if self._pan_view is not None:
+            n_visible = self._draw_panned()
+        elif self._pending_view is not None:
+            self._apply_view()
+            n_visible = len(self.trains.get_xdata())
+        elif self._background is None:
+            return
+        else:
+            self.restore_region(self._background)
+            n_visible = self._draw_trains()
+        self.blit(self.figure.bbox)
+        self.frame_rendered.emit(self.fps, self.simulation_time, n_visible)
+
+
+class MainWindow(QtWidgets.QMainWindow):
+    """Main window with the network canvas and a status bar."""
+
+    def __init__(self, processed_directory, n_trains=1000, duration=3600.0):
+        super().__init__()
+        self.setWindowTitle("Railway Simulation")
+        self.canvas = NetworkCanvas(self)
+        self.setCentralWidget(self.canvas)
+        self.statusBar().showMessage("Loading the network...")
+        self.canvas.frame_rendered.connect(self._show_frame)
+
+        self.loader = DataLoader(processed_directory, n_trains, duration, self)
+        self.loader.network_loaded.connect(self.canvas.set_network)
+        self.loader.replay_loaded.connect(self.canvas.set_replay)
+        self.loader.failed.connect(self.statusBar().showMessage)
+        self.loader.start()
+
+    def _show_frame(self, fps, simulation_time, n_visible):
+        hours, seconds = divmod(int(simulation_time), 3600)
+        self.statusBar().showMessage(
+            f"{fps:5.1f} fps | t = {hours:02d}:{seconds // 60:02d}:{seconds % 60:02d}"
+            f" | {n_visible} trains in view"
+        )
+
+    def closeEvent(self, event):
+        self.canvas.timer.stop()
+        self.loader.wait()
+        super().closeEvent(event)
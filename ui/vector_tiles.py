@@ -0,0 +1,554 @@
+"""
+Mapbox vector tiles (MVT) of the line segments and stations.
+
+Tiles are addressed by ``z/x/y`` in the Web Mercator tiling scheme and hold two
+layers, ``segments`` and ``stations``. Geometries are projected to Web Mercator
+once; below ``FULL_DETAIL_ZOOM`` every zoom level gets its own copy of the
+segments simplified to one pixel, built on first use together with an STRtree,
+so a tile only clips and encodes the few geometries it intersects and never
+carries detail its zoom cannot show. Tiles are encoded with a small protobuf
+writer, so no MVT library is needed.
+
+Encoded tiles are kept in a memory LRU cache and on disk under the version of
+the processed data, so tiles survive restarts and are invalidated when the data
+is rebuilt.
+"""
+
+import math
+import os
+import shutil
+import struct
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+from flask import jsonify, request
+
+from ui.data_service import ResponseCache, cached_response
+
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+EARTH_RADIUS = 6378137.0
+WORLD_SIZE = 2 * math.pi * EARTH_RADIUS
+MAX_LATITUDE = 85.0511287798
+
+MAX_ZOOM = 20
+# From this zoom on tiles carry the full segment geometry
+FULL_DETAIL_ZOOM = 14
+# Tile coordinate units per tile side and buffer around the tile in those units
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# Pixels per tile side the simplification tolerance is derived from
+TILE_PIXELS = 256
+
+# Feature properties of the layers, taken from the columns that exist
+SEGMENT_PROPERTIES = ["line_id", "line_name", "track_gauge"]
+STATION_PROPERTIES = ["station_abbr", "stop_name", "didok"]
+
+# MVT geometry types and commands
+_POINT, _LINESTRING = 1, 2
+_MOVE_TO, _LINE_TO = 1, 2
+
+
+def to_mercator(coordinates):
+    """
+    Project longitude/latitude coordinates to Web Mercator metres.
+
+    Args:
+        coordinates (np.ndarray): ``(n, 2)`` longitudes and latitudes.
+
+    Returns:
+        np.ndarray: ``(n, 2)`` Web Mercator coordinates.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    latitude = np.radians(np.clip(coordinates[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+    return np.column_stack(
+        [
+            EARTH_RADIUS * np.radians(coordinates[:, 0]),
+            EARTH_RADIUS * np.log(np.tan(math.pi / 4 + latitude / 2)),
+        ]
+    )
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator bounds of a tile.
+
+    Args:
+        z (int): Zoom level.
+        x (int): Column, from the west.
+        y (int): Row, from the north.
+
+    Returns:
+        tuple: ``(min_x, min_y, max_x, max_y)`` in metres.
+    """
+    size = WORLD_SIZE / 2**z
+    min_x = -WORLD_SIZE / 2 + x * size
+    max_y = WORLD_SIZE / 2 - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def _varint(value):
+    """Encode a non-negative integer as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _packed_varints(values):
+    """Encode non-negative integers as consecutive varints, vectorized."""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35, 42, 49, 56, 63):
+        n_bytes += values >= np.uint64(1 << shift)
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    start = np.cumsum(n_bytes) - n_bytes
+    for byte in range(int(n_bytes.max())):
+        has = n_bytes > byte
+        chunk = (values[has] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (n_bytes[has] > byte + 1).astype(np.uint64) << np.uint64(7)
+        out[start[has] + byte] = chunk | more
+    return out.tobytes()
+
+
+def _zigzag(values):
+    """Map signed integers to unsigned ones, ``0, -1, 1, -2`` to ``0, 1, 2, 3``."""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _field(number, payload):
+    """Encode a length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+    """Encode a varint protobuf field."""
+    return _varint(number << 3) + _varint(value)
+
+
+def _encode_value(value):
+    """Encode a feature property as an MVT ``Value`` message."""
+    if isinstance(value, (bool, np.bool_)):
+        return _uint_field(7, int(value))
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        if value >= 0:
+            return _uint_field(5, value)
+        return _uint_field(6, int(_zigzag([value])[0]))
+    if isinstance(value, (float, np.floating)):
+        return _varint(3 << 3 | 1) + struct.pack("<d", float(value))
+    return _field(1, str(value).encode("utf-8"))
+
+
+def _geometry_commands(points, part_starts, geometry_type):
+    """
+    MVT geometry commands of one feature.
+
+    Args:
+        points (np.ndarray): ``(n, 2)`` integer tile coordinates of all parts.
+        part_starts (np.ndarray): Index of the first point of every part.
+        geometry_type (int): ``_POINT`` or ``_LINESTRING``.
+
+    Returns:
+        np.ndarray: Command and parameter integers.
+    """
+    # The cursor carries over between parts, so deltas run across all points
+    deltas = _zigzag(np.diff(points, axis=0, prepend=np.zeros((1, 2), np.int64)))
+    if geometry_type == _POINT:
+        return np.concatenate([[_MOVE_TO | len(points) << 3], deltas.ravel()]).astype(
+            np.uint64
+        )
+    part_ends = np.r_[part_starts[1:], len(points)]
+    commands = []
+    for start, end in zip(part_starts, part_ends):
+        commands.append([_MOVE_TO | 1 << 3])
+        commands.append(deltas[start])
+        commands.append([_LINE_TO | (end - start - 1) << 3])
+        commands.append(deltas[start + 1 : end].ravel())
+    return np.concatenate(commands).astype(np.uint64)
+
+
+def encode_layer(name, features, extent=TILE_EXTENT):
+    """
+    Encode an MVT layer.
+
+    Args:
+        name (str): Layer name.
+        features (list[tuple]): ``(id, geometry_type, commands, properties)`` of
+            every feature, with the properties as ``(key, value)`` pairs.
+        extent (int): Tile coordinate units per tile side.
+
+    Returns:
+        bytes: The ``Layer`` message, empty without features.
+    """
+    if not features:
+        return b""
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, geometry_type, commands, properties in features:
+        tags = []
+        for key, value in properties:
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        encoded.append(
+            _field(
+                2,
+                _uint_field(1, int(feature_id))
+                + _field(2, _packed_varints(tags))
+                + _uint_field(3, geometry_type)
+                + _field(4, _packed_varints(commands)),
+            )
+        )
+    return (
+        _uint_field(15, 2)
+        + _field(1, name.encode("utf-8"))
+        + b"".join(encoded)
+        + b"".join(_field(3, key.encode("utf-8")) for key in keys)
+        + b"".join(_field(4, _encode_value(value)) for _, value in values)
+        + _uint_field(5, extent)
+    )
+
+
+def _properties(df, columns):
+    """``(key, value)`` pairs of the non-missing properties of every row."""
+    columns = [name for name in columns if name in df.columns]
+    rows = [[] for _ in range(len(df))]
+    for name in columns:
+        for row, value in zip(rows, df[name].tolist()):
+            if not pd.isna(value):
+                row.append((name, value))
+    return [tuple(row) for row in rows]
+
+
+class TileIndex:
+    """
+    Projected geometries of the network and their per-zoom simplifications.
+
+    Attributes:
+        version (str): Version of the data the tiles are built from.
+        segments (np.ndarray): Segment geometries in Web Mercator.
+        segment_ids (np.ndarray): Id of every segment.
+        segment_properties (list[tuple]): Properties of every segment.
+        stations (np.ndarray): ``(n, 2)`` station coordinates in Web Mercator.
+        station_ids (np.ndarray): Id of every station.
+        station_properties (list[tuple]): Properties of every station.
+    """
+
+    def __init__(
+        self,
+        segments,
+        segment_ids,
+        segment_properties,
+        stations,
+        station_ids,
+        station_properties,
+        version="",
+    ):
+        self.version = version
+        self.segments = segments
+        self.segment_ids = np.asarray(segment_ids, dtype=np.int64)
+        self.segment_properties = segment_properties
+        self.stations = np.asarray(stations, dtype=np.float64).reshape(-1, 2)
+        self.station_ids = np.asarray(station_ids, dtype=np.int64)
+        self.station_properties = station_properties
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data_index(cls, index):
+        """
+        Build the tile index from the tables of a data index.
+
+        Args:
+            index (DataIndex): The data service index.
+
+        Returns:
+            TileIndex: The tile index.
+        """
+        line_segments = index.frames["line_segments"]
+        stations_info = index.frames["stations_info"]
+        segments = shapely.transform(line_segments.geometry.to_numpy(), to_mercator)
+        stations = to_mercator(
+            stations_info[["longitude", "latitude"]].to_numpy(np.float64)
+        )
+        located = np.isfinite(stations).all(axis=1)
+        station_properties = _properties(stations_info, STATION_PROPERTIES)
+        return cls(
+            segments,
+            np.arange(len(line_segments)),
+            _properties(line_segments, SEGMENT_PROPERTIES),
+            stations[located],
+            stations_info["station_id"].to_numpy(np.int64)[located],
+            [row for row, keep in zip(station_properties, located) if keep],
+            version=index.version,
+        )
+
+    def level(self, z):
+        """
+        Segments simplified for a zoom level and an STRtree over them.
+
+        Args:
+            z (int): Zoom level.
+
+        Returns:
+            tuple[np.ndarray, shapely.STRtree]: The geometries and their tree.
+        """
+        z = min(z, FULL_DETAIL_ZOOM)
+        with self._lock:
+            if z not in self._levels:
+                geometries = self.segments
+                if z < FULL_DETAIL_ZOOM:
+                    tolerance = WORLD_SIZE / 2**z / TILE_PIXELS
+                    geometries = shapely.simplify(
+                        geometries, tolerance, preserve_topology=True
+                    )
+                self._levels[z] = (geometries, shapely.STRtree(geometries))
+            return self._levels[z]
+
+    def encode(self, z, x, y, extent=TILE_EXTENT, buffer=TILE_BUFFER):
+        """
+        Encode one tile.
+
+        Args:
+            z (int): Zoom level.
+            x (int): Column, from the west.
+            y (int): Row, from the north.
+            extent (int): Tile coordinate units per tile side.
+            buffer (int): Tile units around the tile included for rendering.
+
+        Returns:
+            bytes: The MVT tile, empty if no feature falls into it.
+        """
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+        scale = extent / (max_x - min_x)
+        margin = buffer / scale
+        clip = (min_x - margin, min_y - margin, max_x + margin, max_y + margin)
+
+        def to_tile(coordinates):
+            return np.round(
+                np.column_stack(
+                    [
+                        (coordinates[:, 0] - min_x) * scale,
+                        (max_y - coordinates[:, 1]) * scale,
+                    ]
+                )
+            ).astype(np.int64)
+
+        geometries, tree = self.level(z)
+        candidates = np.sort(tree.query(shapely.box(*clip)))
+        clipped = shapely.clip_by_rect(geometries[candidates], *clip)
+        parts, part_feature = shapely.get_parts(clipped, return_index=True)
+        coordinates, point_part = shapely.get_coordinates(parts, return_index=True)
+        points = to_tile(coordinates)
+        # Drop points that repeat their predecessor after quantization
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (np.diff(points, axis=0) != 0).any(axis=1) | (
+            point_part[1:] != point_part[:-1]
+        )
+        points, point_part = points[keep], point_part[keep]
+
+        segments = []
+        part_bounds = np.searchsorted(point_part, np.arange(len(parts) + 1))
+        feature_bounds = np.searchsorted(part_feature, np.arange(len(candidates) + 1))
+        for feature, candidate in enumerate(candidates):
+            starts, chunks = [], []
+            for part in range(feature_bounds[feature], feature_bounds[feature + 1]):
+                chunk = points[part_bounds[part] : part_bounds[part + 1]]
+                if len(chunk) >= 2:
+                    starts.append(sum(len(c) for c in chunks))
+                    chunks.append(chunk)
+            if chunks:
+                segments.append(
+                    (
+                        self.segment_ids[candidate],
+                        _LINESTRING,
+                        _geometry_commands(
+                            np.concatenate(chunks), np.asarray(starts), _LINESTRING
+                        ),
+                        self.segment_properties[candidate],
+                    )
+                )
+
+        inside = np.flatnonzero(
+            (self.stations[:, 0] >= clip[0])
+            & (self.stations[:, 0] <= clip[2])
+            & (self.stations[:, 1] >= clip[1])
+            & (self.stations[:, 1] <= clip[3])
+        )
+        station_points = to_tile(self.stations[inside])
+        stations = [
+            (
+                self.station_ids[station],
+                _POINT,
+                _geometry_commands(point[None, :], np.zeros(1, np.int64), _POINT),
+                self.station_properties[station],
+            )
+            for station, point in zip(inside, station_points)
+        ]
+
+        return b"".join(
+            _field(3, layer)
+            for layer in [
+                encode_layer("segments", segments, extent),
+                encode_layer("stations", stations, extent),
+            ]
+            if layer
+        )
+
+
+class DiskTileCache:
+    """
+    Encoded tiles on disk, in one directory per data version.
+
+    Attributes:
+        directory (str): Root directory of the cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, version, z, x, y):
+        """Path of a cached tile."""
+        return os.path.join(self.directory, version, str(z), str(x), f"{y}.mvt")
+
+    def get(self, version, z, x, y):
+        """Return a cached tile, or None."""
+        try:
+            with open(self.path(version, z, x, y), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, version, z, x, y, data):
+        """Store a tile, replacing it atomically."""
+        path = self.path(version, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+
+    def prune(self, version):
+        """Remove the tiles of every other data version."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name != version:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class TileService:
+    """
+    Tiles of the current data version with their memory and disk caches.
+
+    Attributes:
+        index (TileIndex): Tile index of the current data.
+        memory (ResponseCache): Cache of encoded tile responses.
+        disk (DiskTileCache): Tiles on disk, None to keep them in memory only.
+    """
+
+    def __init__(self, index, cache_directory=None, cache_size=2048):
+        self.memory = ResponseCache(cache_size)
+        self.disk = None if cache_directory is None else DiskTileCache(cache_directory)
+        self.reset(index)
+
+    def reset(self, index):
+        """
+        Switch to a new data index and invalidate the cached tiles.
+
+        Args:
+            index (DataIndex): The new data service index.
+        """
+        self.index = TileIndex.from_data_index(index)
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.prune(self.index.version)
+
+    def tile(self, z, x, y):
+        """
+        Return an encoded tile, from the disk cache if possible.
+
+        Args:
+            z (int): Zoom level.
+            x (int): Column, from the west.
+            y (int): Row, from the north.
+
+        Returns:
+            bytes: The MVT tile.
+        """
+        index = self.index
+        if self.disk is not None:
+            data = self.disk.get(index.version, z, x, y)
+            if data is not None:
+                return data
+        data = index.encode(z, x, y)
+        if self.disk is not None:
+            # Tiles of a version that was replaced meanwhile are not stored
+            if index is self.index:
+                self.disk.put(index.version, z, x, y, data)
+        return data
+
+
+def register_tiles(app, state, cache_directory=None, cache_size=2048):
+    """
+    Add the tile endpoints to the data service.
+
+    ``/tiles/<z>/<x>/<y>.mvt`` serves the tiles and ``/tiles.json`` describes
+    them as TileJSON for map clients.
+
+    Args:
+        app (Flask): The data service.
+        state (ServiceState): State of the data service.
+        cache_directory (str, optional): Directory of the disk tile cache.
+        cache_size (int): Number of tiles kept in memory.
+
+    Returns:
+        TileService: The tile service, also kept in
+        ``app.extensions["railway_tiles"]``.
+    """
+    tiles = TileService(state.index, cache_directory, cache_size)
+    state.on_reload.append(tiles.reset)
+    app.extensions["railway_tiles"] = tiles
+
+    @app.route("/tiles/<int:z>/<int:x>/<int:y>.mvt")
+    def tile(z, x, y):
+        if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+            return jsonify(error=f"No tile {z}/{x}/{y}"), 404
+        index = tiles.index
+        return cached_response(
+            tiles.memory,
+            ("tile", index.version, z, x, y),
+            lambda: tiles.tile(z, x, y),
+            mimetype=MVT_MIMETYPE,
+        )
+
+    @app.route("/tiles.json")
+    def tilejson():
+        index = state.index
+        bounds = index.segments.bounds
+        return jsonify(
+            tilejson="3.0.0",
+            version=index.version,
+            tiles=[request.host_url + "tiles/{z}/{x}/{y}.mvt"],
+            minzoom=0,
+            maxzoom=MAX_ZOOM,
+            bounds=[
+                float(np.nanmin(bounds[:, 0])) if len(bounds) else -180.0,
+                float(np.nanmin(bounds[:, 1])) if len(bounds) else -MAX_LATITUDE,
+                float(np.nanmax(bounds[:, 2])) if len(bounds) else 180.0,
+                float(np.nanmax(bounds[:, 3])) if len(bounds) else MAX_LATITUDE,
+            ],
+            vector_layers=[
+                {"id": "segments", "fields": {name: "" for name in SEGMENT_PROPERTIES}},
+                {"id": "stations", "fields": {name: "" for name in STATION_PROPERTIES}},
+            ],
+        )
+
+    return tiles
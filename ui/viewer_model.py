@@ -0,0 +1,367 @@
+"""
+Data model of the network viewer, independent of Qt.
+
+``NetworkGeometry`` keeps the track geometry at several levels of detail, each
+with an STRtree, and returns only the paths inside the view at the coarsest
+level that still looks exact at the view's resolution. ``RoutePlacer`` turns
+the route positions of the simulation into coordinates with a few vectorized
+lookups, and ``Replay`` interpolates a recorded simulation at any time. All of
+it is plain NumPy, so the viewer can prepare it in a worker thread and the
+drawing code only receives arrays.
+"""
+
+import os
+
+import numpy as np
+import shapely
+
+from src.scripts.data_preparation import lod_store, processed_store
+
+
+def in_view(x, y, extent, margin=0.0):
+    """
+    Mask of the points inside a view.
+
+    Args:
+        x (np.ndarray): Longitudes.
+        y (np.ndarray): Latitudes.
+        extent (tuple): ``(min_x, max_x, min_y, max_y)`` of the view.
+        margin (float): Extra coordinate units around the view.
+
+    Returns:
+        np.ndarray: True for the visible points.
+    """
+    return (
+        (x >= extent[0] - margin)
+        & (x <= extent[1] + margin)
+        & (y >= extent[2] - margin)
+        & (y <= extent[3] + margin)
+    )
+
+
+class NetworkGeometry:
+    """
+    Track geometry at several levels of detail.
+
+    Attributes:
+        tolerances (np.ndarray): Simplification tolerance of every level.
+        levels (list[np.ndarray]): Geometries of every level.
+        bounds (tuple): ``(min_x, max_x, min_y, max_y)`` of the full geometry.
+    """
+
+    def __init__(self, tolerances, levels):
+        self.tolerances = np.asarray(tolerances, dtype=np.float64)
+        self.levels = [np.asarray(level, dtype=object) for level in levels]
+        min_x, min_y, max_x, max_y = shapely.total_bounds(self.levels[0])
+        self.bounds = (min_x, max_x, min_y, max_y)
+        self._trees = {}
+
+    @classmethod
+    def from_geometries(cls, geometries, tolerances=lod_store.DEFAULT_TOLERANCES):
+        """
+        Simplify geometries at every tolerance.
+
+        Args:
+            geometries (np.ndarray): Shapely geometries in longitude/latitude.
+            tolerances (list[float]): Tolerance of every level, increasing.
+
+        Returns:
+            NetworkGeometry: The geometry.
+        """
+        tolerances = sorted(tolerances)
+        return cls(tolerances, lod_store.simplify_levels(geometries, tolerances))
+
+    @classmethod
+    def from_lod(cls, path):
+        """
+        Read every level of a file written by ``lod_store.write_lod``.
+
+        Args:
+            path (str): Path of the level of detail file.
+
+        Returns:
+            NetworkGeometry: The geometry.
+        """
+        store = lod_store.LODStore(path)
+        return cls(
+            store.tolerances,
+            [store.read(level).geometry.to_numpy() for level in range(store.n_levels)],
+        )
+
+    def level_for(self, resolution):
+        """
+        Pick the coarsest level whose simplification error stays below a pixel.
+
+        Args:
+            resolution (float): Coordinate units per pixel.
+
+        Returns:
+            int: The level.
+        """
+        return max(int(np.searchsorted(self.tolerances, resolution, "right")) - 1, 0)
+
+    def _tree(self, level):
+        """Return the STRtree of a level, building it on first use."""
+        if level not in self._trees:
+            self._trees[level] = shapely.STRtree(self.levels[level])
+        return self._trees[level]
+
+    def paths(self, extent, pixels):
+        """
+        Paths of the geometries inside a view, decimated for its resolution.
+
+        Args:
+            extent (tuple): ``(min_x, max_x, min_y, max_y)`` of the view.
+            pixels (tuple[int, int]): Width and height of the view in pixels.
+
+        Returns:
+            tuple[int, list[np.ndarray]]: The level used and the ``(n, 2)``
+            vertex array of every visible line.
+        """
+        level = self.level_for(lod_store.resolution_of(extent, pixels))
+        geometries = self.levels[level]
+        visible = self._tree(level).query(
+            shapely.box(extent[0], extent[2], extent[1], extent[3])
+        )
+        parts = shapely.get_parts(geometries[np.sort(visible)])
+        coordinates, part = shapely.get_coordinates(parts, return_index=True)
+        splits = np.flatnonzero(part[1:] != part[:-1]) + 1
+        return level, [path for path in np.split(coordinates, splits) if len(path) > 1]
+
+
+class RoutePlacer:
+    """
+    Coordinates of positions along routes through the railway graph.
+
+    The edges of all routes are laid out one after the other in CSR form with the
+    distance from the route start at which every edge begins, so placing any
+    number of trains is one ``searchsorted`` plus one ``LinearReference`` lookup.
+
+    Attributes:
+        route_indptr (np.ndarray): Edge offsets of every route.
+        edges (np.ndarray): Graph edge ids of all routes.
+        forward (np.ndarray): Whether every edge is run from source to target.
+        edge_start (np.ndarray): Distance from the route start to every edge in m.
+    """
+
+    def __init__(self, graph, reference, routes, route_origins):
+        """
+        Lay out the routes.
+
+        Args:
+            graph (RailwayGraph): The railway network.
+            reference (LinearReference): Linear reference of the lines.
+            routes (list[list[int]]): Graph edge ids of every route.
+            route_origins (np.ndarray): Graph node every route starts at.
+        """
+        self.graph = graph
+        self.reference = reference
+        edges, forward = [], []
+        for path, node in zip(routes, route_origins):
+            for edge in path:
+                is_forward = graph.edge_source[edge] == node
+                node = (
+                    graph.edge_target[edge] if is_forward else graph.edge_source[edge]
+                )
+                edges.append(edge)
+                forward.append(is_forward)
+        self.route_indptr = np.r_[0, np.cumsum([len(path) for path in routes])]
+        self.edges = np.asarray(edges, dtype=np.int64)
+        self.forward = np.asarray(forward, dtype=bool)
+
+        self._edge_length = graph.edge_length[self.edges] * 1000.0
+        route_of_edge = np.repeat(np.arange(len(routes)), np.diff(self.route_indptr))
+        cumulative = np.r_[0.0, np.cumsum(self._edge_length)]
+        self.edge_start = (
+            cumulative[:-1] - cumulative[self.route_indptr[:-1]][route_of_edge]
+        )
+        # Shift every route into its own disjoint range of one sorted key array
+        route_length = np.diff(cumulative[self.route_indptr])
+        self._route_base = np.r_[0.0, np.cumsum(route_length + 1.0)[:-1]]
+        self._keys = self.edge_start + self._route_base[route_of_edge]
+        self._known_line = np.isin(graph.edge_line_id[self.edges], reference.line_ids)
+
+    def place(self, route, position):
+        """
+        Coordinates of positions along routes.
+
+        Args:
+            route (np.ndarray): Route index of every train.
+            position (np.ndarray): Distance travelled along the route in m.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Longitude and latitude of every train,
+            NaN where the route or its line geometry is unknown.
+        """
+        route = np.asarray(route, dtype=np.int64)
+        position = np.asarray(position, dtype=np.float64)
+        lon = np.full(len(route), np.nan)
+        lat = np.full(len(route), np.nan)
+        first, stop = self.route_indptr[route], self.route_indptr[route + 1]
+        valid = stop > first
+        if not valid.any():
+            return lon, lat
+
+        route, position = route[valid], position[valid]
+        edge = np.searchsorted(self._keys, position + self._route_base[route], "right")
+        edge = np.clip(edge - 1, first[valid], stop[valid] - 1)
+        fraction = np.clip(
+            (position - self.edge_start[edge])
+            / np.maximum(self._edge_length[edge], 1e-9),
+            0.0,
+            1.0,
+        )
+        fraction = np.where(self.forward[edge], fraction, 1.0 - fraction)
+
+        graph_edge = self.edges[edge]
+        km_start = self.graph.edge_km_start[graph_edge]
+        km = km_start + fraction * (self.graph.edge_km_end[graph_edge] - km_start)
+        known = self._known_line[edge]
+        placed_lat, placed_lon, _ = self.reference.locate_km(
+            self.graph.edge_line_id[graph_edge][known], km[known]
+        )
+        index = np.flatnonzero(valid)[known]
+        lon[index], lat[index] = placed_lon, placed_lat
+        return lon, lat
+
+
+class Replay:
+    """
+    Recorded simulation that can be shown at any time.
+
+    Attributes:
+        time (np.ndarray): Time of every record in s.
+        position (np.ndarray): ``(n_records, n_trains)`` route positions in m.
+        departure_time (np.ndarray): Departure time of every train in s.
+        arrival_time (np.ndarray): Arrival time of every train, NaN if none.
+        route (np.ndarray): Route index of every train.
+        placer (RoutePlacer): Placer of the route positions.
+    """
+
+    def __init__(self, time, position, departure_time, arrival_time, route, placer):
+        self.time = np.asarray(time, dtype=np.float64)
+        self.position = np.asarray(position, dtype=np.float64)
+        self.departure_time = np.asarray(departure_time, dtype=np.float64)
+        self.arrival_time = np.asarray(arrival_time, dtype=np.float64)
+        self.route = np.asarray(route, dtype=np.int64)
+        self.placer = placer
+
+    @classmethod
+    def record(cls, simulation, duration, placer, record_every=10):
+        """
+        Run a simulation and record it.
+
+        Args:
+            simulation (TimeSteppedSimulation): The simulation.
+            duration (float): Simulated time to record in s.
+            placer (RoutePlacer): Placer of the fleet's routes.
+            record_every (int): Record every this many steps.
+
+        Returns:
+            Replay: The recorded simulation.
+        """
+        fleet = simulation.fleet
+        start = (simulation.time, fleet.position.copy())
+        records = simulation.run(duration, record_every)
+        return cls(
+            np.r_[start[0], records["time"]],
+            np.vstack([start[1], records["position"]]),
+            fleet.departure_time,
+            fleet.arrival_time,
+            fleet.route,
+            placer,
+        )
+
+    @property
+    def duration(self):
+        """float: Time span of the records in s."""
+        return float(self.time[-1] - self.time[0]) if len(self.time) else 0.0
+
+    def state_at(self, time):
+        """
+        Coordinates of the trains running at a time.
+
+        Positions are interpolated linearly between the records around ``time``.
+
+        Args:
+            time (float): Simulation time in s.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: Indices, longitudes and
+            latitudes of the running trains.
+        """
+        time = float(np.clip(time, self.time[0], self.time[-1]))
+        record = int(
+            np.clip(
+                np.searchsorted(self.time, time, "right") - 1, 0, len(self.time) - 2
+            )
+        )
+        if len(self.time) > 1:
+            span = self.time[record + 1] - self.time[record]
+            weight = (time - self.time[record]) / span if span > 0 else 0.0
+            position = (1 - weight) * self.position[record] + weight * self.position[
+                record + 1
+            ]
+        else:
+            position = self.position[0]
+        with np.errstate(invalid="ignore"):
+            running = (self.departure_time <= time) & ~(self.arrival_time <= time)
+        trains = np.flatnonzero(running)
+        lon, lat = self.placer.place(self.route[trains], position[trains])
+        placed = np.isfinite(lon)
+        return trains[placed], lon[placed], lat[placed]
+
+
+def build_demo_replay(
+    processed_directory, n_trains=1000, duration=3600.0, record_every=10, seed=0
+):
+    """
+    Simulate random trips through the network for the viewer.
+
+    Args:
+        processed_directory (str): Directory with the processed tables.
+        n_trains (int): Number of trains.
+        duration (float): Simulated time in s.
+        record_every (int): Record every this many 1 s steps.
+        seed (int): Seed of the random trips.
+
+    Returns:
+        Replay: The recorded simulation.
+    """
+    from src.network.graph import build_graph
+    from src.network.linear_referencing import LinearReference
+    from src.simulation.engine import TimeSteppedSimulation, fleet_from_graph
+
+    line_segments = processed_store.read_table(
+        os.path.join(processed_directory, "line_segments.parquet")
+    )
+    stations_info = processed_store.read_table(
+        os.path.join(processed_directory, "stations_info.parquet"),
+        key_column="station_id",
+    )
+    graph = build_graph(line_segments, stations_info)
+    reference = LinearReference.from_table(
+        line_segments, "segment_start", "segment_end"
+    )
+
+    # Draw trips within the largest component found from a few random hubs, so
+    # every trip has a route
+    rng = np.random.default_rng(seed)
+    reachable = max(
+        (
+            np.flatnonzero(np.isfinite(graph.distances_to(int(hub))[0]))
+            for hub in rng.integers(graph.n_nodes, size=5)
+        ),
+        key=len,
+    )
+    origins = rng.choice(reachable, n_trains)
+    destinations = rng.choice(reachable, n_trains)
+    trips = origins != destinations
+    fleet = fleet_from_graph(
+        graph,
+        origins[trips],
+        destinations[trips],
+        np.sort(rng.uniform(0.0, duration / 2, trips.sum())),
+    )
+    placer = RoutePlacer(graph, reference, fleet.routes, fleet.route_origins)
+    return Replay.record(TimeSteppedSimulation(fleet), duration, placer, record_every)